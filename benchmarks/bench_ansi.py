@@ -0,0 +1,93 @@
+# Mbf, the mud bot framework - ANSI stripping benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Compare stripping ANSI colour codes once per line, in mbf's receive pipeline (mbf.ansi), with stripping them with re.sub.
+Reports lines per second for:
+	re.sub: one substitution per line, throwing the colours away;
+	AnsiStripper: mbf's stripping, once per line, keeping each line's colour spans;
+	re.sub per trigger: what users had to do without it, each trigger stripping the line itself before matching;
+	strip_ansi stage: mbf stripping each line once, then the trigger set matching the plain lines (with some triggers matching on colour).
+Usage: python benchmarks/bench_ansi.py [--lines 50000] [--triggers 10,100]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+from mbf.ansi import AnsiStripper, SEQUENCE
+
+ANSI = re.compile(SEQUENCE.encode("ascii"))
+
+
+def make_lines(n):
+	"""Coloured mud output: prompts, combat, channels, and some plain lines"""
+	lines = []
+	for i in range(n):
+		kind = i % 5
+		if kind == 0:
+			lines.append(b"\x1b[1;32m<%dhp \x1b[1;34m%dmp\x1b[0m 80mv> " % (100 + i % 50, 40 + i % 10))
+		elif kind == 1:
+			lines.append(b"\x1b[31mThe goblin hits you with a rusty dagger%d.\x1b[0m" % (i % 7))
+		elif kind == 2:
+			lines.append(b"\x1b[35m[gossip] \x1b[1;37mKara\x1b[0;35m: anyone selling a longsword?\x1b[0m")
+		elif kind == 3:
+			lines.append(b"\x1b[33mA shimmering mob%d arrives from the north.\x1b[0m" % (i % 300))
+		else:
+			lines.append(b"You see nothing special here, just a long line of room description text.")
+	return lines
+
+
+def timed(f, lines):
+	start = time.time()
+	f(lines)
+	return len(lines) / (time.time() - start)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=50000)
+	parser.add_argument("--triggers", default="10,100")
+	args = parser.parse_args()
+	lines = make_lines(args.lines)
+	batches = [lines[i:i + 50] for i in range(0, len(lines), 50)]
+
+	def sub(lines):
+		for l in lines:
+			ANSI.sub(b"", l)
+	def stripper(lines):
+		a = AnsiStripper()
+		for l in lines:
+			a.strip(l)
+	print("%28s %12s" % ("", "lines/s"))
+	print("%28s %12.0f" % ("re.sub", timed(sub, lines)))
+	print("%28s %12.0f" % ("AnsiStripper", timed(stripper, lines)))
+	for count in [int(c) for c in args.triggers.split(",")]:
+		patterns = [re.compile((r"""hits you with a rusty dagger%d|mob%d arrives|(\w+)\: anyone selling""" % (i % 7, i)).encode("ascii")) for i in range(count)]
+		def naive(lines):
+			for l in lines:
+				for p in patterns:
+					p.search(ANSI.sub(b"", l))
+		m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, strip_ansi=True)
+		fired = [0]
+		def hit(t, match):
+			fired[0] += 1
+		for i, p in enumerate(patterns):
+			if i % 4 == 0: # some only fire on red
+				m.trigger(p.pattern, fg="red", name="t{}".format(i))(hit)
+			else:
+				m.trigger(p.pattern, name="t{}".format(i))(hit)
+		def staged(lines):
+			for b in batches:
+				m.handle_lines(b)
+		print("%28s %12.0f" % ("re.sub per trigger (%d)" % count, timed(naive, lines)))
+		print("%28s %12.0f" % ("strip_ansi stage (%d)" % count, timed(staged, lines)))
+		sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
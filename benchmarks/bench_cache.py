@@ -0,0 +1,56 @@
+# Mbf, the mud bot framework - line cache benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Replay a combat heavy session (generated, or recorded with replay.py) through mbf's trigger processing with and without the line cache (Mbf's line_cache argument), at 100 and 1000 triggers.
+The triggers are bench_triggers.py's: a few that match the session, and the rest item, mob and tiredness triggers that mostly don't.
+Reports lines per second, how many times triggers fired (which should be the same either way), and the cache's hit rate and size.
+Usage: python benchmarks/bench_cache.py [--counts 100,1000] [--lines 50000] [--cache 4096] [--transcript FILE]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+import replay
+from bench_triggers import make_triggers
+
+
+def throughput(transcript, n, cache):
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, line_cache=cache)
+	counter = [0]
+	make_triggers(m, n, counter)
+	m.trigger_set.compile()
+	lines = [0]
+	handle_lines = m.handle_lines
+	def count(l):
+		lines[0] += len(l)
+		handle_lines(l)
+	m.handle_lines = count
+	took = replay.replay(m, transcript)
+	return lines[0] / took, counter[0], m.stats().get('line_cache')
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--counts", default="100,1000")
+	parser.add_argument("--lines", type=int, default=50000)
+	parser.add_argument("--cache", type=int, default=4096)
+	parser.add_argument("--transcript", help="a transcript recorded with replay.py, instead of a generated one")
+	args = parser.parse_args()
+	if args.transcript:
+		transcript = replay.load_transcript(args.transcript)
+	else:
+		transcript = replay.generate(args.lines)
+	print("%8s %14s %14s %8s %10s %10s %10s" % ("triggers", "lines/s", "cached", "fires", "hit rate", "entries", "KiB"))
+	for n in [int(c) for c in args.counts.split(",")]:
+		rate, fires, stats = throughput(transcript, n, 0)
+		cached_rate, cached_fires, stats = throughput(transcript, n, args.cache)
+		print("%8d %14.0f %14.0f %8s %9.1f%% %10d %10.0f" % (n, rate, cached_rate, fires if fires == cached_fires else "%d/%d" % (cached_fires, fires), stats['hit_rate'] * 100, stats['entries'], stats['bytes'] / 1024.0))
+		sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,113 @@
+# Mbf, the mud bot framework - multi-session host benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Compare the memory and cpu cost of running many sessions with a thread each against running them all on one mbf.host.Host.
+Usage: python benchmarks/bench_host.py [--counts 10,50,100] [--seconds 3] [--rate 20]
+A fake mud runs in a separate process, so the cpu time reported is mbf's alone.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+from mbf.host import Host
+
+
+def rss_kb():
+	"""The resident memory of this process, in kilobytes"""
+	with open("/proc/self/statm") as f:
+		return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def cpu_seconds():
+	t = os.times()
+	return t[0] + t[1]
+
+
+def start_mud(rate):
+	p = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakemud.py"), "--rate", str(rate)], stdout=subprocess.PIPE)
+	port = int(p.stdout.readline())
+	return p, port
+
+
+def make_sessions(n, port, scheduler=None):
+	sessions = []
+	for i in range(n):
+		m = mbf.Mbf("127.0.0.1", {}, port=port, auto_login=False, scheduler=scheduler)
+		sessions.append(m)
+	return sessions
+
+
+def add_triggers(m, hits):
+	@m.trigger(r"""(?P<who>\w+) hits you""")
+	def hit(t, match):
+		hits[0] += 1
+	@m.trigger(r"""<(?P<hp>\d+)hp""")
+	def prompt(t, match):
+		m.g['hp'] = int(match.group('hp'))
+
+
+def run(mode, n, rate, seconds):
+	"""Connect n sessions to a fake mud sending rate lines a second, and measure them for the given number of seconds"""
+	mud, port = start_mud(rate)
+	hits = [0]
+	base_rss = rss_kb()
+	base_threads = threading.active_count()
+	if mode == "threads":
+		sessions = make_sessions(n, port)
+		for m in sessions:
+			add_triggers(m, hits)
+			m.start_processing()
+	else:
+		host = Host()
+		@host.trigger(r"""(?P<who>\w+) hits you""")
+		def hit(m, t, match):
+			hits[0] += 1
+		@host.trigger(r"""<(?P<hp>\d+)hp""")
+		def prompt(m, t, match):
+			m.g['hp'] = int(match.group('hp'))
+		sessions = make_sessions(n, port, host.scheduler)
+		for m in sessions:
+			host.add(m)
+		host.start()
+	time.sleep(0.5) # let everything settle
+	start_cpu = cpu_seconds()
+	time.sleep(seconds)
+	cpu = cpu_seconds() - start_cpu
+	rss = rss_kb() - base_rss
+	threads = threading.active_count() - base_threads
+	if mode == "host":
+		host.stop()
+	for m in sessions:
+		m.disconnect() # not just closing the socket, which the sessions would reconnect after
+	end = time.time() + 5
+	while threading.active_count() > base_threads and time.time() < end: # so the next run's count starts clean
+		time.sleep(0.05)
+	mud.kill()
+	mud.wait()
+	return rss, threads, cpu, hits[0]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--counts", default="10,50,100", help="comma separated session counts")
+	parser.add_argument("--seconds", type=float, default=3)
+	parser.add_argument("--rate", type=float, default=20, help="lines per second per session when busy")
+	args = parser.parse_args()
+	print("%-8s %-5s %6s %10s %8s %14s %8s" % ("mode", "load", "count", "kB/session", "threads", "cpu ms/s/sess", "hits"))
+	for n in [int(c) for c in args.counts.split(",")]:
+		for load, rate in (("idle", 0), ("busy", args.rate)):
+			for mode in ("threads", "host"):
+				rss, threads, cpu, hits = run(mode, n, rate, args.seconds)
+				print("%-8s %-5s %6d %10.1f %8d %14.3f %8d" % (mode, load, n, float(rss) / n, threads, cpu * 1000 / args.seconds / n, hits))
+				sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
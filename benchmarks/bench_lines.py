@@ -0,0 +1,115 @@
+# Mbf, the mud bot framework - per line allocation benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Measure what mbf's receive path costs per line: assembling lines from socket sized chunks (mbf.linebuffer) and matching them against a trigger set with a mix of case sensitive and insensitive, regexp and plain text triggers.
+Lines are either left as bytes (the default) or decoded once into mbf.line.Line objects (Mbf's charset argument).
+Reports microseconds per line (the best of three runs) and, where tracemalloc is available (python 3.9 and later), the peak memory allocated while handling one chunk, divided by the lines in it, in bytes.
+Only the modules the receive path needs are imported, so this runs on python 3 as well as 2.
+Usage: python benchmarks/bench_lines.py [--lines 50000] [--triggers 200] [--chunk 4096]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "mbf"))
+
+from linebuffer import LineBuffer
+from trigger import Trigger
+from triggerset import TriggerSet
+
+try:
+	import tracemalloc
+	tracemalloc.reset_peak
+except (ImportError, AttributeError):
+	tracemalloc = None
+
+
+def make_data(n):
+	"""A session's worth of mud output, as bytes"""
+	lines = []
+	for i in range(n):
+		kind = i % 5
+		if kind == 0:
+			lines.append("<%dhp %dmp %dmv> " % (100 + i % 50, 80, 200))
+		elif kind == 1:
+			lines.append("The goblin hits you with a rusty dagger%d." % (i % 7))
+		elif kind == 2:
+			lines.append("Bob tells you, 'You FEEL very tired%d today'" % (i % 9))
+		elif kind == 3:
+			lines.append("A shimmering mob%d arrives from the north." % (i % 300))
+		else:
+			lines.append("You see nothing special here, just a long line of room description text.")
+	return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def make_triggers(n, text):
+	"""n triggers, their patterns bytes or text to match the lines"""
+	def p(s):
+		return s if text or str is bytes else s.encode("utf-8")
+	hits = [0]
+	def hit(t, match):
+		hits[0] += 1
+	ts = TriggerSet()
+	for i in range(n):
+		kind = i % 4
+		if kind == 0:
+			t = Trigger(p(r"""hits you with a rusty dagger%d""" % (i % 13)))
+		elif kind == 1:
+			t = Trigger(p("""A shimmering mob%d arrives""" % i), is_regexp=False)
+		elif kind == 2:
+			t = Trigger(p(r"""you feel (?:very )?tired%d""" % (i % 17)), case_sensitive=False)
+		else:
+			t = Trigger(p("""you feel very tired%d""" % (i % 11)), is_regexp=False, case_sensitive=False)
+		t.add_function(hit)
+		ts.add(t)
+	ts.compile()
+	return ts, hits
+
+
+def run(data, charset, triggers, chunk):
+	lb = LineBuffer(timeout=None, charset=charset)
+	ts, hits = make_triggers(triggers, charset is not None)
+	chunks = [data[i:i + chunk] for i in range(0, len(data), chunk)]
+	peak = 0
+	count = 0
+	if tracemalloc is not None:
+		tracemalloc.start()
+		for c in chunks:
+			before = tracemalloc.get_traced_memory()[0]
+			tracemalloc.reset_peak()
+			lines = lb.feed(c)
+			ts.process_lines(lines)
+			peak += tracemalloc.get_traced_memory()[1] - before
+			count += len(lines)
+			del lines
+		tracemalloc.stop()
+	best = None
+	for i in range(3):
+		start = time.time()
+		lines_seen = 0
+		for c in chunks:
+			lines = lb.feed(c)
+			ts.process_lines(lines)
+			lines_seen += len(lines)
+		elapsed = (time.time() - start) / lines_seen
+		best = elapsed if best is None else min(best, elapsed)
+	return best * 1e6, (float(peak) / count if count else None), hits[0]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=50000)
+	parser.add_argument("--triggers", type=int, default=200)
+	parser.add_argument("--chunk", type=int, default=4096)
+	args = parser.parse_args()
+	data = make_data(args.lines)
+	print("%10s %12s %14s %8s" % ("lines", "us/line", "bytes/line", "fires"))
+	for charset in (None, "utf-8"):
+		us, per_line, fires = run(data, charset, args.triggers, args.chunk)
+		print("%10s %12.2f %14s %8d" % (charset or "bytes", us, "%.0f" % per_line if per_line is not None else "n/a", fires))
+
+
+if __name__ == '__main__':
+	main()
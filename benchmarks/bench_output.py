@@ -0,0 +1,105 @@
+# Mbf, the mud bot framework - output benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Measure how printing what the mud sends (start_processing's print_output) affects how many lines a second mbf can run triggers on.
+Compares printing each line straight to the sink on the trigger thread, the way mbf used to, with mbf's output writer (mbf.output), which prints on a thread of it's own in batches, with and without output filters (gags, substitutions and highlights).
+The sink is either fast (a function that throws the output away) or slow (one that sleeps for --delay seconds on every write, like a busy terminal or a pipe that's full).
+Reports lines per second through Mbf.handle_lines, and how many lines the writer dropped because the sink fell more than --queue lines behind.
+Usage: python benchmarks/bench_output.py [--lines 50000] [--delay 0.0005] [--queue 10000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+
+
+def make_lines(n):
+	"""Mud output, with a busy channel"""
+	lines = []
+	for i in range(n):
+		kind = i % 5
+		if kind == 0:
+			lines.append(b"<%dhp %dmp 80mv> " % (100 + i % 50, 40 + i % 10))
+		elif kind == 1:
+			lines.append(b"The goblin hits you with a rusty dagger%d." % (i % 7))
+		elif kind == 2:
+			lines.append(b"[ooc] Kara: anyone selling a longsword%d?" % (i % 11))
+		elif kind == 3:
+			lines.append(b"A shimmering mob%d arrives from the north." % (i % 300))
+		else:
+			lines.append(b"You see nothing special here, just a long line of room description text.")
+	return lines
+
+
+class Sink(object):
+	def __init__(self, delay):
+		self.delay = delay
+		self.written = 0
+
+	def __call__(self, data):
+		if self.delay:
+			time.sleep(self.delay)
+		self.written += data.count(b"\n")
+
+
+def session(sink, queue, filters, writer):
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, output=sink, output_queue=queue)
+	fired = [0]
+	def hit(t, match):
+		fired[0] += 1
+	for i in range(20):
+		m.trigger((r"""hits you with a rusty dagger%d|mob%d arrives""" % (i % 7, i)).encode("ascii"), name="t{}".format(i))(hit)
+	if filters:
+		m.gag(b"[ooc]", is_regexp=False)
+		m.substitute(br"""goblin""", b"GOBLIN")
+		m.highlight(br"""mob\d+""", fg="yellow")
+		for i in range(7):
+			m.gag((r"""^A shimmering mob%d\b""" % (i * 40)).encode("ascii"))
+	m.start_processing(print_output=writer, thread=False)
+	if not writer: # print each line on the trigger thread, as print_output used to
+		m.print_output = False
+		handle = m.handle_lines
+		def handle_lines(lines):
+			for line in lines:
+				if line and not line.isspace():
+					sink(line + b"\n")
+			handle(lines)
+		m.handle_lines = handle_lines
+	return m
+
+
+def run(lines, delay, queue, filters, writer):
+	sink = Sink(delay)
+	m = session(sink, queue, filters, writer)
+	batches = [lines[i:i + 20] for i in range(0, len(lines), 20)]
+	start = time.time()
+	for b in batches:
+		m.handle_lines(b)
+	elapsed = time.time() - start
+	dropped = m.output.get_stats()['dropped'] if writer else 0
+	m.stop_processing()
+	return len(lines) / elapsed, dropped
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=50000)
+	parser.add_argument("--delay", type=float, default=0.0005)
+	parser.add_argument("--queue", type=int, default=10000)
+	args = parser.parse_args()
+	lines = make_lines(args.lines)
+	print("%34s %12s %10s" % ("", "lines/s", "dropped"))
+	for name, delay in (("fast sink", 0), ("slow sink", args.delay)):
+		for label, filters, writer in (("printed on trigger thread", False, False), ("output writer", False, True), ("output writer + filters", True, True)):
+			rate, dropped = run(lines, delay, args.queue, filters, writer)
+			print("%34s %12.0f %10d" % ("%s, %s" % (name, label), rate, dropped))
+			sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
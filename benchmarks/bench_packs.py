@@ -0,0 +1,97 @@
+# Mbf, the mud bot framework - trigger pack benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Compare the time a bot takes to get a large generated trigger set ready to match, with the trigger decorator and with a trigger pack (mbf.pack).
+Reports, at each trigger count, the seconds from nothing to a compiled trigger set for:
+	decorator: a Trigger per pattern from the trigger decorator, compiled when processing starts;
+	pack, cold: loading the pack's json with nothing cached, which compiles it and writes the cache;
+	pack, cached: loading it again, from the cache, like every bot after the first does.
+It also checks the pack's triggers fire on the same lines as the decorator's. Every measurement is made in a fresh process.
+Usage: python benchmarks/bench_packs.py [--counts 1000,5000,20000]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def make_spec(n):
+	"""A pack like one generated from a game's item and mob lists"""
+	triggers = []
+	for i in range(n):
+		kind = i % 10
+		if kind < 6:
+			triggers.append({'pattern': r"""(?P<who>\w+) gives you an? (?P<item>\w+ item{})""".format(i), 'handler': "item", 'name': "item{}".format(i)})
+		elif kind < 9:
+			triggers.append({'pattern': """A shimmering mob{} arrives""".format(i), 'is_regexp': False, 'handler': "mob", 'group': "mobs", 'name': "mob{}".format(i)})
+		else:
+			triggers.append({'pattern': r"""you feel (?:very )?tired{}""".format(i), 'case_sensitive': False, 'handler': "tired", 'name': "tired{}".format(i)})
+	return {'defaults': {'group': "items", 'sequence': 50}, 'triggers': triggers}
+
+
+def child(mode, path, cache):
+	import mbf
+	hits = []
+	def hit(t, match):
+		hits.append(t)
+	handlers = {'item': hit, 'mob': hit, 'tired': hit}
+	start = time.time()
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False)
+	if mode == "decorator":
+		with open(path) as f:
+			spec = json.load(f)
+		for item in spec['triggers']:
+			options = dict(spec['defaults'])
+			options.update(item)
+			pattern = options.pop('pattern')
+			function = handlers[options.pop('handler')]
+			m.trigger(pattern, **options)(function)
+	else:
+		m.load_trigger_pack(path, handlers, cache_dir=cache)
+	m.trigger_set.compile()
+	ready = time.time() - start
+	lines = ["Bob gives you a shiny item3", "A shimmering mob7 arrives", "You feel very TIRED9", "Nothing to see here"]
+	m.trigger_set.process_lines(lines)
+	print(json.dumps({'ready': ready, 'hits': hits}))
+
+
+def run(mode, path, cache):
+	out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", mode, path, cache])
+	return json.loads(out.decode("utf-8").strip().splitlines()[-1])
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--counts", default="1000,5000,20000")
+	parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		return child(*args.child)
+	directory = tempfile.mkdtemp()
+	try:
+		print("%8s %12s %12s %12s %10s" % ("triggers", "decorator s", "pack cold s", "pack cached s", "speedup"))
+		for count in [int(c) for c in args.counts.split(",")]:
+			path = os.path.join(directory, "pack{}.json".format(count))
+			cache = os.path.join(directory, "cache")
+			with open(path, "w") as f:
+				json.dump(make_spec(count), f)
+			decorator = run("decorator", path, cache)
+			cold = run("pack", path, cache)
+			cached = run("pack", path, cache)
+			if not (decorator['hits'] == cold['hits'] == cached['hits']):
+				print("""Pack triggers fired differently: {} {} {}""".format(decorator['hits'], cold['hits'], cached['hits']))
+			print("%8d %12.3f %12.3f %13.3f %9.1fx" % (count, decorator['ready'], cold['ready'], cached['ready'], decorator['ready'] / cached['ready']))
+			sys.stdout.flush()
+	finally:
+		shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	main()
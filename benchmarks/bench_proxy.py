@@ -0,0 +1,88 @@
+# Mbf, the mud bot framework - proxy benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Measure what attaching mud clients to a bot (Mbf.listen; see mbf.proxy) costs the bot.
+A generated session is replayed into an Mbf instance with 100 triggers, at the speed it was recorded (sped up by --speed) so clients have a chance to keep up, with no clients attached, with some attached clients reading everything, and with those plus one client that never reads at all.
+Reports how long the bot spent handling what it read (which attached clients shouldn't change), how much of the session each reading client received, the most data the proxy held for clients at once (bounded by --buffer, however many clients there are, since they share it), and how much the stalled client skipped.
+Usage: python benchmarks/bench_proxy.py [--lines 20000] [--clients 1,4] [--buffer 262144] [--speed 10]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+import replay
+from bench_triggers import make_triggers
+
+
+def reader(sock, counter):
+	while True:
+		try:
+			data = sock.recv(65536)
+		except socket.error:
+			break
+		if not data:
+			break
+		counter[0] += len(data)
+
+
+def run(transcript, clients, stalled, buffer_size, speed):
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False)
+	make_triggers(m, 100, [0])
+	p = m.listen(0, max_buffer=buffer_size)
+	counters = []
+	socks = []
+	for i in range(clients):
+		s = socket.create_connection(("127.0.0.1", p.port))
+		counters.append([0])
+		t = threading.Thread(target=reader, args=(s, counters[-1]))
+		t.daemon = True
+		t.start()
+		socks.append(s)
+	if stalled:
+		s = socket.create_connection(("127.0.0.1", p.port))
+		s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+		socks.append(s)
+	time.sleep(0.2) # let the proxy accept them
+	m.tn = replay.FakeTelnet(transcript)
+	busy = 0.0
+	for delay, chunk in transcript:
+		if delay:
+			time.sleep(delay / speed)
+		start = time.time()
+		m.handle_read()
+		busy += time.time() - start
+	time.sleep(0.5)
+	stats = p.get_stats()
+	p.stop()
+	for s in socks:
+		s.close()
+	return busy, [c[0] for c in counters], stats
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=20000)
+	parser.add_argument("--clients", default="1,4")
+	parser.add_argument("--buffer", type=int, default=256 * 1024)
+	parser.add_argument("--speed", type=float, default=10.0)
+	args = parser.parse_args()
+	transcript = replay.generate(args.lines)
+	total = sum(len(chunk) for delay, chunk in transcript)
+	print("%28s %12s %16s %14s %12s" % ("", "bot busy (s)", "received (min %)", "max backlog", "skipped"))
+	configs = [(0, False)] + [(int(c), False) for c in args.clients.split(",")] + [(int(c), True) for c in args.clients.split(",")]
+	for clients, stalled in configs:
+		busy, received, stats = run(transcript, clients, stalled, args.buffer, args.speed)
+		label = "%d clients%s" % (clients, " + 1 stalled" if stalled else "")
+		print("%28s %12.3f %16s %14d %12d" % (label, busy, "%.1f" % (100.0 * min(received) / total) if received else "-", stats['max_backlog'], stats['skipped']))
+		sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
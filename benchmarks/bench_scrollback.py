@@ -0,0 +1,117 @@
+# Mbf, the mud bot framework - scrollback benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Measure multiline triggers on text that's split between reads, the way muds' room descriptions and score tables often are.
+The session is rooms (a name, a description and an exits line) and score tables (a header, some stats and a footer), fed to Mbf.handle_lines in batches of 1 to 8 lines, so blocks are usually split.
+Compares:
+	per buffer: plain multiline triggers, matched against each batch on it's own, as mbf always has; they miss every block that's split.
+	history: keeping every line in a list (as bots do in g to work around that) and matching the multiline regexps against all of it whenever lines arrive; it finds everything, but gets slower and bigger the longer it runs, so it's only run on --history lines.
+	scrollback: multiline triggers with a window (for rooms) and a start and end (for score tables), matched against mbf's scrollback.
+Reports lines per second, how many rooms and score tables were found out of how many were sent, and the lines kept at the end.
+Usage: python benchmarks/bench_scrollback.py [--lines 200000] [--history 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+
+ROOM = br"""^(?P<name>[A-Z][^\n]*)\n(?:[^\n]*\n){0,3}\[Exits: (?P<exits>[a-z ]+)\]$"""
+SCORE = br"""^-+ Score -+\n(?P<body>.*?)\n-+$"""
+
+
+def make_batches(n, seed=1):
+	"""Return (batches, rooms, scores): the session's lines split into batches, and how many rooms and score tables are in it"""
+	rng = random.Random(seed)
+	lines = []
+	rooms = scores = 0
+	while len(lines) < n:
+		kind = rng.random()
+		if kind < 0.5:
+			lines.append(b"The Winding Path %d" % rng.randint(0, 500))
+			for i in range(rng.randint(1, 3)):
+				lines.append(b"  Trees crowd close on either side of the path, and somewhere a bird calls.")
+			lines.append(b"[Exits: north south]")
+			rooms += 1
+		elif kind < 0.6:
+			lines.append(b"----- Score -----")
+			for stat in (b"Str", b"Int", b"Wis", b"Dex", b"Con"):
+				lines.append(b"%s: %d" % (stat, rng.randint(3, 25)))
+			lines.append(b"-----------------")
+			scores += 1
+		else:
+			lines.append(b"<%dhp %dmp 80mv> You hit the goblin." % (rng.randint(1, 100), rng.randint(1, 50)))
+	batches = []
+	i = 0
+	while i < len(lines):
+		size = rng.randint(1, 8)
+		batches.append(lines[i:i + size])
+		i += size
+	return batches, rooms, scores
+
+
+def session(kind):
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, scrollback=200)
+	found = {'rooms': 0, 'scores': 0}
+	def room(t, match):
+		found['rooms'] += 1
+	def score(t, match):
+		found['scores'] += 1
+	if kind == "per buffer":
+		m.trigger(ROOM, multiline=True)(room)
+		m.trigger(SCORE, multiline=True)(score)
+	elif kind == "scrollback":
+		m.trigger(ROOM, window=5)(room)
+		m.trigger(br"""(?s)\A.*""", start=br"""^-+ Score -+$""", end=br"""^-+$""", window=10)(score)
+	else: # everything so far, in a list, matched again whenever lines arrive
+		import re
+		room_re = re.compile(ROOM, re.M)
+		score_re = re.compile(SCORE, re.M | re.S)
+		history = m.g['history'] = []
+		@m.trigger(br"""^""")
+		def keep(t, match):
+			history.append(t)
+		handle = m.handle_lines
+		def handle_lines(lines):
+			handle(lines)
+			text = b"\n".join(history)
+			found['rooms'] = len(room_re.findall(text))
+			found['scores'] = len(score_re.findall(text))
+		m.handle_lines = handle_lines
+	m.start_processing(print_output=False, thread=False)
+	return m, found
+
+
+def run(kind, batches):
+	m, found = session(kind)
+	lines = sum(len(b) for b in batches)
+	start = time.time()
+	for b in batches:
+		m.handle_lines(b)
+	elapsed = time.time() - start
+	kept = len(m.g['history']) if 'history' in m.g else len(m.scrollback)
+	m.stop_processing()
+	return lines / elapsed, found, kept
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=200000)
+	parser.add_argument("--history", type=int, default=20000)
+	args = parser.parse_args()
+	print("%26s %10s %16s %16s %10s" % ("", "lines/s", "rooms", "score tables", "kept"))
+	for kind, n in (("per buffer", args.lines), ("history", args.history), ("scrollback", args.lines)):
+		batches, rooms, scores = make_batches(n)
+		rate, found, kept = run(kind, batches)
+		label = "%s (%d lines)" % (kind, sum(len(b) for b in batches))
+		print("%26s %10.0f %16s %16s %10d" % (label, rate, "%d/%d" % (found['rooms'], rooms), "%d/%d" % (found['scores'], scores), kept))
+		sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
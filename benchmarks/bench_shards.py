@@ -0,0 +1,78 @@
+# Mbf, the mud bot framework - trigger matching process benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Replay a combat heavy session through a set of expensive triggers (regular expressions with no literal text to prefilter on, and multiline ones) with matching done in this process, and in 1 to N worker processes (Mbf's match_processes; see mbf.shard).
+Reports lines per second, the speedup over matching in this process, and how many times triggers fired (which should be the same for every run).
+Worker processes can only help with as many cores as the machine has; the default counts go up to that.
+Usage: python benchmarks/bench_shards.py [--triggers 200] [--lines 20000] [--processes 0,1,2,4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+import replay
+
+
+def make_triggers(m, n, counter):
+	"""n triggers that have to be tried on every line or block"""
+	def hit(t, match):
+		counter[0] += 1
+	for i in range(n):
+		kind = i % 4
+		if kind == 0:
+			m.trigger(r"""^(\w+) (?:hits|misses|slashes) (?:the )?(\w+)(?: with a (\w+(?: \w+)*))?[.!]{{{}}}$""".format(i % 3 + 1), name="t{}".format(i))(hit)
+		elif kind == 1:
+			m.trigger(r"""^<(\d+)hp (\d+)mp (\d+)mv> (?:\w+ ){{{}}}""".format(i % 5), name="t{}".format(i))(hit)
+		elif kind == 2:
+			m.trigger(r"""(?i)^\s*(?:\w+\s+){{2,}}(?:torch|pillar|shadow)\w*{}""".format(i), name="t{}".format(i))(hit)
+		else:
+			m.trigger(r"""^([A-Z][\w ]+)\n(?:\s+.+\n)+Exits: (\w+(?: \w+)*)$""", multiline=True, name="t{}".format(i))(hit)
+
+
+def throughput(transcript, n, processes):
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, match_processes=processes)
+	counter = [0]
+	make_triggers(m, n, counter)
+	lines = [0]
+	handle_lines = m.handle_lines
+	def count(l):
+		lines[0] += len(l)
+		handle_lines(l)
+	m.handle_lines = count
+	if m.shards is not None:
+		m.shards.start()
+	took = replay.replay(m, transcript)
+	if m.shards is not None:
+		m.shards.stop()
+	return lines[0] / took, counter[0]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--triggers", type=int, default=200)
+	parser.add_argument("--lines", type=int, default=20000)
+	parser.add_argument("--processes", default=",".join(str(p) for p in [0, 1, 2, 4, 8] if p <= max(2, multiprocessing.cpu_count())))
+	parser.add_argument("--transcript", help="a transcript recorded with replay.py, instead of a generated one")
+	args = parser.parse_args()
+	if args.transcript:
+		transcript = replay.load_transcript(args.transcript)
+	else:
+		transcript = replay.generate(args.lines)
+	print("%d cores, %d triggers" % (multiprocessing.cpu_count(), args.triggers))
+	print("%10s %12s %10s %8s" % ("processes", "lines/s", "speedup", "fires"))
+	base = None
+	for p in [int(c) for c in args.processes.split(",")]:
+		rate, fires = throughput(transcript, args.triggers, p)
+		if base is None:
+			base = rate
+		print("%10s %12.0f %9.2fx %8d" % (p or "in process", rate, rate / base, fires))
+		sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,92 @@
+# Mbf, the mud bot framework - import and startup benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Time how long a short lived bot takes to get going: importing mbf, creating an Mbf instance, adding triggers and timers, and starting processing.
+Every measurement is made in a fresh process (the best of --runs is reported), since imports are only slow the first time.
+Pass --max-import-ms or --max-startup-ms to exit with an error when a limit is exceeded, so a regression (like a heavy module imported at the top of mbf again) fails a build.
+Usage: python benchmarks/bench_startup.py [--runs 5] [--triggers 100] [--max-import-ms N] [--max-startup-ms N]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def child(triggers, timers, backend):
+	"""Take one set of measurements and print them as json"""
+	start = time.time()
+	import mbf
+	imported = time.time()
+	heavy = sorted(set(m.split(".")[0] for m in sys.modules if m.split(".")[0] in ("apscheduler", "pkg_resources", "tzlocal", "pytz")))
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, timer_backend=backend)
+	created = time.time()
+	def hit(t, match):
+		pass
+	for i in range(triggers):
+		m.trigger(r"""(?P<who>\w+) gives you a (?P<item>\w+ item{})""".format(i), name="t{}".format(i))(hit)
+	added = time.time()
+	for i in range(timers):
+		m.timer(seconds=60, name="timer{}".format(i))(hit)
+	timed = time.time()
+	m.start_processing(thread=False)
+	started = time.time()
+	m.stop_processing()
+	print(json.dumps({
+		'import_ms': (imported - start) * 1000,
+		'heavy_modules': heavy,
+		'create_ms': (created - imported) * 1000,
+		'triggers_ms': (added - created) * 1000,
+		'timers_ms': (timed - added) * 1000,
+		'start_ms': (started - timed) * 1000,
+		'total_ms': (started - start) * 1000,
+	}))
+
+
+def measure(triggers, timers, backend, runs):
+	best = None
+	for i in range(runs):
+		out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", str(triggers), str(timers), backend])
+		r = json.loads(out.decode("utf-8").strip().splitlines()[-1])
+		if best is None or r['total_ms'] < best['total_ms']:
+			best = r
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--triggers", type=int, default=100)
+	parser.add_argument("--max-import-ms", type=float)
+	parser.add_argument("--max-startup-ms", type=float, help="the limit for a bot with triggers but no timers")
+	parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		return child(int(args.child[0]), int(args.child[1]), args.child[2])
+	cases = [
+		("no timers", args.triggers, 0, "apscheduler"),
+		("1 timer, apscheduler", args.triggers, 1, "apscheduler"),
+		("1 timer, builtin", args.triggers, 1, "builtin"),
+	]
+	print("%22s %10s %10s %12s %10s %10s %10s  %s" % ("bot", "import ms", "create ms", "triggers ms", "timers ms", "start ms", "total ms", "heavy modules after import"))
+	failed = False
+	for label, triggers, timers, backend in cases:
+		r = measure(triggers, timers, backend, args.runs)
+		print("%22s %10.1f %10.2f %12.2f %10.2f %10.2f %10.1f  %s" % (label, r['import_ms'], r['create_ms'], r['triggers_ms'], r['timers_ms'], r['start_ms'], r['total_ms'], ", ".join(r['heavy_modules']) or "none"))
+		if timers == 0:
+			if args.max_import_ms is not None and r['import_ms'] > args.max_import_ms:
+				print("""Importing mbf took {:.1f}ms, more than the limit of {}ms""".format(r['import_ms'], args.max_import_ms))
+				failed = True
+			if args.max_startup_ms is not None and r['total_ms'] > args.max_startup_ms:
+				print("""Starting a bot took {:.1f}ms, more than the limit of {}ms""".format(r['total_ms'], args.max_startup_ms))
+				failed = True
+	if failed:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,120 @@
+# Mbf, the mud bot framework - persistent state benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Measure what keeping g on disk costs the trigger thread, and how long a bot with a lot of state takes to start.
+g starts with an item database of --items entries and a map of --rooms rooms. Every line runs a trigger that counts a kill in g, so g changes on every line. Compared:
+	dict: an ordinary g, which is lost when the bot exits.
+	pickle on change: saving g by hand from the trigger, with pickle, whenever it changes (at most every --every lines, since every line would be hopeless).
+	store: g is an mbf.store.Store (Mbf's state argument), which writes dirty keys on a thread of it's own.
+Reports lines per second through Mbf.handle_lines, the longest any one batch took (the stall a bot sees), and for the store, what it's writer did. Then reports how long loading the saved state takes: unpickling all of it, or opening the store (which loads values lazily) and reading one key.
+Usage: python benchmarks/bench_state.py [--lines 100000] [--items 50000] [--rooms 20000] [--every 1000]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+from mbf.store import Store
+
+try:
+	import cPickle as pickle
+except ImportError: # python 3
+	import pickle
+
+
+def fill(g, items, rooms):
+	g['items'] = dict(("item %d" % i, {'name': "a shiny item %d" % i, 'value': i, 'keywords': ["item", str(i)]}) for i in range(items))
+	g['map'] = dict((i, {'exits': {'north': i + 1, 'south': i - 1}, 'name': "Room %d" % i}) for i in range(rooms))
+	g['kills'] = {}
+	g['xp'] = 0
+
+
+def run(kind, lines, items, rooms, every, directory):
+	state = os.path.join(directory, "g.db") if kind == "store" else None
+	m = mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, state=state)
+	fill(m.g, items, rooms)
+	if kind == "store": # writing the whole database the first time is a one off; time what triggers pay from then on
+		m.g.flush()
+	pickled = os.path.join(directory, "g.pickle")
+	count = [0]
+	@m.trigger(br"""^You killed (?P<mob>.+)\.$""")
+	def killed(t, match):
+		g = m.g
+		mob = match.group("mob")
+		g['kills'][mob] = g['kills'].get(mob, 0) + 1
+		if kind == "store":
+			g.touch('kills')
+		g['xp'] = g['xp'] + 10
+		count[0] += 1
+		if kind == "pickle on change" and count[0] % every == 0:
+			with open(pickled, "wb") as f:
+				pickle.dump(g, f, 2)
+	m.start_processing(print_output=False, thread=False)
+	batches = [[b"You killed a goblin %d." % ((i + j) % 50) for j in range(10)] for i in range(0, lines, 10)]
+	worst = 0.0
+	start = time.time()
+	for b in batches:
+		s = time.time()
+		m.handle_lines(b)
+		worst = max(worst, time.time() - s)
+	elapsed = time.time() - start
+	m.stop_processing()
+	stats = None
+	if kind == "store":
+		m.g.close()
+		stats = m.g.get_stats()
+	return lines / elapsed, worst, stats
+
+
+def load_times(items, rooms, directory):
+	"""How long the state takes to load: (unpickling all of it, opening the store and reading one key)"""
+	pickled = os.path.join(directory, "load.pickle")
+	g = {}
+	fill(g, items, rooms)
+	with open(pickled, "wb") as f:
+		pickle.dump(g, f, 2)
+	store = Store(os.path.join(directory, "load.db"))
+	fill(store, items, rooms)
+	store.close()
+	start = time.time()
+	with open(pickled, "rb") as f:
+		pickle.load(f)
+	unpickled = time.time() - start
+	start = time.time()
+	store = Store(os.path.join(directory, "load.db"))
+	store['xp']
+	opened = time.time() - start
+	store.close()
+	return unpickled, opened
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=100000)
+	parser.add_argument("--items", type=int, default=50000)
+	parser.add_argument("--rooms", type=int, default=20000)
+	parser.add_argument("--every", type=int, default=1000)
+	args = parser.parse_args()
+	directory = tempfile.mkdtemp()
+	try:
+		print("%20s %10s %14s" % ("", "lines/s", "worst batch"))
+		for kind in ("dict", "pickle on change", "store"):
+			rate, worst, stats = run(kind, args.lines, args.items, args.rooms, args.every, directory)
+			print("%20s %10.0f %12.1fms" % (kind, rate, worst * 1000))
+			if stats is not None:
+				print("%20s %d records, %d bytes logged in %.3fs; %d snapshots in %.3fs" % ("", stats['records'], stats['log_bytes'], stats['write_time'], stats['snapshots'], stats['snapshot_time']))
+			sys.stdout.flush()
+		unpickled, opened = load_times(args.items, args.rooms, directory)
+		print("loading: unpickling everything %.1fms, opening the store and reading one key %.1fms" % (unpickled * 1000, opened * 1000))
+	finally:
+		shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	main()
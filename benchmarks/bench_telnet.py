@@ -0,0 +1,69 @@
+# Mbf, the mud bot framework - telnet layer benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Measure how fast mud output can be read and split into lines by plain telnetlib, and by mbf's telnet layer with and without MCCP compression.
+Also reports how many bytes went over the wire, and checks that every line arrived intact.
+Usage: python benchmarks/bench_telnet.py [--lines 200000]
+"""
+
+import argparse
+import os
+import sys
+import telnetlib
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from mbf.linebuffer import LineBuffer
+from mbf.telnet import Telnet
+from fakemud import FakeMud
+
+LINES = [
+	"The orc hits you with a mighty blow!",
+	"You slash the orc.",
+	"<100hp 50mp 80mv> ",
+	"Dernan tells you, 'hello there, how's the hunting going?'",
+	"A small goblin arrives from the north.",
+]
+
+
+def run(name, client_class, mccp, count):
+	mud = FakeMud(greeting="", mccp=mccp)
+	tn = client_class("127.0.0.1", mud.port)
+	mud.wait_for_clients(1)
+	if mccp: # read until compression has been negotiated
+		end = time.time() + 5
+		while not mud.compressors and time.time() < end:
+			tn.read_very_eager()
+			time.sleep(0.01)
+	payload = "".join(LINES[i % len(LINES)] + "\r\n" for i in range(count))
+	before = mud.bytes_sent
+	def send():
+		for i in range(0, len(payload), 4096):
+			mud.send(0, payload[i:i+4096])
+	buf = LineBuffer()
+	got = 0
+	start = time.time()
+	threading.Thread(target=send).start()
+	while got < count:
+		got += len(buf.feed(tn.read_very_eager()))
+	took = time.time() - start
+	wire = mud.bytes_sent - before
+	tn.close()
+	mud.close()
+	print("%-22s %10d %10.3f %12.0f" % (name, wire, took, count / took))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--lines", type=int, default=200000)
+	args = parser.parse_args()
+	print("%-22s %10s %10s %12s" % ("client", "wire bytes", "seconds", "lines/sec"))
+	run("telnetlib", telnetlib.Telnet, False, args.lines)
+	run("mbf.telnet", Telnet, False, args.lines)
+	run("mbf.telnet + mccp", Telnet, True, args.lines)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,105 @@
+# Mbf, the mud bot framework - timer scheduler benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Compare apscheduler's BackgroundScheduler with mbf's built-in HeapScheduler as the backend for mbf timers.
+Thousands of interval timers are spread across a number of sessions sharing one scheduler, and run for a while. Reports:
+	startup: seconds to create the scheduler and sessions and add every timer;
+	memory: resident memory added per timer, in bytes;
+	drift: how late timers ran compared to when they were scheduled (mean, p99 and worst, in milliseconds);
+	cpu: cpu seconds used per thousand timer runs.
+Each run happens in a fresh process, so imports and memory don't carry over between them.
+Usage: python benchmarks/bench_timers.py [--counts 100,1000,5000] [--sessions 20] [--seconds 5]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def rss_kb():
+	"""The resident memory of this process, in kilobytes"""
+	with open("/proc/self/statm") as f:
+		return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def cpu_seconds():
+	t = os.times()
+	return t[0] + t[1]
+
+
+def child(backend, count, sessions, seconds):
+	"""Run one benchmark and print it's results as json"""
+	import mbf
+	from mbf.scheduler import HeapScheduler, EVENT_JOB_EXECUTED
+	base_rss = rss_kb()
+	start = time.time()
+	if backend == "builtin":
+		scheduler = HeapScheduler()
+	else:
+		from apscheduler.schedulers.background import BackgroundScheduler
+		scheduler = BackgroundScheduler()
+	bots = [mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, scheduler=scheduler) for i in range(sessions)]
+	runs = [0]
+	def tick():
+		runs[0] += 1
+	for i in range(count):
+		interval = 0.1 + (i % 10) * 0.1 # 0.1 to 1 second
+		bots[i % sessions].timer(seconds=interval, name="t{}".format(i))(tick)
+	startup = time.time() - start
+	rss = rss_kb() - base_rss
+	lags = []
+	def listener(event):
+		scheduled = event.scheduled_run_time
+		if scheduled.tzinfo is not None: # apscheduler's are aware; the built-in scheduler's are naive, in utc
+			scheduled = scheduled.replace(tzinfo=None) - scheduled.utcoffset()
+		lags.append(time.time() - ((scheduled - EPOCH).total_seconds()))
+	scheduler.add_listener(listener, EVENT_JOB_EXECUTED)
+	cpu = cpu_seconds()
+	if backend == "builtin":
+		scheduler.start(thread=True) # what mbf's trigger processor (or a host) would do between reads
+	else:
+		scheduler.start()
+	time.sleep(seconds)
+	scheduler.shutdown(wait=False)
+	cpu = cpu_seconds() - cpu
+	lags.sort()
+	n = len(lags)
+	print(json.dumps({
+		'startup': startup,
+		'bytes_per_timer': rss * 1024.0 / count,
+		'runs': runs[0],
+		'mean_ms': sum(lags) / n * 1000 if n else 0,
+		'p99_ms': lags[min(n - 1, int(n * 0.99))] * 1000 if n else 0,
+		'max_ms': lags[-1] * 1000 if n else 0,
+		'cpu_per_1000': cpu / runs[0] * 1000 if runs[0] else 0,
+	}))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--counts", default="100,1000,5000")
+	parser.add_argument("--sessions", type=int, default=20)
+	parser.add_argument("--seconds", type=float, default=5)
+	parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		return child(args.child[0], int(args.child[1]), args.sessions, args.seconds)
+	print("%12s %8s %10s %14s %8s %10s %10s %10s %12s" % ("backend", "timers", "startup s", "bytes/timer", "runs", "mean ms", "p99 ms", "max ms", "cpu s/1000"))
+	for count in [int(c) for c in args.counts.split(",")]:
+		for backend in ("apscheduler", "builtin"):
+			out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", backend, str(count), "--sessions", str(args.sessions), "--seconds", str(args.seconds)])
+			r = json.loads(out.decode("utf-8").strip().splitlines()[-1])
+			print("%12s %8d %10.3f %14.0f %8d %10.3f %10.3f %10.3f %12.4f" % (backend, count, r['startup'], r['bytes_per_timer'], r['runs'], r['mean_ms'], r['p99_ms'], r['max_ms'], r['cpu_per_1000']))
+			sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,162 @@
+# Mbf, the mud bot framework - trigger benchmark
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Replay a combat heavy session (generated, or recorded with replay.py) through mbf's trigger processing, at 10, 100 and 1000 triggers.
+Reports:
+	lines/sec for the compiled trigger set, and for the old engine that tried every trigger against every buffer;
+	the average and worst per-trigger cost of matching one line;
+	end to end reaction latency over a real socket, from the mud sending a line to the trigger function running.
+Usage: python benchmarks/bench_triggers.py [--counts 10,100,1000] [--lines 50000] [--transcript FILE]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mbf
+from mbf.telnet import Telnet
+import replay
+
+
+class NaiveTriggerSet(object):
+	"""The trigger processing mbf used to do: every enabled trigger, in order, searched the whole buffer, then split it into lines again to fire"""
+
+	def __init__(self, triggers):
+		self.triggers = sorted(triggers, key=lambda t: t.sequence)
+		self.dirty = False
+		self.cache = None
+
+	# the rest of TriggerSet's interface that handle_lines uses, which the old engine didn't have
+	def scan(self, lines):
+		return None
+
+	def track_blocks(self, new):
+		pass
+
+	def filter_lines(self, lines, scanned=None):
+		return lines
+
+	def process_lines(self, lines, block=None, colours=None, scanned=None):
+		buff = "\n".join(lines)
+		for t in self.triggers:
+			if t.enabled and t.matches(buff):
+				if t.fire(buff):
+					return t
+		return None
+
+
+def make_triggers(m, n, counter):
+	"""Add n triggers to m: a handful that match the generated session, and the rest a mix of regexps and plain text that mostly don't, like a bot's item and mob recognition triggers"""
+	def hit(t, match):
+		counter[0] += 1
+	m.trigger(r"""hits you with""", name="hit")(hit)
+	m.trigger(r"""^<(?P<hp>\d+)hp (?P<mp>\d+)mp""", name="prompt")(hit)
+	m.trigger(r"""(?P<name>\w+) tells you, '(?P<message>.+)'""", name="tell")(hit)
+	m.trigger("""you are hungry""", is_regexp=False, case_sensitive=False, name="hungry")(hit)
+	for i in range(n - 4):
+		kind = i % 20
+		if kind < 12:
+			m.trigger(r"""(?P<who>\w+) gives you a (?P<item>\w+ item{})""".format(i), name="t{}".format(i))(hit)
+		elif kind < 17:
+			m.trigger("""A shimmering mob{} arrives""".format(i), is_regexp=False, name="t{}".format(i))(hit)
+		elif kind < 19:
+			m.trigger(r"""you feel (?:very )?tired{}""".format(i), case_sensitive=False, name="t{}".format(i))(hit)
+		else: # no literal to prefilter on
+			m.trigger(r"""^(\w+) (?:hits|misses) (\w+) \d{{{}}}$""".format(i % 5 + 1), name="t{}".format(i))(hit)
+
+
+def new_mbf():
+	return mbf.Mbf("127.0.0.1", {}, autoconnect=False, auto_login=False)
+
+
+def throughput(transcript, n, naive):
+	m = new_mbf()
+	counter = [0]
+	make_triggers(m, n, counter)
+	if naive:
+		m.trigger_set = NaiveTriggerSet(m.triggers)
+	else:
+		m.trigger_set.compile()
+	lines = [0]
+	handle_lines = m.handle_lines
+	def count(l):
+		lines[0] += len(l)
+		handle_lines(l)
+	m.handle_lines = count
+	took = replay.replay(m, transcript)
+	return lines[0] / took, counter[0]
+
+
+def per_trigger_cost(transcript, n, sample=5000):
+	"""Time each trigger's matches() against each of a sample of lines on it's own; returns (average, worst trigger, it's cost) in microseconds per line"""
+	m = new_mbf()
+	make_triggers(m, n, [0])
+	data = b"".join(chunk for delay, chunk in transcript)
+	lines = data.splitlines()[:sample]
+	costs = []
+	for t in m.triggers:
+		start = time.time()
+		for l in lines:
+			t.matches(l)
+		costs.append(((time.time() - start) / len(lines) * 1e6, t))
+	costs.sort(key=lambda c: c[0])
+	return sum(c for c, t in costs) / len(costs), costs[-1][1], costs[-1][0]
+
+
+def latency(transcript, n, pings=200, speed=20.0):
+	"""Replay the transcript over a socket with it's timing sped up, sending a PING line with the time it was sent every so often; returns the sorted reaction latencies in milliseconds"""
+	mud, bot = socket.socketpair()
+	m = new_mbf()
+	make_triggers(m, n, [0])
+	latencies = []
+	@m.trigger(r"""^PING (\S+)""")
+	def ping(t, match):
+		latencies.append((time.time() - float(match.group(1))) * 1000)
+	m.tn = Telnet()
+	m.tn.sock = bot
+	m.read_very_eager = m.tn.read_very_eager
+	m.start_processing()
+	every = max(1, len(transcript) // pings)
+	for i, (delay, chunk) in enumerate(transcript):
+		if delay:
+			time.sleep(delay / speed)
+		mud.sendall(chunk)
+		if i % every == 0:
+			mud.sendall(("PING %f\r\n" % time.time()).encode("ascii"))
+		if len(latencies) >= pings:
+			break
+	time.sleep(0.5)
+	m.stop_processing()
+	mud.close()
+	return sorted(latencies)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--counts", default="10,100,1000")
+	parser.add_argument("--lines", type=int, default=50000)
+	parser.add_argument("--transcript", help="a transcript recorded with replay.py, instead of a generated one")
+	args = parser.parse_args()
+	if args.transcript:
+		transcript = replay.load_transcript(args.transcript)
+	else:
+		transcript = replay.generate(args.lines)
+	print("%8s %14s %14s %8s %10s %24s %10s %10s" % ("triggers", "lines/s", "naive lines/s", "hits", "us/line", "worst trigger (us)", "p50 ms", "p99 ms"))
+	for n in [int(c) for c in args.counts.split(",")]:
+		rate, hits = throughput(transcript, n, False)
+		naive_rate, naive_hits = throughput(transcript, n, True)
+		avg, worst, worst_cost = per_trigger_cost(transcript, n)
+		lat = latency(transcript, n)
+		p50 = lat[len(lat) // 2] if lat else float("nan")
+		p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))] if lat else float("nan")
+		print("%8d %14.0f %14.0f %8s %10.2f %24s %10.3f %10.3f" % (n, rate, naive_rate, hits if hits == naive_hits else "%d/%d" % (hits, naive_hits), avg, "%s (%.2f)" % (worst.name, worst_cost), p50, p99))
+		sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	main()
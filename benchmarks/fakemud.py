@@ -0,0 +1,173 @@
+# Mbf, the mud bot framework - a stand-in mud server for benchmarks and tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import select
+import socket
+import threading
+import time
+import zlib
+
+IAC = b"\xff"
+WILL = b"\xfb"
+DO = b"\xfd"
+SB = b"\xfa"
+SE = b"\xf0"
+MCCP2 = b"\x56"
+MCCP3 = b"\x57"
+
+
+class FakeMud(object):
+	def __init__(self, greeting="Welcome to the fake mud!\r\n", mccp=False, mccp3=False):
+		"""A tiny local server that mbf can connect to in place of a real mud.
+		Every client that connects is sent greeting; after that, use send or broadcast to send them data. Whatever clients send is kept in 'received'.
+		If mccp is set, clients are offered MCCP2, and what's sent to the ones that accept is compressed.
+		If mccp3 is set, clients are offered MCCP3, and what the ones that start it send is decompressed before it's kept.
+		"""
+		self.greeting = greeting
+		self.mccp = mccp
+		self.mccp3 = mccp3
+		self.compressors = {} # client socket: zlib compressor, for clients using MCCP2
+		self.decompressors = {} # client socket: zlib decompressor, for clients using MCCP3
+		self.bytes_sent = 0
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server.bind(("127.0.0.1", 0))
+		self.server.listen(1024)
+		self.port = self.server.getsockname()[1]
+		self.clients = []
+		self.received = []
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(name="fakemud", target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		while not self.stopped.is_set():
+			with self.lock:
+				socks = [self.server] + self.clients
+			try:
+				r, w, e = select.select(socks, [], [], 0.1)
+			except (select.error, socket.error, ValueError): # closed while we waited
+				if self.stopped.is_set():
+					break
+				continue
+			for s in r:
+				if s is self.server:
+					try:
+						c, addr = self.server.accept()
+					except socket.error:
+						continue
+					if self.mccp:
+						c.sendall(IAC + WILL + MCCP2)
+					if self.mccp3:
+						c.sendall(IAC + WILL + MCCP3)
+					c.sendall(self.greeting)
+					with self.lock:
+						self.clients.append(c)
+					continue
+				try:
+					data = s.recv(65536)
+				except socket.error:
+					data = ""
+				if data:
+					data = self.decompress(s, data)
+					self.received.append(data)
+					if IAC + DO + MCCP2 in data and s not in self.compressors:
+						s.sendall(IAC + SB + MCCP2 + IAC + SE)
+						self.compressors[s] = zlib.compressobj()
+				else:
+					with self.lock:
+						if s in self.clients:
+							self.clients.remove(s)
+
+	def decompress(self, c, data):
+		"""What a client sent, decompressed if it's using MCCP3"""
+		d = self.decompressors.get(c)
+		if d is not None:
+			return d.decompress(data)
+		start = IAC + SB + MCCP3 + IAC + SE
+		if self.mccp3 and start in data: # everything after this is compressed
+			before, after = data.split(start, 1)
+			d = self.decompressors[c] = zlib.decompressobj()
+			return before + d.decompress(after)
+		return data
+
+	def wait_for(self, text, timeout=10):
+		"""Wait until text is somewhere in what the clients have sent; returns true if it arrived"""
+		end = time.time() + timeout
+		while time.time() < end:
+			if text in b"".join(self.received):
+				return True
+			time.sleep(0.01)
+		return False
+
+	def drop(self, client):
+		"""Close the connection to one client (an index into clients), as a mud rebooting would"""
+		with self.lock:
+			c = self.clients.pop(client)
+		c.close()
+
+	def wait_for_clients(self, n, timeout=30):
+		"""Wait until n clients are connected"""
+		end = time.time() + timeout
+		while len(self.clients) < n and time.time() < end:
+			time.sleep(0.01)
+
+	def send(self, client, data):
+		"""Send data to one client (an index into clients)"""
+		self.write(self.clients[client], data)
+
+	def write(self, c, data):
+		"""Send data to a client socket, compressed if it's using MCCP2"""
+		z = self.compressors.get(c)
+		if z is not None:
+			data = z.compress(data) + z.flush(zlib.Z_SYNC_FLUSH)
+		self.bytes_sent += len(data)
+		c.sendall(data)
+
+	def broadcast(self, data):
+		"""Send data to every connected client"""
+		with self.lock:
+			clients = list(self.clients)
+		for c in clients:
+			try:
+				self.write(c, data)
+			except socket.error:
+				pass
+
+	def close(self):
+		self.stopped.set()
+		with self.lock:
+			for c in self.clients:
+				c.close()
+			self.clients = []
+		self.server.close()
+		self.thread.join()
+
+
+def main():
+	"""Run a fake mud in it's own process, so it doesn't count against the cpu time of a benchmark.
+	Prints the port it's listening on, then (if a rate is given) sends every client that many lines a second until killed.
+	"""
+	import argparse
+	import sys
+	parser = argparse.ArgumentParser(description=main.__doc__)
+	parser.add_argument("--rate", type=float, default=0, help="lines per second sent to each client")
+	parser.add_argument("--mccp", action="store_true", help="offer clients MCCP2 compression")
+	args = parser.parse_args()
+	mud = FakeMud(mccp=args.mccp)
+	sys.stdout.write("%d\n" % mud.port)
+	sys.stdout.flush()
+	n = 0
+	while True:
+		if args.rate:
+			mud.broadcast("Orc hits you with a mighty blow! (%d)\r\n<100hp 50mp 80mv> " % n)
+			n += 1
+			time.sleep(1.0 / args.rate)
+		else:
+			time.sleep(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,161 @@
+# Mbf, the mud bot framework - session recording and replay
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""Record the data a mud sends, with it's real chunk boundaries and timing, and replay it into mbf without a network.
+A transcript is a list of (delay, chunk) tuples, delay being the seconds since the previous chunk arrived. On disk, each chunk is a line with it's delay and length, followed by the chunk itself.
+Usage: python benchmarks/replay.py record HOST PORT SECONDS FILE
+"""
+
+import random
+import select
+import socket
+import sys
+import time
+
+
+def save_transcript(transcript, path):
+	with open(path, "wb") as f:
+		for delay, chunk in transcript:
+			f.write(("%f %d\n" % (delay, len(chunk))).encode("ascii"))
+			f.write(chunk)
+
+
+def load_transcript(path):
+	transcript = []
+	with open(path, "rb") as f:
+		while True:
+			header = f.readline()
+			if not header:
+				break
+			delay, length = header.split()
+			transcript.append((float(delay), f.read(int(length))))
+	return transcript
+
+
+def record(host, port, seconds):
+	"""Connect to a mud and record everything it sends for the given number of seconds.
+	Nothing is sent, so this captures the login screen and whatever is broadcast; for a real session, record through a proxy or add your own login here.
+	"""
+	sock = socket.create_connection((host, port))
+	transcript = []
+	last = time.time()
+	end = last + seconds
+	while time.time() < end:
+		r, w, e = select.select([sock], [], [], end - time.time())
+		if r:
+			chunk = sock.recv(65536)
+			if not chunk:
+				break
+			now = time.time()
+			transcript.append((now - last, chunk))
+			last = now
+	sock.close()
+	return transcript
+
+
+COMBAT = [
+	"The orc hits you with a mighty blow!",
+	"You slash the orc. It screams in pain.",
+	"The orc misses you.",
+	"You parry the orc's attack.",
+	"<{hp}hp {mp}mp 80mv> ",
+]
+CHATTER = [
+	"Dernan tells you, 'how's the hunting going?'",
+	"[gossip] Kara: anyone selling a longsword?",
+	"A small goblin arrives from the north.",
+	"The goblin leaves south.",
+	"You are hungry.",
+]
+ROOM = [
+	"The Great Hall",
+	"   Tall pillars line the walls of this vast hall. Torches flicker in",
+	"their sconces, casting long shadows across the worn stone floor.",
+	"Exits: north south east",
+]
+
+
+def generate(lines=100000, seed=1, combat=0.7, chunk_size=(64, 1500), delay=(0.0, 0.02)):
+	"""Generate a transcript of a combat heavy session: mostly combat rounds and prompts, with some chatter and rooms.
+	Chunk boundaries are random, so lines are often split between chunks, like they are on a real connection.
+	"""
+	rnd = random.Random(seed)
+	out = []
+	n = 0
+	while n < lines:
+		r = rnd.random()
+		if r < combat:
+			block = COMBAT
+		elif r < combat + (1 - combat) / 2:
+			block = [rnd.choice(CHATTER)]
+		else:
+			block = ROOM
+		for l in block:
+			out.append(l.format(hp=rnd.randint(1, 100), mp=rnd.randint(1, 50)))
+		n += len(block)
+	data = "\r\n".join(out).encode("latin-1") + b"\r\n"
+	transcript = []
+	i = 0
+	while i < len(data):
+		size = rnd.randint(chunk_size[0], chunk_size[1])
+		transcript.append((rnd.uniform(delay[0], delay[1]), data[i:i+size]))
+		i += size
+	return transcript
+
+
+class FakeTelnet(object):
+	def __init__(self, transcript):
+		"""Stands in for mbf.telnet.Telnet; each read returns the next chunk of a transcript, then EOFError when it runs out"""
+		self.chunks = [chunk for delay, chunk in transcript]
+		self.i = 0
+		self.eof = False
+
+	def read_very_eager(self):
+		if self.i >= len(self.chunks):
+			self.eof = True
+			raise EOFError
+		chunk = self.chunks[self.i]
+		self.i += 1
+		return chunk
+
+	def read_with_marks(self):
+		return self.read_very_eager(), []
+
+	def read_oob(self):
+		return []
+
+	def write(self, data):
+		pass
+
+	def close(self):
+		pass
+
+
+def replay(m, transcript):
+	"""Feed a transcript into an Mbf instance as fast as possible, as if it were read from the socket; returns the seconds it took.
+	The instance shouldn't be connected; this replaces it's connection.
+	"""
+	m.tn = FakeTelnet(transcript)
+	m.read_very_eager = m.tn.read_very_eager
+	start = time.time()
+	try:
+		while True:
+			m.handle_read()
+	except EOFError:
+		pass
+	m.handle_lines(m.line_buffer.check_idle(time.time() + 3600)) # whatever partial line is left
+	return time.time() - start
+
+
+def replay_timed(sock, transcript, speed=1.0):
+	"""Write a transcript to a socket with it's original timing (divided by speed); used to drive a real connection"""
+	for delay, chunk in transcript:
+		if delay:
+			time.sleep(delay / speed)
+		sock.sendall(chunk)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) != 6 or sys.argv[1] != "record":
+		sys.exit(__doc__)
+	save_transcript(record(sys.argv[2], int(sys.argv[3]), float(sys.argv[4])), sys.argv[5])
@@ -1 +1,2 @@
-from mbf import Mbf
\ No newline at end of file
+from mbf import Mbf
+from sendqueue import URGENT, NORMAL, BULK
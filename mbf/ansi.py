@@ -0,0 +1,153 @@
+# Mbf, the mud bot framework - ANSI escape stripping
+# Author: Blake Oliver <oliver22213@me.com>
+
+import re
+
+from line import Line
+
+NAMES = ('black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white')
+
+KEEP = object() # a colour a sequence doesn't change
+FINAL_SGR = (b"m", u"m") # the final character of the sequences that set colours
+
+# CSI sequences (ESC [ ... final), OSC sequences (ESC ] ... ended by BEL or ST), and two character escapes
+SEQUENCE = r"""\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)?|[@-Z\\-_])"""
+
+
+def colour_name(n):
+	"""The name of one of the 16 basic colours (0-7, or 8-15 for their bright versions), or the number itself for the rest of the 256"""
+	if n < 8:
+		return NAMES[n]
+	if n < 16:
+		return "bright_" + NAMES[n - 8]
+	return n
+
+
+def sgr_code(fg=None, bg=None):
+	"""The escape sequence that sets the given colours (names as in AnsiStripper's spans), as text; unset ones are left as they are"""
+	params = []
+	for c, base in ((fg, 30), (bg, 40)):
+		if c is None:
+			continue
+		if isinstance(c, int):
+			params.append("{};5;{}".format(base + 8, c))
+		elif c.startswith("#"):
+			params.append("{};2;{};{};{}".format(base + 8, int(c[1:3], 16), int(c[3:5], 16), int(c[5:7], 16)))
+		elif c.startswith("bright_"):
+			params.append(str(base + 60 + NAMES.index(c[7:])))
+		else:
+			params.append(str(base + NAMES.index(c)))
+	return "\x1b[" + ";".join(params) + "m"
+
+RESET = "\x1b[0m"
+
+
+def colour_at(spans, pos):
+	"""Return the (fg, bg) colours of the character at pos in a stripped line, given the line's spans (see AnsiStripper.strip). Colours the mud didn't set are none."""
+	fg = bg = None
+	if spans:
+		for start, f, b in spans: # there are only ever a few
+			if start > pos:
+				break
+			fg, bg = f, b
+	return fg, bg
+
+
+class AnsiStripper(object):
+	def __init__(self):
+		"""Strips ANSI (VT100) escape sequences from lines, once, as they come in, keeping track of what colour each part of each line was.
+		A line's colours are returned as a short list of spans: (position, fg, bg) tuples for every place the colour changes, in positions of the stripped line; a line all in the default colour has none.
+		Colours are the names of the basic ones ('red', or 'bright_red' for the bright version), the number of one of the 256 colour palette's others, or "#rrggbb" for 24 bit colour; unset colours are none.
+		Colour carries over from one line to the next, like it does on a terminal, so a stripper should see every line of a session, in order. Bold and other attributes aren't kept; muds that show bright colours as bold ones will show as the ordinary colour.
+		"""
+		self.fg = None
+		self.bg = None
+		self.text = re.compile(SEQUENCE)
+		self.binary = re.compile(SEQUENCE.encode("ascii"))
+		self.carried = None # the spans of a line without escapes, in the current colour
+		self.effects = {} # sgr parameters: what they do, since muds use the same few over and over
+
+	def strip(self, line):
+		"""Return (line without escape sequences, colour spans or none). Lines without an escape are returned as they are."""
+		binary = isinstance(line, bytes)
+		if (b"\x1b" if binary else u"\x1b") not in line:
+			return line, self.carried
+		# split does the searching in one call: the text between sequences, with each sequence's parameters and final character (none for ones that aren't CSI) in between
+		pieces = (self.binary if binary else self.text).split(line)
+		spans = list(self.carried) if self.carried else []
+		effects = self.effects
+		fg, bg = self.fg, self.bg
+		length = len(pieces[0])
+		for i in range(1, len(pieces), 3):
+			if pieces[i + 1] in FINAL_SGR:
+				params = pieces[i]
+				effect = effects.get(params)
+				if effect is None:
+					if len(effects) > 1000: # 24 bit colour can make no end of them
+						effects.clear()
+					effect = effects[params] = sgr_effect(params if isinstance(params, type(u"")) else params.decode("ascii"))
+				if effect[0] is not KEEP:
+					fg = effect[0]
+				if effect[1] is not KEEP:
+					bg = effect[1]
+				if spans and spans[-1][0] == length: # several sequences in a row; only the last one counts
+					spans.pop()
+				if (spans[-1][1:] if spans else (None, None)) != (fg, bg):
+					spans.append((length, fg, bg))
+			length += len(pieces[i + 2])
+		plain = (b"" if binary else u"").join(pieces[::3])
+		if isinstance(line, Line):
+			plain = Line(plain, None)
+		self.fg, self.bg = fg, bg
+		self.carried = [(0, fg, bg)] if (fg, bg) != (None, None) else None
+		return plain, spans or None
+
+	def strip_lines(self, lines):
+		"""Strip a list of lines; returns (stripped lines, list of each one's spans), or (lines, None) if none of them had any colour"""
+		stripped = []
+		colours = []
+		coloured = False
+		for l in lines:
+			plain, spans = self.strip(l)
+			stripped.append(plain)
+			colours.append(spans)
+			if spans:
+				coloured = True
+		return stripped, (colours if coloured else None)
+
+
+def sgr_effect(params):
+	"""Work out what a Select Graphic Rendition sequence's parameters do to the colours: returns (fg, bg), either of which is KEEP if the sequence leaves it alone"""
+	fg = bg = KEEP
+	codes = [int(p) if p.isdigit() else 0 for p in params.replace(":", ";").split(";")] if params else [0]
+	i = 0
+	while i < len(codes):
+		c = codes[i]
+		if c == 0:
+			fg = bg = None
+		elif 30 <= c <= 37:
+			fg = NAMES[c - 30]
+		elif 90 <= c <= 97:
+			fg = "bright_" + NAMES[c - 90]
+		elif 40 <= c <= 47:
+			bg = NAMES[c - 40]
+		elif 100 <= c <= 107:
+			bg = "bright_" + NAMES[c - 100]
+		elif c == 39:
+			fg = None
+		elif c == 49:
+			bg = None
+		elif c in (38, 48): # extended colours
+			colour = None
+			if i + 2 < len(codes) and codes[i + 1] == 5:
+				colour = colour_name(codes[i + 2])
+				i += 2
+			elif i + 4 < len(codes) and codes[i + 1] == 2:
+				colour = "#{:02x}{:02x}{:02x}".format(*codes[i + 2:i + 5])
+				i += 4
+			if c == 38:
+				fg = colour
+			else:
+				bg = colour
+		i += 1
+	return fg, bg
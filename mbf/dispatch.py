@@ -0,0 +1,166 @@
+# Mbf, the mud bot framework - trigger function dispatcher
+# Author: Blake Oliver <oliver22213@me.com>
+
+import logging
+import threading
+import time
+
+from stats import clock
+
+try:
+	import Queue as queue
+except ImportError: # python 3
+	import queue
+
+
+class Dispatcher(object):
+	def __init__(self, workers=4, max_queue=1000):
+		"""Runs trigger functions on worker threads, so a slow one doesn't hold up reading from the mud.
+		Matching still happens on the thread reading from the socket; what it produces (each matching trigger with the calls it should make, in order of sequence) is handed to a single 'ordered' thread, which calls ordinary triggers one after another and honors stop_processing exactly like inline processing does.
+		Triggers with async_ok set are passed on from there to a pool of worker threads and can run at the same time as each other and later triggers. What they return is ignored, since the triggers after them may already have run, so they never stop processing (or count as stops in their trigger's statistics); the time they take counts towards fire_time like any other trigger's.
+		Whether a trigger is enabled is checked again when it's turn comes, so one disabled by an earlier trigger's function (or anything else) after the buffer was matched isn't fired, just as with inline processing; async_ok triggers are checked when they're handed to the pool.
+		Both queues are bounded; when they're full the reading thread waits, which stops it reading the socket and lets the mud's output back up in the connection instead of in memory.
+		Args:
+			workers: The number of threads running async_ok triggers.
+			max_queue: How many buffers (for the ordered thread) or calls (for the workers) can wait before reading stops.
+		"""
+		self.log = logging.getLogger("mbf.dispatch")
+		self.log.addHandler(logging.NullHandler())
+		self.workers = workers
+		self.ordered = queue.Queue(max_queue)
+		self.pool = queue.Queue(max_queue)
+		self.stopped = threading.Event()
+		self.threads = []
+		self.lock = threading.Lock()
+		self.reset_stats()
+
+	def reset_stats(self):
+		"""Zero the backpressure metrics"""
+		with self.lock:
+			self.calls = 0 # trigger functions run
+			self.call_time = 0.0 # total seconds spent in them
+			self.max_call_time = 0.0
+			self.wait_time = 0.0 # total seconds calls waited in a queue before being run
+			self.max_wait_time = 0.0
+			self.max_depth = 0 # deepest either queue has been
+			self.blocked = 0 # times submit had to wait for room in the queue
+
+	def start(self):
+		"""Start the ordered thread and the worker pool, if they aren't running"""
+		if self.threads and not self.stopped.is_set():
+			return
+		for t in self.threads: # let threads from before a stop finish, so there's never more than one ordered thread
+			if t is not threading.current_thread():
+				t.join()
+		self.threads = []
+		self.stopped.clear()
+		self.threads.append(threading.Thread(name="trigger_dispatch", target=self.run_ordered))
+		for i in range(self.workers):
+			self.threads.append(threading.Thread(name="trigger_worker_{}".format(i), target=self.run_pool))
+		for t in self.threads:
+			t.daemon = True
+			t.start()
+
+	def stop(self, timeout=None):
+		"""Tell the threads to finish what's queued and exit, waiting at most timeout seconds for each of them (unless it's the thread calling stop)"""
+		self.stopped.set()
+		for t in self.threads:
+			if t is not threading.current_thread():
+				t.join(timeout)
+
+	def put(self, q, item):
+		"""Put an item on one of the queues, counting it if the queue is full"""
+		try:
+			q.put_nowait(item)
+		except queue.Full:
+			with self.lock:
+				self.blocked += 1
+			q.put(item) # wait for room; this is the backpressure
+		depth = q.qsize()
+		if depth > self.max_depth:
+			self.max_depth = depth
+
+	def submit(self, plan):
+		"""Queue a list of (trigger, found) tuples, as returned by TriggerSet.match_lines, to be fired in order"""
+		if plan:
+			self.put(self.ordered, (time.time(), plan))
+
+	def record(self, queued, started, finished):
+		with self.lock:
+			self.calls += 1
+			wait = started - queued
+			self.wait_time += wait
+			if wait > self.max_wait_time:
+				self.max_wait_time = wait
+			took = finished - started
+			self.call_time += took
+			if took > self.max_call_time:
+				self.max_call_time = took
+
+	def run_ordered(self):
+		"""Fire each queued plan's triggers in order, until stopped and the queue is empty"""
+		while not (self.stopped.is_set() and self.ordered.empty()):
+			try:
+				queued, plan = self.ordered.get(timeout=0.5)
+			except queue.Empty:
+				continue
+			for t, found in plan:
+				if not t.enabled: # disabled since the buffer was matched
+					continue
+				if t.async_ok:
+					for text, match in found:
+						self.put(self.pool, (time.time(), t, text, match))
+					continue
+				started = time.time()
+				st = t.stats
+				if st is not None:
+					start = clock()
+				try:
+					stp = t.call(found)
+				except Exception:
+					self.log.exception("""Error in {}""".format(t))
+					stp = False
+				self.record(queued, started, time.time())
+				if st is not None:
+					st.fire_time += clock() - start
+					if stp:
+						st.stops += 1
+				if stp: # the trigger function returned true or the trigger has stop_processing set
+					self.log.debug("""{} stopped processing for the current buffer""".format(t))
+					break
+
+	def run_pool(self):
+		"""Run queued async_ok trigger calls, until stopped and the queue is empty"""
+		while not (self.stopped.is_set() and self.pool.empty()):
+			try:
+				queued, t, text, match = self.pool.get(timeout=0.5)
+			except queue.Empty:
+				continue
+			started = time.time()
+			st = t.stats
+			if st is not None:
+				start = clock()
+			try:
+				t.fn(text, match)
+			except Exception:
+				self.log.exception("""Error in {}""".format(t))
+			self.record(queued, started, time.time())
+			if st is not None:
+				took = clock() - start
+				with self.lock: # other workers can be running the same trigger
+					st.fire_time += took
+
+	def get_stats(self):
+		"""Return a dictionary of backpressure metrics: queue depths now and at most, calls made, average and maximum time spent waiting in a queue and running, and how often reading had to wait for room"""
+		with self.lock:
+			return {
+				'ordered_depth': self.ordered.qsize(),
+				'pool_depth': self.pool.qsize(),
+				'max_depth': self.max_depth,
+				'calls': self.calls,
+				'avg_wait': self.wait_time / self.calls if self.calls else 0.0,
+				'max_wait': self.max_wait_time,
+				'avg_call_time': self.call_time / self.calls if self.calls else 0.0,
+				'max_call_time': self.max_call_time,
+				'blocked': self.blocked,
+			}
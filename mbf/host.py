@@ -0,0 +1,245 @@
+# Mbf, the mud bot framework - multi-session host
+# Author: Blake Oliver <oliver22213@me.com>
+
+import functools
+import logging
+import select
+import socket
+import threading
+import time
+
+from scheduler import HeapScheduler, new_scheduler
+
+
+class Host(object):
+	def __init__(self, scheduler=None, poll_interval=0.5, timer_backend="apscheduler"):
+		"""Runs any number of mbf sessions in one thread.
+		Instead of each Mbf instance having it's own trigger processor thread, send queue thread and scheduler, every session added to a host is read from by a single thread waiting on all of their sockets at once (with epoll where it's available), and all of their timers share one scheduler. The same thread writes each session's send queue, when it has commands ready and it's socket can take them.
+		Triggers can be defined once on the host with it's 'trigger' decorator and they'll be added to every session; each session still has it's own 'g' dictionary, and it's own enabled and disabled triggers.
+		An exception raised while processing a session (by one of it's triggers, say) is logged with the session's hostname and the host carries on with the others; a session whose socket fails is treated like one the mud closed.
+		Args:
+			scheduler: The scheduler every session's timers are added to. By default the host creates one; give sessions this scheduler (host.scheduler) when creating them, with Mbf's scheduler argument.
+			poll_interval: The longest the host thread waits for data before checking whether it's been told to stop.
+			timer_backend: The kind of scheduler the host creates, if it isn't given one: "apscheduler" or "builtin" (see Mbf). The host thread runs a built-in scheduler's timers itself, between reads.
+		"""
+		self.log = logging.getLogger("mbf.host")
+		self.log.addHandler(logging.NullHandler())
+		if scheduler is None:
+			scheduler = new_scheduler(timer_backend)
+		self.scheduler = scheduler
+		self.drives_scheduler = isinstance(scheduler, HeapScheduler)
+		self.poll_interval = poll_interval
+		self.sessions = {} # file descriptor: session
+		self.shared_triggers = [] # (args, kwargs, function) for every trigger defined on the host
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = None # the host thread, once start is called
+		self.writing = set() # file descriptors being watched for room to write
+		if hasattr(select, 'epoll'):
+			self.poller = select.epoll()
+		else: # fall back to select(), which is fine for a few dozen sessions
+			self.poller = None
+		# Commands sent from other threads wake the host through a socket pair, so they're written without waiting for poll_interval
+		if hasattr(socket, 'socketpair'):
+			self.waker, self.wakeup = socket.socketpair()
+			self.waker.setblocking(False)
+			self.wakeup.setblocking(False)
+			if self.poller is not None:
+				self.poller.register(self.wakeup.fileno(), select.EPOLLIN)
+		else: # they wait for the next pass instead
+			self.waker = self.wakeup = None
+
+	def trigger(self, *t_args, **t_kwargs):
+		"""Return a decorator that adds a trigger to every session on this host, including ones added later.
+		Takes the same arguments as Mbf's 'trigger' method. Since one function serves every session, it's called with the session as it's first argument: function(m, text, match).
+		"""
+		def decorator(trigger_function):
+			if 'name' not in t_kwargs: # No name for this trigger was provided; use trigger's function name
+				t_kwargs['name'] = trigger_function.__name__
+			self.shared_triggers.append((t_args, t_kwargs, trigger_function))
+			with self.lock:
+				sessions = list(self.sessions.values())
+			for m in sessions:
+				self._add_trigger(m, t_args, t_kwargs, trigger_function)
+			return trigger_function
+		return decorator
+
+	def _add_trigger(self, m, t_args, t_kwargs, trigger_function):
+		"""Add a shared trigger to one session"""
+		m.trigger(*t_args, **dict(t_kwargs))(functools.partial(trigger_function, m))
+
+	def add(self, m, print_output=False):
+		"""Add a connected session to this host and start processing it's triggers.
+		The session should have been created with this host's scheduler.
+		"""
+		if m.host is not self: # not a session coming back after reconnecting, which already has them
+			for t_args, t_kwargs, trigger_function in self.shared_triggers:
+				self._add_trigger(m, t_args, t_kwargs, trigger_function)
+			m.host = self
+		if not self.scheduler.running:
+			self.scheduler.start()
+		m.start_processing(print_output=print_output, thread=False)
+		m.send_queue.start(thread=False, notify=self.wake) # written from the host thread from now on
+		fd = m.fileno()
+		with self.lock:
+			self.sessions[fd] = m
+		if self.poller is not None:
+			self.poller.register(fd, select.EPOLLIN)
+		self.log.debug("""Added session {} on file descriptor {}""".format(m.hostname, fd))
+
+	def remove(self, m):
+		"""Stop processing a session on this host. This doesn't disconnect it."""
+		with self.lock:
+			for fd, session in list(self.sessions.items()):
+				if session is m:
+					del self.sessions[fd]
+					self.writing.discard(fd)
+					if self.poller is not None:
+						try:
+							self.poller.unregister(fd)
+						except (IOError, OSError, ValueError): # the socket was already closed, which unregisters it
+							pass
+					break
+
+	def wake(self):
+		"""Wake the host thread, if it's waiting; sessions' send queues call this when a command is queued"""
+		if self.waker is None or threading.current_thread() is self.thread: # the host writes it before waiting again anyway
+			return
+		try:
+			self.waker.send(b"x")
+		except socket.error: # full, so the host is already due to wake up
+			pass
+
+	def watch_writes(self, sessions):
+		"""Have poll report when the sockets of the given sessions (and only those) can be written to"""
+		sessions = set(sessions)
+		with self.lock:
+			fds = set(fd for fd, m in self.sessions.items() if m in sessions)
+		if self.poller is not None:
+			for fd in fds.symmetric_difference(self.writing):
+				try:
+					self.poller.modify(fd, (select.EPOLLIN | select.EPOLLOUT) if fd in fds else select.EPOLLIN)
+				except (IOError, OSError): # closed, and about to be removed
+					pass
+		self.writing = fds
+
+	def poll(self, timeout):
+		"""Wait up to timeout seconds for any session's socket to become readable, or writable for those passed to watch_writes; return (the readable sessions, the writable ones)"""
+		if self.poller is not None:
+			events = self.poller.poll(timeout)
+			readable, writable = [], []
+			with self.lock:
+				for fd, event in events:
+					m = self.sessions.get(fd)
+					if m is None:
+						if self.wakeup is not None and fd == self.wakeup.fileno():
+							self.woken()
+						continue
+					if event & ~select.EPOLLOUT: # data, or a hangup or error, which reading finds out about
+						readable.append(m)
+					if event & select.EPOLLOUT:
+						writable.append(m)
+			return readable, writable
+		with self.lock:
+			sessions = list(self.sessions.values())
+			writing = [m for fd, m in self.sessions.items() if fd in self.writing]
+		if not sessions:
+			time.sleep(timeout)
+			return [], []
+		waiting = sessions + [self.wakeup] if self.wakeup is not None else sessions
+		r, w, e = select.select(waiting, writing, [], timeout)
+		if self.wakeup in r:
+			r.remove(self.wakeup)
+			self.woken()
+		return r, w
+
+	def woken(self):
+		try:
+			while self.wakeup.recv(4096):
+				pass
+		except socket.error: # nothing more to read
+			pass
+
+	def run(self):
+		"""Read from and process every session until stop is called. This blocks; use start to do it in a thread."""
+		self.stopped.clear()
+		while not self.stopped.is_set():
+			with self.lock:
+				sessions = list(self.sessions.values())
+			timeout = self.poll_interval
+			now = time.time()
+			writing = []
+			for m in sessions:
+				if m.line_buffer.buffer or m.logging_in(): # only sessions with a partial line waiting or a login step that can time out need waking up sooner
+					timeout = min(timeout, m.poll_timeout())
+				due = m.send_queue.due(now)
+				if due == 0:
+					writing.append(m)
+				elif due is not None: # coalescing, or held back by the rate limit
+					timeout = min(timeout, due)
+			if self.drives_scheduler:
+				due = self.scheduler.time_until_next()
+				if due is not None:
+					timeout = min(timeout, due)
+			self.watch_writes(writing)
+			readable, writable = self.poll(timeout)
+			for m in writable:
+				try:
+					m.send_queue.pump() # a broken connection calls connection_lost, which stops the session; it's removed below
+				except Exception:
+					self.log.exception("""Error writing to session {}""".format(m.hostname))
+			for m in readable:
+				try:
+					m.handle_read()
+				except EOFError: # connection is closed
+					self.log.debug("""EOF error reading from session {}""".format(m.hostname))
+					self.lost(m)
+				except socket.error: # the connection was reset
+					self.log.exception("""Error reading from session {}""".format(m.hostname))
+					self.lost(m)
+				except Exception: # a trigger or handler raised; the other sessions shouldn't suffer for it
+					self.log.exception("""Error processing session {}""".format(m.hostname))
+			now = time.time()
+			readable = set(readable)
+			for m in sessions:
+				if m.stopped.is_set(): # processing was stopped on the session itself
+					self.remove(m)
+				elif m not in readable:
+					try:
+						if m.line_buffer.buffer:
+							m.handle_lines(m.line_buffer.check_idle(now))
+						m.check_login()
+					except Exception:
+						self.log.exception("""Error processing session {}""".format(m.hostname))
+			if self.drives_scheduler:
+				self.scheduler.run_pending()
+
+	def lost(self, m):
+		"""Stop processing a session whose connection has gone, and let it reconnect"""
+		self.remove(m)
+		try:
+			m.connection_lost() # which adds it back if it reconnects
+		except Exception:
+			self.log.exception("""Error handling the lost connection of session {}""".format(m.hostname))
+
+	def start(self):
+		"""Start the scheduler and run the host in a background thread"""
+		if not self.scheduler.running:
+			self.scheduler.start()
+		t = self.thread = threading.Thread(name="mbf_host", target=self.run)
+		t.daemon = True
+		t.start()
+		return t
+
+	def stop(self, timeout=None):
+		"""Stop the host thread and shut down the scheduler.
+		Args:
+			timeout: The most seconds to wait for the host thread (started with start) to finish the pass it's on; none means as long as it takes.
+		"""
+		self.stopped.set()
+		self.wake() # rather than waiting out poll_interval
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+		self.thread = None
+		if self.scheduler.running:
+			self.scheduler.shutdown()
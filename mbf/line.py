@@ -0,0 +1,35 @@
+# Mbf, the mud bot framework - decoded lines
+# Author: Blake Oliver <oliver22213@me.com>
+
+try:
+	text_type = unicode
+	view = buffer # python 2's buffer doesn't copy, and decoding reads straight from it
+except NameError: # python 3
+	text_type = str
+	def view(data, start, length):
+		return memoryview(data)[start:start + length]
+
+
+class Line(text_type):
+	# One of these is made for every line the mud sends, so they don't get a __dict__
+	__slots__ = ('_lower',)
+
+	def __new__(cls, data, charset="utf-8", errors="replace"):
+		"""A line of text from the mud, decoded once when it's read (see Mbf's charset argument) and then shared by the login, every trigger, and whatever a trigger function does with it.
+		It's an ordinary (unicode) string, except that lower() is only worked out the first time it's called, so case insensitive triggers all share one lowercased copy of each line.
+		Args:
+			data: The line's bytes; anything with the buffer interface, so it can be decoded straight out of the line buffer without copying it first.
+			charset: The encoding the mud uses. If it's none, data is already text (a line with it's escape sequences stripped, say) and is only copied.
+			errors: What to do with bytes that aren't valid in charset: "replace" (the default) puts a replacement character in their place, "ignore" drops them, and "strict" raises UnicodeDecodeError.
+		"""
+		if charset is None:
+			self = text_type.__new__(cls, data)
+		else:
+			self = text_type.__new__(cls, data, charset, errors)
+		self._lower = None
+		return self
+
+	def lower(self):
+		if self._lower is None:
+			self._lower = text_type.lower(self)
+		return self._lower
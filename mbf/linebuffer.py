@@ -0,0 +1,103 @@
+# Mbf, the mud bot framework - line buffer
+# Author: Blake Oliver <oliver22213@me.com>
+
+import re
+import time
+
+from line import Line, view
+
+try:
+	basestring_ = basestring
+except NameError: # python 3
+	basestring_ = (str, bytes)
+
+
+class LineBuffer(object):
+	def __init__(self, prompts=None, timeout=0.5, charset=None, errors="replace"):
+		"""Assembles the chunks of data read from the socket into complete lines, so that a line split across two reads is still matched as one line.
+		The unfinished tail of the data is kept in a reusable buffer until the rest of it arrives.
+		A tail that never gets a newline (a prompt, usually) is let out either when it matches one of the prompt regular expressions, or after it has sat in the buffer for timeout seconds.
+		Args:
+			prompts: A list of regular expressions (compiled, or strings which will be compiled) that match partial lines which should be passed on without waiting for a newline.
+			timeout: How long, in seconds, a partial line waits for more data before it's passed on anyway. Set to none to only ever pass on complete lines and prompts.
+			charset: If this is set, lines are decoded from this encoding as they're cut out of the buffer, and returned as mbf.line.Line objects instead of bytes.
+			errors: How decoding handles bytes that aren't valid in charset (see Line).
+		"""
+		self.buffer = bytearray()
+		self.prompts = [re.compile(p) if isinstance(p, basestring_) else p for p in (prompts or []) if p is not None]
+		self.timeout = timeout
+		self.charset = charset
+		self.errors = errors
+		self.last_data = time.time() # when data was last fed in
+
+	@property
+	def tail(self):
+		"""The partial line currently waiting in the buffer"""
+		return self.line(0, len(self.buffer))
+
+	def line(self, start, end):
+		"""Cut the line between start and end out of the buffer: it's bytes, or (with a charset) the Line decoded from them, either way made straight from the buffer with no copy in between"""
+		data = view(self.buffer, start, end - start)
+		if self.charset is None:
+			return bytes(data)
+		return Line(data, self.charset, self.errors)
+
+	def feed(self, data, marks=None):
+		"""Add a chunk of data read from the socket, returning a list of the lines it completed (without their line endings).
+		If what's left over after the last newline matches a prompt, it's returned as the last line.
+		Args:
+			data: the data read from the socket.
+			marks: a list of offsets in data where the mud marked the end of a prompt (with telnet GA or EOR); a partial line ending at one of them is returned right away.
+		"""
+		if not data:
+			return []
+		if marks:
+			lines = []
+			start = 0
+			for m in marks:
+				lines.extend(self.feed(data[start:m]))
+				if self.buffer:
+					lines.append(self.flush())
+				start = m
+			lines.extend(self.feed(data[start:]))
+			return lines
+		self.last_data = time.time()
+		buf = self.buffer
+		lines = []
+		pos = 0
+		start = len(buf)
+		buf += data
+		i = buf.find(b"\n", start)
+		while i != -1:
+			end = i
+			if end > pos and buf[end-1] == 13: # strip the carriage return from \r\n
+				end -= 1
+			lines.append(self.line(pos, end))
+			pos = i + 1
+			i = buf.find(b"\n", pos)
+		if pos:
+			del buf[:pos] # keep only the unfinished tail, in place
+		if buf and self.prompts:
+			tail = self.tail
+			for p in self.prompts:
+				if p.search(tail):
+					lines.append(self.flush())
+					break
+		return lines
+
+	def flush(self):
+		"""Return the partial line in the buffer (which may be empty) and clear it"""
+		tail = self.tail
+		del self.buffer[:]
+		return tail
+
+	def check_idle(self, now=None):
+		"""Return the partial line in a list if it has waited longer than timeout for the rest of it, or an empty list otherwise."""
+		if not self.buffer or self.timeout is None:
+			return []
+		if now is None:
+			now = time.time()
+		if now - self.last_data >= self.timeout:
+			return [self.flush()]
+		return []
+
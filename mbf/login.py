@@ -0,0 +1,160 @@
+# Mbf, the mud bot framework - login state machine
+# Author: Blake Oliver <oliver22213@me.com>
+
+import logging
+import threading
+import time
+
+# states
+USERNAME, AFTER_USERNAME, AFTER_PASSWORD, DONE, FAILED = range(5)
+
+
+class Login(object):
+	def __init__(self, mud_info, credentials, send, timeout=3, on_success=None, on_failure=None):
+		"""Logs into a mud by watching the lines it sends, one at a time, instead of waiting on the connection.
+		It's fed the same lines triggers get (see feed), and only tries the regular expressions the current step is waiting for against each new line, so nothing is ever searched twice; it never blocks, so any number of them can run at once, on whatever thread is reading.
+		The steps, and what they wait for, follow mud_info exactly like Mbf describes:
+			1. pre_username is sent, then username_prompt is waited for and username_command (or the username) is sent.
+			2. username_wrong fails the login. password_prompt (if there is one) means post_username, pre_password and password_command are sent.
+				With no password_prompt or password_command, the username command is assumed to have logged in; post_username is sent and the login succeeds if username_wrong doesn't arrive within timeout.
+			3. password_wrong fails the login; password_correct succeeds. If there's no password_correct, the login succeeds if password_wrong doesn't arrive within timeout.
+			post_password is sent when the login succeeds after a password.
+		Args:
+			mud_info: Mbf's mud info dictionary, with it's regular expressions compiled.
+			credentials: A dictionary with 'username' and 'password', for filling in the commands.
+			send: A function that sends a command or list of commands to the mud.
+			timeout: The seconds to wait for each step.
+			on_success: Called with no arguments when the login succeeds.
+			on_failure: Called with a reason string when the login fails.
+		"""
+		self.log = logging.getLogger("mbf.login")
+		self.log.addHandler(logging.NullHandler())
+		self.mud_info = mud_info
+		self.credentials = credentials
+		self.send = send
+		self.timeout = timeout
+		self.on_success = on_success
+		self.on_failure = on_failure
+		self.state = None
+		self.deadline = None
+		self.expecting = [] # (regexp, function to call when it matches) for the current step
+		self.reason = None # why the login failed
+		self.done = threading.Event() # set when the login succeeds or fails
+
+	@property
+	def finished(self):
+		return self.state in (DONE, FAILED)
+
+	@property
+	def succeeded(self):
+		return self.state == DONE
+
+	def start(self, now=None):
+		"""Send the pre-username commands and start waiting for the username prompt"""
+		if self.mud_info.get('username_prompt') is None:
+			return self.fail("Auto login failed, no username prompt provided. Please add this to your info dictionary passed to the framework's constructor")
+		self.send_commands('pre_username')
+		self.wait(USERNAME, now, ('username_prompt', self.got_username_prompt))
+
+	def wait(self, state, now, *expecting):
+		"""Move to state, and wait timeout seconds for one of the (mud_info key, function) pairs in expecting"""
+		self.state = state
+		self.deadline = (now if now is not None else time.time()) + self.timeout
+		self.expecting = [(self.mud_info[k], f) for k, f in expecting if self.mud_info.get(k) is not None]
+		self.log.debug("""Login waiting for {}""".format(", ".join(k for k, f in expecting)))
+
+	def feed(self, lines, now=None):
+		"""Look at lines the mud sent, in order; returns true once the login has finished one way or the other.
+		Lines after the one that finishes a step are checked against the next step, so a whole login screen can arrive in one read.
+		"""
+		for line in lines:
+			if self.finished:
+				break
+			for regexp, f in self.expecting:
+				if regexp.search(line):
+					f(now)
+					break
+		return self.finished
+
+	def check(self, now=None):
+		"""Act on the current step timing out, if it has; returns true once the login has finished"""
+		if self.finished or self.deadline is None:
+			return self.finished
+		if now is None:
+			now = time.time()
+		if now < self.deadline:
+			return False
+		if self.state == USERNAME:
+			self.fail("Timeout while waiting for username prompt! \nThis could mean your username_prompt regular expression is incorrect or your network connection or that of the mud is too slow for the set timeout. \nMake sure your login_prompt regular expression is matching on your mud's login string, check your network connection, and try increasing the timeout value.")
+		elif self.state == AFTER_USERNAME:
+			if self.expects_password():
+				self.fail("Timeout while waiting for either the incorrect username or password prompt regular expressions to match! \nThis could mean your wrong_username or password_prompt regular expressions are not matching or your network connection or that of the mud is too slow for the set timeout. \nMake sure your wrong_username and password_prompt regular expressions are matching on your mud's strings, check your network connection, and try increasing the timeout value.")
+			else: # the username command logged us in, and nothing said it didn't
+				self.send_commands('post_username')
+				self.succeed("Assumed successful login")
+		elif self.state == AFTER_PASSWORD:
+			if self.mud_info.get('password_correct') is not None:
+				self.fail("Timeout while waiting for either the password_correct or password_wrong regular expressions to match.\rThis usually means one of them is written incorrectly. Check them, as well as the strings your mud sends, or try increasing the timeout value.")
+			else: # the password isn't incorrect and we don't know what a successful login looks like, so let's assume things worked
+				self.succeed("Assumed successful login")
+		return self.finished
+
+	def time_left(self, now=None):
+		"""Seconds until the current step times out, or none if the login has finished"""
+		if self.finished or self.deadline is None:
+			return None
+		return max(0, self.deadline - (now if now is not None else time.time()))
+
+	def expects_password(self):
+		return self.mud_info.get('password_prompt') is not None and bool(self.mud_info.get('password_command'))
+
+	def send_commands(self, key):
+		"""Send the command or commands in mud_info[key], if there are any"""
+		if self.mud_info.get(key):
+			self.log.debug("""Sending {} commands""".format(key))
+			self.send(self.mud_info[key])
+
+	def got_username_prompt(self, now):
+		self.log.debug("Matched username prompt")
+		if self.mud_info.get('username_command'):
+			self.send(self.mud_info['username_command'] % (self.credentials))
+		else: # Just send the username on it's own
+			self.send(self.credentials['username'])
+		self.wait(AFTER_USERNAME, now, ('username_wrong', self.got_username_wrong), ('password_prompt', self.got_password_prompt))
+
+	def got_username_wrong(self, now):
+		self.fail("Incorrect username.")
+
+	def got_password_prompt(self, now):
+		self.log.debug("Matched password prompt")
+		self.send_commands('post_username')
+		if not self.expects_password():
+			return self.succeed("Assumed successful login")
+		self.send_commands('pre_password')
+		self.send(self.mud_info['password_command'] % (self.credentials))
+		self.wait(AFTER_PASSWORD, now, ('password_wrong', self.got_password_wrong), ('password_correct', self.got_password_correct))
+
+	def got_password_wrong(self, now):
+		self.fail("Incorrect password.")
+
+	def got_password_correct(self, now):
+		self.succeed("Successfully logged in")
+
+	def succeed(self, message):
+		self.log.info(message)
+		if self.state == AFTER_PASSWORD:
+			self.send_commands('post_password')
+		self.state = DONE
+		self.expecting = []
+		self.done.set()
+		if self.on_success is not None:
+			self.on_success()
+
+	def fail(self, reason):
+		self.log.debug("""Login failed: {}""".format(reason))
+		self.state = FAILED
+		self.reason = reason
+		self.expecting = []
+		self.done.set()
+		if self.on_failure is not None:
+			self.on_failure(reason)
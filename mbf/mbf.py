@@ -1,25 +1,43 @@
 # Mbf, the mud bot framework
 # Author: Blake Oliver <oliver22213@me.com>
 
+import calendar
+import os
 import re
-import telnetlib
 import select
+import socket
 import sys
 import threading
 import time
 import logging
 
 
-from apscheduler.schedulers.background import BackgroundScheduler
-
 from trigger import Trigger
+from triggerset import TriggerSet
+from pack import TriggerPack, resolve_handler
+from linebuffer import LineBuffer
+from ansi import AnsiStripper
+from shard import ShardPool
+from scrollback import Scrollback
+from proxy import Proxy
+from output import OutputFilter, OutputWriter, GAG, SUBSTITUTE, HIGHLIGHT, REWRITE
+from dispatch import Dispatcher
+from sendqueue import SendQueue, URGENT, NORMAL, BULK
+from login import Login
+from reconnect import Reconnector
+from scheduler import HeapScheduler, new_scheduler, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from telnet import Telnet, GMCP, MSDP
+from stats import TriggerStats, TimerStats, format_prometheus, clock
+from oob import DataTree, Handlers, parse_gmcp, encode_gmcp, parse_msdp, encode_msdp
 from timer import Timer
+from transcript import Recorder, INBOUND, OUTBOUND
+from store import Store
 from utils import match_regexp_list, process_info_dict
 
 
 class Mbf(object):
 	
-	def __init__(self, hostname, mud_info, port=23, username=None, password=None, auto_login=True, manage_login=True, autoconnect=True, reconnect=True, timeout=3, trigger_delay=0.1):
+	def __init__(self, hostname, mud_info, port=23, username=None, password=None, auto_login=True, manage_login=True, autoconnect=True, reconnect=True, timeout=3, trigger_delay=0.1, prompts=None, prompt_timeout=0.5, scheduler=None, callback_workers=0, callback_queue=1000, mccp=True, compress_output=False, terminal_type="mbf", window_size=(80, 24), gmcp=True, msdp=True, gmcp_supports=None, collect_stats=False, send_rate=None, send_burst=10, send_coalesce=0.0, reconnect_delay=1.0, reconnect_max_delay=60.0, timer_backend="apscheduler", charset=None, charset_errors="replace", transcript=None, strip_ansi=False, output=None, output_queue=10000, line_cache=0, match_processes=0, scrollback=1000, state=None):
 		"""Constructor for the main Mbf class
 		Args:
 			hostname: the hostname of your mud; this isn't optional for obvious reasons.
@@ -42,9 +60,40 @@ class Mbf(object):
 			Password: your mud account's password. As with username, you don't have to specify it here, but it helps if you want mbf to reconnect you and manage your logins.
 			manage_login: Should the framework worry about managing the login sequence? If set to true, the framework will use the values in the info dictionary to handle logging into the mud. Values like 'prompt_username', 'username_command', 'prompt_password', and 'password_command' are some of the values that the framework will use to correctly log in. If this is set to false, the user will need to make their own triggers for dealing with this. This is set to true by default.
 			autoconnect: automatically connect to the mud using hostname and port upon instance instantiation. This *does not* automatically log you in. Set this to false if you want to connect manually by calling connect().
+			reconnect: Reconnect (and log in again) when the connection to the mud drops, waiting a little longer after each failed attempt; triggers, timers and g are put back the way they were, and commands sent in the meantime are sent once it's back. See mbf.reconnect. True by default.
+			reconnect_delay: Roughly how many seconds to wait before the first reconnect attempt; the wait doubles (up to reconnect_max_delay) with each failure, and is randomized a little so many bots don't reconnect at the same moment.
+			reconnect_max_delay: The longest to wait between reconnect attempts.
 			auto_login: Automatically log in after connecting. Requires that username and password are set, that appropriate values are set in the info dict, and that manage_login is True, will do nothing otherwise. Set this to false if you want to manually login by running login() after running connect(). Note that login() has the same requirements, minus, of course, that this boolean be set to True.
+				Logging in after connecting doesn't wait; it happens as lines arrive once processing has started (or mbf.host is reading the connection), so many bots can log in at once. on_login is called when it's done.
 			timeout: The default timeout when expecting regular expressions from the mud. This is set to 3 seconds by default; if your network or that of the mud is slow you can increase this and mbf will wait longer when expecting.
-			trigger_delay: The amount of time for the trigger processor thread to sleep in between reading chunks of data from the socket. This is usually something you won't need to mess with; it's just here so that the CPU doesn't spike needlessly.
+			trigger_delay: The longest the trigger processor thread will wait for data before checking whether it's been told to stop. Data is processed as soon as it arrives no matter what this is set to; it only affects how often an idle bot wakes up. This is usually something you won't need to mess with.
+			prompts: A list of regular expressions matching partial lines (prompts, mostly) that should be given to triggers straight away, without waiting for a newline. By default these are the '*_prompt' items in mud_info.
+			prompt_timeout: Triggers only see complete lines; a partial line that doesn't match one of the prompts is given to them anyway after waiting this many seconds for the rest of it. Set to none to disable this.
+			scheduler: A scheduler to add this instance's timers to, usually shared with other instances (see mbf.host). Mbf won't shut a scheduler it was given down; by default every instance creates its own, when it's first needed (usually when the first timer is added), so bots without timers never create one.
+			timer_backend: The kind of scheduler an instance creates for itself: "apscheduler" (the default) for apscheduler's BackgroundScheduler, or "builtin" for mbf.scheduler.HeapScheduler, which runs timers on the trigger processor thread instead of a thread pool of it's own, starts faster and uses less memory per timer, but only supports interval and date timers.
+			callback_workers: If this is more than 0, trigger functions are run on other threads instead of the one reading from the mud, so slow ones don't hold up reading; triggers still run in order of sequence and can stop processing, except for ones with async_ok set, which are run on a pool of this many threads. See mbf.dispatch. By default (0) trigger functions run on the reading thread.
+			callback_queue: When callback_workers is set, how many buffers of data can wait for their triggers to run before mbf stops reading from the mud to let them catch up.
+			mccp: Let the mud compress what it sends (MCCP2), if it offers to. This is true by default; it saves bandwidth, and decompression is cheaper than reading the extra data.
+			compress_output: Compress what mbf sends (MCCP3), if the mud offers to accept it. False by default, since commands are small.
+			terminal_type: What mbf tells the mud it's terminal type is, if asked (TTYPE).
+			window_size: The window size, as (columns, rows), mbf tells the mud if asked (NAWS).
+			gmcp: Accept GMCP (structured data the mud sends alongside the text, like your hp or the room you're in) if the mud offers it. See the gmcp decorator.
+			msdp: Accept MSDP (like gmcp, but older) if the mud offers it. See the msdp decorator.
+			gmcp_supports: A list of the GMCP packages to ask the mud for, like ["Char 1", "Room 1"]. By default, mbf asks for the top level packages that gmcp handlers have been registered for.
+			send_rate: The most commands to send per second, on average, for muds that limit how fast commands can arrive. None (the default) means no limit. Commands sent faster than this wait in a queue, and ones sent with priority=URGENT (like the login commands) jump ahead of the rest.
+			send_burst: How many commands can go out at once (after a quiet spell) when send_rate is set; 10 by default.
+			send_coalesce: Seconds to wait for more commands before writing what's been sent, so they go out in one packet. 0 by default; commands sent while the last write was happening are joined regardless.
+			collect_stats: Count how often each trigger and timer is tried, matches and fires, and how long all of that takes; see stats(). This is false by default, in which case it costs next to nothing.
+			charset: The encoding the mud uses, like "utf-8" or "latin-1". If this is set, each line is decoded once, as it's read, into an mbf.line.Line (a unicode string that keeps it's lowercased copy for case insensitive triggers), and that same object is what the login, every trigger and trigger functions see; what's sent is encoded with it. By default (none) lines are left as the bytes the mud sent.
+			charset_errors: What decoding does with bytes that aren't valid in charset: "replace" (the default), "ignore", or "strict" (which raises an exception).
+			strip_ansi: Strip ANSI escape sequences (colours, mostly) from every line once, as it arrives, so the login, triggers and trigger functions see plain text. The colours are remembered, so triggers can match on them with their fg and bg arguments. False by default, which leaves the escapes in.
+			output: Where start_processing's print_output prints to: a file-like object, or a function given each batch of lines as one string. By default it's stdout. Printing happens on a thread of it's own (see mbf.output.OutputWriter), so a slow terminal doesn't slow triggers down; see gag, substitute, highlight and rewrite for changing what's printed.
+			output_queue: The most lines that can wait to be printed; if output falls further behind than this, the oldest lines waiting are dropped.
+			line_cache: Remember which triggers match this many of the most recently seen lines, so lines the mud repeats (prompts, combat messages, channel headers) are only matched against the triggers known to match them. See mbf.triggerset.LineCache; it's hit rate and size are in stats(). 0 (the default) turns it off.
+			match_processes: Match lines against triggers in this many worker processes, each with a share of the triggers, for bots whose triggers keep more than one core busy. Trigger functions still run in this process, in order of sequence. Needs fork (linux, or mac os). See mbf.shard. 0 (the default) matches in this process.
+			scrollback: How many of the most recent lines to keep (see mbf.scrollback), for multiline triggers with a window or a start and end to match against, and for trigger functions to look back through (as m.scrollback.last(n)). It's a fixed number of lines, so memory use doesn't grow however long the bot runs. 1000 by default.
+			state: Keep g on disk, so it survives crashes and restarts: the path of a snapshot database (sqlite) to load it from and save it to, or an mbf.store.Store. Changes are written in the background, from a log that's compacted into the snapshot, and values are only loaded when they're first used. Only setting and deleting keys is noticed; after changing a value in place, call g.touch(key). By default g is an ordinary dictionary, and is lost when the bot exits.
+			transcript: Keep a transcript of everything read from and written to the mud: the path of a file to record to (with gzip compression, a segment per minute), or an mbf.transcript.Recorder. It's written on a thread of it's own; read it back (or replay it into triggers) with mbf.transcript.Transcript.
 		"""
 		self.log = logging.getLogger("mbf")
 		self.log.addHandler(logging.NullHandler())
@@ -59,10 +108,57 @@ class Mbf(object):
 		self.timeout = timeout
 		self.trigger_delay = trigger_delay
 		self.triggers = []
+		self.scrollback = Scrollback(scrollback)
+		self.trigger_set = TriggerSet(line_cache, self.scrollback) # the triggers, compiled so they can all be matched in one pass
+		self.shards = ShardPool(self.trigger_set, match_processes, line_cache) if match_processes else None
 		self.timers = []
+		# name and group: set of triggers or timers, so they can be enabled and disabled without looking through all of them
+		self.trigger_names = {}
+		self.trigger_groups = {}
+		self.timer_names = {}
+		self.timer_groups = {}
 		self.stopped = threading.Event() # the event that when set will stop trigger processing
-		self.scheduler = BackgroundScheduler()
-		self.g = {} # global dictionary for client code to store things in
+		self.owns_scheduler = scheduler is None
+		if timer_backend not in ("apscheduler", "builtin"):
+			raise ValueError("""Unknown timer backend {}""".format(timer_backend))
+		self.timer_backend = timer_backend
+		self._scheduler = scheduler # see the scheduler property
+		self.drives_scheduler = False # whether the trigger processor runs this instance's timers; set when it's built-in scheduler is created
+		self.threaded = True # whether processing was started with it's own thread
+		if state is not None and not isinstance(state, Store):
+			state = Store(state)
+		self.g = state if state is not None else {} # global dictionary for client code to store things in
+		self.print_output = False
+		self.output = OutputWriter(output, max_pending=output_queue) # started by start_processing when it's printing
+		if prompts is None: # use the prompts from the info dict
+			prompts = [v for k, v in self.mud_info.items() if k.endswith('_prompt')]
+		self.charset = charset
+		self.charset_errors = charset_errors
+		self.line_buffer = LineBuffer(prompts, prompt_timeout, charset, charset_errors) # assembles what's read from the socket into lines
+		self.ansi = AnsiStripper() if strip_ansi else None
+		self.dispatcher = Dispatcher(callback_workers, callback_queue) if callback_workers else None
+		self.telnet_options = dict(mccp=mccp, compress_output=compress_output, terminal_type=terminal_type, window_size=window_size, gmcp=gmcp, msdp=msdp)
+		self.gmcp_supports = gmcp_supports
+		self.gmcp_data = DataTree() # the latest value of every gmcp package the mud has sent
+		self.msdp_data = DataTree() # the latest value of every msdp variable the mud has sent
+		self.gmcp_handlers = Handlers()
+		self.msdp_handlers = Handlers()
+		self.send_queue = SendQueue(self.write, rate=send_rate, burst=send_burst, coalesce=send_coalesce, on_error=self.send_failed)
+		self.login_machine = None # the login in progress, if there is one
+		self.reading_thread = None # the thread that last called handle_read; login can't wait on it
+		self.logged_in = False
+		self.processing = False # whether something is reading from the connection and running triggers
+		self.reconnector = Reconnector(self, initial_delay=reconnect_delay, max_delay=reconnect_max_delay) if reconnect else None
+		self.host = None # the mbf.host.Host reading from this instance, if there is one
+		self.connection_lock = threading.Lock()
+		self.collect_stats = collect_stats
+		self.timer_jobs = {} # job id: timer, for matching scheduler events to timers
+		if transcript is not None and not isinstance(transcript, Recorder):
+			transcript = Recorder(transcript)
+		self.transcript = transcript
+		self.proxy = None # an mbf.proxy.Proxy, once listen has been called
+		if self.collect_stats and self._scheduler is not None:
+			self.watch_timer_lag()
 		
 		if username and password:
 			self.log.debug("A username and password were both provided")
@@ -85,9 +181,11 @@ class Mbf(object):
 	def connect(self):
 		"""Method to connect to the provided host using the provided port. Method is ran automatically at class instantiation if autoconnect is set to true; also handles auto logins if that option is enabled"""
 		self.log.info("""Connecting to host {}, port {}""".format(self.hostname, self.port))
-		self.tn = telnetlib.Telnet(self.hostname, self.port)
+		self.tn = Telnet(self.hostname, self.port, **self.telnet_options)
+		self.tn.enabled_callback = self.oob_enabled
 		self.log.debug("Connection established")
-		self.connected = self.tn.eof
+		self.send_queue.start(thread=self.host is None) # a host writes the queues of it's sessions itself
+		self.connected = not self.tn.eof
 		self.log.debug("Running on_connect callback")
 		self.on_connect()
 		# some handy Telnet class local mappings (for easing client implementation and easier wrapping if necessary):
@@ -96,115 +194,179 @@ class Mbf(object):
 		self.expect = self.tn.expect
 		if self.auto_login and self.manage_login:
 			self.log.info("Automatically logging in after connecting")
-			self.login() # Start our autologin sequence
+			self.begin_login() # Start our autologin sequence; it runs as lines arrive
 	
 	def disconnect(self):
 		"""Close the telnet connection"""
 		self.log.info("Disconnected")
+		if self.reconnector is not None:
+			self.reconnector.cancel()
+		self.send_queue.stop(timeout=self.timeout) # send whatever is queued first
+		self.connected = False
 		self.tn.close()
 		self.stop_processing()
 		self.log.debug("Calling on_disconnected callback")
-		self.on_disconnect(self, True) # a deliberate disconnect
-
-	def send(self, msg, prefix = "", suffix = '\n'):
-		"""'write' to the telnet connection, with the provided prefix and suffix. The provided type can be either a string (in which case it will be sent directly), or a list of strings (which will be iterated over and sent, in the order which the items were added)."""
-		self.log.debug("""Sending to the mud: {}""".format(prefix+msg+suffix))
-		try:
-			if type(msg) == str:
-				self.tn.write(prefix+msg+suffix)
-			elif type(msg) == list:
-				for command in list:
-					self.tn.write(prefix+command+suffix)
-		except EOFError as e:
-			self.log.error("""Could not send "{}"; connection broken""".format(prefix+msg+suffix))
-			# the connection is broken
-			self.stop_processing()
+		self.on_disconnect(True) # a deliberate disconnect
+	
+	def connection_lost(self):
+		"""Called by whatever is reading from the connection (or the send queue) when the connection breaks.
+		If reconnect is set, the reconnector takes over; otherwise processing stops. Either way, on_disconnect is called (with a reconnector, before it takes over, so on_disconnect always comes before on_reconnect).
+		"""
+		with self.connection_lock:
+			if not self.connected: # already handled
+				return
+			self.connected = False
+		self.log.info("Connection lost")
+		self.send_queue.stop(flush=False) # nothing queued can be sent now
+		self.logged_in = False
+		if self.reconnector is not None:
 			self.log.debug("Calling on_disconnect callback")
-			self.on_disconnect(False)
-			return False
+			self.on_disconnect(False) # before the reconnector schedules an attempt, so on_reconnect can't come first
+			self.reconnector.connection_lost()
+			return
+		self.send_queue.clear()
+		self.stop_processing()
+		self.log.debug("Calling on_disconnect callback")
+		self.on_disconnect(False)
 	
+	def drop_connection(self):
+		"""Close the connection and stop reading from it, without reconnecting or calling on_disconnect; the scheduler keeps running. Used by the reconnector to give up on an attempt."""
+		with self.connection_lock:
+			self.connected = False
+		self.send_queue.stop(flush=False)
+		self.send_queue.clear()
+		self.stop_processing(keep_scheduler=True)
+		if self.host is not None:
+			self.host.remove(self)
+		self.tn.close()
 	
-	def login(self):
-		"""Manage logging into a mud"""
-		self.log.info("Logging in")
-		if 'username_prompt' in self.mud_info.keys() == False or self.mud_info['username_prompt'] == None:
-			self.exit("Auto login failed, no username prompt provided. Please add this to your info dictionary passed to the framework's constructor")
-		# We should be connected
-		if self.mud_info['pre_username']: # if we have commands to send before sending username_command
-			self.log.debug("Commands need to be sent before sending the username")
-			self.send(self.mud_info['pre_username']) # send them
-			self.log.debug("Done sending pre-username commands")
-		# We use telnetlib's expect method because it waits until it matches a list of regexps
-		self.log.debug("Expecting the username prompt")
-		r = self.expect([self.mud_info['username_prompt']], self.timeout)
-		self.log.debug("""Expect returned {}""".format(r))
-		if r[0] == -1 and r[1] == None: # expect timed out because username_prompt didn't match or didn't arrive within timeout
-			self.exit("Timeout while waiting for username prompt! \nThis could mean your username_prompt regular expression is incorrect or your network connection or that of the mud is too slow for the set timeout. \nMake sure your login_prompt regular expression is matching on your mud's login string, check your network connection, and try increasing the timeout value.")
+	def resume_processing(self):
+		"""Start reading from a new connection the way the old one was read: by the host, if there is one, or the trigger processor thread"""
+		if self.host is not None:
+			self.host.add(self, print_output=self.print_output)
 		else:
-			# we know it matched because if r[0] was anything other than -1, expect() didn't time out, and returned an index insead;
-			# the username prompt is the only item in the list
-			self.log.debug("Matched username prompt")
-		if self.mud_info['username_command']:
-			# Send the username command, providing the credentials dict so the user has access to username and password values
-			self.log.debug("Sending username command")
-			self.send(self.mud_info['username_command'] %(self.credentials))
-		else: # No specific command for the username
-			# Just send the username on it's own
-			self.log.debug("No specific username command was provided; just sending the username on it's own")
-			self.send(self.credentials['username'])
-		
-		l = [self.mud_info['username_wrong']] # List of regexps we think might match
-		self.log.debug("Added the wrong_username regexp to the list of regular expressions we're looking to match")
-		if self.mud_info['password_prompt']:
-			l.append(self.mud_info['password_prompt']) # We have a password prompt regexp, so we add it to the expected list of regexps
-			self.log.debug("Added the password_prompt regexp to the list of regular expressions we're looking to match")
-		self.log.debug("Expecting a regular expression")
-		# we're expecting either the username_wrong regexp, or the password_prompt one as well, if it's given
-		r = self.expect(l, self.timeout)
-		if r[0] == -1 and r[1] == None:
-			# No regular expression matched
-			if self.mud_info['password_prompt']: # a password prompt was given, but it did not match; exit
-				self.exit("Timeout while waiting for either the incorrect username or password prompt regular expressions to match! \nThis could mean your wrong_username or password_prompt regular expressions are not matching or your network connection or that of the mud is too slow for the set timeout. \nMake sure your wrong_username and password_prompt regular expressions are matching on your mud's strings, check your network connection, and try increasing the timeout value.")
-		elif l[r[0]] != self.mud_info['username_wrong']: # if the matching regexp is not username_wrong
-			self.log.debug("The regular expression matched was not the one for an incorrect username")
-			if self.mud_info['post_username']:
-				self.log.debug("Sending post-username commands")
-				self.send(self.mud_info['post_username'])
-		else: # incorrect username
-			self.exit("Incorrect username.")
-		
-		if self.mud_info['password_prompt'] and self.mud_info['password_command'] and l[r[0]] == self.mud_info['password_prompt'] and self.mud_info['password_prompt'] != None: # if we have a password prompt and command (and the prompt is not none) and the password prompt regexp matched
-			self.log.debug("Password prompt and command were given, and the matching regular expression is password_correct")
-			# First, run pre_password commands if any:
-			if self.mud_info['pre_password']:
-				self.log.debug("Running pre-password commands")
-				self.send(self.mud_info['pre_password'])
-			# The mud is requesting a password, because our password_prompt regexp matched
-			self.log.debug("Sending password command")
-			self.send(self.mud_info['password_command'] %(self.credentials)) # Send the password command
-			l = [self.mud_info['password_wrong']] # again, list of regexp(s) we expect to match
-			self.log.debug("Added the password_wrong regular expression to the list of expected matches")
-			if self.mud_info['password_correct']:
-				l.append(self.mud_info['password_correct']) # add the correct password regexp to the expected list of matches
-				self.log.debug("Added the password_correct regular expression to the list of expected matches")
-			self.log.debug("Expecting a password-related regular expression to match")
-			r = self.expect(l, self.timeout)
-			if r[0] == -1 and r[1] == None:
-				self.exit("Timeout while waiting for either the password_correct or password_wrong regular expressions to match.\rThis usually means one of them is written incorrectly. Check them, as well as the strings your mud sends, or try increasing the timeout value.")
-			elif l[r[0]] == self.mud_info['password_correct']: # the password_correct regexp matches
-				# Login successful
-				self.log.info("Successfully logged in")
-				# do successful things here
-				self.logged_in = True
-				return True # Our work is done
-			elif r[0] == -1 and r[1] == None: # the password isn't incorrect, the expect timed out and we don't know what a successful password attempt looks like, so let's assume things worked
-				# login assumed
-				self.log.info("Assumed successful login ")
-				# do successful things here
-				self.logged_in = True
+			self.start_processing(print_output=self.print_output)
+	
+	def save_state(self):
+		"""Return what the reconnector puts back after reconnecting: whether each trigger and timer is enabled, and a copy of g (unless it's a Store, which keeps itself)"""
+		return {
+			'triggers': [(t, t.enabled) for t in self.triggers],
+			'timers': [(t, t.enabled) for t in self.timers],
+			'g': dict(self.g) if not isinstance(self.g, Store) else None, # copying a store would load and rewrite every key
+		}
+	
+	def restore_state(self, state):
+		"""Put back what save_state returned. Values in g are put back on top of whatever is there now."""
+		for t, enabled in state['triggers']:
+			t.enabled = enabled
+		for t, enabled in state['timers']:
+			self.set_enabled(t, enabled)
+		if state['g'] is not None:
+			self.g.update(state['g'])
+	
+	def set_enabled(self, timer, enabled):
+		"""Enable or disable a timer, ignoring ones whose job has already been removed (one shot timers that have run, and timers that reached their run limit)"""
+		try:
+			timer.enabled = enabled
+		except KeyError: # either scheduler's JobLookupError
+			pass
+
+	def send(self, msg, prefix = "", suffix = '\n', priority=NORMAL):
+		"""Queue a command (or commands) to be sent to the mud, with the provided prefix and suffix. The provided type can be either a string (in which case it will be sent directly), or a list of strings (which will be iterated over and sent, in the order which the items were added).
+		This returns right away; the send queue writes commands on it's own thread (or, for a session on an mbf.host.Host, the host's thread does, when the socket can take them), joining ones sent close together into one write, and holding them back if send_rate is set.
+		Returns false if the connection is broken.
+		Args:
+			priority: One of mbf.URGENT, mbf.NORMAL (the default) or mbf.BULK. When commands are being held back by send_rate, more urgent ones are sent first.
+		"""
+		if not self.send_queue.running:
+			if self.reconnector is not None and self.reconnector.active: # hold it until we're back
+				for command in (msg if type(msg) == list else [msg]):
+					self.reconnector.queue(prefix+command+suffix, priority)
 				return True
-			elif l[r[0]] == self.mud_info['password_wrong']: # incorrect password regexp matched
-				self.exit("Incorrect password.")
+			self.log.error("""Could not send {!r}; not connected""".format(msg)) # repr, since text that isn't ascii can't be formatted into a python 2 str
+			return False
+		if type(msg) == list:
+			for command in msg:
+				self.log.debug("""Sending to the mud: {!r}""".format(prefix+command+suffix))
+				self.send_queue.put(prefix+command+suffix, priority)
+		else:
+			self.log.debug("""Sending to the mud: {!r}""".format(prefix+msg+suffix))
+			self.send_queue.put(prefix+msg+suffix, priority)
+		return True
+	
+	def write(self, data):
+		"""Write data to the connection right away, skipping the send queue. This is what the send queue calls to write what's been sent."""
+		if self.charset is not None and not isinstance(data, bytes):
+			data = data.encode(self.charset, self.charset_errors)
+		if self.transcript is not None:
+			self.transcript.record(OUTBOUND, data)
+		self.tn.write(data)
+	
+	def send_failed(self, error):
+		"""Called by the send queue when writing to the connection fails"""
+		self.log.error("""Sending failed; connection broken: {}""".format(error))
+		self.connection_lost()
+	
+	def begin_login(self):
+		"""Start logging into the mud, using the values in the info dictionary, and return right away.
+		The login is carried out by an mbf.login.Login fed the lines triggers see, so it moves along whenever something is reading from the connection (the trigger processor, mbf.host, or login()).
+		When it succeeds, logged_in is set and on_login is called; if it fails, on_login_failed is called with the reason.
+		Returns the Login instance.
+		"""
+		self.log.info("Logging in")
+		self.logged_in = False
+		self.login_machine = Login(self.mud_info, self.credentials, lambda commands: self.send(commands, priority=URGENT), timeout=self.timeout, on_success=self.login_succeeded, on_failure=self.login_failed)
+		self.login_machine.start()
+		return self.login_machine
+	
+	def login(self):
+		"""Manage logging into a mud, and wait until it's done; returns true if the login succeeded.
+		If processing has started, this waits for the trigger processor to carry the login out, for at most four times timeout; if it hasn't finished by then this returns false, though the login can still finish later (and call on_login or on_login_failed). Otherwise it reads from the connection itself until the login is over.
+		Calling it on the thread that reads from the mud (from a trigger function run there, or a timer mbf.host runs) would wait for itself, so that raises RuntimeError; use begin_login there.
+		"""
+		if self.processing and self.reading_thread is threading.current_thread():
+			raise RuntimeError("login() can't wait for the login on the thread that reads from the mud; use begin_login")
+		l = self.begin_login()
+		if self.processing:
+			if not l.done.wait(self.timeout * 4):
+				self.log.warning("""Gave up waiting for the login after {} seconds""".format(self.timeout * 4))
+			return l.succeeded
+		try:
+			while not l.finished:
+				timeout = self.poll_timeout()
+				r, w, e = select.select([self], [], [], timeout)
+				if r:
+					self.handle_read()
+				else:
+					self.handle_idle()
+		except EOFError:
+			l.fail("Connection closed while logging in")
+		return l.succeeded
+	
+	def logging_in(self):
+		"""Return true if a login is in progress"""
+		l = self.login_machine
+		return l is not None and not l.finished
+	
+	def check_login(self):
+		"""Let the login in progress (if any) act on it's current step timing out"""
+		l = self.login_machine
+		if l is not None and not l.finished:
+			l.check()
+	
+	def login_failed(self, reason):
+		if self.reconnector is not None and self.reconnector.active:
+			self.log.warning("""Logging in after reconnecting failed: {}""".format(reason)) # the reconnector will try again
+			self.reconnector.login_failed(reason)
+			return
+		self.on_login_failed(reason)
+	
+	def login_succeeded(self):
+		self.logged_in = True
+		self.log.debug("Calling on_login callback")
+		self.on_login()
+		if self.reconnector is not None and self.reconnector.active:
+			self.reconnector.logged_in()
 	
 	def exit(self, reason="", code=0):
 		"""Centralized exiting function"""
@@ -221,45 +383,346 @@ class Mbf(object):
 		self.stop_processing()
 		if self.connected:
 			self.disconnect()
+		if self.proxy is not None:
+			self.proxy.stop()
+		if self.transcript is not None:
+			self.transcript.close()
+		if isinstance(self.g, Store):
+			self.g.close()
 		sys.exit(code)
 	
-	def start_processing(self, print_output=False):
+	def start_processing(self, print_output=False, thread=True):
 		"""Begin trigger processing and start the scheduler
 		args:
-			print_output: Send what the mud sends to stdin before executing triggers.
+			print_output: Print what the mud sends (after output filters; see gag and substitute) before executing triggers. Lines are handed to a writer thread, so printing never holds triggers up; see the output argument.
+			thread: Start a thread to read from the socket and run triggers. Set this to false if something else (like mbf.host) will be calling handle_read and handle_idle.
 		"""
 		self.log.debug("Starting processing")
 		self.print_output = print_output
+		self.processing = True
 		self.log.debug("Sorting triggers")
 		self.triggers.sort() # put the trigger list in order of sequence
 		self.log.debug("Triggers sorted")
-		self.log.debug("Starting background scheduler")
-		self.scheduler.start()
-		self.log.debug("Background scheduler started")
+		if self.trigger_set.dirty:
+			self.log.debug("Compiling triggers")
+			self.trigger_set.compile()
+			self.log.debug("Triggers compiled")
+		self.threaded = thread
+		if self._scheduler is not None: # there are timers (or something else) to run
+			self.start_scheduler(loop=thread)
 		if self.stopped.is_set():
 			self.log.debug("Stop was set; cleared")
 			self.stopped.clear()
-		self.log.debug("Starting trigger processor thread")
-		t = threading.Thread(name="trigger_processor", target=process_triggers, args=(self,))
-		t.start()
-		self.log.debug("Trigger processor started")
+		if self.shards is not None:
+			self.log.debug("Starting trigger matching processes")
+			self.shards.start()
+		if print_output:
+			self.output.start()
+		if self.dispatcher is not None:
+			self.log.debug("Starting trigger function dispatcher")
+			self.dispatcher.start()
+		if thread:
+			self.log.debug("Starting trigger processor thread")
+			t = threading.Thread(name="trigger_processor", target=process_triggers, args=(self,))
+			t.start()
+			self.log.debug("Trigger processor started")
 		self.log.info("Processing started")	
 
-	def stop_processing(self):
-		"""Stop the scheduler and the trigger processing thread."""
+	@property
+	def scheduler(self):
+		"""The scheduler this instance's timers are added to. If one wasn't given to the constructor, it's created (see timer_backend) the first time it's needed, and started if processing already has been."""
+		if self._scheduler is None:
+			self.log.debug("""Creating {} scheduler""".format(self.timer_backend))
+			self._scheduler = new_scheduler(self.timer_backend)
+			self.drives_scheduler = isinstance(self._scheduler, HeapScheduler)
+			if self.collect_stats:
+				self.watch_timer_lag()
+			if self.processing:
+				self.start_scheduler(loop=self.threaded)
+		return self._scheduler
+	
+	def start_scheduler(self, loop=False):
+		"""Start the scheduler, if it isn't running.
+		args:
+			loop: The trigger processor thread is running, so a built-in scheduler this instance owns should have it's timers run there. Otherwise it runs them on a thread of it's own.
+		"""
+		scheduler = self.scheduler
+		if self.drives_scheduler:
+			scheduler.start(thread=not loop)
+		elif not scheduler.running:
+			self.log.debug("Starting background scheduler")
+			scheduler.start()
+			self.log.debug("Background scheduler started")
+	
+	def stop_processing(self, keep_scheduler=False):
+		"""Stop the scheduler and the trigger processing thread.
+		args:
+			keep_scheduler: Leave the scheduler running, as the reconnector does, since it's attempts are scheduled on it.
+		"""
 		self.log.debug("Stopping processing")
-		if self.scheduler.running:
+		self.processing = False
+		scheduler = self._scheduler
+		if scheduler is not None and scheduler.running and self.owns_scheduler and not keep_scheduler:
 			self.log.debug("Background scheduler is running; shutting down")
-			self.scheduler.shutdown()
+			scheduler.shutdown()
 			self.log.debug("Background scheduler shut down")
+		elif scheduler is not None and keep_scheduler and self.drives_scheduler: # nothing will be running it's timers otherwise
+			scheduler.start(thread=True)
 		if not self.stopped.is_set():
 			self.stopped.set()
 			self.log.debug("Stop flag for trigger processor set; that thread should end soon")
+		if self.dispatcher is not None:
+			self.dispatcher.stop(timeout=1.0)
+		self.output.stop(timeout=1.0)
+		if self.shards is not None:
+			self.shards.stop()
+	
+	def fileno(self):
+		"""Return the file descriptor of the connection's socket, so that an mbf instance can be passed straight to select()"""
+		return self.tn.fileno()
+	
+	def poll_timeout(self):
+		"""Return how long (in seconds) whatever is reading from this instance can wait for data before calling handle_idle"""
+		timeout = self.trigger_delay
+		lb = self.line_buffer
+		if lb.buffer and lb.timeout is not None: # a partial line is waiting to be passed on
+			timeout = min(timeout, max(0, lb.timeout - (time.time() - lb.last_data)))
+		l = self.login_machine
+		if l is not None and not l.finished: # a login step could time out
+			timeout = min(timeout, l.time_left())
+		if self.drives_scheduler:
+			due = self._scheduler.time_until_next()
+			if due is not None:
+				timeout = min(timeout, due)
+		return timeout
+	
+	def handle_read(self):
+		"""Read whatever data is waiting on the socket and process it. This should be called when the socket is readable; it won't block.
+		Raises EOFError if the connection has been closed.
+		"""
+		self.reading_thread = threading.current_thread()
+		buff, marks = self.tn.read_with_marks() # marks are where the mud said a prompt ended
+		if self.transcript is not None:
+			self.transcript.record(INBOUND, buff)
+		if self.proxy is not None:
+			self.proxy.feed(buff)
+		if self.log.isEnabledFor(logging.DEBUG): # don't format every buffer just to throw it away
+			self.log.debug("""Got buffer of data: {}""".format(buff))
+		self.handle_lines(self.line_buffer.feed(buff, marks)) # only complete lines (and prompts) come out
+		self.check_login()
+		for option, data in self.tn.read_oob(): # after the text they came with, so a handler can't run before the lines the mud sent first
+			self.handle_oob(option, data)
+	
+	def handle_idle(self):
+		"""Process a partial line that has waited long enough for the rest of it. Call this when nothing has been read for poll_timeout() seconds."""
+		self.handle_lines(self.line_buffer.check_idle())
+		self.check_login()
+	
+	def handle_lines(self, lines):
+		"""Print (if enabled, through the output filters) and run triggers on a list of complete lines"""
+		if not lines:
+			return
+		colours = None
+		if self.ansi is not None:
+			lines, colours = self.ansi.strip_lines(lines)
+		self.scrollback.extend(lines)
+		self.trigger_set.track_blocks(len(lines)) # before anything can disable a trigger or stop processing
+		l = self.login_machine
+		if l is not None and not l.finished: # the login sees lines before triggers do
+			l.feed(lines)
+		if self.shards is None:
+			matcher = self.trigger_set
+			scanned = self.trigger_set.scan(lines) # one pass over the lines finds candidates for output filters and triggers alike
+		else: # the worker processes do the matching; output filters scan for themselves
+			matcher = self.shards
+			scanned = None
+		if self.print_output:
+			shown = self.trigger_set.filter_lines(lines, scanned)
+			self.output.put([line for line in shown if line and not line.isspace()])
+		if self.dispatcher is not None: # match here, but leave running the trigger functions to the dispatcher's threads
+			self.dispatcher.submit(matcher.match_lines(lines, colours=colours, scanned=scanned))
+			return
+		# Match every enabled trigger against the lines in one pass, and fire the ones that match in order of sequence
+		t = matcher.process_lines(lines, colours=colours, scanned=scanned)
+		if t is not None: # the trigger function returned true or the trigger has stop_processing set
+			self.log.debug("""{} stopped processing for the current buffer""".format(t))
+	
+	def handle_oob(self, option, data):
+		"""Called by handle_read with each GMCP or MSDP message the telnet layer parsed, after the lines read with it; stores the values and calls their handlers.
+		A message that can't be parsed is logged and dropped, and the handlers log their own errors, so neither can stop the rest of the read being processed.
+		"""
+		try:
+			if option == GMCP:
+				messages = [parse_gmcp(data)]
+			else:
+				messages = list(parse_msdp(data).items())
+		except Exception:
+			self.log.exception("""Couldn't parse {} message {!r}""".format("gmcp" if option == GMCP else "msdp", data))
+			return
+		if option == GMCP:
+			for package, value in messages:
+				self.log.debug("""Got gmcp {}: {}""".format(package, value))
+				self.gmcp_data.update(package, value)
+				self.gmcp_handlers.dispatch(package, value)
+		else:
+			for variable, value in messages:
+				self.log.debug("""Got msdp {}: {}""".format(variable, value))
+				self.msdp_data.update(variable, value)
+				self.msdp_handlers.dispatch(variable, value)
+	
+	def oob_enabled(self, option):
+		"""Called by the telnet layer when the mud agrees to send GMCP or MSDP; asks it for what we have handlers for"""
+		if option == GMCP:
+			self.log.debug("GMCP enabled")
+			self.send_gmcp("Core.Hello", {"client": "mbf", "version": "0"})
+			supports = self.gmcp_supports
+			if supports is None:
+				supports = sorted(set(p.split(".")[0] + " 1" for p in self.gmcp_handlers.handlers))
+			if supports:
+				self.send_gmcp("Core.Supports.Set", supports)
+		elif option == MSDP:
+			self.log.debug("MSDP enabled")
+			if self.msdp_handlers.handlers:
+				self.msdp_report(*sorted(self.msdp_handlers.handlers))
+	
+	def send_gmcp(self, package, value=None):
+		"""Send a gmcp message to the mud"""
+		self.tn.send_subnegotiation(GMCP, encode_gmcp(package, value))
+	
+	def send_msdp(self, variable, value):
+		"""Send an msdp variable and value to the mud"""
+		self.tn.send_subnegotiation(MSDP, encode_msdp(variable, value))
+	
+	def msdp_report(self, *variables):
+		"""Ask the mud to send the given msdp variables whenever they change"""
+		self.send_msdp("REPORT", list(variables) if len(variables) > 1 else variables[0])
+	
+	def gmcp(self, package):
+		"""Method that returns a decorator to call a function whenever the mud sends the given gmcp package (or any package in it; 'Char' gets 'Char.Vitals' too).
+		The function is called with the package name and it's decoded value: function(package, value). The latest values are also kept in gmcp_data, so they can be looked up at any time, like m.gmcp_data.get("Char.Vitals.hp").
+		"""
+		def decorator(function):
+			self.gmcp_handlers.add(package, function)
+			return function
+		return decorator
+	
+	def msdp(self, variable):
+		"""Method that returns a decorator to call a function whenever the mud sends the given msdp variable.
+		The function is called with the variable name and it's value: function(variable, value). The latest values are also kept in msdp_data.
+		"""
+		def decorator(function):
+			self.msdp_handlers.add(variable, function)
+			return function
+		return decorator
+	
+	def watch_timer_lag(self):
+		"""Listen for the scheduler running jobs, so the lag between when each timer was scheduled to fire and when it did can be recorded"""
+		def listener(event):
+			t = self.timer_jobs.get(event.job_id)
+			if t is None or t.stats is None or t.stats.started is None:
+				return
+			scheduled = calendar.timegm(event.scheduled_run_time.utctimetuple()) + event.scheduled_run_time.microsecond / 1e6
+			t.stats.record_lag(max(0.0, t.stats.started - scheduled))
+		self.scheduler.add_listener(listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+	
+	def listen(self, port=4000, host="127.0.0.1", max_buffer=1024 * 1024, slow_clients="skip", max_clients=8, send_buffer=64 * 1024):
+		"""Let mud clients connect to this session on port (on localhost, by default) to watch what the mud sends and type commands, while triggers keep running; returns the mbf.proxy.Proxy. Lines clients type go to on_client_input.
+		A client that can't keep up skips ahead (or is disconnected, with slow_clients="drop") once it's max_buffer bytes behind, so it never holds the bot up. See mbf.proxy.Proxy for the rest.
+		"""
+		if self.proxy is not None:
+			self.proxy.stop()
+		self.proxy = Proxy(self, port, host, max_buffer=max_buffer, slow_clients=slow_clients, max_clients=max_clients, send_buffer=send_buffer)
+		self.proxy.start()
+		return self.proxy
+	
+	def stats(self):
+		"""Return the statistics collected for this instance (if it was created with collect_stats), as a dictionary:
+			triggers: trigger name: dictionary of that trigger's counters (see mbf.stats.TriggerStats). Triggers sharing a name are added together.
+			timers: timer name: dictionary of that timer's counters (see mbf.stats.TimerStats).
+			dispatcher: the dispatcher's backpressure metrics, if callback_workers is set.
+			send_queue: how many commands and writes the send queue has made, and how often the rate limit held it back.
+			reconnect: how many times the connection has been restored, how long it was down, and how long reconnecting took, if reconnect is set.
+			transcript: how much the transcript recorder has written, and how far behind it's writer has fallen, if there is one.
+			output: how many lines have been printed, in how many writes, and how many were dropped because output fell too far behind, if print_output is on.
+			line_cache: the line cache's hits, misses, hit rate, entries and roughly how many bytes they take, if line_cache is set (the matching processes' caches added together, with match_processes).
+			proxy: how many clients are attached, how much has been sent to and typed by them, and how much slow ones have skipped or how many were dropped, if listen has been called.
+			state: how many keys g has and how many have been loaded, how many changes have been written and how long that took, and how often the log has been compacted, if state is set.
+			shards: how many batches of lines the matching processes have matched, how long waiting for them took, and how often they had to be restarted or matching fell back to this process, if match_processes is set.
+		"""
+		result = {'triggers': {}, 'timers': {}}
+		for kind, objects in (('triggers', self.triggers), ('timers', self.timers)):
+			for o in objects:
+				if o.stats is None:
+					continue
+				counters = o.stats.as_dict()
+				if o.name in result[kind]: # add triggers or timers with the same name together
+					for k, v in counters.items():
+						if k.startswith('max_'):
+							result[kind][o.name][k] = max(result[kind][o.name][k], v)
+						else:
+							result[kind][o.name][k] += v
+				else:
+					result[kind][o.name] = counters
+		if self.dispatcher is not None:
+			result['dispatcher'] = self.dispatcher.get_stats()
+		result['send_queue'] = self.send_queue.get_stats()
+		if self.reconnector is not None:
+			result['reconnect'] = self.reconnector.get_stats()
+		if self.transcript is not None:
+			result['transcript'] = self.transcript.get_stats()
+		if self.print_output:
+			result['output'] = self.output.get_stats()
+		if isinstance(self.g, Store):
+			result['state'] = self.g.get_stats()
+		if self.proxy is not None:
+			result['proxy'] = self.proxy.get_stats()
+		if self.shards is not None:
+			result['shards'] = self.shards.get_stats()
+			caches = self.shards.get_cache_stats() # the workers do the matching, so they have the caches that are used
+			if caches is not None:
+				result['line_cache'] = caches
+		elif self.trigger_set.cache is not None:
+			result['line_cache'] = self.trigger_set.cache.get_stats()
+		return result
+	
+	def stats_text(self):
+		"""Return stats() in the prometheus text format"""
+		return format_prometheus(self.stats())
+	
+	def dump_stats(self, interval=60, path=None):
+		"""Every interval seconds, log the statistics at info level, or if a path is given, write them there in the prometheus text format (for node_exporter's textfile collector, for example).
+		This uses a timer, so it runs while processing is started.
+		"""
+		def dump():
+			if path is None:
+				self.log.info("""Stats: {}""".format(self.stats()))
+				return
+			tmp = path + ".tmp"
+			with open(tmp, "w") as f:
+				f.write(self.stats_text())
+			os.rename(tmp, path) # so nothing ever reads half a file
+		return self.scheduler.add_job(dump, 'interval', seconds=interval)
 	
 	def on_connect(self):
 		"""Callback that subclasses can override to do something when the connection is established to the mud."""
 		pass
 	
+	def on_login(self):
+		"""Callback that subclasses can override to do something once mbf has logged into the mud."""
+		pass
+	
+	def on_login_failed(self, reason):
+		"""Callback that subclasses can override to decide what happens when logging in fails. By default, mbf exits with reason."""
+		self.exit(reason)
+	
+	def on_reconnect(self):
+		"""Callback that subclasses can override to do something after the reconnector has reconnected, logged in, and restored triggers, timers and g."""
+		pass
+	
+	def on_reconnect_failed(self):
+		"""Callback that subclasses can override to do something when the reconnector gives up (see mbf.reconnect.Reconnector's max_attempts)."""
+		pass
+	
 	def on_disconnect(self, deliberate=False):
 		"""Callback that subclasses can override to do something when the connection to the mud gets broken.
 Args:
@@ -267,6 +730,10 @@ Args:
 		"""
 		pass
 	
+	def on_client_input(self, line):
+		"""Callback that subclasses can override to decide what happens to a line typed in a client attached with listen (to handle commands of your own, say). By default, it's sent to the mud."""
+		self.send(line)
+	
 	def trigger(self, *t_args, **t_kwargs):
 		"""Method that returns a decorator to automatically set up a trigger and associate it with a function to run when the trigger is matched
 		Code in this function gets executed immediately, not when the associated function runs.
@@ -283,58 +750,135 @@ Args:
 				t_kwargs['name'] = trigger_function.__name__
 			# Create an instance of the 'Trigger' class
 			new_trigger = Trigger(*t_args, **t_kwargs)  # provide all wrapper arguments to this 'trigger' instance
-			def wrapper(*args, **kwargs):
-				"""This function is what will be called in place of the decorated function;
-				It takes the arguments given to it and passes them on.
-				It needs to run said function and return what it does or (if it doesn't return anything), return the value of the stop_processing flag in the trigger class
-				"""
+			return self.add_trigger(new_trigger, trigger_function)
+		return decorator
+	
+	def add_trigger(self, new_trigger, trigger_function):
+		"""Associate a Trigger with the function to call when it matches, and add it to this instance; returns the function the trigger calls.
+		The trigger decorator does this for you; it's for triggers made some other way (like the ones in a trigger pack).
+		"""
+		if self.collect_stats:
+			new_trigger.stats = TriggerStats()
+		def wrapper(*args, **kwargs):
+			"""This function is what will be called in place of the decorated function;
+			It takes the arguments given to it and passes them on.
+			It needs to run said function and return what it does or (if it doesn't return anything), return the value of the stop_processing flag in the trigger class
+			"""
+			st = new_trigger.stats
+			if st is None:
 				r = trigger_function(*args, **kwargs) # call the original trigger function
-				return r or new_trigger.stop_processing
-			new_trigger.add_function(wrapper) # Associate the wrapper with the trigger object
-			# add the trigger to an internal list
-			self.triggers.append(new_trigger)
-			return wrapper
+			else:
+				start = clock()
+				r = trigger_function(*args, **kwargs)
+				st.callback_time += clock() - start
+			return r or new_trigger.stop_processing
+		new_trigger.add_function(wrapper) # Associate the wrapper with the trigger object
+		# add the trigger to an internal list, and to the compiled set that does the actual matching
+		self.triggers.append(new_trigger)
+		self.trigger_set.add(new_trigger)
+		self.trigger_names.setdefault(new_trigger.name, set()).add(new_trigger)
+		self.trigger_groups.setdefault(new_trigger.group, set()).add(new_trigger)
+		return wrapper
+	
+	def load_trigger_pack(self, path, handlers=None, cache_dir=None):
+		"""Add every trigger in a trigger pack (see mbf.pack.TriggerPack) to this instance; returns the list of triggers added.
+		The first time a pack is loaded it's compiled, and the compiled pack is cached (in cache_dir, or a __mbfcache__ directory next to the pack) for every bot that loads it afterwards, as long as the pack doesn't change.
+		Args:
+			path: The pack's json file.
+			handlers: Where to find the functions the pack's triggers name as their handler: a dictionary of functions, or an object or module with them as attributes. Handlers written as "module:function" are imported instead. Handlers are called like any trigger function, with the text and match.
+			cache_dir: Where compiled packs are kept.
+		"""
+		pack = TriggerPack.load(path, cache_dir)
+		added = []
+		functions = {} # handler name: function, since many triggers usually share a handler
+		for new_trigger, handler in pack.triggers():
+			if handler not in functions:
+				functions[handler] = resolve_handler(handler, handlers)
+			self.add_trigger(new_trigger, functions[handler])
+			added.append(new_trigger)
+		self.log.debug("""Loaded {} triggers from trigger pack {}""".format(len(added), path))
+		return added
+	
+	def add_filter(self, new_filter):
+		"""Add an output filter (see mbf.output.OutputFilter) to this instance; returns the filter. The gag, substitute, highlight and rewrite methods do this for you."""
+		if self.collect_stats:
+			new_filter.stats = TriggerStats()
+		self.triggers.append(new_filter)
+		self.trigger_set.add(new_filter)
+		self.trigger_names.setdefault(new_filter.name, set()).add(new_filter)
+		self.trigger_groups.setdefault(new_filter.group, set()).add(new_filter)
+		return new_filter
+	
+	def gag(self, pattern, **kwargs):
+		"""Don't print lines that match pattern (they still go to triggers). Takes the same keyword arguments as trigger; returns the filter, which can be enabled and disabled by name or group like a trigger."""
+		kwargs.setdefault('name', """gag {}""".format(pattern))
+		return self.add_filter(OutputFilter(pattern, GAG, **kwargs))
+	
+	def substitute(self, pattern, replacement, **kwargs):
+		"""Print every match of pattern as replacement instead: a string, which can refer to a regular expression's groups (like re.sub's), or a function given the match. Takes the same keyword arguments as trigger."""
+		kwargs.setdefault('name', """substitute {}""".format(pattern))
+		return self.add_filter(OutputFilter(pattern, SUBSTITUTE, replacement, **kwargs))
+	
+	def highlight(self, pattern, fg="yellow", bg=None, **kwargs):
+		"""Print every match of pattern in colour (names as in mbf.ansi: 'red', 'bright_red', a 256 colour number or "#rrggbb"). Takes the same keyword arguments as trigger."""
+		kwargs.setdefault('name', """highlight {}""".format(pattern))
+		return self.add_filter(OutputFilter(pattern, HIGHLIGHT, (fg, bg), **kwargs))
+	
+	def rewrite(self, pattern, **kwargs):
+		"""Return a decorator that makes a function an output filter: it's called with each line pattern matches and the match, and returns the line to print instead (or none, to gag it). Takes the same keyword arguments as trigger."""
+		def decorator(rewrite_function):
+			kwargs.setdefault('name', rewrite_function.__name__)
+			self.add_filter(OutputFilter(pattern, REWRITE, rewrite_function, **kwargs))
+			return rewrite_function
 		return decorator
 	
 	def enable_trigger(self, name):
 		"""Enable the trigger with given name"""
 		self.log.debug("Enable trigger {}".format(name))
-		[t.enable() for t in self.triggers if t.name == name]
+		for t in self.trigger_names.get(name, ()):
+			t.enable()
 	
 	def disable_trigger(self, name):
 		"""Disable the trigger with given name"""
 		self.log.debug("Disable trigger {}".format(name))
-		[t.disable() for t in self.triggers if t.name == name]
+		for t in self.trigger_names.get(name, ()):
+			t.disable()
 	
 	def enable_trigger_group(self, group):
 		"""Enable all triggers in the given group"""
 		self.log.debug("Enable trigger group {}".format(group))
-		[t.enable() for t in self.triggers if t.group == group]
+		for t in self.trigger_groups.get(group, ()):
+			t.enable()
 	
 	def disable_trigger_group(self, group):
 		"""Disable all triggers in the given group"""
 		self.log.debug("Disable trigger group {}".format(group))
-		[t.disable() for t in self.triggers if t.group == group]
+		for t in self.trigger_groups.get(group, ()):
+			t.disable()
 	
 	def enable_timer(self, name):
 		"""Enable the timer with given name"""
 		self.log.debug("Enable timer {}".format(name))
-		[t.enable() for t in self.timers if t.name == name]
+		for t in self.timer_names.get(name, ()):
+			self.set_enabled(t, True)
 	
 	def disable_timer(self, name):
 		"""Disable the timer with given name"""
 		self.log.debug("Disable timer {}".format(name))
-		[t.disable() for t in self.timers if t.name == name]
+		for t in self.timer_names.get(name, ()):
+			self.set_enabled(t, False)
 	
 	def enable_timer_group(self, group):
 		"""Enable all timers in the given group"""
 		self.log.debug("Enable timer group {}".format(group))
-		[t.enable() for t in self.timers if t.group == group]
+		for t in self.timer_groups.get(group, ()):
+			self.set_enabled(t, True)
 	
 	def disable_timer_group(self, group):
 		"""Disable all timers in the given group"""
 		self.log.debug("Disable timer group {}".format(group))
-		[t.disable() for t in self.timers if t.group == group]
+		for t in self.timer_groups.get(group, ()):
+			self.set_enabled(t, False)
 	
 	def timer(self, *t_args, **t_kwargs):
 		"""Method that returns a decorator to automatically set up a timer and associate it with a function to run at the specified time
@@ -349,6 +893,9 @@ Args:
 				t_kwargs['name'] = timer_function.__name__
 			# Create an instance of the 'Timer' class
 			new_timer = Timer(self.scheduler, *t_args, **t_kwargs)  # provide a reffrence to the scheduler and all wrapper arguments to this instance
+			if self.collect_stats:
+				new_timer.stats = TimerStats()
+				self.timer_jobs[new_timer.job.id] = new_timer
 			def wrapper(*args, **kwargs):
 				"""This function is what will be called in place of the decorated function;
 				It takes the arguments given to it and passes them on to the provided function.
@@ -358,6 +905,8 @@ Args:
 			new_timer.add_function(wrapper) # Associate the wrapper with the timer object
 			# add the timer to an internal list
 			self.timers.append(new_timer)
+			self.timer_names.setdefault(new_timer.name, set()).add(new_timer)
+			self.timer_groups.setdefault(new_timer.group, set()).add(new_timer)
 			return wrapper
 		return decorator
 
@@ -365,27 +914,22 @@ Args:
 def process_triggers(m):
 	"""Function that handles trigger processing in the background."""
 	log = logging.getLogger("mbf.trigger_processor")
+	m.reading_thread = threading.current_thread() # timers run here too, maybe before anything's been read
 	while not m.stopped.is_set():
 		try:
-			r, w, e = select.select([m.tn.sock], [], [])
+			# Block until data arrives; there's no sleep between reads, so triggers react as soon as the mud sends something
+			r, w, e = select.select([m], [], [], m.poll_timeout())
 			if r:
-				buff = m.read_very_eager()
-				log.debug("""Got buffer of data: {}""".format(buff))
-				if m.print_output:
-					for line in buff.strip().splitlines():
-						if line != '':
-							print(line)
-				for t in m.triggers :
-					if t.enabled and t.matches(buff):
-						log.debug("""{} matches on something in the current buffer""".format(t))
-						# Find all matches of this trigger in the buffer and call the associated function for each one
-						# Basically, "fire" this trigger
-						stp = t.fire(buff) # stop trigger processing if this returns true
-						if stp: # if the trigger function returned true or the trigger has stop_processing set
-							log.debug("""{} stopped processing for the current buffer""".format(t))
-							break # Don't do any more trigger processing for this buffer of data
-			time.sleep(m.trigger_delay)
+				m.handle_read()
+			else:
+				m.handle_idle()
+			if m.drives_scheduler:
+				m._scheduler.run_pending()
 		except EOFError as e: # connection is closed
 			log.debug("EOF error when reading a buffer for trigger processing")
-			m.stop_processing()
-			m.on_disconnect(deliberate=False)
+			m.connection_lost()
+			break # a reconnect starts a new thread
+		except socket.error as e: # reset by the mud, say; the same as it closing the connection
+			log.debug("""Socket error when reading a buffer for trigger processing: {}""".format(e))
+			m.connection_lost()
+			break
@@ -0,0 +1,176 @@
+# Mbf, the mud bot framework - out of band data (GMCP and MSDP)
+# Author: Blake Oliver <oliver22213@me.com>
+
+import json
+import logging
+
+# MSDP markers
+MSDP_VAR = b"\x01"
+MSDP_VAL = b"\x02"
+MSDP_TABLE_OPEN = b"\x03"
+MSDP_TABLE_CLOSE = b"\x04"
+MSDP_ARRAY_OPEN = b"\x05"
+MSDP_ARRAY_CLOSE = b"\x06"
+MSDP_MARKERS = b"\x01\x02\x03\x04\x05\x06"
+
+
+def parse_gmcp(data):
+	"""Split a GMCP message into it's package name and it's decoded json value (none if there isn't one).
+	A value that isn't valid json is returned as the raw string.
+	"""
+	package, sep, payload = data.partition(b" ")
+	package = package.decode("utf-8", "replace")
+	payload = payload.strip()
+	if not payload:
+		return package, None
+	try:
+		return package, json.loads(payload.decode("utf-8"))
+	except ValueError:
+		return package, payload.decode("utf-8", "replace")
+
+
+def encode_gmcp(package, value=None):
+	"""Encode a package name and (optional) value as a GMCP message"""
+	data = package
+	if value is not None:
+		data = data + " " + json.dumps(value)
+	return data.encode("utf-8")
+
+
+def parse_msdp(data):
+	"""Parse an MSDP message into a dictionary of variable: value; values are strings, lists (for arrays) or dictionaries (for tables)."""
+	values, i = _parse_msdp_table(data, 0, len(data))
+	return values
+
+
+def _parse_msdp_table(data, i, n):
+	"""Parse MSDP_VAR name MSDP_VAL value pairs from data[i:], until the end or a closing table marker; returns (dict, index after it)"""
+	table = {}
+	while i < n:
+		c = data[i:i+1]
+		if c == MSDP_TABLE_CLOSE:
+			return table, i + 1
+		if c != MSDP_VAR:
+			i += 1 # junk; skip it
+			continue
+		name, i = _parse_msdp_string(data, i + 1, n)
+		values = []
+		while data[i:i+1] == MSDP_VAL: # a variable can be given more than one value, which makes it an array
+			value, i = _parse_msdp_value(data, i + 1, n)
+			values.append(value)
+		table[name] = values[0] if len(values) == 1 else values
+	return table, i
+
+
+def _parse_msdp_value(data, i, n):
+	"""Parse one MSDP value starting at data[i]; returns (value, index after it)"""
+	c = data[i:i+1]
+	if c == MSDP_TABLE_OPEN:
+		return _parse_msdp_table(data, i + 1, n)
+	if c == MSDP_ARRAY_OPEN:
+		array = []
+		i += 1
+		while i < n:
+			c = data[i:i+1]
+			if c == MSDP_ARRAY_CLOSE:
+				return array, i + 1
+			if c == MSDP_VAL:
+				value, i = _parse_msdp_value(data, i + 1, n)
+				array.append(value)
+			else:
+				i += 1
+		return array, i
+	return _parse_msdp_string(data, i, n)
+
+
+def _parse_msdp_string(data, i, n):
+	"""Read the text from data[i] up to the next MSDP marker; returns (text, index of the marker)"""
+	j = i
+	while j < n and data[j:j+1] not in MSDP_MARKERS:
+		j += 1
+	return data[i:j].decode("utf-8", "replace"), j
+
+
+def encode_msdp(variable, value):
+	"""Encode a variable and value (a string, a list of strings, or a dictionary of them) as an MSDP message"""
+	return MSDP_VAR + variable.encode("utf-8") + _encode_msdp_value(value)
+
+
+def _encode_msdp_value(value):
+	if isinstance(value, dict):
+		return MSDP_VAL + MSDP_TABLE_OPEN + b"".join(encode_msdp(k, v) for k, v in value.items()) + MSDP_TABLE_CLOSE
+	if isinstance(value, (list, tuple)):
+		return MSDP_VAL + MSDP_ARRAY_OPEN + b"".join(_encode_msdp_value(v) for v in value) + MSDP_ARRAY_CLOSE
+	return MSDP_VAL + ("%s" % value).encode("utf-8")
+
+
+class DataTree(object):
+	def __init__(self):
+		"""The latest values received over GMCP or MSDP, as a tree of dictionaries, so handlers (and anything else) can look them up without parsing anything.
+		GMCP package names are split on dots, so the value of 'Char.Vitals' is stored at tree['Char']['Vitals'], and can be read with get('Char.Vitals') or get('Char.Vitals.hp').
+		"""
+		self.tree = {}
+
+	def update(self, name, value):
+		"""Store the value for a package or variable. Dictionaries are merged into what's already there, since muds often send only what's changed."""
+		node = self.tree
+		path = name.split(".")
+		for key in path[:-1]:
+			child = node.get(key)
+			if not isinstance(child, dict):
+				child = node[key] = {}
+			node = child
+		old = node.get(path[-1])
+		if isinstance(old, dict) and isinstance(value, dict):
+			old.update(value)
+		elif isinstance(value, dict): # a copy, so merging later values doesn't change the one handlers were given
+			node[path[-1]] = dict(value)
+		else:
+			node[path[-1]] = value
+
+	def get(self, name, default=None):
+		"""Return the value at a dotted path, or default if there's nothing there"""
+		node = self.tree
+		for key in name.split("."):
+			if not isinstance(node, dict) or key not in node:
+				return default
+			node = node[key]
+		return node
+
+	def __getitem__(self, name):
+		value = self.get(name, self)
+		if value is self:
+			raise KeyError(name)
+		return value
+
+	def __contains__(self, name):
+		return self.get(name, self) is not self
+
+
+class Handlers(object):
+	def __init__(self):
+		"""Calls the functions registered for a GMCP package or MSDP variable when it arrives.
+		Functions are looked up by exact name in a dictionary, and then by each parent package; a function registered for 'Char' is called for 'Char.Vitals' and 'Char.Status' too.
+		A function that raises is logged, and the others are still called.
+		"""
+		self.log = logging.getLogger("mbf.oob")
+		self.log.addHandler(logging.NullHandler())
+		self.handlers = {} # name: list of functions
+
+	def add(self, name, function):
+		self.handlers.setdefault(name, []).append(function)
+
+	def dispatch(self, name, value):
+		"""Call every function registered for name or one of it's parents, with (name, value)"""
+		handlers = self.handlers
+		key = name
+		while True:
+			for f in handlers.get(key, ()):
+				try:
+					f(name, value)
+				except Exception:
+					self.log.exception("""Handler {} for {} failed""".format(getattr(f, '__name__', f), name))
+			dot = key.rfind(".")
+			if dot == -1:
+				break
+			key = key[:dot]
@@ -0,0 +1,197 @@
+# Mbf, the mud bot framework - output filters and the console writer
+# Author: Blake Oliver <oliver22213@me.com>
+
+import collections
+import logging
+import re
+import sys
+import threading
+import time
+
+from trigger import Trigger
+from ansi import sgr_code, RESET
+
+# What an output filter does to the lines it matches
+GAG = "gag" # leave the line out
+SUBSTITUTE = "substitute" # replace what matched
+HIGHLIGHT = "highlight" # colour what matched
+REWRITE = "rewrite" # replace the line with whatever a function returns
+
+
+class OutputFilter(Trigger):
+	__slots__ = ('action', 'replacement', 'pattern')
+	is_filter = True
+
+	def __init__(self, trig, action, replacement=None, **kwargs):
+		"""A rule for changing what mbf prints (see Mbf's start_processing) before it's printed: gagging spam, substituting text, or highlighting it. The lines triggers see aren't changed.
+		Filters are made like triggers and take the same arguments (they're added to the same trigger set, so finding the lines they apply to is part of the one pass over each buffer, and they're enabled and disabled by name and group the same way), but they're never fired, and a trigger that stops processing doesn't stop them. They're applied in order of sequence, each to what the ones before it left.
+		Mbf's gag, substitute, highlight and rewrite methods make these.
+		Args:
+			trig: A regular expression or plain text string, as for Trigger.
+			action: GAG, SUBSTITUTE, HIGHLIGHT or REWRITE.
+			replacement: For SUBSTITUTE, what to put in place of each match: a string (which can refer to a regular expression's groups, like re.sub's) or a function given the match. For HIGHLIGHT, (fg, bg) colours. For REWRITE, a function given the line and the first match, which returns the line to print instead, or none to gag it.
+			kwargs: The rest of Trigger's arguments. Filters work on single lines, without colour, so multiline, fg and bg can't be used.
+		"""
+		if kwargs.get('multiline') or kwargs.get('fg') is not None or kwargs.get('bg') is not None:
+			raise ValueError("Output filters match single lines, without colour")
+		Trigger.__init__(self, trig, **kwargs)
+		self.action = action
+		if self.is_regexp:
+			self.compile()
+			self.pattern = self.trig
+		else: # matched by the trigger set like any plain text trigger, but changed with a regexp
+			self.pattern = re.compile(re.escape(self.trig), 0 if self.case_sensitive else re.IGNORECASE)
+		if action == SUBSTITUTE and not self.is_regexp and not callable(replacement):
+			text = replacement
+			replacement = lambda m: text # plain text replacements are used as they are, backslashes and all
+		elif action == HIGHLIGHT:
+			start = sgr_code(*replacement)
+			end = RESET
+			if isinstance(self.pattern.pattern, bytes) and str is not bytes:
+				start, end = start.encode("ascii"), end.encode("ascii")
+			replacement = lambda m: start + m.group(0) + end
+		self.replacement = replacement
+
+	def apply(self, line):
+		"""Return line as this filter would have it printed, or none if it's gagged"""
+		if self.action == GAG:
+			return None if self.pattern.search(line) else line
+		if self.action == REWRITE:
+			m = self.pattern.search(line)
+			return line if m is None else self.replacement(line, m)
+		return self.pattern.sub(self.replacement, line)
+
+	def __repr__(self):
+		return """<{} filter {}>""".format(self.action, self.name)
+
+
+class OutputWriter(object):
+	def __init__(self, sink=None, max_pending=10000, coalesce=0.05):
+		"""Prints lines on a thread of it's own, in batches, so a slow terminal (or log file, or whatever else is printed to) never holds up the thread running triggers.
+		Lines are queued, and the writer joins everything queued since it last woke up into one write and one flush. If the sink falls so far behind that max_pending lines are waiting, the oldest are dropped (and counted) rather than waiting for it.
+		Args:
+			sink: Where lines go: a file-like object (sys.stdout, by default), or a function given each batch as one string.
+			max_pending: The most lines that can wait to be written.
+			coalesce: Seconds the writer waits after being woken, so lines that follow soon after go in the same write.
+		"""
+		self.log = logging.getLogger("mbf.output")
+		self.log.addHandler(logging.NullHandler())
+		self.sink = sink
+		self.max_pending = max_pending
+		self.coalesce = coalesce
+		self.pending = collections.deque()
+		self.cond = threading.Condition()
+		self.running = False
+		self.busy = False
+		self.thread = None
+		# metrics
+		self.lines = 0 # lines written
+		self.writes = 0
+		self.dropped = 0
+		self.max_depth = 0
+
+	def put(self, lines):
+		"""Queue a list of lines to be printed; returns right away"""
+		with self.cond:
+			pending = self.pending
+			pending.extend(lines)
+			depth = len(pending)
+			if depth > self.max_pending:
+				if not self.dropped:
+					self.log.warning("""Output is {} lines behind; dropping the oldest""".format(depth))
+				for i in range(depth - self.max_pending):
+					pending.popleft()
+				self.dropped += depth - self.max_pending
+				depth = self.max_pending
+			if depth > self.max_depth:
+				self.max_depth = depth
+			self.cond.notify()
+
+	def start(self):
+		"""Start the writer thread, if it isn't running"""
+		with self.cond:
+			if self.running:
+				return
+			self.running = True
+		self.thread = threading.Thread(name="mbf_output", target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self, flush=True, timeout=None):
+		"""Stop the writer thread; if flush is true, whatever is queued is written first (waiting at most timeout seconds for it)"""
+		if flush:
+			self.flush(timeout)
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+		self.thread = None
+
+	def flush(self, timeout=None):
+		"""Wait until everything queued has been written, or timeout seconds pass; returns true if the queue emptied"""
+		end = None if timeout is None else time.time() + timeout
+		with self.cond:
+			while self.running and (self.busy or self.pending):
+				wait = None if end is None else end - time.time()
+				if wait is not None and wait <= 0:
+					return False
+				self.cond.wait(wait)
+			return not self.busy and not self.pending
+
+	def run(self):
+		"""The writer thread: wait for lines, and write them in batches"""
+		cond = self.cond
+		while True:
+			with cond:
+				while self.running and not self.pending:
+					cond.wait()
+				if not self.running:
+					return
+			if self.coalesce:
+				time.sleep(self.coalesce)
+			with cond:
+				batch = list(self.pending)
+				self.pending.clear()
+				self.busy = True
+			try:
+				self.write(batch)
+			except Exception:
+				self.log.exception("""Writing {} lines of output failed""".format(len(batch)))
+			with cond:
+				self.busy = False
+				self.lines += len(batch)
+				self.writes += 1
+				cond.notify_all() # for flush
+
+	def write(self, batch):
+		"""Write a batch of lines to the sink, as one string"""
+		nl = b"\n" if isinstance(batch[0], bytes) else u"\n"
+		data = nl.join(batch) + nl
+		sink = self.sink if self.sink is not None else sys.stdout
+		if callable(sink) and not hasattr(sink, "write"):
+			sink(data)
+			return
+		if str is not bytes: # python 3: bytes go to the stream's buffer, if it has one
+			if isinstance(data, bytes):
+				if hasattr(sink, "buffer"):
+					sink.flush()
+					sink = sink.buffer
+				else:
+					data = data.decode(getattr(sink, "encoding", None) or "utf-8", "replace")
+		elif not isinstance(data, bytes) and isinstance(sink, file): # python 2 files want bytes
+			data = data.encode(getattr(sink, "encoding", None) or "utf-8", "replace")
+		sink.write(data)
+		if hasattr(sink, "flush"):
+			sink.flush()
+
+	def get_stats(self):
+		"""Return the writer's metrics as a dictionary"""
+		with self.cond:
+			return {
+				'lines': self.lines,
+				'writes': self.writes,
+				'dropped': self.dropped,
+				'queued': len(self.pending),
+				'max_depth': self.max_depth,
+			}
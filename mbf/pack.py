@@ -0,0 +1,143 @@
+# Mbf, the mud bot framework - trigger packs
+# Author: Blake Oliver <oliver22213@me.com>
+
+import hashlib
+import importlib
+import json
+import logging
+import marshal
+import os
+import re
+import sys
+import tempfile
+
+from trigger import Trigger
+from triggerset import required_literal
+
+FORMAT = 3 # bumped whenever what's in a compiled pack changes
+
+# The options a pack entry can have, besides pattern and handler; they're Trigger's arguments
+OPTIONS = ('is_regexp', 'case_sensitive', 'multiline', 'name', 'group', 'enabled', 'stop_processing', 'sequence', 'async_ok', 'fg', 'bg', 'window', 'start', 'end')
+
+
+def native(s):
+	"""json gives python 2 unicode strings; mbf matches str there"""
+	if str is bytes and isinstance(s, type(u"")):
+		return s.encode("utf-8")
+	return s
+
+
+class TriggerPack(object):
+	def __init__(self, entries, digest=None):
+		"""A compiled trigger pack: a large set of triggers, written declaratively (usually generated from data files), with their regular expressions checked and their prefilter literals already worked out.
+		A pack's spec is json:
+			{"defaults": {"group": "items"},
+			"triggers": [
+				{"pattern": "(?P<who>\\w+) gives you (?P<item>.+)\\.", "handler": "got_item", "sequence": 50},
+				{"pattern": "A goblin arrives", "is_regexp": false, "handler": "mobs:goblin"}]}
+		Each trigger has a pattern, a handler (the name of it's function; see Mbf's load_trigger_pack) and any of Trigger's options; defaults apply to every trigger that doesn't set them.
+		Compiling a pack means parsing every regular expression for the literal text the trigger set prefilters on. load caches the result on disk, keyed by a hash of the spec, so only the first bot to load a pack pays for that; the rest read the cached pack, and their triggers' regular expressions are only compiled if a line containing the trigger's literal ever arrives.
+		Args:
+			entries: A list of tuples, one per trigger, as made by compile.
+			digest: The hash of the spec the pack was compiled from.
+		"""
+		self.entries = entries
+		self.digest = digest
+
+	@classmethod
+	def compile(cls, spec, digest=None):
+		"""Compile a spec (a dictionary, parsed from a pack's json) into a TriggerPack. Raises ValueError if any of it's triggers are invalid."""
+		if not isinstance(spec, dict) or not isinstance(spec.get('triggers'), list):
+			raise ValueError("A trigger pack needs a list of triggers")
+		defaults = spec.get('defaults', {})
+		entries = []
+		for n, item in enumerate(spec['triggers']):
+			entry = dict(defaults)
+			entry.update(item)
+			if 'pattern' not in entry or 'handler' not in entry:
+				raise ValueError("""Trigger {} in the pack needs a pattern and a handler""".format(n))
+			unknown = set(entry) - set(OPTIONS) - set(('pattern', 'handler'))
+			if unknown:
+				raise ValueError("""Trigger {} in the pack has unknown options: {}""".format(n, ", ".join(sorted(unknown))))
+			pattern = native(entry['pattern'])
+			handler = native(entry['handler'])
+			# Trigger does this work, so use one to get it right; it's thrown away
+			t = Trigger(pattern, **dict((k, native(v)) for k, v in entry.items() if k in OPTIONS))
+			if t.is_regexp:
+				try:
+					t.compile()
+				except re.error as e:
+					raise ValueError("""Trigger {} ({}) in the pack has an invalid regular expression: {}""".format(n, t.name or pattern, e))
+				literal = required_literal(t.trig)
+				ignore_case = bool(t.trig.flags & re.IGNORECASE)
+			else:
+				literal = t.trig if (b"\n" if isinstance(t.trig, bytes) else u"\n") not in t.trig else None
+				ignore_case = not t.case_sensitive
+			entries.append((pattern, t.is_regexp, t.case_sensitive, t.multiline, t.name if t.name is not None else handler, t.group, t.enabled, t.stop_processing, t.sequence, t.async_ok, t.fg, t.bg, t.window, native(entry.get('start')), native(entry.get('end')), handler, literal, ignore_case))
+		return cls(entries, digest)
+
+	@classmethod
+	def load(cls, path, cache_dir=None):
+		"""Load the pack whose spec is in the json file at path, using a cached compiled copy if there's one for exactly this spec.
+		Compiled packs are kept in cache_dir, which is a __mbfcache__ directory next to the spec by default. If it can't be written to, the pack is compiled every time, just like python does with it's .pyc files.
+		"""
+		log = logging.getLogger("mbf.pack")
+		with open(path, "rb") as f:
+			data = f.read()
+		digest = hashlib.sha1(data + """{} {}""".format(FORMAT, sys.version_info[:2]).encode("ascii")).hexdigest()
+		if cache_dir is None:
+			cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "__mbfcache__")
+		cached = os.path.join(cache_dir, """{}.{}.mbfpack""".format(os.path.basename(path), digest[:16]))
+		try:
+			with open(cached, "rb") as f:
+				fmt, cached_digest, entries = marshal.loads(f.read())
+			if fmt == FORMAT and cached_digest == digest:
+				log.debug("""Loaded compiled trigger pack {}""".format(cached))
+				return cls(entries, digest)
+		except (IOError, OSError, EOFError, ValueError, TypeError): # not there, or not something we wrote
+			pass
+		pack = cls.compile(json.loads(data.decode("utf-8")), digest)
+		try:
+			pack.save(cached)
+		except (IOError, OSError) as e:
+			log.debug("""Couldn't cache compiled trigger pack {}: {}""".format(cached, e))
+		return pack
+
+	def save(self, path):
+		"""Write this compiled pack to path. It's written to a temporary file that's renamed into place, so another process loading the pack at the same time never reads half of it."""
+		directory = os.path.dirname(path)
+		if directory and not os.path.isdir(directory):
+			os.makedirs(directory)
+		fd, tmp = tempfile.mkstemp(dir=directory or ".", suffix=".tmp")
+		try:
+			with os.fdopen(fd, "wb") as f:
+				f.write(marshal.dumps((FORMAT, self.digest, self.entries)))
+			os.rename(tmp, path)
+		except:
+			os.unlink(tmp)
+			raise
+
+	def triggers(self):
+		"""Create the pack's triggers; yields (trigger, handler name) pairs. The triggers have no function yet, and their regular expressions aren't compiled."""
+		for pattern, is_regexp, case_sensitive, multiline, name, group, enabled, stop_processing, sequence, async_ok, fg, bg, window, start, end, handler, literal, ignore_case in self.entries:
+			t = Trigger(pattern, is_regexp=is_regexp, case_sensitive=case_sensitive, multiline=multiline, name=name, group=group, enabled=enabled, stop_processing=stop_processing, sequence=sequence, async_ok=async_ok, fg=fg, bg=bg, window=window, start=start, end=end)
+			t.prefilter = (literal, ignore_case)
+			yield t, handler
+
+	def __len__(self):
+		return len(self.entries)
+
+
+def resolve_handler(name, handlers):
+	"""Find the function a pack trigger's handler names: "module:function" is imported, and anything else is looked up in handlers (a dictionary, or an object or module whose attributes are the functions)"""
+	if ":" in name:
+		module, attr = name.split(":", 1)
+		try:
+			return getattr(importlib.import_module(module), attr)
+		except (ImportError, AttributeError) as e:
+			raise ValueError("""Can't find trigger handler {}: {}""".format(name, e))
+	if handlers is not None:
+		f = handlers.get(name) if isinstance(handlers, dict) else getattr(handlers, name, None)
+		if f is not None:
+			return f
+	raise ValueError("""No trigger handler called {}""".format(name))
@@ -0,0 +1,299 @@
+# Mbf, the mud bot framework - proxy for attaching mud clients to a session
+# Author: Blake Oliver <oliver22213@me.com>
+
+import collections
+import errno
+import logging
+import select
+import socket
+import threading
+
+from line import view
+
+# where a client's telnet commands are up to
+DATA, COMMAND, OPTION, SUBNEGOTIATION, SUBNEGOTIATION_IAC = range(5)
+
+
+class Client(object):
+	__slots__ = ('sock', 'address', 'pos', 'input', 'state')
+
+	def __init__(self, sock, address, pos):
+		"""A mud client attached to a proxy"""
+		self.sock = sock
+		self.address = address
+		self.pos = pos # how far through everything the mud has sent this client has been sent
+		self.input = bytearray() # a partial line typed by the client
+		self.state = DATA
+
+	def received(self, data):
+		"""Add data the client sent, leaving out it's telnet commands; returns the complete lines, without their line endings"""
+		buf = self.input
+		state = self.state
+		for c in bytearray(data): # clients send little, a line at a time
+			if state == DATA:
+				if c == 255:
+					state = COMMAND
+				else:
+					buf.append(c)
+			elif state == COMMAND:
+				if c == 255: # an escaped 255
+					buf.append(c)
+					state = DATA
+				elif 251 <= c <= 254: # will, won't, do, don't and an option
+					state = OPTION
+				elif c == 250:
+					state = SUBNEGOTIATION
+				else:
+					state = DATA
+			elif state == OPTION:
+				state = DATA
+			elif state == SUBNEGOTIATION:
+				if c == 255:
+					state = SUBNEGOTIATION_IAC
+			elif state == SUBNEGOTIATION_IAC:
+				state = DATA if c == 240 else SUBNEGOTIATION
+		self.state = state
+		lines = []
+		while True:
+			end = buf.find(b"\n")
+			if end == -1:
+				break
+			lines.append(bytes(buf[:end]).rstrip(b"\r"))
+			del buf[:end + 1]
+		return lines
+
+	def __repr__(self):
+		return """<client {}:{}>""".format(*self.address[:2])
+
+
+class Proxy(object):
+	def __init__(self, m, port, host="127.0.0.1", max_buffer=1024 * 1024, slow_clients="skip", max_clients=8, send_buffer=64 * 1024):
+		"""Lets ordinary mud clients connect to a running bot, to watch what the mud sends it and type commands of their own, while it's triggers keep running. Mbf's listen method starts one.
+		Everything the mud sends is kept once, in a queue of the chunks it arrived in, shared by every client; each client just has a position in it, and is sent straight from the chunks (through memoryviews, so nothing is copied for each client). Chunks are let go once every client has been sent them.
+		Sending happens on the proxy's own thread, with non blocking sockets, so a slow client never holds up the bot. What a slow client hasn't been sent is kept up to max_buffer bytes; past that, it either skips ahead, losing the oldest of it, or (with slow_clients="drop") is disconnected.
+		Lines typed in a client are passed to the session's on_client_input, which sends them to the mud by default. Telnet negotiation from clients is ignored.
+		The proxy has no password, so it only listens on localhost unless told otherwise.
+		Args:
+			m: The Mbf instance whose session clients attach to.
+			port: The port to listen on.
+			host: The address to listen on.
+			max_buffer: The most data, in bytes, to keep for clients that haven't been sent it yet.
+			slow_clients: What to do with a client that falls more than max_buffer behind: "skip" (the default) or "drop".
+			max_clients: The most clients that can be attached at once.
+			send_buffer: The size of each client socket's send buffer in the kernel (SO_SNDBUF), so it can't hide how far behind a client is by holding megabytes of it's own.
+		"""
+		if slow_clients not in ("skip", "drop"):
+			raise ValueError("""Unknown slow_clients policy {}""".format(slow_clients))
+		self.log = logging.getLogger("mbf.proxy")
+		self.log.addHandler(logging.NullHandler())
+		self.m = m
+		self.host = host
+		self.port = port
+		self.max_buffer = max_buffer
+		self.slow_clients = slow_clients
+		self.max_clients = max_clients
+		self.send_buffer = send_buffer
+		self.clients = []
+		self.chunks = collections.deque() # (position, data) of what clients haven't all been sent
+		self.head = 0 # position of the first byte in chunks
+		self.tail = 0 # position just after the last; every byte the mud has sent has a position
+		self.lock = threading.Lock()
+		self.listener = None
+		self.thread = None
+		self.running = False
+		self.woken = False
+		# metrics
+		self.connections = 0
+		self.bytes_in = 0 # typed by clients
+		self.bytes_out = 0 # sent to clients, all together
+		self.commands = 0
+		self.skipped = 0 # bytes slow clients skipped
+		self.dropped = 0 # clients disconnected for being too slow
+		self.max_backlog = 0
+
+	def start(self):
+		"""Start listening, and start the proxy's thread"""
+		self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.listener.bind((self.host, self.port))
+		self.listener.listen(5)
+		self.port = self.listener.getsockname()[1] # in case it was 0, for any free port
+		self.wake_r, self.wake_w = socket.socketpair()
+		self.wake_w.setblocking(False)
+		self.running = True
+		self.thread = threading.Thread(name="mbf_proxy", target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+		self.log.info("""Listening for clients on {}:{}""".format(self.host, self.port))
+
+	def stop(self):
+		"""Disconnect every client and stop listening"""
+		if not self.running:
+			return
+		self.running = False
+		self.wake()
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join()
+		with self.lock:
+			for c in self.clients:
+				c.sock.close()
+			self.clients = []
+			self.chunks.clear()
+			self.head = self.tail
+		self.listener.close()
+		self.wake_r.close()
+		self.wake_w.close()
+
+	def wake(self):
+		"""Wake the proxy's thread, if it isn't awake already"""
+		if not self.woken:
+			self.woken = True
+			try:
+				self.wake_w.send(b"x")
+			except socket.error: # it's already got one waiting
+				pass
+
+	def feed(self, data):
+		"""Pass data the mud sent on to every client; returns right away. Mbf calls this with each chunk it reads."""
+		if not self.clients or not data:
+			return
+		with self.lock:
+			self.chunks.append((self.tail, data))
+			self.tail += len(data)
+			self.trim()
+		self.wake()
+
+	def trim(self):
+		"""Let go of chunks every client has been sent, and deal with clients too far behind; called with the lock held"""
+		chunks = self.chunks
+		low = min(c.pos for c in self.clients) if self.clients else self.tail
+		while chunks and chunks[0][0] + len(chunks[0][1]) <= low:
+			chunks.popleft()
+		while chunks and self.tail - chunks[0][0] > self.max_buffer and len(chunks) > 1:
+			chunks.popleft()
+		self.head = chunks[0][0] if chunks else self.tail
+		backlog = self.tail - self.head
+		if backlog > self.max_backlog:
+			self.max_backlog = backlog
+		for c in list(self.clients):
+			if c.pos < self.head:
+				if self.slow_clients == "drop":
+					self.log.warning("""Dropping {}; it fell more than {} bytes behind""".format(c, self.max_buffer))
+					self.dropped += 1
+					self.disconnect(c)
+				else:
+					self.skipped += self.head - c.pos
+					c.pos = self.head
+
+	def disconnect(self, c):
+		"""Close a client's connection; called with the lock held"""
+		if c in self.clients:
+			self.clients.remove(c)
+		try:
+			c.sock.close()
+		except socket.error:
+			pass
+
+	def run(self):
+		"""The proxy's thread: accept clients, read what they type, and send them what the mud sends"""
+		while self.running:
+			with self.lock:
+				clients = list(self.clients)
+				behind = [c.sock for c in clients if c.pos < self.tail]
+			try:
+				r, w, e = select.select([self.listener, self.wake_r] + [c.sock for c in clients], behind, [], 1.0)
+			except (select.error, socket.error, ValueError): # a client was closed under us
+				continue
+			if self.wake_r in r:
+				self.woken = False
+				try:
+					self.wake_r.recv(4096)
+				except socket.error:
+					pass
+			if self.listener in r and self.running:
+				self.accept()
+			for c in clients:
+				if c.sock in r:
+					self.read(c)
+				if c.sock in w:
+					with self.lock:
+						self.send(c)
+
+	def accept(self):
+		try:
+			sock, address = self.listener.accept()
+		except socket.error:
+			return
+		with self.lock:
+			if len(self.clients) >= self.max_clients:
+				sock.close()
+				self.log.warning("""Refused a client from {}; {} are already attached""".format(address, self.max_clients))
+				return
+			sock.setblocking(False)
+			if self.send_buffer:
+				sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+			c = Client(sock, address, self.tail) # it sees what the mud sends from now on
+			self.clients.append(c)
+			self.connections += 1
+		self.log.info("""{} attached""".format(c))
+
+	def read(self, c):
+		"""Read what a client typed, and pass each line on to the session"""
+		try:
+			data = c.sock.recv(4096)
+		except socket.error as e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return
+			data = b""
+		if not data:
+			self.log.info("""{} detached""".format(c))
+			with self.lock:
+				self.disconnect(c)
+				self.trim()
+			return
+		self.bytes_in += len(data)
+		m = self.m
+		for line in c.received(data):
+			if m.charset is not None:
+				line = line.decode(m.charset, m.charset_errors)
+			self.commands += 1
+			try:
+				m.on_client_input(line)
+			except Exception:
+				self.log.exception("""on_client_input failed on {!r}""".format(line))
+
+	def send(self, c):
+		"""Send a client as much of what it's behind on as it's socket will take; called with the lock held"""
+		for start, data in self.chunks:
+			end = start + len(data)
+			if end <= c.pos:
+				continue
+			offset = c.pos - start
+			try:
+				sent = c.sock.send(view(data, offset, len(data) - offset)) # a slice of the shared chunk, not a copy
+			except socket.error as e:
+				if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+					break
+				self.log.info("""{} detached: {}""".format(c, e))
+				self.disconnect(c)
+				break
+			c.pos += sent
+			self.bytes_out += sent
+			if c.pos < end: # the socket's full
+				break
+		self.trim()
+
+	def get_stats(self):
+		"""Return the proxy's metrics as a dictionary"""
+		with self.lock:
+			return {
+				'clients': len(self.clients),
+				'connections': self.connections,
+				'bytes_in': self.bytes_in,
+				'bytes_out': self.bytes_out,
+				'commands': self.commands,
+				'backlog': self.tail - self.head,
+				'max_backlog': self.max_backlog,
+				'skipped': self.skipped,
+				'dropped': self.dropped,
+			}
@@ -0,0 +1,210 @@
+# Mbf, the mud bot framework - reconnect supervisor
+# Author: Blake Oliver <oliver22213@me.com>
+
+import datetime
+import logging
+import random
+import socket
+import threading
+import time
+
+
+class Reconnector(object):
+	def __init__(self, m, initial_delay=1.0, max_delay=60.0, factor=2.0, jitter=0.5, max_attempts=None, login_timeout=None):
+		"""Reconnects an Mbf instance when it's connection drops, and puts it back the way it was.
+		When the connection is lost, the enabled state of every trigger and timer and a copy of g are saved, timers are paused so they don't fire into a dead connection, and whatever was waiting in the send queue is held.
+		Attempts are scheduled as timers on the instance's scheduler, after an exponentially growing delay with random jitter, so a fleet of bots dropped by the same mud reboot don't all come back at the same moment.
+		Once connected and logged in (the instance's usual automatic login, when it has credentials), triggers, timers and g are restored, held commands are sent, and on_reconnect is called.
+		Nothing waits for the login: an attempt connects, starts reading again and returns, and the login's success or failure (or a timeout job) finishes it. The thread running the scheduler can be the one reading the connection, as it is on a host with a built-in scheduler.
+		Args:
+			m: The Mbf instance to look after.
+			initial_delay: Seconds before the first attempt.
+			max_delay: The longest wait between attempts.
+			factor: What the delay is multiplied by after each failed attempt.
+			jitter: The fraction of each delay that's random; with 0.5, a 10 second delay is somewhere between 5 and 10 seconds.
+			max_attempts: Give up after this many failed attempts; none (the default) means never give up.
+			login_timeout: Seconds to wait for the login to finish after connecting before counting the attempt as failed. By default it's four times the instance's timeout, enough for every step of the login.
+		"""
+		self.log = logging.getLogger("mbf.reconnect")
+		self.log.addHandler(logging.NullHandler())
+		self.m = m
+		self.initial_delay = initial_delay
+		self.max_delay = max_delay
+		self.factor = factor
+		self.jitter = jitter
+		self.max_attempts = max_attempts
+		self.login_timeout = login_timeout
+		self.lock = threading.Lock()
+		self.active = False # a reconnect is in progress
+		self.attempts = 0 # failed attempts since the connection was lost
+		self.state = None # what was saved when the connection was lost
+		self.pending = [] # (priority, command) waiting to be sent once reconnected
+		self.job = None
+		self.login = None # the login the current attempt is waiting for
+		self.started = None # when the current attempt started
+		self.lost_at = None
+		# metrics
+		self.reconnects = 0
+		self.failed_attempts = 0
+		self.gave_up = 0
+		self.last_downtime = 0.0 # seconds from losing the connection to being back
+		self.max_downtime = 0.0
+		self.total_downtime = 0.0
+		self.last_latency = 0.0 # seconds the successful attempt took, from starting to connect to being logged in
+		self.max_latency = 0.0
+
+	def delay(self, attempt):
+		"""Return the seconds to wait before the given attempt (counting from 0)"""
+		delay = min(self.max_delay, self.initial_delay * (self.factor ** attempt))
+		return delay * (1 - self.jitter * random.random())
+
+	def connection_lost(self):
+		"""Save the instance's state, stop it, and schedule the first attempt"""
+		m = self.m
+		with self.lock:
+			if self.active:
+				return
+			self.active = True
+			self.attempts = 0
+			self.lost_at = time.time()
+		self.state = m.save_state()
+		self.pending.extend(m.send_queue.drain())
+		for t in m.timers:
+			m.set_enabled(t, False)
+		m.stop_processing(keep_scheduler=True)
+		m.start_scheduler() # the attempts are scheduled on it
+		self.schedule()
+
+	def queue(self, command, priority):
+		"""Hold a command sent while reconnecting, to be sent once reconnected"""
+		with self.lock:
+			self.pending.append((priority, command))
+
+	def schedule(self):
+		delay = self.delay(self.attempts)
+		self.log.info("""Reconnecting to {} in {:.1f} seconds""".format(self.m.hostname, delay))
+		self.job = self.m.scheduler.add_job(self.attempt, 'date', run_date=datetime.datetime.now() + datetime.timedelta(seconds=delay))
+
+	def cancel(self):
+		"""Stop reconnecting"""
+		with self.lock:
+			self.active = False
+			self.pending = []
+			self.login = None
+		self.remove_job()
+
+	def remove_job(self):
+		job = self.job
+		self.job = None
+		if job is not None:
+			try:
+				job.remove()
+			except KeyError: # JobLookupError; it already ran
+				pass
+
+	def attempt(self):
+		"""Try to connect, and start logging in; runs on the scheduler. This returns as soon as reading has resumed: the login moves along on whatever is reading the connection, and logged_in, login_failed or login_timed_out finish the attempt."""
+		m = self.m
+		self.job = None
+		if not self.active:
+			return
+		start = time.time()
+		try:
+			m.connect()
+		except (socket.error, EOFError, IOError, OSError) as e:
+			return self.failed("""could not connect: {}""".format(e))
+		if not self.active: # cancelled while connecting
+			m.drop_connection()
+			return
+		l = m.login_machine
+		if l is not None and l.finished and not l.succeeded: # it couldn't even start
+			m.drop_connection()
+			return self.failed("""login failed: {}""".format(l.reason))
+		if l is None or l.finished:
+			m.resume_processing()
+			return self.succeeded(start)
+		with self.lock:
+			self.login = l
+			self.started = start
+		timeout = self.login_timeout if self.login_timeout is not None else m.timeout * 4
+		self.job = m.scheduler.add_job(self.login_timed_out, 'date', run_date=datetime.datetime.now() + datetime.timedelta(seconds=timeout))
+		m.resume_processing()
+
+	def claim(self):
+		"""Take the login the current attempt is waiting for, so only one of logged_in, login_failed and login_timed_out finishes it; returns false if there isn't one"""
+		with self.lock:
+			if self.login is None:
+				return False
+			self.login = None
+		return True
+
+	def logged_in(self):
+		"""Called by the instance when a login succeeds, on the thread reading the connection"""
+		if self.claim():
+			self.remove_job()
+			self.succeeded(self.started)
+
+	def login_failed(self, reason):
+		"""Called by the instance when a login fails, on the thread reading the connection. Dropping the connection stops that thread's reading, so it's done on the scheduler."""
+		if self.claim():
+			self.remove_job()
+			self.job = self.m.scheduler.add_job(self.abandon, 'date', args=["""login failed: {}""".format(reason)])
+
+	def login_timed_out(self):
+		self.job = None
+		if self.claim():
+			self.abandon("login failed: timed out")
+
+	def abandon(self, reason):
+		"""Give up on the current attempt, and schedule the next"""
+		self.job = None
+		self.m.drop_connection()
+		self.failed(reason)
+
+	def failed(self, reason):
+		self.failed_attempts += 1
+		self.attempts += 1
+		self.log.warning("""Reconnect attempt {} to {} failed; {}""".format(self.attempts, self.m.hostname, reason))
+		if self.max_attempts is not None and self.attempts >= self.max_attempts:
+			self.log.error("""Giving up reconnecting to {} after {} attempts""".format(self.m.hostname, self.attempts))
+			self.gave_up += 1
+			self.cancel()
+			self.m.stop_processing()
+			self.m.on_reconnect_failed()
+			return
+		if self.active:
+			self.schedule()
+
+	def succeeded(self, start):
+		m = self.m
+		now = time.time()
+		with self.lock:
+			self.active = False
+			pending = self.pending
+			self.pending = []
+			self.last_latency = now - start
+			self.max_latency = max(self.max_latency, self.last_latency)
+			self.last_downtime = now - self.lost_at
+			self.max_downtime = max(self.max_downtime, self.last_downtime)
+			self.total_downtime += self.last_downtime
+			self.reconnects += 1
+		m.restore_state(self.state)
+		self.state = None
+		for priority, command in pending:
+			m.send_queue.put(command, priority)
+		self.log.info("""Reconnected to {} after {:.1f} seconds""".format(m.hostname, self.last_downtime))
+		m.on_reconnect()
+
+	def get_stats(self):
+		"""Return the reconnect metrics as a dictionary"""
+		with self.lock:
+			return {
+				'reconnects': self.reconnects,
+				'failed_attempts': self.failed_attempts,
+				'gave_up': self.gave_up,
+				'last_downtime': self.last_downtime,
+				'max_downtime': self.max_downtime,
+				'total_downtime': self.total_downtime,
+				'last_latency': self.last_latency,
+				'max_latency': self.max_latency,
+			}
@@ -0,0 +1,269 @@
+# Mbf, the mud bot framework - built-in timer scheduler
+# Author: Blake Oliver <oliver22213@me.com>
+
+import calendar
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class JobLookupError(KeyError):
+	"""Raised when pausing, resuming or removing a job that's been removed.
+	apscheduler's JobLookupError is also a KeyError, so catching KeyError handles both schedulers without importing apscheduler.
+	"""
+
+# Event masks for add_listener; the same values apscheduler.events uses, so one listener works with either scheduler
+EVENT_JOB_EXECUTED = 2 ** 12
+EVENT_JOB_ERROR = 2 ** 13
+
+
+def to_timestamp(when):
+	"""Convert a datetime (naive ones are local time) or a number of seconds since the epoch to seconds since the epoch"""
+	if isinstance(when, datetime.datetime):
+		if when.tzinfo is not None:
+			return calendar.timegm(when.utctimetuple()) + when.microsecond / 1e6
+		return time.mktime(when.timetuple()) + when.microsecond / 1e6
+	return float(when)
+
+
+def new_scheduler(backend="apscheduler"):
+	"""Create a scheduler: apscheduler's BackgroundScheduler for "apscheduler" (imported only now, since it's slow to import), or a HeapScheduler for "builtin" """
+	if backend == "builtin":
+		return HeapScheduler()
+	if backend == "apscheduler":
+		from apscheduler.schedulers.background import BackgroundScheduler
+		return BackgroundScheduler()
+	raise ValueError("""Unknown timer backend {}""".format(backend))
+
+
+class JobEvent(object):
+	__slots__ = ('code', 'job_id', 'scheduled_run_time', 'exception')
+
+	def __init__(self, code, job_id, scheduled_run_time, exception=None):
+		"""What listeners are given when a job runs; like apscheduler's JobExecutionEvent, scheduled_run_time is a datetime (a naive one, in UTC)"""
+		self.code = code
+		self.job_id = job_id
+		self.scheduled_run_time = scheduled_run_time
+		self.exception = exception
+
+
+class Job(object):
+	__slots__ = ('scheduler', 'id', 'func', 'args', 'kwargs', 'interval', 'start', 'end', 'next_run', 'paused', 'removed', 'version')
+
+	def __init__(self, scheduler, id, func, args, kwargs, interval, start, end):
+		"""One job on a HeapScheduler: a function to run once at start, or every interval seconds from start (until end, if it's set).
+		It has the parts of apscheduler's Job that mbf uses: id, pause, resume and remove.
+		"""
+		self.scheduler = scheduler
+		self.id = id
+		self.func = func
+		self.args = args
+		self.kwargs = kwargs
+		self.interval = interval # none for jobs that run once
+		self.start = start
+		self.end = end
+		self.next_run = start
+		self.paused = False
+		self.removed = False
+		self.version = 0 # bumped whenever the job's entry in the heap stops being valid
+
+	def pause(self):
+		self.scheduler.pause_job(self)
+
+	def resume(self):
+		self.scheduler.resume_job(self)
+
+	def remove(self):
+		self.scheduler.remove_job(self)
+
+	def __repr__(self):
+		return """<job {}>""".format(self.id)
+
+
+class HeapScheduler(object):
+	def __init__(self):
+		"""A small timer scheduler, for use in place of apscheduler's BackgroundScheduler (see Mbf's timer_backend argument).
+		Jobs are kept in a heap ordered by when they next run, so finding what's due is cheap however many timers there are, and each job is one small object.
+		It has no threads of it's own unless asked for one: whatever loop is reading from the mud (Mbf's trigger processor, or mbf.host) calls run_pending after each wait, and waits no longer than time_until_next, so jobs run on the same thread as triggers.
+		When nothing is reading (while reconnecting, say), start(thread=True) runs jobs on a thread instead.
+		It understands 'interval' jobs (seconds, minutes, hours, days and weeks, with optional start_date and end_date) and 'date' jobs (run_date); anything else (like cron jobs) needs apscheduler.
+		Interval jobs stay on their original schedule rather than drifting by however late each run was; if a job falls more than an interval behind, the runs it missed are skipped.
+		"""
+		self.log = logging.getLogger("mbf.scheduler")
+		self.log.addHandler(logging.NullHandler())
+		self.heap = [] # (time, sequence, version, job)
+		self.jobs = {} # id: job
+		self.counter = itertools.count()
+		self.ids = itertools.count(1)
+		self.lock = threading.Lock()
+		self.wakeup = threading.Condition(self.lock)
+		self.listeners = [] # (function, mask)
+		self.running = False
+		self.thread = None
+
+	def add_job(self, func, trigger='interval', args=None, kwargs=None, id=None, name=None, seconds=0, minutes=0, hours=0, days=0, weeks=0, start_date=None, end_date=None, run_date=None):
+		"""Add a job; takes the same arguments as apscheduler's add_job for 'interval' and 'date' jobs, and returns the Job"""
+		now = time.time()
+		if trigger == 'interval':
+			interval = seconds + minutes * 60 + hours * 3600 + days * 86400 + weeks * 604800
+			if interval <= 0:
+				raise ValueError("An interval job needs a positive interval")
+			start = to_timestamp(start_date) if start_date is not None else now
+			if start <= now: # the first run is an interval after the start
+				start += interval
+		elif trigger == 'date':
+			interval = None
+			start = to_timestamp(run_date) if run_date is not None else now
+		else:
+			raise ValueError("""The built-in scheduler doesn't support {} jobs; use apscheduler for those""".format(trigger))
+		end = to_timestamp(end_date) if end_date is not None else None
+		job = Job(self, id if id is not None else str(next(self.ids)), func, tuple(args or ()), dict(kwargs or {}), interval, start, end)
+		with self.lock:
+			self.jobs[job.id] = job
+			self.push(job)
+		return job
+
+	def push(self, job):
+		"""Put a job on the heap at it's next run time; call with the lock held"""
+		heapq.heappush(self.heap, (job.next_run, next(self.counter), job.version, job))
+		if self.heap[0][3] is job: # it's the next job now; a waiting thread needs to know
+			self.wakeup.notify()
+
+	def get_job(self, id):
+		return self.jobs.get(id)
+
+	def get_jobs(self):
+		return list(self.jobs.values())
+
+	def pause_job(self, job):
+		with self.lock:
+			if job.removed:
+				raise JobLookupError(job.id)
+			if not job.paused:
+				job.paused = True
+				job.version += 1 # it's heap entry is left to be skipped
+
+	def resume_job(self, job):
+		with self.lock:
+			if job.removed:
+				raise JobLookupError(job.id)
+			if job.paused:
+				job.paused = False
+				job.version += 1
+				if job.interval is not None: # back on it's original schedule, at the next run that hasn't passed
+					now = time.time()
+					if job.next_run <= now:
+						job.next_run += ((now - job.next_run) // job.interval + 1) * job.interval
+				self.push(job)
+
+	def remove_job(self, job):
+		"""Remove a job (or the job with the given id)"""
+		with self.lock:
+			if not isinstance(job, Job):
+				job = self.jobs.get(job)
+			if job is None or job.removed:
+				raise JobLookupError(getattr(job, 'id', job))
+			job.removed = True
+			job.version += 1
+			del self.jobs[job.id]
+
+	def add_listener(self, callback, mask=EVENT_JOB_EXECUTED | EVENT_JOB_ERROR):
+		"""Call callback with a JobEvent after jobs run (EVENT_JOB_EXECUTED) or raise an exception (EVENT_JOB_ERROR)"""
+		self.listeners.append((callback, mask))
+
+	def time_until_next(self, now=None):
+		"""Seconds until the next job is due (0 if one is overdue), or none if there are no jobs"""
+		with self.lock:
+			return self.next_due(now)
+
+	def next_due(self, now=None):
+		"""time_until_next, for when the lock is already held"""
+		heap = self.heap
+		while heap and heap[0][2] != heap[0][3].version: # drop entries for paused and removed jobs
+			heapq.heappop(heap)
+		if not heap:
+			return None
+		return max(0, heap[0][0] - (now if now is not None else time.time()))
+
+	def run_pending(self, now=None):
+		"""Run every job that's due; returns the number run"""
+		if not self.running:
+			return 0
+		if now is None:
+			now = time.time()
+		heap = self.heap
+		ran = 0
+		while True:
+			with self.lock:
+				if not heap or heap[0][0] > now:
+					break
+				when, seq, version, job = heapq.heappop(heap)
+				if version != job.version: # paused, removed or rescheduled since this entry was made
+					continue
+				if job.interval is None:
+					job.removed = True
+					self.jobs.pop(job.id, None)
+				else:
+					job.next_run = when + job.interval
+					if job.next_run <= now: # fell behind; skip the missed runs
+						job.next_run += ((now - job.next_run) // job.interval + 1) * job.interval
+					if job.end is not None and job.next_run > job.end:
+						job.removed = True
+						self.jobs.pop(job.id, None)
+					else:
+						self.push(job)
+			self.run_job(job, when)
+			ran += 1
+		return ran
+
+	def run_job(self, job, when):
+		code, exception = EVENT_JOB_EXECUTED, None
+		try:
+			job.func(*job.args, **job.kwargs)
+		except Exception as e:
+			self.log.exception("""Job {} raised an exception""".format(job.id))
+			code, exception = EVENT_JOB_ERROR, e
+		if self.listeners:
+			event = JobEvent(code, job.id, datetime.datetime.utcfromtimestamp(when), exception)
+			for callback, mask in self.listeners:
+				if mask & code:
+					callback(event)
+
+	def start(self, thread=False):
+		"""Start running jobs. With thread set, they're run on a thread of the scheduler's own; otherwise, whatever calls run_pending runs them (a thread started earlier is stopped)."""
+		with self.lock:
+			self.running = True
+			if thread and self.thread is None:
+				self.thread = threading.Thread(name="mbf_scheduler", target=self.run)
+				self.thread.daemon = True
+				self.thread.start()
+			elif not thread and self.thread is not None:
+				self.thread = None # it notices and exits
+				self.wakeup.notify_all()
+
+	def shutdown(self, wait=True):
+		"""Stop running jobs (and the scheduler's thread, if it has one). Jobs are kept, and run again if the scheduler is started again."""
+		with self.lock:
+			self.running = False
+			thread = self.thread
+			self.thread = None
+			self.wakeup.notify_all()
+		if wait and thread is not None and thread is not threading.current_thread():
+			thread.join()
+
+	def run(self):
+		"""The scheduler's own thread, when it has one"""
+		me = threading.current_thread()
+		while True:
+			with self.lock:
+				if not self.running or self.thread is not me:
+					return
+				timeout = self.next_due()
+				if timeout is None or timeout > 0:
+					self.wakeup.wait(timeout)
+				if not self.running or self.thread is not me:
+					return
+			self.run_pending()
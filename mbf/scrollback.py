@@ -0,0 +1,60 @@
+# Mbf, the mud bot framework - scrollback
+# Author: Blake Oliver <oliver22213@me.com>
+
+
+class Scrollback(object):
+	def __init__(self, capacity=1000):
+		"""The most recent lines the mud sent, kept in a ring buffer of a fixed number of lines, so it takes the same memory however long a bot runs. Mbf keeps one for each session (see it's scrollback argument) and adds every line to it before triggers see them.
+		Every line ever added has a number, counting from 0; the buffer has the last capacity of them. Multiline triggers with a window (see Trigger) look back through it instead of keeping text of their own, and trigger functions can too, with last.
+		Args:
+			capacity: The number of lines kept.
+		"""
+		self.capacity = capacity
+		self.ring = [None] * capacity
+		self.total = 0 # lines ever added; the next line's number
+
+	def __len__(self):
+		return min(self.total, self.capacity)
+
+	@property
+	def first(self):
+		"""The number of the oldest line still kept"""
+		return self.total - len(self)
+
+	def extend(self, lines):
+		"""Add lines, forgetting the oldest ones if there isn't room"""
+		capacity = self.capacity
+		if not capacity:
+			self.total += len(lines)
+			return
+		if len(lines) > capacity:
+			self.total += len(lines) - capacity
+			lines = lines[-capacity:]
+		start = self.total % capacity
+		end = start + len(lines)
+		if end <= capacity:
+			self.ring[start:end] = lines
+		else: # wraps around
+			split = capacity - start
+			self.ring[start:] = lines[:split]
+			self.ring[:end - capacity] = lines[split:]
+		self.total += len(lines)
+
+	def lines(self, start, end=None):
+		"""Return the lines numbered start up to (not including) end, or to the newest line; none if start has already been forgotten"""
+		if end is None or end > self.total:
+			end = self.total
+		if start < self.first:
+			return None
+		if start >= end:
+			return []
+		capacity = self.capacity
+		s = start % capacity
+		e = s + (end - start)
+		if e <= capacity:
+			return self.ring[s:e]
+		return self.ring[s:] + self.ring[:e - capacity]
+
+	def last(self, n):
+		"""Return the last n lines (or as many as there are), oldest first"""
+		return self.lines(max(self.first, self.total - n))
@@ -0,0 +1,261 @@
+# Mbf, the mud bot framework - outgoing command queue
+# Author: Blake Oliver <oliver22213@me.com>
+
+import collections
+import logging
+import socket
+import threading
+import time
+
+# Priority lanes; commands in a lower numbered lane are always sent before ones in a higher numbered lane
+URGENT = 0 # logging in, fleeing, healing; whatever can't wait behind anything else
+NORMAL = 1
+BULK = 2 # spam, like selling a whole inventory
+
+
+class SendQueue(object):
+	def __init__(self, write, rate=None, burst=10, coalesce=0.0, max_write=4096, on_error=None):
+		"""Queues commands for the mud and writes them on a thread of it's own, so nothing sending a command ever waits on the socket.
+		Started without a thread (see start), it's written instead by whatever calls pump when the socket can take more data; mbf.host.Host does that for every session from it's own thread, so a host's sessions don't each need a writer thread.
+		Commands queued close together (everything queued by the time the writer wakes up, plus whatever arrives in the next coalesce seconds) are joined and sent in one write instead of one each.
+		A token bucket can limit how many commands go out per second, for muds that drop or punish commands sent faster than that; when it's limiting, commands wait in three lanes (URGENT, NORMAL and BULK) and are taken from the most urgent one first.
+		Args:
+			write: The function that actually sends data; given one string of joined commands.
+			rate: The number of commands that can be sent per second, on average. None (the default) means no limit.
+			burst: How many commands can be sent at once, after enough time without any, when rate is set.
+			coalesce: Seconds the writer waits after being woken, so commands that follow soon after are sent in the same write. 0 by default, which only joins commands that were queued while the last write was happening.
+			max_write: The most data (roughly) to send in one write; more commands than this are sent in more than one.
+			on_error: A function called with the exception if write raises one (the connection is probably broken). The writer stops; what it was writing goes back on the front of the lanes it came from, to be drained and sent again after reconnecting, or cleared.
+		"""
+		self.log = logging.getLogger("mbf.sendqueue")
+		self.log.addHandler(logging.NullHandler())
+		self.write = write
+		self.rate = rate
+		self.burst = burst
+		self.coalesce = coalesce
+		self.max_write = max_write
+		self.on_error = on_error
+		self.lanes = (collections.deque(), collections.deque(), collections.deque())
+		self.cond = threading.Condition()
+		self.write_lock = threading.Lock() # keeps batches written by pump in order, whatever threads call it
+		self.tokens = float(burst)
+		self.last_refill = time.time()
+		self.queued_at = 0.0 # when the first of the commands waiting was queued, for coalescing without a thread
+		self.running = False
+		self.threaded = False # written by the writer thread, rather than by pump
+		self.busy = False # the writer has taken commands off the queue and is writing them
+		self.thread = None
+		self.notify = None # called when a command is queued, if the queue is written with pump
+		# metrics
+		self.commands = 0 # commands written
+		self.writes = 0 # write calls those took
+		self.bytes = 0
+		self.throttled = 0 # times the rate limit made the writer wait
+		self.max_depth = 0
+
+	def __len__(self):
+		return sum(len(l) for l in self.lanes)
+
+	def put(self, command, priority=NORMAL):
+		"""Queue a command (which should already end with a newline) to be sent; returns right away"""
+		with self.cond:
+			depth = len(self)
+			if not depth:
+				self.queued_at = time.time()
+			self.lanes[priority].append(command)
+			depth += 1
+			if depth > self.max_depth:
+				self.max_depth = depth
+			self.cond.notify()
+			notify = self.notify if not self.threaded else None
+		if notify is not None:
+			notify()
+
+	def start(self, thread=True, notify=None):
+		"""Start writing queued commands, if it isn't already being done the way asked for.
+		Args:
+			thread: Write them on a thread of it's own. If false, they're written when pump is called instead (and a writer thread that's running is stopped, leaving what it hadn't written queued).
+			notify: For a queue written with pump, a function to call whenever a command is queued, so whatever calls pump can wake up and watch the socket.
+		"""
+		with self.cond:
+			if notify is not None:
+				self.notify = notify
+			if self.running and self.threaded == thread:
+				return
+			self.running = True
+			self.threaded = thread
+			writer = self.thread
+			self.cond.notify_all() # a writer thread that's running sees threaded is false, and exits
+		if writer is not None and writer is not threading.current_thread():
+			writer.join()
+		self.thread = None
+		if thread:
+			self.thread = threading.Thread(name="mbf_send_queue", target=self.run)
+			self.thread.daemon = True
+			self.thread.start()
+
+	def stop(self, flush=True, timeout=None):
+		"""Stop writing; if flush is true, whatever is queued is sent first (waiting at most timeout seconds for it)"""
+		if flush:
+			self.flush(timeout)
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+		self.thread = None
+
+	def clear(self):
+		"""Drop every queued command"""
+		with self.cond:
+			for l in self.lanes:
+				l.clear()
+			self.cond.notify_all()
+
+	def drain(self):
+		"""Remove and return everything queued, as a list of (priority, command), most urgent first"""
+		with self.cond:
+			commands = [(priority, c) for priority, lane in enumerate(self.lanes) for c in lane]
+			for l in self.lanes:
+				l.clear()
+			self.cond.notify_all()
+			return commands
+
+	def flush(self, timeout=None):
+		"""Wait until everything queued has been written, or timeout seconds pass; returns true if the queue emptied.
+		Without a writer thread, the calling thread writes it (with pump), so a host's thread can flush one of it's own sessions.
+		"""
+		end = None if timeout is None else time.time() + timeout
+		if not self.threaded:
+			while True:
+				wait = self.due()
+				if wait is None:
+					return not len(self)
+				if end is not None and time.time() + wait > end:
+					return False
+				if wait:
+					time.sleep(wait)
+				self.pump()
+		with self.cond:
+			while self.running and (self.busy or len(self)):
+				wait = None if end is None else end - time.time()
+				if wait is not None and wait <= 0:
+					return False
+				self.cond.wait(wait)
+			return not self.busy and not len(self)
+
+	def refill(self, now):
+		"""Add the tokens earned since the last refill to the bucket"""
+		if self.rate is not None:
+			self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.rate)
+		self.last_refill = now
+
+	def take(self):
+		"""Take as many commands as the rate limit and max_write allow, most urgent first; returns (a list of (priority, command), seconds to wait before trying again if some had to be left)"""
+		self.refill(time.time())
+		batch = []
+		size = 0
+		for priority, lane in enumerate(self.lanes):
+			while lane and size < self.max_write:
+				if self.rate is not None:
+					if self.tokens < 1:
+						return batch, (1 - self.tokens) / self.rate
+					self.tokens -= 1
+				command = lane.popleft()
+				batch.append((priority, command))
+				size += len(command)
+		return batch, 0
+
+	def due(self, now=None):
+		"""For a queue written with pump: none if there's nothing to write, otherwise the seconds until pump can write some of it (0 if it can now), for coalescing and the rate limit"""
+		with self.cond:
+			if not self.running or not len(self):
+				return None
+			if now is None:
+				now = time.time()
+			wait = 0.0
+			if self.coalesce:
+				wait = max(wait, self.queued_at + self.coalesce - now)
+			if self.rate is not None:
+				self.refill(now)
+				if self.tokens < 1:
+					wait = max(wait, (1 - self.tokens) / self.rate)
+			return wait
+
+	def pump(self):
+		"""Write one batch of what's queued (as much as the rate limit and max_write allow) on the calling thread, for a queue started without a thread of it's own.
+		Call it when the socket can be written to and due returns 0. Returns false if the connection broke, in which case on_error has been called.
+		"""
+		with self.write_lock:
+			with self.cond:
+				if not self.running:
+					return True
+				batch, wait = self.take()
+				if not batch:
+					return True
+				self.busy = True
+			return self.write_batch(batch, wait)
+
+	def write_batch(self, batch, wait):
+		"""Write a batch of (priority, command) taken off the queue; returns false if the connection broke"""
+		cond = self.cond
+		data = batch[0][1][:0].join(c for priority, c in batch) # works for both byte and unicode strings
+		try:
+			self.write(data)
+		except (EOFError, socket.error, IOError, OSError) as e:
+			self.log.error("""Could not send {} commands; connection broken: {}""".format(len(batch), e))
+			with cond:
+				self.busy = False
+				self.running = False
+				for priority, c in reversed(batch): # it was first in line, so it goes back there, each command in it's own lane
+					self.lanes[priority].appendleft(c)
+				cond.notify_all()
+			if self.on_error is not None:
+				self.on_error(e)
+			return False
+		with cond:
+			self.busy = False
+			self.commands += len(batch)
+			self.writes += 1
+			self.bytes += len(data)
+			if wait:
+				self.throttled += 1
+			cond.notify_all() # for flush
+		return True
+
+	def run(self):
+		"""The writer thread: wait for commands, and write them in batches, until stopped or told to leave writing to pump"""
+		cond = self.cond
+		while True:
+			with cond:
+				while self.running and self.threaded and not len(self):
+					cond.wait()
+				if not (self.running and self.threaded):
+					return
+			if self.coalesce:
+				time.sleep(self.coalesce)
+			with cond:
+				if not (self.running and self.threaded):
+					return
+				batch, wait = self.take()
+				if not batch:
+					self.throttled += 1
+					cond.wait(wait) # new commands wake this early, which just means checking again
+					continue
+				self.busy = True
+			if not self.write_batch(batch, wait):
+				return
+			if wait: # the rate limit left some queued; wait for the next token
+				time.sleep(wait)
+
+	def get_stats(self):
+		"""Return the queue's metrics as a dictionary"""
+		with self.cond:
+			return {
+				'commands': self.commands,
+				'writes': self.writes,
+				'bytes': self.bytes,
+				'throttled': self.throttled,
+				'queued': len(self),
+				'max_depth': self.max_depth,
+			}
@@ -0,0 +1,270 @@
+# Mbf, the mud bot framework - trigger matching in worker processes
+# Author: Blake Oliver <oliver22213@me.com>
+
+import logging
+import mmap
+import multiprocessing
+import time
+
+from triggerset import TriggerSet
+
+try: # python 3 lets us ask for fork; it's the only way python 2 starts processes on the platforms that have it
+	context = multiprocessing.get_context("fork")
+except AttributeError:
+	context = multiprocessing
+
+
+def work(shard, ring, conn, cache_size):
+	"""A worker process: match each batch of lines it's told about against it's shard of triggers, and send back what matched.
+	shard is a list of (index in the main process's trigger set, trigger); the triggers are this process's own copies (it was forked), so they're all enabled here, and whether they really are is checked in the main process.
+	A batch is (offset, length, text, colours, data): the lines are ring[offset:offset + length] joined with newlines, or data if they were too big for the ring. What's sent back is a list of (index, [(line number, or -1 for the block, start of the match or none)]), and the worker's line cache stats (or none).
+	"""
+	ts = TriggerSet(cache_size)
+	index = {}
+	for i, t in shard:
+		t.enabled = True
+		t.stats = None
+		t.fn = None
+		index[id(t)] = i
+		ts.add(t)
+	ts.compile()
+	while True:
+		try:
+			batch = conn.recv()
+		except (EOFError, KeyboardInterrupt):
+			break
+		if batch is None:
+			break
+		offset, length, text, colours, data = batch
+		try:
+			if data is None:
+				data = ring[offset:offset + length]
+			if text:
+				data = data.decode("utf-8")
+			lines = data.split(u"\n" if text else b"\n")
+			numbers = {} # the line number of each line object, since found gives the line itself
+			for n, l in enumerate(lines):
+				numbers.setdefault(id(l), n) # equal lines can be the same object; either number gives the same text back
+			matched = []
+			for t, found in ts.iter_found(lines, colours=colours):
+				matched.append((index[id(t)], [(-1 if t.multiline else numbers[id(l)], m.start() if m is not None else None) for l, m in found]))
+			result = (matched, ts.cache.get_stats() if ts.cache is not None else None)
+		except Exception as e:
+			result = e
+		conn.send(result)
+
+
+class ShardPool(object):
+	def __init__(self, trigger_set, processes, cache_size=0, ring_size=1024 * 1024):
+		"""Matches lines against a trigger set in a pool of worker processes, each of which has a share (shard) of the triggers, so matching isn't limited to the one core the GIL allows. Mbf makes one of these when it's given match_processes.
+		Lines go to the workers through a ring buffer in shared memory that every worker can read; only where they are in it goes down each worker's pipe. Workers send back which triggers matched which lines, and where; this process matches each of those again, anchored where the worker found it, to get the match object the trigger function is given. Trigger functions run here, in order of sequence, and a trigger that stops processing stops every trigger after it, just like without a pool. Whether a trigger is enabled is checked here too, as it's reached, so enabling and disabling triggers works as it always does.
+		Workers are forked with a copy of the compiled trigger set; when triggers are added (so the set is rebuilt) they're forked again. If a worker dies or fails, that batch is matched in this process instead, and the workers are started again for the next one.
+		Triggers are shared out so each worker gets about the same amount of work, counting triggers without a keyword to prefilter on (which are tried on every line) and multiline triggers as heavier than the rest. Output filters stay in this process, as do triggers with a window, which match against the session's scrollback.
+		Shipping lines to other processes and back costs something on every batch, so this only pays when triggers cost more than that: many complicated regular expressions, or many multiline ones, on a busy mud. It also only helps with more than one core to run the workers on: with one, the workers and this process just take turns, and bench_shards measured 0.87 times the speed of matching in this process with two workers. See benchmarks/bench_shards.py.
+		Args:
+			trigger_set: The TriggerSet to match against.
+			processes: How many worker processes to start.
+			cache_size: Each worker's line cache size (see TriggerSet).
+			ring_size: The size of the shared ring buffer, in bytes. Batches bigger than this go down the pipes instead.
+		"""
+		self.log = logging.getLogger("mbf.shard")
+		self.log.addHandler(logging.NullHandler())
+		self.trigger_set = trigger_set
+		self.processes = processes
+		self.cache_size = cache_size
+		self.ring_size = ring_size
+		self.ring = None
+		self.position = 0 # where the next batch goes in the ring
+		self.workers = [] # (process, connection)
+		self.caches = {} # process: it's line cache stats, as of the last batch
+		self.generation = None # of the trigger set the workers were forked with
+		self.running = False
+		# metrics
+		self.batches = 0
+		self.lines = 0
+		self.wait_time = 0.0 # seconds spent waiting for workers
+		self.restarts = 0
+		self.fallbacks = 0 # batches matched in this process because a worker failed
+
+	def start(self):
+		"""Compile the trigger set if it needs it, and fork the workers. Mbf's start_processing calls this; otherwise it's done when the first batch is matched."""
+		ts = self.trigger_set
+		if ts.dirty:
+			ts.compile()
+		if self.ring is None:
+			self.ring = mmap.mmap(-1, self.ring_size) # anonymous, and so shared with processes forked after it's made
+		for shard in self.shards():
+			parent, child = context.Pipe()
+			p = context.Process(name="mbf_shard", target=work, args=(shard, self.ring, child, self.cache_size))
+			p.daemon = True
+			p.start()
+			child.close()
+			self.workers.append((p, parent))
+		self.generation = ts.generation
+		self.running = True
+		self.log.debug("""Started {} matching processes for {} triggers""".format(len(self.workers), len(ts.triggers)))
+
+	def stop(self):
+		"""Stop the workers"""
+		for p, conn in self.workers:
+			try:
+				conn.send(None)
+				conn.close()
+			except (EOFError, IOError, OSError):
+				pass
+		for p, conn in self.workers:
+			p.join(1.0)
+			if p.is_alive():
+				p.terminate()
+		self.workers = []
+		self.caches = {}
+		self.running = False
+
+	def restart(self):
+		self.stop()
+		self.restarts += 1
+		self.start()
+
+	def shards(self):
+		"""Share the triggers out between the workers; returns a list of (index, trigger) lists"""
+		ts = self.trigger_set
+		unfiltered = set(ts.unfiltered)
+		weighed = []
+		windowed = set(ts.windowed)
+		for i, t in enumerate(ts.triggers):
+			if t.is_filter or i in windowed:
+				continue
+			weight = 1
+			if i in unfiltered:
+				weight *= 10
+			if t.multiline:
+				weight *= 4
+			weighed.append((weight, i, t))
+		weighed.sort(key=lambda w: -w[0])
+		shards = [[] for i in range(self.processes)]
+		loads = [0] * self.processes
+		for weight, i, t in weighed: # the heaviest first, each to the least loaded worker
+			least = loads.index(min(loads))
+			shards[least].append((i, t))
+			loads[least] += weight
+		return [s for s in shards if s]
+
+	def put(self, data):
+		"""Write a batch's data into the ring; returns (offset, length), or none if it doesn't fit"""
+		length = len(data)
+		if length > self.ring_size:
+			return None
+		if self.position + length > self.ring_size:
+			self.position = 0
+		offset = self.position
+		self.ring[offset:offset + length] = data
+		self.position += length
+		return offset, length
+
+	def iter_found(self, lines, block=None, colours=None, scanned=None):
+		"""Yield (trigger, found) for every enabled trigger that matches lines, in order of sequence, like TriggerSet.iter_found, with the matching done by the workers.
+		Multiline triggers are always given the lines joined with newlines, so block is ignored, as is scanned.
+		"""
+		ts = self.trigger_set
+		if ts.dirty:
+			ts.compile()
+		if not lines:
+			return
+		if not self.running:
+			self.start()
+		elif ts.generation != self.generation: # triggers were added or removed since the workers were forked
+			self.restart()
+		results = self.match(lines, colours)
+		if results is None:
+			self.fallbacks += 1
+			for r in ts.iter_found(lines, colours=colours):
+				yield r
+			return
+		text = not isinstance(lines[0], bytes)
+		joined = None
+		for i in sorted(set(results).union(ts.windowed)):
+			t = ts.triggers[i]
+			if not t.enabled:
+				continue
+			if joined is None and t.multiline and (i in results or ts.scrollback is None):
+				joined = (u"\n" if text else b"\n").join(lines)
+			if i not in results: # matched here, against the scrollback
+				found = t.find_window(ts.scrollback, len(lines)) if ts.scrollback is not None else t.find(joined)
+				if not found:
+					continue
+			else:
+				if not t.compiled:
+					t.compile()
+				found = []
+				for n, start in results[i]:
+					line = joined if n == -1 else lines[n]
+					found.append((line, t.trig.match(line, start) if start is not None else None))
+			st = t.stats
+			if st is not None:
+				st.hits += len(found)
+			yield t, found
+
+	def match(self, lines, colours):
+		"""Send a batch of lines to every worker and collect what they found: a dictionary of trigger index: [(line number, start)], or none if a worker failed"""
+		text = not isinstance(lines[0], bytes)
+		data = (u"\n" if text else b"\n").join(lines)
+		if text:
+			data = data.encode("utf-8")
+		where = self.put(data)
+		batch = (where[0], where[1], text, colours, None) if where is not None else (0, 0, text, colours, data)
+		start = time.time()
+		results = {}
+		failed = False
+		try:
+			for p, conn in self.workers:
+				conn.send(batch)
+			for p, conn in self.workers:
+				result = conn.recv()
+				if isinstance(result, Exception):
+					self.log.error("""A matching process failed: {}""".format(result))
+					failed = True
+					continue
+				matched, self.caches[p] = result
+				for i, found in matched:
+					results[i] = found
+		except (EOFError, IOError, OSError) as e:
+			self.log.error("""Lost a matching process ({}); starting them again""".format(e))
+			self.running = False
+			for p, conn in self.workers: # whatever the others were sending back is never read, so they have to go
+				p.terminate()
+			self.workers = []
+			self.caches = {}
+			failed = True
+		self.wait_time += time.time() - start
+		self.batches += 1
+		self.lines += len(lines)
+		return None if failed else results
+
+	def process_lines(self, lines, block=None, colours=None, scanned=None):
+		"""Match lines in the workers and fire the triggers that matched, in order of sequence; returns the trigger that stopped processing, if one did"""
+		return self.trigger_set.fire(self.iter_found(lines, block, colours))
+
+	def match_lines(self, lines, block=None, colours=None, scanned=None):
+		"""Match lines in the workers without firing any triggers; a list of (trigger, found) in order of sequence"""
+		return list(self.iter_found(lines, block, colours))
+
+	def get_stats(self):
+		"""Return the pool's metrics as a dictionary"""
+		return {
+			'processes': len(self.workers),
+			'batches': self.batches,
+			'lines': self.lines,
+			'wait_time': self.wait_time,
+			'restarts': self.restarts,
+			'fallbacks': self.fallbacks,
+		}
+
+	def get_cache_stats(self):
+		"""Return the workers' line caches' metrics, added together, as of the last batch each of them matched; none if they don't have caches"""
+		caches = [c for c in list(self.caches.values()) if c is not None]
+		if not caches:
+			return None
+		total = dict((k, sum(c[k] for c in caches)) for k in ('hits', 'misses', 'entries', 'bytes'))
+		looked_up = total['hits'] + total['misses']
+		total['hit_rate'] = float(total['hits']) / looked_up if looked_up else 0.0
+		return total
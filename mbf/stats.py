@@ -0,0 +1,78 @@
+# Mbf, the mud bot framework - trigger and timer statistics
+# Author: Blake Oliver <oliver22213@me.com>
+
+import time
+
+clock = getattr(time, 'perf_counter', time.time) # the most precise clock there is
+
+
+class TriggerStats(object):
+	"""Counters for one trigger, kept when mbf is created with collect_stats set.
+	Attributes:
+		attempts: lines (or blocks, for multiline triggers) this trigger was tried against. Lines the compiled trigger set ruled out without trying the trigger don't count.
+		hits: matches found.
+		match_time: seconds spent looking for matches.
+		fire_time: seconds spent firing the trigger, which includes callback_time.
+		callback_time: seconds spent in the trigger's function itself.
+		stops: times this trigger stopped processing for the rest of a buffer.
+	"""
+	fields = ('attempts', 'hits', 'match_time', 'fire_time', 'callback_time', 'stops')
+
+	def __init__(self):
+		self.attempts = 0
+		self.hits = 0
+		self.match_time = 0.0
+		self.fire_time = 0.0
+		self.callback_time = 0.0
+		self.stops = 0
+
+	def as_dict(self):
+		return dict((f, getattr(self, f)) for f in self.fields)
+
+
+class TimerStats(object):
+	"""Counters for one timer, kept when mbf is created with collect_stats set.
+	Attributes:
+		fires: times the timer's function was run.
+		callback_time, max_callback_time: total and longest seconds spent in the timer's function.
+		lag, max_lag: total and longest seconds between when the timer was scheduled to fire and when it did.
+	"""
+	fields = ('fires', 'callback_time', 'max_callback_time', 'lag', 'max_lag')
+
+	def __init__(self):
+		self.fires = 0
+		self.callback_time = 0.0
+		self.max_callback_time = 0.0
+		self.lag = 0.0
+		self.max_lag = 0.0
+		self.started = None # wall clock time the current or last run started, for working out lag
+
+	def record_run(self, took):
+		self.fires += 1
+		self.callback_time += took
+		if took > self.max_callback_time:
+			self.max_callback_time = took
+
+	def record_lag(self, lag):
+		self.lag += lag
+		if lag > self.max_lag:
+			self.max_lag = lag
+
+	def as_dict(self):
+		return dict((f, getattr(self, f)) for f in self.fields)
+
+
+def format_prometheus(stats, prefix="mbf"):
+	"""Format the dictionary returned by Mbf.stats() in the prometheus text exposition format"""
+	out = []
+	def metric(name, labels, value):
+		label_text = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in sorted(labels.items()))
+		out.append("{}_{}{{{}}} {}".format(prefix, name, label_text, value))
+	for kind in ('trigger', 'timer'):
+		for name, counters in sorted(stats.get(kind + 's', {}).items()):
+			for field, value in sorted(counters.items()):
+				metric("{}_{}".format(kind, field), {kind: name}, value)
+	for section in ('dispatcher', 'send_queue', 'reconnect', 'transcript', 'output', 'line_cache', 'shards', 'proxy', 'state'):
+		for field, value in sorted(stats.get(section, {}).items()):
+			metric("{}_{}".format(section, field), {}, value)
+	return "\n".join(out) + "\n"
@@ -0,0 +1,290 @@
+# Mbf, the mud bot framework - persistent g
+# Author: Blake Oliver <oliver22213@me.com>
+
+import atexit
+import collections
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+try:
+	import cPickle as pickle
+except ImportError: # python 3
+	import pickle
+
+try:
+	from collections.abc import MutableMapping
+except ImportError: # python 2
+	from collections import MutableMapping
+
+FORMAT = 1
+PROTOCOL = 2 # pickle protocol; one python 2 and 3 can both read
+RECORD = struct.Struct("<Ii") # the lengths of the pickled key and value that follow; the value's is -1 for a deletion
+
+
+class Store(MutableMapping):
+	def __init__(self, path, flush_interval=0.5, compact_size=8 * 1024 * 1024, fsync=False):
+		"""A dictionary that's kept on disk, for a bot's g: maps, kill counts, item databases, anything that should survive a crash or a restart. Mbf makes one when it's given a state path.
+		Setting or deleting a key only changes the dictionary and notes that the key is dirty; the trigger thread never pickles or writes anything. A thread of the store's own wakes every flush_interval seconds and appends the current value of every dirty key to a log (path + ".log"), so a crash loses at most that much.
+		When the log grows past compact_size bytes (and when the store is closed), it's compacted into a snapshot: an sqlite database at path, with a row per key. The full log is moved aside (to path + ".log.old") and a new one started, and the old one is applied to the snapshot in one transaction, on a connection of it's own and without holding the lock loading a value needs, so a trigger reading a key it hasn't used yet doesn't wait for it (the snapshot is in sqlite's WAL mode, so reading it doesn't wait for the transaction either). A crash part way through just leaves the old log to be applied again, before the new one, the next time the store is opened.
+		Loading is lazy: opening a store applies any log left over to the snapshot and reads the list of keys, but a key's value is only unpickled when it's first asked for, so a bot with a huge item database starts as fast as one without.
+		A key is written under the pickle it was first written or loaded with, so keys that are equal but pickle differently (in python 2, 'hp' and u'hp', or 1, 1L and True) are one key on disk, as they are in the dictionary.
+		Only changes to the store itself are noticed. Changing a value in place (g['kills'][mob] += 1, or g['map'].add(room)) doesn't dirty it's key; call touch(key) afterwards so it's written. Keys and values must be picklable, and pickling happens on the store's thread, so values being changed there while they're written are written again next time. A key's whole value is pickled again whenever it changes (and python runs one thread at a time, so that still takes time from triggers), so state that's big and changes often is better split across several keys than kept in one.
+		Args:
+			path: The snapshot database. The log is next to it.
+			flush_interval: How often, in seconds, the writer wakes up to write dirty keys.
+			compact_size: How big, in bytes, the log can get before it's compacted into the snapshot.
+			fsync: fsync the log after each write, so what's written also survives the machine crashing, not just the bot.
+		"""
+		self.log = logging.getLogger("mbf.store")
+		self.log.addHandler(logging.NullHandler())
+		self.path = path
+		self.flush_interval = flush_interval
+		self.compact_size = compact_size
+		self.fsync = fsync
+		self.data = {} # the values that have been loaded or set
+		self.unloaded = set() # keys in the snapshot that haven't been asked for yet
+		self.pickles = {} # key: the pickle it's row is under, for every key in the snapshot or the log; only used with the lock held
+		self.changes = collections.deque() # keys set, deleted or touched since the last write; appending doesn't need a lock
+		self.lock = threading.Lock() # held while using self.db or the log
+		self.compacting = threading.Lock() # held while the old log is applied to the snapshot
+		# metrics
+		self.records = 0 # written to the log
+		self.log_bytes = 0
+		self.snapshots = 0
+		self.loads = 0 # values loaded lazily
+		self.max_dirty = 0
+		self.write_time = 0.0 # seconds the writer has spent pickling and writing
+		self.snapshot_time = 0.0
+		self.log_path = path + ".log"
+		self.old_log_path = path + ".log.old" # a full log being compacted
+		self.db = sqlite3.connect(path, check_same_thread=False) # used by whichever thread loads a value, with the lock held
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)")
+		self.db.execute("CREATE TABLE IF NOT EXISTS g (key BLOB PRIMARY KEY, value BLOB)")
+		row = self.db.execute("SELECT value FROM meta WHERE name = 'format'").fetchone()
+		if row is None:
+			self.db.execute("INSERT INTO meta VALUES ('format', ?)", (FORMAT,))
+			self.db.commit()
+		elif row[0] != FORMAT:
+			raise ValueError("""{} is a state snapshot in a different format ({}); use a new file""".format(path, row[0]))
+		self.apply_logs(self.db, [self.old_log_path, self.log_path]) # whatever a crash left, oldest first
+		self.remove_log(self.old_log_path)
+		self.log_file = open(self.log_path, "wb")
+		for (blob,) in self.db.execute("SELECT key FROM g"):
+			blob = bytes(blob)
+			key = pickle.loads(blob)
+			self.pickles[key] = blob
+			self.unloaded.add(key)
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(name="mbf_store", target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+		atexit.register(self.close)
+
+	def __getitem__(self, key):
+		try:
+			return self.data[key]
+		except KeyError:
+			if key not in self.unloaded:
+				raise
+		return self.load(key)
+
+	def __setitem__(self, key, value):
+		self.data[key] = value
+		if self.unloaded:
+			self.unloaded.discard(key)
+		self.changes.append(key)
+
+	def __delitem__(self, key):
+		if key in self.data:
+			del self.data[key]
+		elif key in self.unloaded:
+			self.unloaded.discard(key)
+		else:
+			raise KeyError(key)
+		self.changes.append(key)
+
+	def __contains__(self, key):
+		return key in self.data or key in self.unloaded
+
+	def __iter__(self):
+		for key in list(self.data):
+			yield key
+		for key in list(self.unloaded):
+			yield key
+
+	def __len__(self):
+		return len(self.data) + len(self.unloaded)
+
+	def __repr__(self):
+		return """<Store {} ({} keys)>""".format(self.path, len(self))
+
+	def touch(self, key):
+		"""Note that the value of key has been changed in place, so it's written"""
+		self.changes.append(key)
+
+	def load(self, key):
+		"""Read a key's value from the snapshot"""
+		with self.lock:
+			if key not in self.unloaded: # it was set, deleted or loaded by another thread while we waited
+				return self.data[key]
+			row = self.db.execute("SELECT value FROM g WHERE key = ?", (sqlite3.Binary(self.pickles[key]),)).fetchone()
+			value = pickle.loads(bytes(row[0]))
+			self.data.setdefault(key, value)
+			self.unloaded.discard(key) # not del; the trigger thread can set or delete the key without the lock
+			self.loads += 1
+			return self.data[key]
+
+	def run(self):
+		"""The writer thread"""
+		while not self.stopped.wait(self.flush_interval):
+			try:
+				self.write_dirty()
+			except Exception:
+				self.log.exception("""Writing state to {} failed""".format(self.path))
+
+	def write_dirty(self):
+		"""Append the current value of every dirty key to the log, and compact it if it's grown too big"""
+		if self.write_log() and self.compacting.acquire(False): # if a compaction's already running, the next write will try again
+			try:
+				self.compact()
+			finally:
+				self.compacting.release()
+
+	def write_log(self):
+		"""Append the current value of every dirty key to the log; returns true if it needs compacting"""
+		with self.lock: # so the writer and flush take turns, and records go in the log in order
+			if self.log_file is None:
+				return False
+			changes = self.changes
+			dirty = set()
+			for i in range(len(changes)):
+				dirty.add(changes.popleft())
+			if not dirty:
+				return os.path.exists(self.old_log_path) # a compaction that failed is tried again
+			if len(dirty) > self.max_dirty:
+				self.max_dirty = len(dirty)
+			start = time.time()
+			missing = object()
+			records = []
+			pickles = self.pickles
+			for key in dirty:
+				value = self.data.get(key, missing)
+				if value is missing:
+					if key in self.unloaded: # touched, but never loaded, so it hasn't changed
+						continue
+					k = pickles.pop(key, None)
+					if k is not None: # deleted; nothing to do if it was never written
+						records.append(RECORD.pack(len(k), -1) + k)
+					continue
+				try:
+					k = pickles.get(key)
+					if k is None:
+						k = pickle.dumps(key, PROTOCOL)
+					v = pickle.dumps(value, PROTOCOL)
+				except RuntimeError: # changed while it was being pickled; try again next time
+					self.touch(key)
+					continue
+				pickles.setdefault(key, k)
+				records.append(RECORD.pack(len(k), len(v)) + k + v)
+			data = b"".join(records)
+			self.log_file.write(data)
+			self.log_file.flush()
+			if self.fsync:
+				os.fsync(self.log_file.fileno())
+			self.records += len(records)
+			self.log_bytes += len(data)
+			self.write_time += time.time() - start
+			return self.log_file.tell() > self.compact_size or os.path.exists(self.old_log_path)
+
+	def compact(self):
+		"""Move the log aside, start a new one, and apply the old one to the snapshot; called with self.compacting held"""
+		with self.lock:
+			if self.log_file is None:
+				return
+			if not os.path.exists(self.old_log_path): # otherwise a compaction failed, and it's log has to be applied before this one
+				self.log_file.close()
+				try:
+					os.rename(self.log_path, self.old_log_path)
+				finally:
+					self.log_file = open(self.log_path, "ab")
+		db = sqlite3.connect(self.path) # self.db is for loading, with the lock held
+		try:
+			self.apply_logs(db, [self.old_log_path])
+		finally:
+			db.close()
+		self.remove_log(self.old_log_path)
+
+	def apply_logs(self, db, paths):
+		"""Apply the records in the logs at paths (those that exist), in order, to the snapshot in one transaction"""
+		data = []
+		for path in paths:
+			if os.path.exists(path):
+				with open(path, "rb") as f:
+					data.append(f.read())
+		if not any(data):
+			return
+		start = time.time()
+		latest = {} # the key's pickle: the value's, or none if it was deleted; nothing needs unpickling
+		for log in data:
+			pos = 0
+			while pos + RECORD.size <= len(log):
+				key_length, value_length = RECORD.unpack_from(log, pos)
+				middle = pos + RECORD.size + key_length
+				end = middle + max(value_length, 0)
+				if end > len(log): # cut short by a crash
+					break
+				latest[log[pos + RECORD.size:middle]] = log[middle:end] if value_length >= 0 else None
+				pos = end
+		with db:
+			db.executemany("DELETE FROM g WHERE key = ?", [(sqlite3.Binary(k),) for k, v in latest.items() if v is None])
+			db.executemany("INSERT OR REPLACE INTO g VALUES (?, ?)", [(sqlite3.Binary(k), sqlite3.Binary(v)) for k, v in latest.items() if v is not None])
+		self.snapshots += 1
+		self.snapshot_time += time.time() - start
+		self.log.debug("""Compacted {} bytes of log into {}""".format(sum(len(log) for log in data), self.path))
+
+	def remove_log(self, path):
+		try:
+			os.remove(path)
+		except OSError: # there wasn't one
+			pass
+
+	def flush(self):
+		"""Write every dirty key now, rather than waiting for the writer"""
+		self.write_dirty()
+
+	def close(self):
+		"""Write every dirty key, compact the log into the snapshot, and stop the writer"""
+		if self.stopped.is_set():
+			return
+		self.stopped.set()
+		if self.thread is not threading.current_thread():
+			self.thread.join()
+		self.write_dirty()
+		with self.compacting:
+			with self.lock:
+				self.log_file.close()
+				self.log_file = None
+				self.apply_logs(self.db, [self.old_log_path, self.log_path])
+				self.remove_log(self.old_log_path)
+				open(self.log_path, "wb").close()
+				self.db.close()
+
+	def get_stats(self):
+		"""Return the store's metrics as a dictionary"""
+		return {
+			'keys': len(self),
+			'loaded': len(self.data),
+			'changes': len(self.changes),
+			'max_dirty': self.max_dirty,
+			'records': self.records,
+			'log_bytes': self.log_bytes,
+			'snapshots': self.snapshots,
+			'loads': self.loads,
+			'write_time': self.write_time,
+			'snapshot_time': self.snapshot_time,
+		}
@@ -0,0 +1,268 @@
+# Mbf, the mud bot framework - telnet protocol layer
+# Author: Blake Oliver <oliver22213@me.com>
+
+import logging
+import struct
+import telnetlib
+import threading
+import zlib
+
+# Telnet commands
+IAC = b"\xff"
+DONT = b"\xfe"
+DO = b"\xfd"
+WONT = b"\xfc"
+WILL = b"\xfb"
+SB = b"\xfa"
+GA = b"\xf9"
+EOR_CMD = b"\xef"
+SE = b"\xf0"
+
+# Telnet options
+ECHO = b"\x01"
+SGA = b"\x03"
+TTYPE = b"\x18"
+EOR = b"\x19"
+NAWS = b"\x1f"
+MCCP2 = b"\x56"
+MCCP3 = b"\x57"
+MSDP = b"\x45"
+GMCP = b"\xc9"
+
+# parser states
+DATA, COMMAND, OPTION, SUBNEG, SUBNEG_IAC = range(5)
+
+
+class Telnet(telnetlib.Telnet):
+	def __init__(self, host=None, port=0, mccp=True, compress_output=False, terminal_type="mbf", window_size=(80, 24), gmcp=False, msdp=False):
+		"""A telnetlib.Telnet that negotiates the options muds use instead of refusing all of them.
+		Supported options are:
+			MCCP2: the mud compresses what it sends with zlib; it's decompressed here as it's read, before any other processing.
+			MCCP3: what mbf sends is compressed too, if compress_output is set and the mud offers it.
+			NAWS: tells the mud window_size, as (columns, rows).
+			TTYPE: tells the mud terminal_type when it asks.
+			EOR, GA: the mud marks the end of a prompt with one of these; their positions in the data are kept (see read_with_marks), so a prompt without a newline can be passed to triggers right away.
+			ECHO, SGA: accepted so muds that hide passwords or suppress go-ahead work normally.
+			GMCP, MSDP: out of band data, accepted if gmcp or msdp are set. Their messages are kept, undecoded, until read_oob is called, so whoever reads can handle them after the text that came with them rather than in the middle of parsing it; enabled_callback(option) is called when the mud agrees to send them.
+		The data is read from the socket in large chunks, and everything between telnet commands is passed through in slices, rather than byte by byte like telnetlib does it.
+		All of telnetlib's read and expect methods still work.
+		"""
+		self.log = logging.getLogger("mbf.telnet")
+		self.log.addHandler(logging.NullHandler())
+		self.mccp = mccp
+		self.compress_output = compress_output
+		self.terminal_type = terminal_type
+		self.window_size = window_size
+		self.state = DATA
+		self.command = None # the command waiting for an option
+		self.sbdata = [] # pieces of the subnegotiation being read
+		self.local = set() # options we've agreed to do
+		self.remote = set() # options we've agreed the mud can do
+		self.accept = set([EOR, ECHO, SGA]) # options the mud can do, if it offers
+		if mccp:
+			self.accept.add(MCCP2)
+		if compress_output:
+			self.accept.add(MCCP3)
+		if gmcp:
+			self.accept.add(GMCP)
+		if msdp:
+			self.accept.add(MSDP)
+		self.oob = [] # (option, data) for each GMCP or MSDP message not yet read
+		self.enabled_callback = None
+		self.decompressor = None
+		self.compressor = None
+		self.send_lock = threading.Lock() # sending happens on the reader, send queue and user threads; MCCP3's stream has to stay in order
+		self.marks = [] # offsets in cookedq where a prompt ended
+		telnetlib.Telnet.__init__(self, host, port)
+
+	def fill_rawq(self):
+		"""Fill the raw queue with one recv() call, decompressing if the mud is compressing"""
+		if self.irawq >= len(self.rawq):
+			self.rawq = b""
+			self.irawq = 0
+		buf = self.sock.recv(65536)
+		self.eof = (not buf)
+		if buf and self.decompressor is not None:
+			buf = self.decompress(buf)
+		self.rawq = self.rawq + buf
+
+	def process_rawq(self):
+		"""Move everything in the raw queue to the cooked queue, handling telnet commands along the way"""
+		raw = self.rawq[self.irawq:] if self.irawq else self.rawq
+		self.rawq = b""
+		self.irawq = 0
+		if raw:
+			self.cookedq = self.cookedq + self.parse(raw)
+
+	def parse(self, raw):
+		"""Return the data in raw with telnet commands removed, and act on the commands.
+		Commands split across reads are finished on the next call.
+		"""
+		out = []
+		outlen = len(self.cookedq) # for recording where prompts end
+		i = 0
+		n = len(raw)
+		while i < n:
+			state = self.state
+			if state == DATA:
+				j = raw.find(IAC, i)
+				if j == -1:
+					out.append(raw[i:] if i else raw)
+					break
+				if j > i:
+					out.append(raw[i:j])
+					outlen += j - i
+				self.state = COMMAND
+				i = j + 1
+			elif state == COMMAND:
+				c = raw[i:i+1]
+				i += 1
+				self.state = DATA
+				if c == IAC: # an escaped 255
+					out.append(IAC)
+					outlen += 1
+				elif c in (DO, DONT, WILL, WONT):
+					self.command = c
+					self.state = OPTION
+				elif c == SB:
+					self.sbdata = []
+					self.state = SUBNEG
+				elif c == GA or c == EOR_CMD:
+					self.marks.append(outlen)
+			elif state == OPTION:
+				self.state = DATA
+				self.negotiate(self.command, raw[i:i+1])
+				i += 1
+			elif state == SUBNEG:
+				j = raw.find(IAC, i)
+				if j == -1:
+					self.sbdata.append(raw[i:])
+					break
+				self.sbdata.append(raw[i:j])
+				self.state = SUBNEG_IAC
+				i = j + 1
+			elif state == SUBNEG_IAC:
+				c = raw[i:i+1]
+				i += 1
+				if c == IAC:
+					self.sbdata.append(IAC)
+					self.state = SUBNEG
+				else: # SE, or a broken subnegotiation; either way it's over
+					self.state = DATA
+					data = b"".join(self.sbdata)
+					self.sbdata = []
+					if data:
+						started = self.decompressor is None and data[:1] == MCCP2 and MCCP2 in self.remote
+						self.subnegotiate(data[:1], data[1:])
+						if started: # everything after this is compressed
+							raw = self.decompress(raw[i:])
+							i = 0
+							n = len(raw)
+		return b"".join(out)
+
+	def negotiate(self, command, option):
+		"""Answer a DO, DONT, WILL or WONT from the mud"""
+		self.log.debug("""Received {} {}""".format(ord(command), ord(option)))
+		if command == WILL:
+			if option in self.accept:
+				if option not in self.remote:
+					self.remote.add(option)
+					self.send_raw(IAC + DO + option)
+					if option == MCCP3: # we start compressing as soon as we say so, before anything else is sent
+						with self.send_lock:
+							self.sock.sendall(IAC + SB + MCCP3 + IAC + SE)
+							self.compressor = zlib.compressobj()
+					if self.enabled_callback is not None:
+						self.enabled_callback(option)
+			else:
+				self.send_raw(IAC + DONT + option)
+		elif command == WONT:
+			if option in self.remote:
+				self.remote.discard(option)
+				self.send_raw(IAC + DONT + option)
+				if option == MCCP3:
+					with self.send_lock:
+						self.compressor = None
+		elif command == DO:
+			if option in (NAWS, TTYPE):
+				if option not in self.local:
+					self.local.add(option)
+					self.send_raw(IAC + WILL + option)
+				if option == NAWS:
+					self.send_naws()
+			else:
+				self.send_raw(IAC + WONT + option)
+		elif command == DONT:
+			if option in self.local:
+				self.local.discard(option)
+				self.send_raw(IAC + WONT + option)
+
+	def subnegotiate(self, option, data):
+		"""Handle a subnegotiation from the mud"""
+		if option == MCCP2 and MCCP2 in self.remote:
+			self.log.debug("MCCP2 compression started")
+			self.decompressor = zlib.decompressobj()
+		elif option == TTYPE and data[:1] == b"\x01": # SEND
+			self.send_raw(IAC + SB + TTYPE + b"\x00" + self.terminal_type.encode("ascii") + IAC + SE)
+		elif (option == GMCP or option == MSDP) and option in self.remote:
+			self.oob.append((option, data))
+
+	def send_subnegotiation(self, option, data):
+		"""Send IAC SB option data IAC SE to the mud, doubling any IAC characters in data"""
+		self.send_raw(IAC + SB + option + data.replace(IAC, IAC + IAC) + IAC + SE)
+
+	def send_naws(self):
+		"""Tell the mud our window size"""
+		size = struct.pack(">HH", self.window_size[0], self.window_size[1]).replace(IAC, IAC + IAC)
+		self.send_raw(IAC + SB + NAWS + size + IAC + SE)
+
+	def decompress(self, data):
+		"""Decompress data from the mud; if the compressed stream ends, whatever came after it is returned as is and decompression stops"""
+		d = self.decompressor
+		try:
+			out = d.decompress(data)
+		except zlib.error as e:
+			self.log.error("""MCCP decompression failed: {}""".format(e))
+			self.decompressor = None
+			return b""
+		if d.unused_data: # the mud ended compression
+			self.log.debug("MCCP2 compression ended")
+			out = out + d.unused_data
+			self.decompressor = None
+		return out
+
+	def send_raw(self, data):
+		"""Send data to the mud as is (compressing it if we're compressing). Safe to call from any thread."""
+		with self.send_lock:
+			if self.compressor is not None:
+				data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+			self.sock.sendall(data)
+
+	def write(self, buffer):
+		"""Write a string to the socket, doubling any IAC characters"""
+		if IAC in buffer:
+			buffer = buffer.replace(IAC, IAC + IAC)
+		self.send_raw(buffer)
+
+	def read_with_marks(self):
+		"""Like read_very_eager, but return (data, marks), where marks is a list of offsets in data where the mud marked the end of a prompt with GA or EOR"""
+		data = self.read_very_eager()
+		marks = [m for m in self.marks if m <= len(data)]
+		self.marks = []
+		return data, marks
+
+	def read_oob(self):
+		"""Return the (option, data) of every GMCP and MSDP message parsed since the last call, in the order they arrived"""
+		oob = self.oob
+		self.oob = []
+		return oob
+
+	def read_until(self, match, timeout=None):
+		r = telnetlib.Telnet.read_until(self, match, timeout)
+		self.marks = [] # the offsets are only good while the cooked queue is read all at once
+		return r
+
+	def expect(self, list, timeout=None):
+		r = telnetlib.Telnet.expect(self, list, timeout)
+		self.marks = []
+		return r
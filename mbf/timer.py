@@ -1,7 +1,13 @@
 # Mbf, the mud bot framework - timer class
 # Author: Blake Oliver <oliver22213@me.com>
 
+import time
+
+from stats import clock
+
 class Timer(object):
+	__slots__ = ('scheduler', 'type', '_enabled', 'name', 'group', 'one_shot', 'run_limit', 'fn', 'run_count', 'stats', 'job')
+	
 	def __init__(self, scheduler, type='interval', enabled=True, name=None, group='all', one_shot=False, run_limit = -1, *args, **kwargs):
 		"""Class that wraps an 'APScheduler' job into a timer instance for mbf.
 		
@@ -28,10 +34,11 @@ class Timer(object):
 		self.run_limit = run_limit
 		self.fn = None
 		self.run_count = 0
+		self.stats = None # a TimerStats instance, if mbf is collecting statistics
 		self.job = self.scheduler.add_job(self.fire, self.type, *args, **kwargs)
 		if self.enabled == False:
 			self.job.pause()
-		if self.one_shot and self.run_limit > 1: # one_shot overrides run_limit
+		if self.one_shot and self.run_limit != 1: # one_shot overrides run_limit
 			self.run_limit = 1
 	
 	def fire(self, *function_args, **function_kwargs):
@@ -40,16 +47,32 @@ class Timer(object):
 		To specify args and kwargs for the timer's associated function to run, add 'args' and 'kwargs', items, of types list and dict (respectively) to mbf's timer decorator or on 'Timer' class initialization; they'll get passed to add_job which will pass them to this method.
 		"""		
 		if self.fn is not None:
-			if self.run_limit==-1 or self.run_count <= self.run_limit:
+			if self.run_limit==-1 or self.run_count < self.run_limit:
 				# if we don't have a run limit, or we do and the run count is less than said limit 
-				self.fn(*function_args, **function_kwargs)
 				self.run_count += 1
+				if self.run_count == self.run_limit: # that's the last run; don't leave the job to fire once more for nothing
+					self.remove_job()
+				st = self.stats
+				if st is None:
+					self.fn(*function_args, **function_kwargs)
+				else:
+					st.started = time.time()
+					start = clock()
+					self.fn(*function_args, **function_kwargs)
+					st.record_run(clock() - start)
 			else: # no more runs for this timer
-				self.job.remove()
+				self.remove_job()
 		else:
 			# throw a specific exception here that has yet to be created
 			pass
 	
+	def remove_job(self):
+		"""Remove this timer's job from the scheduler, if it's still there (date jobs are removed once they've run)"""
+		try:
+			self.job.remove()
+		except KeyError: # both schedulers' JobLookupError
+			pass
+	
 	@property
 	def enabled(self):
 		return self._enabled
@@ -57,7 +80,7 @@ class Timer(object):
 	@enabled.setter
 	def enabled(self, val):
 		"""Enable this timer / job"""
-		if job is not None and val != self._enabled:
+		if self.job is not None and val != self._enabled:
 			if val == True:
 				self._enabled = True
 				self.job.resume()
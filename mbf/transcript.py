@@ -0,0 +1,323 @@
+# Mbf, the mud bot framework - session transcripts
+# Author: Blake Oliver <oliver22213@me.com>
+
+import atexit
+import bisect
+import collections
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from scheduler import to_timestamp
+
+# Directions
+INBOUND = 0 # what the mud sent
+OUTBOUND = 1 # what mbf sent
+
+FORMAT = 1
+RECORD = struct.Struct("<dBI") # time, direction, length; followed by the data
+MAGIC = {"gzip": b"\x1f\x8b\x08", "zstd": b"\x28\xb5\x2f\xfd"} # what each segment starts with
+
+
+def compressor(compression, level):
+	"""Return (compress, sync, finish) functions for a new compressed stream"""
+	if compression == "gzip":
+		c = zlib.compressobj(level, zlib.DEFLATED, 31) # 31: with a gzip header, so a transcript is an ordinary multi-member gzip file
+		return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+	if compression == "zstd":
+		import zstandard
+		c = zstandard.ZstdCompressor(level=level).compressobj()
+		return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+	raise ValueError("""Unknown transcript compression {}""".format(compression))
+
+
+def decompressor(compression):
+	if compression == "gzip":
+		return zlib.decompressobj(31)
+	import zstandard
+	return zstandard.ZstdDecompressor().decompressobj()
+
+
+class Recorder(object):
+	def __init__(self, path, compression="gzip", level=6, segment_seconds=60, segment_size=64 * 1024 * 1024, flush_interval=0.5):
+		"""Records everything a session reads from and writes to the mud, with timestamps, to a compressed transcript.
+		Recording only puts the data on a queue; a thread of the recorder's own compresses and writes it, so keeping a transcript adds next to nothing to how quickly triggers react.
+		The transcript at path is a series of compressed segments, one for every segment_seconds of wall clock time (every minute, by default) that had traffic, started early if one grows past segment_size.
+		An index next to it (path + ".idx") has a line for each finished segment: it's first and last record times, where it is in the file and how long it is. That's all that needs to be read to find a given minute of a log many gigabytes long; see Transcript.
+		With gzip, the transcript is an ordinary gzip file (one member per segment) that zcat can read. A transcript that already exists is added to.
+		Args:
+			path: The file to write.
+			compression: "gzip" (the default), or "zstd", which compresses faster and needs the zstandard package.
+			level: The compression level.
+			segment_seconds: How much time each segment covers. Segments start on multiples of this, so with 60 each one is a calendar minute.
+			segment_size: The most (uncompressed) data in a segment.
+			flush_interval: How often, in seconds, the writer wakes up to write what's been recorded. It's compressed stream is flushed each time, so a crash loses at most this much.
+		"""
+		self.log = logging.getLogger("mbf.transcript")
+		self.log.addHandler(logging.NullHandler())
+		self.path = path
+		self.compression = compression
+		self.level = level
+		self.segment_seconds = segment_seconds
+		self.segment_size = segment_size
+		self.flush_interval = flush_interval
+		compressor(compression, level) # fail now if the compression is unknown or it's module is missing
+		self.pending = collections.deque() # (time, direction, data); appending doesn't need a lock
+		self.stopped = threading.Event()
+		self.lock = threading.Lock() # held while writing
+		self.index = self.open_index()
+		self.file = open(path, "ab")
+		self.segment = None # [bucket, first time, last time, offset, records, uncompressed size] of the segment being written
+		# metrics
+		self.records = 0
+		self.bytes_in = 0
+		self.bytes_out = 0
+		self.segments = 0
+		self.max_backlog = 0 # most records waiting for the writer
+		self.write_time = 0.0 # seconds the writer has spent compressing and writing
+		self.thread = threading.Thread(name="mbf_transcript", target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+		atexit.register(self.close)
+
+	def open_index(self):
+		"""Open the index for adding to, writing it's header if it's new, or checking it if it isn't"""
+		header = """mbf transcript {} {}\n""".format(FORMAT, self.compression)
+		index_path = self.path + ".idx"
+		if os.path.exists(index_path) and os.path.getsize(index_path):
+			with open(index_path) as f:
+				existing = f.readline()
+			if existing != header:
+				raise ValueError("""{} is a transcript in a different format ({}); record to a new file""".format(self.path, existing.strip()))
+			return open(index_path, "a")
+		index = open(index_path, "w")
+		index.write(header)
+		index.flush()
+		return index
+
+	def record(self, direction, data):
+		"""Record data read from (INBOUND) or written to (OUTBOUND) the mud; returns right away"""
+		if data:
+			self.pending.append((time.time(), direction, data))
+
+	def run(self):
+		"""The writer thread"""
+		while not self.stopped.wait(self.flush_interval):
+			try:
+				self.write_pending()
+			except Exception:
+				self.log.exception("""Writing transcript {} failed""".format(self.path))
+
+	def write_pending(self, now=None):
+		"""Compress and write whatever has been recorded, finishing the current segment if it's time is up"""
+		pending = self.pending
+		with self.lock:
+			if self.file is None:
+				return
+			start = time.time()
+			backlog = len(pending)
+			if backlog > self.max_backlog:
+				self.max_backlog = backlog
+			wrote = False
+			for i in range(backlog):
+				when, direction, data = pending.popleft()
+				if not isinstance(data, bytes): # text commands, when there's no charset to encode them
+					data = data.encode("utf-8")
+				bucket = int(when // self.segment_seconds)
+				s = self.segment
+				if s is not None and (bucket != s[0] or s[5] >= self.segment_size):
+					self.finish_segment()
+					s = None
+				if s is None:
+					s = self.segment = [bucket, when, when, self.file.tell(), 0, 0]
+					self.compress, self.sync, self.finish = compressor(self.compression, self.level)
+				self.file.write(self.compress(RECORD.pack(when, direction, len(data))))
+				self.file.write(self.compress(data))
+				s[2] = when
+				s[4] += 1
+				s[5] += RECORD.size + len(data)
+				self.records += 1
+				if direction == INBOUND:
+					self.bytes_in += len(data)
+				else:
+					self.bytes_out += len(data)
+				wrote = True
+			if self.segment is not None:
+				if int((now if now is not None else time.time()) // self.segment_seconds) != self.segment[0]: # the segment's minute is over
+					self.finish_segment()
+				elif wrote:
+					self.file.write(self.sync())
+			self.file.flush()
+			self.write_time += time.time() - start
+
+	def finish_segment(self):
+		"""End the current segment's compressed stream and add it to the index; called with the lock held"""
+		bucket, first, last, offset, count, size = self.segment
+		self.file.write(self.finish())
+		self.file.flush()
+		self.index.write("""{:.6f} {:.6f} {} {} {}\n""".format(first, last, offset, self.file.tell() - offset, count))
+		self.index.flush()
+		self.segment = None
+		self.segments += 1
+
+	def close(self):
+		"""Write everything recorded so far, finish the last segment, and stop the writer"""
+		if self.stopped.is_set():
+			return
+		self.stopped.set()
+		if self.thread is not threading.current_thread():
+			self.thread.join()
+		self.write_pending()
+		with self.lock:
+			if self.segment is not None:
+				self.finish_segment()
+			self.file.close()
+			self.index.close()
+			self.file = None
+
+	def get_stats(self):
+		"""Return the recorder's metrics as a dictionary"""
+		return {
+			'records': self.records,
+			'bytes_in': self.bytes_in,
+			'bytes_out': self.bytes_out,
+			'segments': self.segments,
+			'backlog': len(self.pending),
+			'max_backlog': self.max_backlog,
+			'write_time': self.write_time,
+		}
+
+
+Segment = collections.namedtuple("Segment", "start end offset length records")
+
+
+class Transcript(object):
+	def __init__(self, path):
+		"""Reads a transcript written by a Recorder.
+		Only the index is read up front; segments are decompressed when records from them are asked for, so reading a few minutes of a large transcript only touches those minutes.
+		Each segment is decompressed on it's own, so one that's damaged doesn't cost the ones after it. A crash leaves the segment being written unfinished and out of the index, and the recorder carries on after it when it's started again; those stretches are found from the gaps between indexed segments, and read for the times between them.
+		Times can be given as datetimes (naive ones are local time) or seconds since the epoch.
+		"""
+		self.path = path
+		with open(path + ".idx") as f:
+			header = f.readline().split()
+			if header[:2] != ["mbf", "transcript"] or int(header[2]) != FORMAT:
+				raise ValueError("""{} isn't a transcript index""".format(path + ".idx"))
+			self.compression = header[3]
+			self.segments = []
+			for l in f:
+				parts = l.split()
+				if len(parts) == 5: # a line being written while we read is left for next time
+					self.segments.append(Segment(float(parts[0]), float(parts[1]), int(parts[2]), int(parts[3]), int(parts[4])))
+		self.starts = [s.start for s in self.segments]
+		self.gaps = [] # (after, before, offset, length) for each unindexed stretch between segments; the times are the indexed records either side
+		position, after = 0, None
+		for s in self.segments:
+			if s.offset > position:
+				self.gaps.append((after, s.start, position, s.offset - position))
+			position, after = s.offset + s.length, s.end
+
+	def find(self, start=None, end=None):
+		"""Return the segments that have records between start and end"""
+		first = 0
+		if start is not None:
+			first = max(0, bisect.bisect_right(self.starts, to_timestamp(start)) - 1)
+		segments = []
+		for s in self.segments[first:]:
+			if end is not None and s.start >= to_timestamp(end):
+				break
+			if start is None or s.end >= to_timestamp(start):
+				segments.append(s)
+		return segments
+
+	def records(self, start=None, end=None, direction=None):
+		"""Yield (time, direction, data) for every record between start and end (inclusive of start, exclusive of end), optionally only one direction.
+		With no end, records in a segment that's still being written (and so isn't in the index yet) are included, up to the recorder's last flush.
+		"""
+		lo = to_timestamp(start) if start is not None else None
+		hi = to_timestamp(end) if end is not None else None
+		with open(self.path, "rb") as f:
+			sources = [(s.offset, s.length) for s in self.find(start, end)]
+			sources.extend((offset, length) for after, before, offset, length in self.gaps if (lo is None or before >= lo) and (hi is None or after is None or after < hi))
+			sources.sort()
+			if hi is None: # the unindexed tail
+				tail = self.segments[-1].offset + self.segments[-1].length if self.segments else 0
+				sources.append((tail, None))
+			for offset, length in sources:
+				f.seek(offset)
+				for record in self.parse(f.read() if length is None else f.read(length)):
+					when, d, data = record
+					if lo is not None and when < lo:
+						continue
+					if hi is not None and when >= hi:
+						return
+					if direction is None or d == direction:
+						yield record
+
+	def parse(self, compressed):
+		"""Decompress one or more segments' worth of data and yield their records.
+		A segment that's damaged gives the records before the damage, and decompression starts again at the next segment; an incomplete record at the end of a segment is ignored.
+		"""
+		pos = 0
+		while pos < len(compressed):
+			d = decompressor(self.compression)
+			try:
+				data = d.decompress(compressed[pos:])
+				end = len(compressed) - len(d.unused_data)
+			except Exception: # damaged; the next segment starts with the compression's magic number
+				end = compressed.find(MAGIC[self.compression], pos + 1)
+				if end == -1:
+					end = len(compressed)
+				data = self.salvage(compressed[pos:end])
+			for record in self.split(data):
+				yield record
+			if end <= pos: # no progress; never loop forever
+				break
+			pos = end
+
+	def salvage(self, compressed):
+		"""Decompress a damaged segment a little at a time, and return what came out before the damage"""
+		d = decompressor(self.compression)
+		data = []
+		for i in range(0, len(compressed), 4096):
+			try:
+				data.append(d.decompress(compressed[i:i + 4096]))
+			except Exception:
+				break
+		return b"".join(data)
+
+	def split(self, data):
+		"""Yield the records in one segment's decompressed data"""
+		pos = 0
+		while pos + RECORD.size <= len(data):
+			when, direction, length = RECORD.unpack_from(data, pos)
+			pos += RECORD.size
+			if pos + length > len(data):
+				break
+			yield when, direction, data[pos:pos + length]
+			pos += length
+
+	def chunks(self, start=None, end=None):
+		"""Return what the mud sent between start and end as a list of (delay, chunk), the format benchmarks/replay.py uses"""
+		transcript = []
+		last = None
+		for when, direction, data in self.records(start, end, INBOUND):
+			transcript.append((when - last if last is not None else 0.0, data))
+			last = when
+		return transcript
+
+	def replay(self, m, start=None, end=None):
+		"""Feed what the mud sent between start and end through an Mbf instance's line buffer, login and triggers, as fast as possible, without a connection; returns the number of lines. Good for testing triggers against real sessions."""
+		count = 0
+		for when, direction, data in self.records(start, end, INBOUND):
+			lines = m.line_buffer.feed(data)
+			count += len(lines)
+			m.handle_lines(lines)
+		rest = m.line_buffer.flush()
+		if rest:
+			m.handle_lines([rest])
+			count += 1
+		return count
@@ -4,9 +4,15 @@
 
 import re
 
+from ansi import colour_at
+
 
 class Trigger(object):
-	def __init__(self, trig, is_regexp=True, case_sensitive=True, multiline=False, name=None, group='all', enabled=True, stop_processing=False, sequence=100):
+	# Bots can have thousands of triggers, so they don't each get a __dict__
+	__slots__ = ('trig', 'is_regexp', 'case_sensitive', 'multiline', 'name', 'group', 'enabled', 'sequence', 'stop_processing', 'async_ok', 'stats', 'mode', 'fn', 'compiled', 'prefilter', 'fg', 'bg', 'window', 'start', 'end', 'started', 'blocks')
+	is_filter = False # see mbf.output.OutputFilter
+	
+	def __init__(self, trig, is_regexp=True, case_sensitive=True, multiline=False, name=None, group='all', enabled=True, stop_processing=False, sequence=100, async_ok=False, fg=None, bg=None, window=None, start=None, end=None):
 		"""This class represents a trigger and it's metadata;
 			It does not store code, as it's intended that a function in mbf will "decorate" user functions with a trigger class,
 		Arguments:
@@ -22,6 +28,11 @@ class Trigger(object):
 			stop_processing: A bool, false by default, that tells the parser to stop firing triggers after this one.
 			sequence: An integer (100 by default) that is used to determine the order in which triggers will be fired.
 				Triggers will be fired from lowest sequence to highest; if any trigger tells the parser to stop firing, no more triggers (no matter their sequence) will be fired afterwards for that specific buffer of data.
+			async_ok: A bool, false by default. When mbf runs trigger functions on worker threads (see Mbf's callback_workers argument), a trigger with this set may run at the same time as other triggers instead of waiting for the ones before it to finish. It's return value can't stop processing, since nothing waits for it.
+			fg: Only match text the mud coloured this colour (or any of a list of colours): 'red', 'bright_red', a 256 colour palette number, or "#rrggbb". What counts is the colour of the first character matched. Needs Mbf's strip_ansi; see mbf.ansi for the colour names. Single line triggers only.
+			bg: Like fg, for the background colour.
+			window: For multiline triggers, how many lines to look back over: the trigger is matched against the last window lines of the session's scrollback (see mbf.scrollback) whenever new lines arrive, so text split between reads still matches, and only matches that end in the new lines count, so nothing fires twice. With start and end, the most lines a block can have. Setting it makes the trigger multiline.
+			start, end: For multiline triggers, regular expressions (or plain text, if is_regexp is false) for the first and last lines of a block, like the header and footer of score or who output. The lines from one that matches start to the next that matches end (which can arrive in later reads) are matched against trig as one block, once it's complete; trig can be r"(?s)\A.*" to take the whole block. The block is taken from the scrollback, so nothing is kept while it's being waited for but where it started. Blocks are followed on every buffer whether the trigger is enabled or not, or reached (see track_blocks); one is matched if the trigger's enabled when it ends. Setting them makes the trigger multiline.
 		"""
 		self.trig = trig
 		self.is_regexp = is_regexp
@@ -32,23 +43,53 @@ class Trigger(object):
 		self.enabled = enabled
 		self.sequence = sequence
 		self.stop_processing = stop_processing
+		self.async_ok = async_ok
+		self.stats = None # a TriggerStats instance, if mbf is collecting statistics
+		self.fn = None
+		self.window = window
+		self.start = start
+		self.end = end
+		self.started = None # the scrollback line number a start and end trigger's block started on, while it's waiting for the end
+		self.blocks = [] # complete blocks waiting for the trigger to be matched against them
+		if (start is None) != (end is None):
+			raise ValueError("A trigger's start and end have to be given together")
+		if window is not None or start is not None:
+			multiline = self.multiline = True
+		self.fg = as_colours(fg)
+		self.bg = as_colours(bg)
+		if multiline and (fg is not None or bg is not None):
+			raise ValueError("Only single line triggers can match on colour")
+		self.prefilter = None # (literal, ignore_case) if it's already known, as it is for triggers from a pack; see TriggerSet.compile
+		self.mode = 0  #flags for the re
 		if self.is_regexp:
-			self.mode = 0  #flags for the re
 			if self.case_sensitive == False:
-				mode += re.IGNORECASE
+				self.mode |= re.IGNORECASE
 			if self.multiline:
 				self.mode += re.MULTILINE|re.DOTALL
-			# After setting modes, compile the re pattern object with them
-			self.trig = re.compile(self.trig, flags=self.mode) # compile into a re pattern object
+			# The pattern is compiled with these modes the first time it's needed (see compile), so creating thousands of triggers is cheap
+			self.compiled = False
 		else:
 			if self.case_sensitive == False:
 				self.trig = self.trig.lower()
+			self.compiled = True
+	
+	def compile(self):
+		"""Compile this trigger's regular expression, if it hasn't been already. Mbf does this for every trigger when processing starts; matching a trigger that hasn't been compiled compiles it first."""
+		if not self.compiled:
+			self.trig = re.compile(self.trig, flags=self.mode) # compile into a re pattern object
+			self.compiled = True
+		if isinstance(self.start, (bytes, type(u""))): # a start and end pair match single lines
+			flags = 0 if self.case_sensitive else re.IGNORECASE
+			if self.is_regexp:
+				self.start, self.end = re.compile(self.start, flags), re.compile(self.end, flags)
+			else:
+				self.start, self.end = re.compile(re.escape(self.start), flags), re.compile(re.escape(self.end), flags)
 	
 	def add_function(self, f):
 		"""Add a function to an instance of this class; this function will be what gets run when this trigger matches
 		It's signature should be as follows:
 			text - The text that this trigger found a match in.
-				For multiline triggers, this is the entire block of text that was pulled from the socket and passed to fire.
+				For multiline triggers, this is the block of complete lines that was read from the socket and passed to fire.
 				For single line triggers, whether regexp or plaintext, this will be the single line that it matched in.
 				If your trigger is multiline, this may be a large chunk of text; triggers using regular expressions will have a much easier time of parsing their line(s) from this data.
 			match - If the trigger uses a regular expression, this will be it's corresponding match object. If the trigger is a plaintext string, this will be none.
@@ -64,47 +105,179 @@ class Trigger(object):
 		Args:
 			string - a string to look in to see if this trigger matches at least once
 		"""
+		if not self.compiled:
+			self.compile()
 		if self.is_regexp:
 			if self.trig.search(string):
 				return True
 			else: # No matches for this regexp trigger on given string
 				return False
 		elif self.is_regexp == False:
+			if self.case_sensitive == False:
+				string = string.lower()
 			if self.trig in string:
 				return True
 			else: # text trigger string not found in given data
 				return False
 	
+	def find(self, string, lowered=None):
+		"""Return a list of (text, match) tuples, one for every time this trigger matches in string; each is what the associated function would be called with.
+		Single line triggers look at each line in string on it's own (see find_lines); multiline triggers get the whole block.
+		Args:
+			string - a string of text to look for matches in.
+			lowered - string.lower(), if it's already been worked out; case insensitive plain text triggers use it instead of lowercasing string themselves.
+		"""
+		if self.multiline == False: # split string up into lines
+			return self.find_lines(string.splitlines())
+		if not self.compiled:
+			self.compile()
+		if self.is_regexp:
+			# We can feed each trigger the hole block
+			return [(string, m) for m in self.trig.finditer(string)]
+		# Ugh, plain-text triggers
+		if self.case_sensitive:
+			lowered = string
+		elif lowered is None:
+			lowered = string.lower()
+		if self.trig in lowered:
+			return [(string, None)]
+		return []
+	
+	def find_lines(self, lines, lowered=None, colours=None):
+		"""Like find, but for a single line trigger and an already split list of lines.
+		Lines that don't match are skipped, so it's fine for only some of them to contain a match.
+		lowered, if it's given, is the lines lowercased, shared by every case insensitive plain text trigger (see TriggerSet.iter_found).
+		colours is each line's colour spans, from mbf.ansi, for triggers with fg or bg set.
+		"""
+		if self.fg is not None or self.bg is not None:
+			return self.find_coloured(lines, lowered, colours)
+		found = []
+		if not self.compiled:
+			self.compile()
+		if self.is_regexp:
+			for l in lines:
+				for m in self.trig.finditer(l):
+					found.append((l, m))
+		else:
+			if self.case_sensitive:
+				lowered = lines
+			elif lowered is None:
+				lowered = [l.lower() for l in lines]
+			for n, l in enumerate(lowered):
+				# Plaintext triggers fire once per buffer, on the first line they're found in
+				if self.trig in l:
+					found.append((lines[n], None))
+					break
+		return found
+	
+	def find_coloured(self, lines, lowered=None, colours=None):
+		"""find_lines, for triggers with fg or bg set: only matches that start in the right colour count"""
+		found = []
+		if colours is None:
+			colours = [None] * len(lines)
+		if not self.compiled:
+			self.compile()
+		if self.is_regexp:
+			for n, l in enumerate(lines):
+				for m in self.trig.finditer(l):
+					if self.in_colour(colours[n], m.start()):
+						found.append((l, m))
+		else:
+			if self.case_sensitive:
+				lowered = lines
+			elif lowered is None:
+				lowered = [l.lower() for l in lines]
+			for n, l in enumerate(lowered):
+				i = l.find(self.trig)
+				while i != -1:
+					if self.in_colour(colours[n], i):
+						return [(lines[n], None)]
+					i = l.find(self.trig, i + 1)
+		return found
+	
+	def find_window(self, scrollback, new):
+		"""find, for a multiline trigger with a window or a start and end: match it against what's in scrollback, the last new lines of which have just arrived. Only matches ending in the new lines are returned, so each is found once. Start and end triggers are matched against the blocks track_blocks has completed since they were last matched instead."""
+		self.compile()
+		if self.start is not None:
+			blocks, self.blocks = self.blocks, []
+			found = []
+			for block in blocks:
+				found.extend(self.find(block))
+			return found
+		if new > len(scrollback):
+			new = len(scrollback)
+		if not new:
+			return []
+		last = scrollback.total - new # the number of the first new line
+		nl = b"\n" if isinstance(scrollback.lines(last, last + 1)[0], bytes) else u"\n"
+		old = scrollback.lines(max(scrollback.first, last - self.window + 1), last)
+		lines = old + scrollback.lines(last)
+		block = nl.join(lines)
+		done = len(nl.join(old)) + 1 if old else 0 # where the new lines start
+		if self.is_regexp:
+			return [(block, m) for m in self.trig.finditer(block) if m.end() > done]
+		lowered = block if self.case_sensitive else block.lower()
+		if lowered.find(self.trig, max(0, done - len(self.trig) + 1)) != -1:
+			return [(block, None)]
+		return []
+	
+	def track_blocks(self, scrollback, new):
+		"""For a start and end trigger: follow the last new lines added to scrollback, noting where a block starts and keeping each complete block (as text) for find_window to match.
+		This is called for every buffer, before triggers are matched, so a block isn't lost because the trigger was disabled when it started, or an earlier trigger stopped processing when it ended; only blocks that end while the trigger is enabled are kept.
+		"""
+		self.compile()
+		if not self.enabled:
+			self.blocks = [] # kept for a trigger that was disabled before it was reached
+		if new > len(scrollback):
+			new = len(scrollback)
+		if not new:
+			return
+		last = scrollback.total - new
+		lines = scrollback.lines(last)
+		nl = b"\n" if isinstance(lines[0], bytes) else u"\n"
+		limit = self.window or scrollback.capacity
+		for n, line in enumerate(lines, last):
+			if self.started is not None:
+				if n - self.started >= limit: # too long to be a block; start over
+					self.started = None
+				elif self.end.search(line):
+					block = scrollback.lines(self.started, n + 1)
+					self.started = None
+					if block is not None and self.enabled: # it would be, unless the scrollback is smaller than window
+						self.blocks.append(nl.join(block))
+					continue
+			if self.started is None and self.start.search(line):
+				self.started = n
+	
+	def in_colour(self, spans, pos):
+		"""Whether the character at pos, in a line with the given colour spans, is in this trigger's colours"""
+		fg, bg = colour_at(spans, pos)
+		return (self.fg is None or fg in self.fg) and (self.bg is None or bg in self.bg)
+	
+	def call(self, found):
+		"""Call the associated function with every (text, match) tuple in found, as returned by find or find_lines.
+		Returns true if the associated function (or this trigger's stop_processing flag) says that trigger processing should stop for this buffer.
+		"""
+		stp = False
+		for text, m in found:
+			stp = self.fn(text, m) or stp # call the trigger's function
+		return stp
+	
 	def fire(self, string):
 		"""Fires this trigger by running the function associated with it.
 		This properly handles regexp and plain-text triggers, (both single and multiline), calling the associated function for every match in string.
 		It is assumed that 'matches' has been called and has returned true; otherwise running this is a waist
+		Returns true if the associated function (or this trigger's stop_processing flag) says that trigger processing should stop for this buffer.
 		Args:
 			string - a string of text to look for matches in.
 		"""
-		if self.is_regexp:
-			if self.multiline == False: # split string up into lines
-				for l in string.splitlines(): # And feed them to finditer
-					for m in self.trig.finditer(l):	
-						self.fn(l, m) # call the trigger's function
-			elif self.multiline: # multiline trig
-				# We can feed each trigger the hole block
-				for m in self.trig.finditer(string): # for every occurrence of this trigger in given block of text
-					self.fn(string, m) # call the trigger's function
-		elif self.is_regexp == False:
-			# Ugh, plain-text triggers
-			if self.case_sensitive == False:
-				string = string.lower()
-			if self.multiline:
-				if self.trig  in string:
-					return self.fn(string, None)
-			else: # not multiline
-				# split string by lines
-				lines = string.splitlines()
-				# line by line text matching iteration
-				for l in lines:
-					if self.trig in l:
-						return self.fn(string, None) # call associated function and return it's value
+		return self.call(self.find(string))
+	
+	def fire_lines(self, lines):
+		"""Fire this single line trigger against a list of lines, calling the associated function for every match in each line.
+		Like 'fire', returns true if trigger processing should stop for this buffer.
+		"""
+		return self.call(self.find_lines(lines))
 	
 	def enable(self):
 		"""Enable this trigger"""
@@ -122,6 +295,16 @@ class Trigger(object):
 	__le__ = lambda self, other: self.sequence <= other.sequence
 	__gt__ = lambda self, other: self.sequence > other.sequence
 	__ge__ = lambda self, other: self.sequence >= other.sequence
+	__hash__ = object.__hash__ # hash by identity, so triggers can be kept in mbf's name and group indexes
 
 	def __repr__(self):
-		return """<trigger {}>""".format(self.name)
\ No newline at end of file
+		return """<trigger {}>""".format(self.name)
+
+
+def as_colours(c):
+	"""A trigger's fg or bg argument as a tuple of colours, or none"""
+	if c is None:
+		return None
+	if isinstance(c, (list, tuple, set, frozenset)):
+		return tuple(c)
+	return (c,)
@@ -0,0 +1,463 @@
+# Mbf, the mud bot framework - compiled trigger set
+# Author: Blake Oliver <oliver22213@me.com>
+
+import re
+import sys
+
+from stats import clock
+
+try: # python 3.11+ moved the regexp parser into the re package
+	from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+	import sre_parse
+	import sre_constants
+
+
+def required_literal(pattern):
+	"""Given a compiled regular expression, return the longest run of literal text that every match of it must contain, or None if there isn't a useful one.
+	Only runs that appear at the top level of the pattern (or inside plain groups at the top level) are considered, so the result is safe to use as a prefilter: if the literal isn't in a line, the regexp can't match that line.
+	If the pattern ignores case the literal is returned lower()-ed; it should then be looked for in lower()-ed text.
+	"""
+	try:
+		parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+	except Exception: # anything the parser chokes on just doesn't get a prefilter
+		return None
+	runs = [[]]
+	def walk(items):
+		for op, av in items:
+			if op is sre_constants.LITERAL:
+				if av == 10: # a literal can't span lines, because lines are scanned one at a time
+					runs.append([])
+				else:
+					runs[-1].append(av)
+			elif op is sre_constants.SUBPATTERN and av[-1] is not None:
+				# a plain group is still mandatory; walk it, but don't join runs across its edges
+				runs.append([])
+				walk(av[-1])
+				runs.append([])
+			else:
+				runs.append([])
+	walk(parsed)
+	literal = max(runs, key=len)
+	if len(literal) < 2: # a single character prefilter is worse than none at all
+		return None
+	if pattern.flags & re.IGNORECASE and any(c > 127 for c in literal):
+		return None # case folding outside ascii is not ours to guess at
+	if isinstance(pattern.pattern, bytes): # also python 2's str
+		literal = bytes(bytearray(literal))
+	else:
+		literal = u"".join(map(chr_, literal))
+	if pattern.flags & re.IGNORECASE:
+		literal = literal.lower()
+	return literal
+
+try:
+	chr_ = unichr
+except NameError: # python 3
+	chr_ = chr
+
+
+class Automaton(object):
+	"""A small Aho-Corasick automaton; finds every one of a set of keywords in a string with one pass over it.
+	Each keyword is associated with a value (a trigger's index in the set), and 'search' returns the values of every keyword found.
+	Stepping through a string a character at a time in python costs more than letting the re module try a few dozen alternatives at each position in C, so small sets of keywords (up to regexp_limit) are searched with one regular expression instead.
+	"""
+	regexp_limit = 40
+
+	def __init__(self):
+		self.goto = [{}]
+		self.fail = [0]
+		self.out = [[]]
+		self.size = 0 # number of keywords added
+		self.keywords = {} # keyword: list of values
+		self.regexp = None
+
+	def add(self, keyword, value):
+		"""Add a keyword to the trie. 'build' must be called after adding keywords and before searching."""
+		s = 0
+		for c in keyword:
+			nxt = self.goto[s].get(c)
+			if nxt is None:
+				nxt = len(self.goto)
+				self.goto[s][c] = nxt
+				self.goto.append({})
+				self.fail.append(0)
+				self.out.append([])
+			s = nxt
+		self.out[s].append(value)
+		self.keywords.setdefault(keyword, []).append(value)
+		self.size += 1
+
+	def build(self):
+		"""Compute failure links breadth first, merging outputs so a state reports every keyword that ends there."""
+		queue = list(self.goto[0].values())
+		for s in queue:
+			self.fail[s] = 0
+		i = 0
+		while i < len(queue):
+			r = queue[i]
+			i += 1
+			for c, s in self.goto[r].items():
+				queue.append(s)
+				f = self.fail[r]
+				while f and c not in self.goto[f]:
+					f = self.fail[f]
+				self.fail[s] = self.goto[f].get(c, 0)
+				self.out[s] = self.out[s] + self.out[self.fail[s]]
+		if 0 < self.size <= self.regexp_limit:
+			# A lookahead finds the longest keyword starting at every position, even where keywords overlap.
+			# Any shorter keyword starting at the same position is a substring of that one, so each keyword maps to the values of every keyword inside it.
+			keywords = sorted(self.keywords, key=len, reverse=True)
+			alternatives = [re.escape(k) for k in keywords]
+			if isinstance(keywords[0], bytes):
+				self.regexp = re.compile(b"(?=(" + b"|".join(alternatives) + b"))")
+			else:
+				self.regexp = re.compile(u"(?=(" + u"|".join(alternatives) + u"))")
+			self.contained = {}
+			for k in keywords:
+				self.contained[k] = [v for other in keywords if other in k for v in self.keywords[other]]
+
+	def search(self, text, found):
+		"""Add the value of every keyword that occurs in text to the set 'found'."""
+		if self.regexp is not None:
+			contained = self.contained
+			for keyword in self.regexp.findall(text): # just the keywords; no match objects
+				found.update(contained[keyword])
+			return
+		goto = self.goto
+		fail = self.fail
+		out = self.out
+		s = 0
+		for c in text:
+			while s and c not in goto[s]:
+				s = fail[s]
+			s = goto[s].get(c, 0)
+			if out[s]:
+				found.update(out[s])
+
+
+class LineCache(object):
+	"""Remembers which triggers match a line, so muds' endlessly repeated lines (prompts, combat rounds, channel headers, room descriptions) aren't matched against every trigger again.
+	Entries are kept for the most recently seen lines: there are two generations of them, and once the newer one has half of size lines it becomes the older one, and the older one is forgotten. A line found in the older generation moves back into the newer one. That's close to least recently used, with nothing but dictionary lookups on each line.
+	"""
+
+	def __init__(self, size):
+		self.size = size
+		self.clear()
+		self.hits = 0
+		self.misses = 0
+
+	def clear(self):
+		"""Forget every line"""
+		self.new = {}
+		self.old = {}
+		self.bytes = 0 # roughly what the entries take up
+
+	def get(self, line):
+		"""Return the entry for line, or none"""
+		entry = self.new.get(line)
+		if entry is None:
+			entry = self.old.pop(line, None)
+			if entry is None:
+				self.misses += 1
+				return None
+			self.new[line] = entry
+			self.age()
+		self.hits += 1
+		return entry
+
+	def put(self, line, entry):
+		"""Remember the entry for a line"""
+		self.new[line] = entry
+		self.bytes += sys.getsizeof(line) + sys.getsizeof(entry)
+		self.age()
+
+	def age(self):
+		if len(self.new) >= self.size // 2 or not self.size:
+			forgotten = self.old
+			self.old = self.new
+			self.new = {}
+			if forgotten:
+				self.bytes -= sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in forgotten.items())
+
+	def get_stats(self):
+		"""Return the cache's metrics as a dictionary"""
+		looked_up = self.hits + self.misses
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'hit_rate': float(self.hits) / looked_up if looked_up else 0.0,
+			'entries': len(self.new) + len(self.old),
+			'bytes': self.bytes,
+		}
+
+
+class TriggerSet(object):
+	"""All of an mbf instance's triggers, compiled so a buffer of data can be matched against every one of them in a single pass.
+	Plaintext triggers, and regexp triggers that contain a literal run of text, are put in an Aho-Corasick automaton (one for case sensitive and one for case insensitive keywords); each line is scanned once, and only triggers whose keyword was found are tried.
+	Regexp triggers without a usable literal are always tried.
+	Each line is lowercased at most once per buffer, and the copy is shared by the case insensitive automaton and every case insensitive plain text trigger (lines that are mbf.line.Line objects keep it, for trigger functions too).
+	Triggers are still fired in order of sequence, and a trigger that stops processing still stops every trigger after it for that buffer.
+	Output filters (see mbf.output) are kept in the same automata, so the one scan of each buffer finds the lines they apply to as well; they're never fired, only applied to what's printed (see filter_lines).
+	Enabling or disabling triggers doesn't require rebuilding anything, since a trigger's enabled flag is checked when it's a candidate; adding a trigger marks the set dirty, and it is rebuilt the next time it's used.
+	With cache_size set, which single line triggers match each line is remembered for that many recently seen lines (see LineCache). A line seen again is only matched against the triggers known to match it, to get their match objects; plain text triggers aren't matched at all. Entries record disabled triggers too, so enabling and disabling triggers leaves them valid; rebuilding the set (after adding or removing a trigger) clears the cache. Triggers that match on colour and multiline triggers are always matched.
+	With a scrollback (see mbf.scrollback), multiline triggers with a window, or a start and end, are matched against it instead of just the lines being matched, which have to be the newest lines in it (see Trigger.find_window). They're tried on every buffer, since what they match can be in lines that came before; start and end triggers follow their blocks in track_blocks, which has to be called with every buffer added to the scrollback, before it's matched.
+	"""
+
+	def __init__(self, cache_size=0, scrollback=None):
+		self.triggers = []
+		self.dirty = True
+		self.generation = 0 # bumped whenever the set is rebuilt
+		self.cache = LineCache(cache_size) if cache_size else None
+		self.scrollback = scrollback
+
+	def add(self, trigger):
+		"""Add a trigger to this set"""
+		self.triggers.append(trigger)
+		self.dirty = True
+
+	def remove(self, trigger):
+		"""Remove a trigger from this set"""
+		self.triggers = [t for t in self.triggers if t is not trigger] # not list.remove; triggers compare equal by sequence
+		self.dirty = True
+
+	def compile(self):
+		"""Sort triggers by sequence and build the keyword automata."""
+		self.triggers.sort(key=lambda t: t.sequence) # stable, so equal sequences keep the order they were added in
+		self.sensitive = Automaton()
+		self.insensitive = Automaton()
+		self.unfiltered = [] # indexes of triggers that have to be tried on every buffer
+		self.filters = [] # (index, whether it has a keyword) of every output filter
+		self.cacheable = set() # indexes of triggers whose matches the line cache can remember
+		self.windowed = [] # indexes of triggers matched against the scrollback
+		for i, t in enumerate(self.triggers):
+			if not (t.is_filter or t.multiline or t.fg is not None or t.bg is not None):
+				self.cacheable.add(i)
+			if t.prefilter is not None: # worked out ahead of time; the regexp can wait until a line has it's literal
+				literal, ignore_case = t.prefilter
+			elif t.is_regexp:
+				t.compile()
+				literal = required_literal(t.trig)
+				ignore_case = bool(t.trig.flags & re.IGNORECASE)
+			else:
+				literal = t.trig # plaintext triggers are already lower()-ed if they aren't case sensitive
+				ignore_case = not t.case_sensitive
+				if (b"\n" if isinstance(literal, bytes) else u"\n") in literal: # can't be found by scanning lines one at a time
+					literal = None
+			if t.window is not None or t.start is not None: # it's keyword may be in lines that came before
+				literal = None
+				self.windowed.append(i)
+			if t.is_filter:
+				self.filters.append((i, bool(literal)))
+				if not literal:
+					continue
+			if not literal:
+				self.unfiltered.append(i)
+			elif ignore_case:
+				self.insensitive.add(literal, i)
+			else:
+				self.sensitive.add(literal, i)
+		self.sensitive.build()
+		self.insensitive.build()
+		# lines are lowercased once per buffer, for the case insensitive keywords and plain text triggers to share
+		self.lowercase = bool(self.insensitive.size) or any(not t.is_regexp and not t.case_sensitive for t in self.triggers)
+		# with the cache, triggers it covers are only tried on the lines they're known to match, so aren't tried on every buffer
+		self.uncached = [i for i in self.unfiltered if i not in self.cacheable]
+		self.unfiltered_cacheable = [i for i in self.unfiltered if i in self.cacheable]
+		if self.cache is not None:
+			self.cache.clear()
+		self.dirty = False
+		self.generation += 1
+
+	def candidates(self, lines, lowered=None):
+		"""Scan lines once and return a dict mapping trigger indexes to the list of line indexes their keyword was found in.
+		Triggers without a keyword aren't included; see 'unfiltered'.
+		lowered is the lines lowercased, if that's already been done.
+		"""
+		hits = {}
+		found = set()
+		if self.insensitive.size and lowered is None:
+			lowered = [l.lower() for l in lines]
+		for n, l in enumerate(lines):
+			if self.sensitive.size:
+				self.sensitive.search(l, found)
+			if self.insensitive.size:
+				self.insensitive.search(lowered[n], found)
+			if found:
+				for i in found:
+					hits.setdefault(i, []).append(n)
+				found.clear()
+		return hits
+
+	def process(self, buff):
+		"""Match and fire every enabled trigger against a buffer of data.
+		Returns the trigger that stopped processing, if one did.
+		"""
+		return self.process_lines(buff.splitlines(), buff)
+
+	def process_lines(self, lines, block=None, colours=None, scanned=None):
+		"""Match and fire every enabled trigger against a list of complete lines.
+		Single line triggers are fired on the lines themselves; multiline triggers are given block, which is the lines joined with newlines if it isn't provided.
+		colours is a list of each line's colour spans (see mbf.ansi), for triggers that match on colour.
+		Returns the trigger that stopped processing, if one did.
+		"""
+		return self.fire(self.iter_found(lines, block, colours, scanned))
+
+	def fire(self, matches):
+		"""Call the function of each trigger in matches, an iterable of (trigger, found) like iter_found's, until one stops processing; returns that trigger, if one did."""
+		for t, found in matches:
+			st = t.stats
+			if st is None:
+				stp = t.call(found)
+			else:
+				start = clock()
+				stp = t.call(found)
+				st.fire_time += clock() - start
+				if stp:
+					st.stops += 1
+			if stp: # if the trigger function returned true or the trigger has stop_processing set
+				return t
+		return None
+
+	def scan(self, lines):
+		"""Scan lines once, for both triggers and output filters; returns (the lines lowercased or none, candidates) to pass to filter_lines and process_lines"""
+		if self.dirty:
+			self.compile()
+		lowered = [l.lower() for l in lines] if self.lowercase else None
+		return lowered, self.candidates(lines, lowered)
+
+	def track_blocks(self, new):
+		"""Let every start and end trigger, enabled or not, follow the last new lines added to the scrollback (see Trigger.track_blocks)"""
+		if self.scrollback is None:
+			return
+		if self.dirty:
+			self.compile()
+		triggers = self.triggers
+		for i in self.windowed:
+			t = triggers[i]
+			if t.start is not None and not t.is_filter:
+				t.track_blocks(self.scrollback, new)
+
+	def iter_found(self, lines, block=None, colours=None, scanned=None):
+		"""Yield (trigger, found) for every enabled trigger that matches lines, in order of sequence; found is a list of the (text, match) tuples the trigger's function should be called with.
+		This is a generator, so whether a trigger is enabled is checked only when it's reached; a trigger function that's called between steps can enable or disable triggers after it for the same lines.
+		scanned is what scan returned for these lines, if it's already been called.
+		"""
+		if self.dirty:
+			self.compile()
+		if not lines:
+			return
+		lowered, hits = scanned if scanned is not None else self.scan(lines)
+		lowered_block = None
+		if self.cache is not None:
+			hits = self.known_matches(lines, lowered, hits)
+			order = sorted(set(hits).union(self.uncached))
+		else:
+			order = sorted(set(hits).union(self.unfiltered))
+		for i in order:
+			t = self.triggers[i]
+			if not t.enabled or t.is_filter:
+				continue
+			st = t.stats
+			if st is not None:
+				start = clock()
+			if t.multiline and self.scrollback is not None and (t.window is not None or t.start is not None):
+				found = t.find_window(self.scrollback, len(lines))
+				tried = 1
+			elif t.multiline:
+				if block is None:
+					block = (b"\n" if isinstance(lines[0], bytes) else u"\n").join(lines)
+				if not t.is_regexp and not t.case_sensitive and lowered_block is None:
+					lowered_block = block.lower()
+				found = t.find(block, lowered_block)
+				tried = 1
+			else:
+				if i in hits:
+					tried = [lines[n] for n in hits[i]]
+					tried_lowered = [lowered[n] for n in hits[i]] if not (t.is_regexp or t.case_sensitive) else None
+				else:
+					tried, tried_lowered = lines, lowered
+				tried_colours = None
+				if colours is not None and (t.fg is not None or t.bg is not None):
+					tried_colours = [colours[n] for n in hits[i]] if i in hits else colours
+				found = t.find_lines(tried, tried_lowered, tried_colours)
+			if st is not None:
+				st.match_time += clock() - start
+				st.attempts += tried if t.multiline else len(tried)
+				st.hits += len(found)
+			if found:
+				yield t, found
+
+	def known_matches(self, lines, lowered, hits):
+		"""Return candidates (see candidates) in which every trigger the line cache covers is a candidate only on the lines it really matches, working that out for lines the cache hasn't seen."""
+		cache = self.cache
+		cacheable = self.cacheable
+		exact = dict((i, n) for i, n in hits.items() if i not in cacheable)
+		by_line = None
+		for n, l in enumerate(lines):
+			entry = cache.get(l)
+			if entry is None:
+				if by_line is None: # the candidates of each line, worked out once for all the lines being matched
+					by_line = [[] for line in lines]
+					for i, ns in hits.items():
+						if i in cacheable:
+							for m in ns:
+								by_line[m].append(i)
+				matched = []
+				for i in by_line[n] + self.unfiltered_cacheable: # enabled or not, so the entry stays right when they're enabled
+					t = self.triggers[i]
+					if t.is_regexp:
+						if not t.compiled: # pack triggers compile when they're first needed
+							t.compile()
+						if t.trig.search(l) is not None:
+							matched.append(i)
+					elif t.trig in (l if t.case_sensitive else lowered[n]):
+						matched.append(i)
+				entry = tuple(matched)
+				cache.put(l, entry)
+			for i in entry:
+				exact.setdefault(i, []).append(n)
+		return exact
+
+	def match_lines(self, lines, block=None, colours=None, scanned=None):
+		"""Match every enabled trigger against lines without firing any of them; return a list of (trigger, found) in order of sequence (see iter_found)."""
+		return list(self.iter_found(lines, block, colours, scanned))
+
+	def filter_lines(self, lines, scanned=None):
+		"""Apply every enabled output filter to lines, in order of sequence; returns the lines as they should be printed, leaving out gagged ones.
+		A filter with a keyword is only applied to the lines it was found in, and to lines an earlier filter changed (which the scan never saw as they are now).
+		"""
+		if self.dirty:
+			self.compile()
+		if not self.filters or not lines:
+			return lines
+		lowered, hits = scanned if scanned is not None else self.scan(lines)
+		shown = list(lines)
+		everything = range(len(lines))
+		rewritten = set() # lines an earlier filter changed
+		for i, keyword in self.filters:
+			t = self.triggers[i]
+			if not t.enabled:
+				continue
+			st = t.stats
+			if st is not None:
+				start = clock()
+			if not keyword:
+				tried = everything
+			elif rewritten:
+				tried = sorted(rewritten.union(hits.get(i, ())))
+			else:
+				tried = hits.get(i, ())
+			changed = 0
+			for n in tried:
+				before = shown[n]
+				if before is not None:
+					shown[n] = t.apply(before)
+					if shown[n] != before:
+						changed += 1
+						rewritten.add(n)
+			if st is not None:
+				st.match_time += clock() - start
+				st.attempts += len(tried)
+				st.hits += changed
+		return [l for l in shown if l is not None]
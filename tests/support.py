@@ -0,0 +1,72 @@
+# Mbf, the mud bot framework - shared test helpers
+# Author: Blake Oliver <oliver22213@me.com>
+
+"""What the tests share: mbf and benchmarks/fakemud.py on the path, a login screen FakeMud can greet with, and waiting for something to happen on another thread.
+Run the tests from the top of the repository with: python -m unittest discover -s tests
+"""
+
+import logging
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+sys.path.insert(0, root)
+
+import mbf
+
+logging.getLogger("mbf").addHandler(logging.NullHandler()) # errors the tests cause on purpose shouldn't be printed
+
+LOGIN_INFO = {
+	'username_prompt': r"By what name",
+	'username_wrong': r"No such player",
+	'username_command': "%(username)s",
+	'password_prompt': r"Password:",
+	'password_wrong': r"Wrong password",
+	'password_command': "%(password)s",
+	'password_correct': r"Welcome back",
+}
+
+# A whole login screen in one go; the login works through it a line at a time
+LOGIN_SCREEN = b"By what name do you go?\r\nPassword:\r\nWelcome back!\r\n"
+WRONG_PASSWORD_SCREEN = b"By what name do you go?\r\nPassword:\r\nWrong password.\r\n"
+
+
+def wait_until(predicate, timeout=10):
+	"""Wait until predicate() is true, for at most timeout seconds; returns whether it became true"""
+	end = time.time() + timeout
+	while time.time() < end:
+		if predicate():
+			return True
+		time.sleep(0.01)
+	return bool(predicate())
+
+
+class Bot(mbf.Mbf):
+	"""An Mbf that records it's callbacks instead of exiting when a login fails"""
+	def __init__(self, *args, **kwargs):
+		self.events = []
+		mbf.Mbf.__init__(self, *args, **kwargs)
+
+	def on_login(self):
+		self.events.append("login")
+
+	def on_login_failed(self, reason):
+		self.events.append(("login failed", reason))
+
+	def on_reconnect(self):
+		self.events.append("reconnect")
+
+	def on_disconnect(self, deliberate=False):
+		self.events.append(("disconnect", deliberate))
+
+
+def shut_down(m):
+	"""Stop an Mbf instance from the outside, without exiting"""
+	if m.reconnector is not None:
+		m.reconnector.cancel()
+	if m.connected:
+		m.disconnect()
+	else:
+		m.stop_processing()
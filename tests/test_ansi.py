@@ -0,0 +1,101 @@
+# Mbf, the mud bot framework - ANSI stripping and colour trigger tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+import support # puts mbf on the path
+
+from mbf.ansi import AnsiStripper, colour_at, sgr_code
+from mbf.trigger import Trigger
+
+
+class AnsiStripperTest(unittest.TestCase):
+	def setUp(self):
+		self.a = AnsiStripper()
+
+	def test_plain_lines_are_left_alone(self):
+		line = b"An orc arrives."
+		self.assertTrue(self.a.strip(line)[0] is line)
+		self.assertEqual(self.a.strip_lines([b"a", b"b"]), ([b"a", b"b"], None))
+
+	def test_csi(self):
+		self.assertEqual(self.a.strip(b"\x1b[2J\x1b[1;1HHello \x1b[1mthere\x1b[0m\x1b[K"), (b"Hello there", None))
+
+	def test_osc(self):
+		self.assertEqual(self.a.strip(b"\x1b]0;window title\x07Hello"), (b"Hello", None))
+		self.assertEqual(self.a.strip(b"\x1b]8;;http://example.com\x1b\\link\x1b]8;;\x1b\\ text"), (b"link text", None))
+
+	def test_two_character_escapes(self):
+		self.assertEqual(self.a.strip(b"\x1b7saved\x1b8 \x1bMup\x1b="), (b"\x1b7saved\x1b8 up\x1b=", None)) # ESC 7, 8 and = aren't in the range, so they're left as text
+		self.assertEqual(self.a.strip(b"a\x1bMb\x1bDc"), (b"abc", None))
+
+	def test_text(self):
+		self.assertEqual(self.a.strip(u"\x1b[31m\xe9p\xe9e\x1b[0m"), (u"\xe9p\xe9e", [(0, 'red', None), (4, None, None)]))
+
+	def test_spans(self):
+		plain, spans = self.a.strip(b"An \x1b[31morc\x1b[0m and a \x1b[1;92;44mtroll\x1b[39m!\x1b[0m")
+		self.assertEqual(plain, b"An orc and a troll!")
+		self.assertEqual(spans, [(3, 'red', None), (6, None, None), (13, 'bright_green', 'blue'), (18, None, 'blue'), (19, None, None)])
+		self.assertEqual(colour_at(spans, 0), (None, None))
+		self.assertEqual(colour_at(spans, 3), ('red', None))
+		self.assertEqual(colour_at(spans, 5), ('red', None))
+		self.assertEqual(colour_at(spans, 6), (None, None))
+		self.assertEqual(colour_at(spans, 15), ('bright_green', 'blue'))
+		self.assertEqual(colour_at(spans, 18), (None, 'blue'))
+		self.assertEqual(colour_at(None, 4), (None, None))
+
+	def test_extended_colours(self):
+		self.assertEqual(self.a.strip(b"\x1b[38;5;208ma\x1b[48;2;255;0;16mb\x1b[38;5;9mc")[1], [(0, 208, None), (1, 208, "#ff0010"), (2, 'bright_red', "#ff0010")])
+
+	def test_sequences_in_a_row(self):
+		self.assertEqual(self.a.strip(b"\x1b[31m\x1b[32m\x1b[33mx")[1], [(0, 'yellow', None)])
+		self.assertEqual(AnsiStripper().strip(b"\x1b[31m\x1b[0mx")[1], None)
+
+	def test_colour_carries_across_lines(self):
+		stripped, colours = self.a.strip_lines([b"plain", b"\x1b[34mblue", b"still blue", b"blue \x1b[0mnot", b"plain"])
+		self.assertEqual(stripped, [b"plain", b"blue", b"still blue", b"blue not", b"plain"])
+		self.assertEqual(colours, [None, [(0, 'blue', None)], [(0, 'blue', None)], [(0, 'blue', None), (5, None, None)], None])
+
+	def test_sgr_code(self):
+		for fg, bg in (('red', None), (None, 'bright_cyan'), (208, "#0a0b0c"), ('white', 'black')):
+			self.assertEqual(AnsiStripper().strip(sgr_code(fg, bg) + "x")[1], [(0, fg, bg)])
+
+
+class ColourTriggerTest(unittest.TestCase):
+	def setUp(self):
+		self.lines, self.colours = AnsiStripper().strip_lines([
+			b"An \x1b[31morc\x1b[0m hits an orc.",
+			b"\x1b[41;37mAn orc\x1b[0m arrives.",
+			b"An orc leaves, \x1b[32mBob\x1b[0m follows.",
+		])
+
+	def found(self, trigger):
+		return [(text, m.span() if m is not None else None) for text, m in trigger.find_lines(self.lines, colours=self.colours)]
+
+	def test_fg(self):
+		self.assertEqual(self.found(Trigger(br"""orc""", fg="red")), [(self.lines[0], (3, 6))])
+		self.assertEqual(self.found(Trigger(br"""orc""", fg=["red", "white"])), [(self.lines[0], (3, 6)), (self.lines[1], (3, 6))])
+		self.assertEqual(self.found(Trigger(br"""\w+ follows""", fg="green")), [(self.lines[2], (15, 26))])
+		self.assertEqual(self.found(Trigger(br"""orc""", fg="blue")), [])
+
+	def test_bg(self):
+		self.assertEqual(self.found(Trigger(br"""\w+""", bg="red")), [(self.lines[1], (0, 2)), (self.lines[1], (3, 6))])
+		self.assertEqual(self.found(Trigger(br"""\w+""", fg="white", bg="red")), [(self.lines[1], (0, 2)), (self.lines[1], (3, 6))])
+		self.assertEqual(self.found(Trigger(br"""\w+""", fg="red", bg="red")), [])
+
+	def test_plain_text(self):
+		"""A plain text trigger fires once, on the first line it's found in the right colour in"""
+		self.assertEqual(self.found(Trigger(b"an orc", is_regexp=False, case_sensitive=False, bg="red")), [(self.lines[1], None)])
+		self.assertEqual(self.found(Trigger(b"orc", is_regexp=False, fg="red")), [(self.lines[0], None)])
+		self.assertEqual(self.found(Trigger(b"bob", is_regexp=False, fg="red")), [])
+
+	def test_without_colours(self):
+		"""Lines with no colour only match triggers that don't care what it is"""
+		self.assertEqual(Trigger(br"""orc""", fg="red").find_lines([b"An orc"]), [])
+
+	def test_multiline_is_refused(self):
+		self.assertRaises(ValueError, Trigger, b"orc\nelf", multiline=True, fg="red")
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,73 @@
+# Mbf, the mud bot framework - trigger function dispatcher tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import time
+import unittest
+
+from support import Bot, wait_until
+
+
+class DispatchTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, callback_workers=2, collect_stats=True)
+		self.got = []
+
+	def tearDown(self):
+		self.m.stop_processing()
+
+	def test_order_and_stop_processing(self):
+		m = self.m
+		@m.trigger(br"""^a$""", sequence=1)
+		def slow(t, match):
+			time.sleep(0.05)
+			self.got.append("slow")
+		@m.trigger(br"""^a$""", sequence=2)
+		def stop(t, match):
+			self.got.append("stop")
+			return True
+		@m.trigger(br"""^a$""", sequence=3)
+		def after(t, match):
+			self.got.append("after")
+		m.start_processing(print_output=False, thread=False)
+		m.handle_lines([b"a"])
+		self.assertTrue(wait_until(lambda: len(self.got) == 2))
+		time.sleep(0.1)
+		self.assertEqual(self.got, ["slow", "stop"])
+
+	def test_disabled_after_matching(self):
+		"""A trigger disabled by an earlier one's function, after the buffer was matched, isn't fired"""
+		m = self.m
+		@m.trigger(br"""^a$""", sequence=1)
+		def first(t, match):
+			self.got.append("first")
+			m.disable_trigger("second")
+			m.disable_trigger("pooled")
+		@m.trigger(br"""^a$""", sequence=2)
+		def second(t, match):
+			self.got.append("second")
+		@m.trigger(br"""^a$""", sequence=3, async_ok=True)
+		def pooled(t, match):
+			self.got.append("pooled")
+		@m.trigger(br"""^a$""", sequence=4)
+		def last(t, match):
+			self.got.append("last")
+		m.start_processing(print_output=False, thread=False)
+		m.handle_lines([b"a"])
+		self.assertTrue(wait_until(lambda: "last" in self.got))
+		time.sleep(0.1)
+		self.assertEqual(self.got, ["first", "last"])
+
+	def test_pool_calls_are_timed(self):
+		m = self.m
+		@m.trigger(br"""^a$""", async_ok=True)
+		def pooled(t, match):
+			time.sleep(0.02)
+			self.got.append("pooled")
+		m.start_processing(print_output=False, thread=False)
+		m.handle_lines([b"a"])
+		self.assertTrue(wait_until(lambda: self.got))
+		self.assertTrue(wait_until(lambda: m.stats()['triggers']['pooled']['fire_time'] >= 0.015))
+
+
+if __name__ == '__main__':
+	unittest.main()
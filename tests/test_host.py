@@ -0,0 +1,68 @@
+# Mbf, the mud bot framework - multi-session host tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import threading
+import unittest
+
+from support import Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.host import Host
+
+
+class HostTest(unittest.TestCase):
+	def setUp(self):
+		self.host = Host(timer_backend="builtin", poll_interval=0.1)
+		self.muds = [FakeMud(b""), FakeMud(b"")]
+		self.sessions = []
+		self.got = []
+		for n, mud in enumerate(self.muds):
+			m = Bot("127.0.0.1", {}, port=mud.port, auto_login=False, reconnect=False, scheduler=self.host.scheduler)
+			self.host.add(m)
+			mud.wait_for_clients(1)
+			self.sessions.append(m)
+		@self.host.trigger(br"""^boom$""")
+		def boom(m, t, match):
+			raise RuntimeError("a broken trigger")
+		@self.host.trigger(br"""^ping$""")
+		def ping(m, t, match):
+			m.send("pong") # queued on the host thread
+		@self.host.trigger(br"""^line (\d+)$""")
+		def line(m, t, match):
+			self.got.append((self.sessions.index(m), match.group(1)))
+		self.host.start()
+
+	def tearDown(self):
+		self.host.stop()
+		for m in self.sessions:
+			shut_down(m)
+		for mud in self.muds:
+			mud.close()
+
+	def test_a_trigger_raising_only_costs_its_own_buffer(self):
+		self.muds[0].send(0, b"boom\r\n")
+		self.muds[1].send(0, b"line 1\r\n")
+		self.assertTrue(wait_until(lambda: (1, b"1") in self.got))
+		self.muds[0].send(0, b"line 2\r\n") # the session that raised is still being read
+		self.assertTrue(wait_until(lambda: (0, b"2") in self.got))
+		self.assertEqual(len(self.host.sessions), 2)
+
+	def test_a_closed_connection_is_removed(self):
+		self.muds[0].drop(0)
+		self.assertTrue(wait_until(lambda: self.sessions[0].events)) # it's removed, then told
+		self.assertEqual(self.sessions[0].events, [("disconnect", False)])
+		self.assertEqual(len(self.host.sessions), 1)
+		self.muds[1].send(0, b"line 3\r\n")
+		self.assertTrue(wait_until(lambda: (1, b"3") in self.got))
+
+	def test_sessions_are_written_by_the_host(self):
+		self.assertNotIn("mbf_send_queue", [t.name for t in threading.enumerate()])
+		self.sessions[0].send("say from another thread") # wakes the host
+		self.assertTrue(self.muds[0].wait_for(b"say from another thread\n", 2))
+		self.muds[1].send(0, b"ping\r\n")
+		self.assertTrue(self.muds[1].wait_for(b"pong\n", 2))
+		self.assertEqual(self.sessions[1].stats()['send_queue']['commands'], 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,112 @@
+# Mbf, the mud bot framework - trigger and timer name and group index tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+from support import Bot, wait_until
+
+from mbf.trigger import Trigger
+
+
+class TriggerIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False)
+		self.got = []
+		for n in range(3):
+			self.add(b"line", name="a" if n < 2 else "b", group="first")
+		self.add(b"line", name="c", group="second")
+
+	def add(self, pattern, **kwargs):
+		@self.m.trigger(pattern, is_regexp=False, **kwargs)
+		def f(text, match):
+			self.got.append(kwargs['name'])
+
+	def fired(self):
+		self.got = []
+		self.m.handle_lines([b"line"])
+		return sorted(self.got)
+
+	def test_indexes(self):
+		m = self.m
+		self.assertEqual(sorted((name, len(ts)) for name, ts in m.trigger_names.items()), [("a", 2), ("b", 1), ("c", 1)])
+		self.assertEqual(sorted((group, len(ts)) for group, ts in m.trigger_groups.items()), [("first", 3), ("second", 1)])
+		self.assertEqual(set(m.triggers), m.trigger_groups["first"] | m.trigger_groups["second"])
+
+	def test_by_name(self):
+		self.assertEqual(self.fired(), ["a", "a", "b", "c"])
+		self.m.disable_trigger("a") # every trigger with the name
+		self.assertEqual(self.fired(), ["b", "c"])
+		self.m.disable_trigger("missing")
+		self.m.enable_trigger("a")
+		self.assertEqual(self.fired(), ["a", "a", "b", "c"])
+
+	def test_by_group(self):
+		self.m.disable_trigger_group("first")
+		self.assertEqual(self.fired(), ["c"])
+		self.m.enable_trigger("b")
+		self.assertEqual(self.fired(), ["b", "c"])
+		self.m.enable_trigger_group("first")
+		self.m.disable_trigger_group("second")
+		self.assertEqual(self.fired(), ["a", "a", "b"])
+		self.m.enable_trigger_group("missing")
+
+	def test_filters(self):
+		f = self.m.gag(b"spam", is_regexp=False, group="gags")
+		self.assertEqual(self.m.trigger_names[f.name], set([f]))
+		self.m.disable_trigger_group("gags")
+		self.assertFalse(f.enabled)
+
+	def test_triggers_hash_by_identity(self):
+		"""Triggers compare by sequence, so ones with the same sequence are equal; they're still different members of a set"""
+		a, b = Trigger(b"a"), Trigger(b"b")
+		self.assertTrue(a == b)
+		self.assertEqual(len(set([a, b, a])), 2)
+		self.assertRaises(AttributeError, setattr, a, "other", 1) # __slots__
+
+
+class TimerIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, timer_backend="builtin")
+		self.ran = []
+
+	def tearDown(self):
+		self.m.stop_processing()
+
+	def add(self, name, group="all", **kwargs):
+		@self.m.timer(seconds=0.02, name=name, group=group, **kwargs)
+		def f():
+			self.ran.append(name)
+
+	def test_by_name_and_group(self):
+		m = self.m
+		self.add("a", group="g")
+		self.add("a", group="h")
+		self.add("b", group="g")
+		self.assertEqual(sorted((name, len(ts)) for name, ts in m.timer_names.items()), [("a", 2), ("b", 1)])
+		m.disable_timer("a")
+		self.assertTrue(all(t.job.paused for t in m.timer_names["a"]))
+		self.assertFalse(any(t.job.paused for t in m.timer_names["b"]))
+		m.disable_timer_group("g")
+		self.assertTrue(all(t.job.paused for t in m.timers))
+		m.enable_timer_group("h")
+		self.assertEqual([t.enabled for t in m.timers], [False, True, False])
+		m.enable_timer("b")
+		m.disable_timer("missing")
+		self.assertEqual([t.enabled for t in m.timers], [False, True, True])
+
+	def test_finished_timers(self):
+		"""Timers whose job is gone (because they reached their run limit) can still be enabled and disabled"""
+		m = self.m
+		self.add("once", group="g", one_shot=True)
+		self.add("limited", group="g", run_limit=2)
+		m.start_processing(thread=False)
+		self.assertTrue(wait_until(lambda: len(self.ran) == 3, 5))
+		self.assertEqual(m.scheduler.get_jobs(), [])
+		m.disable_timer("once")
+		m.disable_timer_group("g")
+		m.enable_timer_group("g")
+		self.assertEqual(sorted(self.ran), ["limited", "limited", "once"])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,92 @@
+# Mbf, the mud bot framework - lazily created scheduler tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import subprocess
+import sys
+import threading
+import unittest
+
+from support import Bot, root, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.scheduler import HeapScheduler
+
+
+class LazySchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.m = None
+		self.ran = []
+
+	def tearDown(self):
+		if self.m is not None:
+			shut_down(self.m)
+
+	def bot(self, **kwargs):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, **kwargs)
+		return self.m
+
+	def add_timer(self):
+		@self.m.timer(seconds=0.02)
+		def tick():
+			self.ran.append(threading.current_thread().name)
+
+	def test_apscheduler_is_not_imported(self):
+		code = "import sys; sys.path.insert(0, {!r}); import mbf; m = mbf.Mbf('127.0.0.1', {{}}, autoconnect=False, reconnect=False); m.start_processing(thread=False); m.stop_processing(); print('apscheduler' in sys.modules)".format(root)
+		self.assertEqual(subprocess.check_output([sys.executable, "-c", code]).strip(), b"False")
+
+	def test_none_until_a_timer(self):
+		m = self.bot()
+		m.start_processing(thread=False)
+		m.poll_timeout()
+		m.stats()
+		self.assertEqual(m._scheduler, None)
+		m.stop_processing()
+		self.assertEqual(m._scheduler, None)
+
+	def test_started_when_a_timer_is_added_after_processing(self):
+		for backend in ("apscheduler", "builtin"):
+			self.ran = []
+			m = self.bot(timer_backend=backend)
+			m.start_processing(thread=False)
+			self.add_timer()
+			self.assertTrue(m._scheduler.running)
+			self.assertTrue(wait_until(lambda: len(self.ran) >= 2, 5))
+			m.stop_processing()
+			self.assertFalse(m._scheduler.running)
+
+	def test_not_started_before_processing(self):
+		m = self.bot(timer_backend="builtin")
+		self.add_timer()
+		self.assertTrue(isinstance(m._scheduler, HeapScheduler))
+		self.assertFalse(m._scheduler.running)
+		m.start_processing(thread=False)
+		self.assertTrue(m._scheduler.running)
+
+	def test_given_scheduler(self):
+		s = HeapScheduler()
+		m = self.bot(scheduler=s)
+		self.assertTrue(m.scheduler is s)
+		s.start()
+		m.start_processing(thread=False)
+		m.stop_processing()
+		self.assertTrue(s.running) # it isn't this instance's to stop
+		s.shutdown()
+
+	def test_run_by_the_trigger_processor(self):
+		"""With the trigger processor reading, a built-in scheduler created after processing starts runs it's timers on that thread"""
+		mud = FakeMud(b"")
+		try:
+			m = self.m = Bot("127.0.0.1", {}, port=mud.port, auto_login=False, reconnect=False, timer_backend="builtin")
+			mud.wait_for_clients(1)
+			m.start_processing()
+			self.add_timer()
+			self.assertTrue(wait_until(lambda: len(self.ran) >= 2, 5))
+			self.assertEqual(set(self.ran), set(["trigger_processor"]))
+			self.assertEqual(m.scheduler.thread, None)
+		finally:
+			shut_down(m)
+			mud.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
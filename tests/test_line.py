@@ -0,0 +1,91 @@
+# Mbf, the mud bot framework - decoded line and charset tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+from support import Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.line import Line, text_type
+from mbf.linebuffer import LineBuffer
+
+
+class LineTest(unittest.TestCase):
+	def test_decoding(self):
+		self.assertEqual(Line(b"caf\xc3\xa9"), u"caf\xe9")
+		self.assertEqual(Line(b"caf\xe9", "latin-1"), u"caf\xe9")
+		self.assertEqual(Line(u"caf\xe9", None), u"caf\xe9")
+		self.assertTrue(isinstance(Line(b"x"), text_type))
+
+	def test_errors(self):
+		self.assertEqual(Line(b"caf\xe9!"), u"caf\ufffd!")
+		self.assertEqual(Line(b"caf\xe9!", errors="ignore"), u"caf!")
+		self.assertRaises(UnicodeDecodeError, Line, b"caf\xe9", "utf-8", "strict")
+
+	def test_lower_is_worked_out_once(self):
+		l = Line(b"An ORC Arrives")
+		self.assertEqual(l._lower, None)
+		lowered = l.lower()
+		self.assertEqual(lowered, u"an orc arrives")
+		self.assertTrue(l.lower() is lowered)
+		self.assertEqual(l, u"An ORC Arrives") # the line itself isn't changed
+
+	def test_no_dict(self):
+		self.assertRaises(AttributeError, setattr, Line(b"x"), "other", 1)
+
+	def test_from_the_line_buffer(self):
+		lines = LineBuffer(charset="latin-1").feed(b"Caf\xe9 OPEN\r\nnext\r\n")
+		self.assertEqual(lines, [u"Caf\xe9 OPEN", u"next"])
+		self.assertTrue(all(isinstance(l, Line) for l in lines))
+		self.assertEqual(lines[0].lower(), u"caf\xe9 open")
+
+
+class CharsetTest(unittest.TestCase):
+	def setUp(self):
+		self.mud = FakeMud(b"")
+		self.got = []
+
+	def tearDown(self):
+		shut_down(self.m)
+		self.mud.close()
+
+	def bot(self, **kwargs):
+		self.m = Bot("127.0.0.1", {}, port=self.mud.port, auto_login=False, reconnect=False, **kwargs)
+		self.mud.wait_for_clients(1)
+		return self.m
+
+	def test_write_encodes(self):
+		m = self.bot(charset="latin-1")
+		m.write(u"say caf\xe9\r\n")
+		m.write(b"say na\xefve raw\r\n") # bytes go as they are
+		self.assertTrue(self.mud.wait_for(b"raw"))
+		self.assertEqual(b"".join(self.mud.received).split(b"\r\n")[:2], [b"say caf\xe9", b"say na\xefve raw"])
+
+	def test_write_errors(self):
+		m = self.bot(charset="ascii")
+		m.write(u"say \u2603!\r\n")
+		self.assertTrue(self.mud.wait_for(b"say ?!"))
+
+	def test_send(self):
+		m = self.bot(charset="utf-8")
+		self.assertTrue(m.send(u"say caf\xe9"))
+		self.assertTrue(m.send([u"caf\xe9", u"\xe9t\xe9"], prefix=u"say "))
+		self.assertTrue(self.mud.wait_for(b"say caf\xc3\xa9\nsay caf\xc3\xa9\nsay \xc3\xa9t\xc3\xa9\n"))
+
+	def test_triggers_see_lines(self):
+		m = self.bot(charset="utf-8")
+		@m.trigger(u"CAF\xc9", is_regexp=False, case_sensitive=False)
+		def cafe(text, match):
+			self.got.append(text)
+		@m.trigger(u"""^(\\w+) says""")
+		def says(text, match):
+			self.got.append(match.group(1))
+		m.start_processing()
+		self.mud.send(0, b"Bob says the caf\xc3\xa9 is open\r\n")
+		self.assertTrue(wait_until(lambda: len(self.got) == 2))
+		self.assertEqual(self.got, [u"Bob says the caf\xe9 is open", u"Bob"])
+		self.assertTrue(isinstance(self.got[0], Line))
+
+
+if __name__ == '__main__':
+	unittest.main()
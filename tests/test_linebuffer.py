@@ -0,0 +1,51 @@
+# Mbf, the mud bot framework - line buffer tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+import support # puts mbf on the path
+
+from mbf.linebuffer import LineBuffer
+
+
+class LineBufferTest(unittest.TestCase):
+	def test_lines_split_between_reads(self):
+		b = LineBuffer(timeout=None)
+		self.assertEqual(b.feed(b"first li"), [])
+		self.assertEqual(b.feed(b"ne\r\nsecond\nthi"), [b"first line", b"second"])
+		self.assertEqual(b.tail, b"thi")
+		self.assertEqual(b.feed(b"rd\r\n"), [b"third"])
+		self.assertEqual(b.tail, b"")
+
+	def test_marks_end_prompts(self):
+		b = LineBuffer(timeout=None)
+		data = b"You are hungry.\r\n<100hp 50mp> "
+		self.assertEqual(b.feed(data, [len(data)]), [b"You are hungry.", b"<100hp 50mp> "])
+		self.assertEqual(b.tail, b"")
+
+	def test_mark_finishes_a_prompt_split_between_reads(self):
+		b = LineBuffer(timeout=None)
+		self.assertEqual(b.feed(b"<100hp "), [])
+		self.assertEqual(b.feed(b"50mp> ", [6]), [b"<100hp 50mp> "])
+
+	def test_mark_in_the_middle_of_a_read(self):
+		b = LineBuffer(timeout=None)
+		data = b"<100hp> You are hit!\r\n<90hp> "
+		self.assertEqual(b.feed(data, [len(b"<100hp> ")]), [b"<100hp> ", b"You are hit!"])
+		self.assertEqual(b.tail, b"<90hp> ")
+
+	def test_prompt_regexps(self):
+		b = LineBuffer(prompts=[br"""^<\d+hp> $"""], timeout=None)
+		self.assertEqual(b.feed(b"<100hp> "), [b"<100hp> "])
+		self.assertEqual(b.feed(b"no prompt here"), [])
+
+	def test_idle_partial_line(self):
+		b = LineBuffer(timeout=0.5)
+		b.feed(b"What is your name? ")
+		self.assertEqual(b.check_idle(b.last_data + 0.1), [])
+		self.assertEqual(b.check_idle(b.last_data + 0.5), [b"What is your name? "])
+		self.assertEqual(b.check_idle(), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,115 @@
+# Mbf, the mud bot framework - login tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import threading
+import unittest
+
+from support import LOGIN_INFO, LOGIN_SCREEN, WRONG_PASSWORD_SCREEN, Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.login import Login
+from mbf.utils import process_info_dict
+
+
+class LoginMachineTest(unittest.TestCase):
+	def setUp(self):
+		self.sent = []
+		self.results = []
+		self.login = Login(process_info_dict(dict(LOGIN_INFO)), {'username': "bob", 'password': "pw"}, self.sent.append, timeout=3, on_success=lambda: self.results.append("ok"), on_failure=self.results.append)
+
+	def test_success(self):
+		l = self.login
+		l.start(now=100)
+		self.assertFalse(l.feed([b"Welcome to the mud!", b"By what name do you go?"], now=100))
+		self.assertEqual(self.sent, ["bob"])
+		self.assertFalse(l.feed([b"Password:"], now=101))
+		self.assertEqual(self.sent, ["bob", "pw"])
+		self.assertTrue(l.feed([b"Welcome back!"], now=102))
+		self.assertTrue(l.succeeded)
+		self.assertTrue(l.done.is_set())
+		self.assertEqual(self.results, ["ok"])
+
+	def test_whole_screen_in_one_read(self):
+		l = self.login
+		l.start(now=100)
+		self.assertTrue(l.feed(LOGIN_SCREEN.split(b"\r\n"), now=100))
+		self.assertTrue(l.succeeded)
+
+	def test_wrong_username(self):
+		l = self.login
+		l.start(now=100)
+		l.feed([b"By what name do you go?", b"No such player."], now=100)
+		self.assertTrue(l.finished)
+		self.assertFalse(l.succeeded)
+		self.assertEqual(self.results, ["Incorrect username."])
+
+	def test_wrong_password(self):
+		l = self.login
+		l.start(now=100)
+		l.feed(WRONG_PASSWORD_SCREEN.split(b"\r\n"), now=100)
+		self.assertFalse(l.succeeded)
+		self.assertEqual(l.reason, "Incorrect password.")
+
+	def test_timeout(self):
+		l = self.login
+		l.start(now=100)
+		self.assertFalse(l.check(now=102))
+		self.assertTrue(l.check(now=103.5))
+		self.assertFalse(l.succeeded)
+		self.assertIn("Timeout", l.reason)
+		self.assertEqual(l.time_left(now=104), None)
+
+
+class LoginTest(unittest.TestCase):
+	def setUp(self):
+		self.m = None
+
+	def tearDown(self):
+		if self.m is not None:
+			shut_down(self.m)
+		self.mud.close()
+
+	def test_automatic_login(self):
+		self.mud = FakeMud(LOGIN_SCREEN)
+		m = self.m = Bot("127.0.0.1", dict(LOGIN_INFO), port=self.mud.port, username="bob", password="pw", reconnect=False, timeout=2)
+		m.start_processing(print_output=False) # connecting began the login; it moves along as lines are read
+		self.assertTrue(wait_until(lambda: m.logged_in))
+		self.assertEqual(m.events, ["login"])
+		self.assertTrue(self.mud.wait_for(b"bob\npw\n"))
+
+	def test_failed_login(self):
+		self.mud = FakeMud(WRONG_PASSWORD_SCREEN)
+		m = self.m = Bot("127.0.0.1", dict(LOGIN_INFO), port=self.mud.port, username="bob", password="wrong", reconnect=False, timeout=2)
+		m.start_processing(print_output=False)
+		self.assertTrue(wait_until(lambda: m.events))
+		self.assertFalse(m.logged_in)
+		self.assertEqual(m.events, [("login failed", "Incorrect password.")])
+
+	def test_login_while_processing(self):
+		self.mud = FakeMud(b"")
+		m = self.m = Bot("127.0.0.1", dict(LOGIN_INFO), port=self.mud.port, username="bob", password="pw", auto_login=False, reconnect=False, timeout=2)
+		m.start_processing(print_output=False)
+		self.mud.wait_for_clients(1)
+		threading.Timer(0.2, self.mud.send, args=(0, LOGIN_SCREEN)).start() # once login() is waiting for the trigger processor
+		self.assertTrue(m.login())
+		self.assertEqual(m.events, ["login"])
+
+	def test_login_on_the_reading_thread(self):
+		"""A trigger function calling login() would wait for itself forever"""
+		self.mud = FakeMud(b"")
+		m = self.m = Bot("127.0.0.1", dict(LOGIN_INFO), port=self.mud.port, username="bob", password="pw", auto_login=False, reconnect=False, timeout=2)
+		raised = []
+		@m.trigger(br"""^You have been idle too long\.$""")
+		def relog(t, match):
+			try:
+				m.login()
+			except RuntimeError:
+				raised.append(True)
+		m.start_processing(print_output=False)
+		self.mud.wait_for_clients(1)
+		self.mud.send(0, b"You have been idle too long.\r\n")
+		self.assertTrue(wait_until(lambda: raised))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+# Mbf, the mud bot framework - GMCP and MSDP tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+from support import Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.oob import encode_msdp, parse_gmcp, parse_msdp
+from mbf.telnet import GMCP, IAC, SB, SE, WILL
+
+
+class OobTest(unittest.TestCase):
+	def test_parse_gmcp(self):
+		self.assertEqual(parse_gmcp(b'Char.Vitals {"hp": 5, "mp": 10}'), (u"Char.Vitals", {u"hp": 5, u"mp": 10}))
+		self.assertEqual(parse_gmcp(b"Core.Ping"), (u"Core.Ping", None))
+		self.assertEqual(parse_gmcp(b"Comm.Say not json"), (u"Comm.Say", u"not json"))
+
+	def test_parse_gmcp_bad_utf8(self):
+		package, value = parse_gmcp(b"Char.\xfeBad 1")
+		self.assertEqual(package, u"Char.\ufffdBad")
+		self.assertEqual(value, 1)
+
+	def test_msdp_round_trip(self):
+		self.assertEqual(parse_msdp(encode_msdp("HEALTH", "50")), {u"HEALTH": u"50"})
+		self.assertEqual(parse_msdp(encode_msdp("ROOM", {"NAME": "Square", "EXITS": ["n", "s"]})), {u"ROOM": {u"NAME": u"Square", u"EXITS": [u"n", u"s"]}})
+
+	def test_handlers_run_after_lines_and_errors_are_isolated(self):
+		mud = FakeMud(b"")
+		m = Bot("127.0.0.1", {}, port=mud.port, auto_login=False, reconnect=False, gmcp=True)
+		events = []
+		@m.trigger(br"""^hello$""")
+		def hello(t, match):
+			events.append("line")
+		@m.gmcp("Char")
+		def broken(name, value):
+			raise RuntimeError("a broken handler")
+		@m.gmcp("Char.Vitals")
+		def vitals(name, value):
+			events.append(("vitals", value))
+		try:
+			m.start_processing(print_output=False)
+			mud.wait_for_clients(1)
+			mud.send(0, IAC + WILL + GMCP)
+			self.assertTrue(mud.wait_for(b"Core.Hello"))
+			# the text comes first, so it's triggers run before the handlers, though the telnet layer parses the message in the same read
+			mud.send(0, b"hello\r\n" + IAC + SB + GMCP + b'Char.Vitals {"hp": 5}' + IAC + SE)
+			self.assertTrue(wait_until(lambda: len(events) == 2))
+			self.assertEqual(events, ["line", ("vitals", {u"hp": 5})])
+			self.assertEqual(m.gmcp_data.get("Char.Vitals"), {u"hp": 5})
+		finally:
+			shut_down(m)
+			mud.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,150 @@
+# Mbf, the mud bot framework - output filter and writer tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+from support import Bot, wait_until
+
+from mbf.ansi import RESET, sgr_code
+from mbf.output import OutputWriter
+
+
+class OutputFilterTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False)
+
+	def shown(self, *lines):
+		return self.m.trigger_set.filter_lines(list(lines))
+
+	def test_gag(self):
+		self.m.gag(br"""^\w+ shouts""")
+		self.m.gag(b"spam", is_regexp=False, case_sensitive=False)
+		self.assertEqual(self.shown(b"Bob shouts 'hi'", b"Bob says 'hi'", b"Buy SPAM now", b"You hear no shouts"), [b"Bob says 'hi'", b"You hear no shouts"])
+
+	def test_substitute_with_a_string(self):
+		self.m.substitute(br"""(\w+) tells you""", br"""\1 says to you""")
+		self.m.substitute(b"gold", b"\\1 coins", is_regexp=False) # plain text is used as it is
+		self.assertEqual(self.shown(b"Bob tells you 'hi'", b"You get 5 gold and 1 gold."), [b"Bob says to you 'hi'", b"You get 5 \\1 coins and 1 \\1 coins."])
+
+	def test_substitute_with_a_function(self):
+		self.m.substitute(br"""\d+""", lambda match: str(int(match.group(0)) * 2).encode("ascii"))
+		self.assertEqual(self.shown(b"5 orcs and 12 goblins", b"none"), [b"10 orcs and 24 goblins", b"none"])
+
+	def test_highlight(self):
+		self.m.highlight(b"orc", fg="red", is_regexp=False, case_sensitive=False)
+		start, end = sgr_code("red"), RESET
+		if str is not bytes:
+			start, end = start.encode("ascii"), end.encode("ascii")
+		self.assertEqual(self.shown(b"An Orc hits an orc."), [b"An " + start + b"Orc" + end + b" hits an " + start + b"orc" + end + b"."])
+
+	def test_rewrite(self):
+		@self.m.rewrite(br"""^(.+?) hits you""")
+		def hits(line, match):
+			if match.group(1) == b"Bob":
+				return None
+			return b"OUCH: " + line
+		self.assertEqual(self.shown(b"Bob hits you.", b"An orc hits you.", b"You hit Bob."), [b"OUCH: An orc hits you.", b"You hit Bob."])
+
+	def test_order_by_sequence(self):
+		self.m.substitute(b"goblin", b"troll", is_regexp=False, sequence=20)
+		self.m.substitute(b"orc", b"goblin", is_regexp=False, sequence=10)
+		self.m.gag(b"troll", is_regexp=False, sequence=30, name="no trolls")
+		self.assertEqual(self.shown(b"an orc", b"a goblin", b"a rat"), [b"a rat"])
+		self.m.disable_trigger("no trolls")
+		self.assertEqual(self.shown(b"an orc"), [b"an troll"])
+
+	def test_each_sees_what_the_last_left(self):
+		self.m.substitute(b"orc", b"goblin", is_regexp=False, sequence=20)
+		self.m.substitute(b"goblin", b"troll", is_regexp=False, sequence=10)
+		self.assertEqual(self.shown(b"an orc", b"a goblin"), [b"an goblin", b"a troll"])
+
+	def test_enable_and_disable(self):
+		self.m.gag(b"spam", is_regexp=False, name="spam")
+		self.m.substitute(b"orc", b"goblin", is_regexp=False, group="monsters")
+		self.m.disable_trigger("spam")
+		self.m.disable_trigger_group("monsters")
+		self.assertEqual(self.shown(b"spam", b"an orc"), [b"spam", b"an orc"])
+		self.m.enable_trigger("spam")
+		self.m.enable_trigger_group("monsters")
+		self.assertEqual(self.shown(b"spam", b"an orc"), [b"an goblin"])
+
+	def test_filters_are_not_triggers(self):
+		"""Filters change what's printed, not what triggers see; they aren't fired, and a trigger that stops processing doesn't stop them"""
+		m = self.m
+		got = []
+		printed = []
+		m.output.sink = printed.append
+		m.output.coalesce = 0
+		@m.trigger(br"""orc""", sequence=1)
+		def stop(text, match):
+			got.append(text)
+			return True
+		m.substitute(b"orc", b"goblin", is_regexp=False, sequence=50)
+		m.gag(b"spam", is_regexp=False, sequence=60)
+		@m.trigger(br"""spam|goblin""", sequence=100)
+		def after(text, match):
+			got.append(text)
+		m.start_processing(print_output=True, thread=False)
+		try:
+			m.handle_lines([b"an orc", b"spam"])
+			self.assertTrue(m.output.flush(2))
+		finally:
+			m.stop_processing()
+		self.assertEqual(got, [b"an orc"])
+		self.assertEqual(printed, [b"an goblin\n"])
+
+	def test_colour_and_multiline_are_refused(self):
+		self.assertRaises(ValueError, self.m.gag, b"orc", fg="red")
+		self.assertRaises(ValueError, self.m.gag, b"orc\nelf", multiline=True)
+
+
+class OutputWriterTest(unittest.TestCase):
+	def test_batches(self):
+		written = []
+		w = OutputWriter(written.append, coalesce=0.05)
+		w.start()
+		try:
+			w.put([b"a", b"b"])
+			w.put([b"c"])
+			self.assertTrue(w.flush(2))
+		finally:
+			w.stop()
+		self.assertEqual(written, [b"a\nb\nc\n"])
+		self.assertEqual((w.lines, w.writes), (3, 1))
+
+	def test_drops_the_oldest(self):
+		written = []
+		w = OutputWriter(written.append, max_pending=3, coalesce=0)
+		w.put([b"1", b"2"])
+		w.put([b"3", b"4", b"5"])
+		self.assertEqual(w.get_stats()['dropped'], 2)
+		self.assertEqual(w.get_stats()['max_depth'], 3)
+		w.start()
+		try:
+			self.assertTrue(w.flush(2))
+		finally:
+			w.stop()
+		self.assertEqual(written, [b"3\n4\n5\n"])
+		self.assertEqual(w.get_stats()['queued'], 0)
+
+	def test_a_failing_sink(self):
+		written = []
+		def sink(data):
+			if not written:
+				written.append(None)
+				raise IOError("full")
+			written.append(data)
+		w = OutputWriter(sink, coalesce=0)
+		w.start()
+		try:
+			w.put([b"lost"])
+			self.assertTrue(wait_until(lambda: w.writes == 1))
+			w.put([b"kept"])
+			self.assertTrue(w.flush(2))
+		finally:
+			w.stop()
+		self.assertEqual(written, [None, b"kept\n"])
+
+
+if __name__ == '__main__':
+	unittest.main()
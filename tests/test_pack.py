@@ -0,0 +1,155 @@
+# Mbf, the mud bot framework - trigger pack tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import json
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import Bot
+
+from mbf import pack
+from mbf.pack import FORMAT, TriggerPack
+from mbf.triggerset import TriggerSet
+from test_triggerset import ALL_BATCHES, ALL_SPECS, record_batches
+
+
+def spec_for(specs):
+	"""A pack spec with a trigger for each of specs (as in test_triggerset), named like make_triggers names them"""
+	triggers = []
+	for n, (pattern, kwargs) in enumerate(specs):
+		entry = dict(kwargs)
+		entry['pattern'] = pattern.decode("utf-8")
+		entry['name'] = "t{}".format(n)
+		triggers.append(entry)
+	return {'defaults': {'handler': "record"}, 'triggers': triggers}
+
+
+class TriggerPackTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, "pack.json")
+		self.cache = os.path.join(self.dir, "cache")
+		self.write(spec_for(ALL_SPECS))
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def write(self, spec):
+		with open(self.path, "w") as f:
+			json.dump(spec, f)
+
+	def cached(self):
+		return [os.path.join(self.cache, name) for name in os.listdir(self.cache)] if os.path.isdir(self.cache) else []
+
+	def load_cached(self):
+		"""Load the pack, failing if it has to be compiled"""
+		compile = TriggerPack.compile
+		def refuse(*args, **kwargs):
+			raise AssertionError("the pack was compiled")
+		TriggerPack.compile = classmethod(refuse)
+		try:
+			return TriggerPack.load(self.path, self.cache)
+		finally:
+			TriggerPack.compile = compile
+
+	def test_round_trip(self):
+		compiled = TriggerPack.load(self.path, self.cache)
+		self.assertEqual(len(compiled), len(ALL_SPECS))
+		self.assertEqual(len(self.cached()), 1)
+		loaded = self.load_cached()
+		self.assertEqual(loaded.entries, compiled.entries)
+		self.assertEqual(loaded.digest, compiled.digest)
+
+	def test_default_cache_dir(self):
+		TriggerPack.load(self.path)
+		self.assertEqual(len(os.listdir(os.path.join(self.dir, "__mbfcache__"))), 1)
+
+	def test_changed_spec(self):
+		TriggerPack.load(self.path, self.cache)
+		self.write(spec_for(ALL_SPECS[:3]))
+		self.assertEqual(len(TriggerPack.load(self.path, self.cache)), 3)
+		self.assertEqual(len(self.load_cached()), 3)
+
+	def test_corrupt_cache(self):
+		TriggerPack.load(self.path, self.cache)
+		path = self.cached()[0]
+		for junk in (b"", b"junk", marshal.dumps([1, 2])):
+			with open(path, "wb") as f:
+				f.write(junk)
+			self.assertEqual(len(TriggerPack.load(self.path, self.cache)), len(ALL_SPECS))
+			self.assertEqual(len(self.load_cached()), len(ALL_SPECS)) # and it was written again
+
+	def test_stale_cache(self):
+		"""A cached pack from another version of the format, or compiled from something else, is compiled again"""
+		good = TriggerPack.load(self.path, self.cache)
+		path = self.cached()[0]
+		for stale in ((FORMAT - 1, good.digest, []), (FORMAT, "something else", [])):
+			with open(path, "wb") as f:
+				f.write(marshal.dumps(stale))
+			self.assertEqual(TriggerPack.load(self.path, self.cache).entries, good.entries)
+
+	def test_unwritable_cache(self):
+		with open(self.cache, "w") as f: # a file where the directory should be
+			f.write("")
+		self.assertEqual(len(TriggerPack.load(self.path, self.cache)), len(ALL_SPECS))
+
+	def test_invalid(self):
+		for spec in ({}, {'triggers': [{'pattern': "a"}]}, {'triggers': [{'pattern': "a(", 'handler': "h"}]}, {'triggers': [{'pattern': "a", 'handler': "h", 'colour': "red"}]}):
+			self.assertRaises(ValueError, TriggerPack.compile, spec)
+
+	def test_same_as_built_directly(self):
+		"""Pack triggers come with their prefilter worked out, and don't compile their regexps until a line has their literal; they fire the same as triggers made directly"""
+		expected = record_batches(ALL_SPECS, ALL_BATCHES)
+		for p in (TriggerPack.load(self.path, self.cache), self.load_cached()):
+			record = []
+			triggers = []
+			ts = TriggerSet()
+			for t, handler in p.triggers():
+				self.assertEqual(handler, "record")
+				self.assertTrue(t.prefilter is not None)
+				def fn(text, match, t=t):
+					record.append((t.name, text, match.span() if match is not None else None))
+					return t.stop_processing
+				t.add_function(fn)
+				triggers.append(t)
+				ts.add(t)
+			ts.compile()
+			self.assertFalse(triggers[0].compiled) # it's literal is checked first
+			for batch in ALL_BATCHES:
+				if callable(batch):
+					batch(triggers)
+				else:
+					lines, colours = batch
+					ts.process_lines(list(lines), colours=colours)
+			self.assertEqual(record, expected)
+
+	def test_compiled_when_needed(self):
+		self.write({'triggers': [{'pattern': "never (\\w+) here", 'handler': "h"}, {'pattern': "(\\w+) arrives", 'handler': "h"}]})
+		ts = TriggerSet()
+		triggers = [t for t, handler in TriggerPack.load(self.path, self.cache).triggers()]
+		for t in triggers:
+			t.add_function(lambda text, match: None)
+			ts.add(t)
+		ts.process_lines([b"An orc arrives", b"here it is"])
+		self.assertEqual([t.compiled for t in triggers], [False, True])
+
+	def test_load_trigger_pack(self):
+		got = []
+		m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False)
+		self.write({'triggers': [{'pattern': "(\\w+) arrives", 'handler': "arrives", 'group': "mobs"}, {'pattern': "gone", 'is_regexp': False, 'handler': "os.path:basename"}]})
+		added = m.load_trigger_pack(self.path, {'arrives': lambda text, match: got.append(match.group(1))}, cache_dir=self.cache)
+		self.assertEqual(len(added), 2)
+		self.assertTrue(added[1].fn is not None)
+		m.handle_lines([b"An orc arrives"])
+		m.disable_trigger_group("mobs")
+		m.handle_lines([b"A troll arrives"])
+		self.assertEqual(got, [b"orc"])
+		self.assertRaises(ValueError, pack.resolve_handler, "missing", {})
+		self.assertRaises(ValueError, pack.resolve_handler, "no_such_module:f", None)
+
+
+if __name__ == '__main__':
+	unittest.main()
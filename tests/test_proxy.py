@@ -0,0 +1,168 @@
+# Mbf, the mud bot framework - client proxy tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import socket
+import time
+import unittest
+
+from support import Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.proxy import Client, Proxy
+
+
+class ClientTest(unittest.TestCase):
+	def setUp(self):
+		self.c = Client(None, ("127.0.0.1", 1234), 0)
+
+	def test_lines(self):
+		self.assertEqual(self.c.received(b"look\r\nsay hi\n"), [b"look", b"say hi"])
+		self.assertEqual(self.c.received(b"no"), [])
+		self.assertEqual(self.c.received(b"rth\r"), [])
+		self.assertEqual(self.c.received(b"\n"), [b"north"])
+
+	def test_negotiation_is_left_out(self):
+		self.assertEqual(self.c.received(b"\xff\xfd\x01lo\xff\xf1ok\xff\xfb\x18\r\n"), [b"look"]) # do echo, a nop, will terminal type
+
+	def test_escaped_iac(self):
+		self.assertEqual(self.c.received(b"say \xff\xffhi\r\n"), [b"say \xffhi"])
+
+	def test_subnegotiation_is_left_out(self):
+		self.assertEqual(self.c.received(b"a\xff\xfa\x18\x00xterm\xff\xff\r\n\xff\xf0b\r\n"), [b"ab"]) # an escaped 255 and a newline in it don't end it
+
+	def test_split_between_reads(self):
+		"""Where a client is in a telnet command carries over to what it sends next"""
+		self.assertEqual(self.c.received(b"a\xff"), [])
+		self.assertEqual(self.c.received(b"\xfb"), [])
+		self.assertEqual(self.c.received(b"\x18b\xff\xfa\x1f\x00"), [])
+		self.assertEqual(self.c.received(b"\x50\xff"), [])
+		self.assertEqual(self.c.received(b"\xf0c\r\n"), [b"abc"])
+
+
+class TrimTest(unittest.TestCase):
+	def setUp(self):
+		self.socks = []
+
+	def proxy(self, slow_clients):
+		p = Proxy(None, 0, max_buffer=10, slow_clients=slow_clients)
+		p.wake = lambda: None # there's no thread to wake
+		for pos in (0, 0):
+			a, b = socket.socketpair()
+			self.socks.append(b)
+			p.clients.append(Client(a, ("127.0.0.1", len(self.socks)), pos))
+		return p
+
+	def tearDown(self):
+		for s in self.socks:
+			s.close()
+
+	def test_skip(self):
+		p = self.proxy("skip")
+		slow, fast = p.clients
+		for n in range(3):
+			p.feed(b"chunk" + str(n).encode("ascii"))
+			with p.lock:
+				fast.pos = p.tail # sent everything so far
+		self.assertEqual(p.tail, 18)
+		self.assertEqual(p.head, 12) # what's more than max_buffer behind is let go
+		self.assertEqual(slow.pos, 12)
+		self.assertEqual(p.get_stats()['skipped'], 12)
+		self.assertEqual(p.clients, [slow, fast])
+		with p.lock:
+			p.send(slow)
+		self.assertEqual(self.socks[0].recv(100), b"chunk2")
+		self.assertEqual(list(p.chunks), []) # both have been sent everything
+
+	def test_drop(self):
+		p = self.proxy("drop")
+		slow, fast = p.clients
+		for n in range(3):
+			p.feed(b"chunk" + str(n).encode("ascii"))
+			with p.lock:
+				fast.pos = p.tail
+		self.assertEqual(p.clients, [fast])
+		self.assertEqual(p.get_stats()['dropped'], 1)
+		self.assertEqual(self.socks[0].recv(100), b"") # disconnected
+
+	def test_a_chunk_bigger_than_the_buffer(self):
+		"""The newest chunk is kept whatever it's size, so a client can be sent it"""
+		p = self.proxy("skip")
+		p.feed(b"x" * 50)
+		self.assertEqual((p.head, p.tail), (0, 50))
+
+	def test_unknown_policy(self):
+		self.assertRaises(ValueError, Proxy, None, 0, slow_clients="wait")
+
+
+class ProxyTest(unittest.TestCase):
+	def setUp(self):
+		self.mud = FakeMud(b"")
+		self.m = Bot("127.0.0.1", {}, port=self.mud.port, auto_login=False, reconnect=False)
+		self.mud.wait_for_clients(1)
+		self.m.start_processing()
+		self.clients = []
+
+	def tearDown(self):
+		for c in self.clients:
+			c.close()
+		shut_down(self.m)
+		self.mud.close()
+
+	def attach(self, proxy, n=1):
+		for i in range(n):
+			c = socket.create_connection(("127.0.0.1", proxy.port), 5)
+			self.clients.append(c)
+		self.assertTrue(wait_until(lambda: proxy.connections == len(self.clients)))
+		return self.clients[-n:]
+
+	def recv_until(self, c, text):
+		data = b""
+		end = time.time() + 10
+		while text not in data and time.time() < end:
+			data += c.recv(4096)
+		return data
+
+	def test_clients_see_the_mud_and_type_to_it(self):
+		proxy = self.m.listen(0)
+		a, b = self.attach(proxy, 2)
+		self.mud.send(0, b"\x1b[31mAn orc\x1b[0m arrives.\r\n")
+		for c in (a, b):
+			self.assertEqual(self.recv_until(c, b"arrives.\r\n"), b"\x1b[31mAn orc\x1b[0m arrives.\r\n") # just as the mud sent it
+		a.sendall(b"\xff\xfd\x01kill orc\r\n")
+		self.assertTrue(self.mud.wait_for(b"kill orc"))
+		self.assertFalse(b"\xff\xfd\x01" in b"".join(self.mud.received))
+		self.assertEqual(proxy.get_stats()['commands'], 1)
+
+	def test_on_client_input(self):
+		typed = []
+		self.m.on_client_input = typed.append
+		a, = self.attach(self.m.listen(0))
+		a.sendall(b"#stats\r\n")
+		self.assertTrue(wait_until(lambda: typed == [b"#stats"]))
+
+	def test_detach(self):
+		proxy = self.m.listen(0)
+		a, b = self.attach(proxy, 2)
+		a.close()
+		self.assertTrue(wait_until(lambda: len(proxy.clients) == 1))
+		self.mud.send(0, b"still here\r\n")
+		self.assertEqual(self.recv_until(b, b"here\r\n"), b"still here\r\n")
+
+	def test_max_clients(self):
+		proxy = self.m.listen(0, max_clients=1)
+		self.attach(proxy)
+		c = socket.create_connection(("127.0.0.1", proxy.port), 5)
+		self.clients.append(c)
+		self.assertEqual(c.recv(100), b"") # refused
+		self.assertEqual(len(proxy.clients), 1)
+
+	def test_stop(self):
+		proxy = self.m.listen(0)
+		a, = self.attach(proxy)
+		proxy.stop()
+		self.assertEqual(a.recv(100), b"")
+		self.assertFalse(proxy.thread.is_alive())
+
+
+if __name__ == '__main__':
+	unittest.main()
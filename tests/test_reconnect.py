@@ -0,0 +1,80 @@
+# Mbf, the mud bot framework - reconnect tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+from support import LOGIN_INFO, LOGIN_SCREEN, WRONG_PASSWORD_SCREEN, Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.host import Host
+
+
+class ReconnectTest(unittest.TestCase):
+	def setUp(self):
+		self.mud = FakeMud(LOGIN_SCREEN)
+		self.host = None
+
+	def tearDown(self):
+		if self.host is not None:
+			self.host.stop()
+		shut_down(self.m)
+		self.mud.close()
+
+	def bot(self, reconnect_delay=0.1, **kwargs):
+		m = self.m = Bot("127.0.0.1", dict(LOGIN_INFO), port=self.mud.port, username="bob", password="pw", timeout=1, reconnect_delay=reconnect_delay, **kwargs)
+		@m.trigger(br"""^You are hit""", group="combat")
+		def hit(t, match):
+			pass
+		return m
+
+	def reconnects(self):
+		return self.m.stats()['reconnect']['reconnects']
+
+	def test_reconnect(self):
+		m = self.bot(reconnect_delay=1) # the first attempt is half a second to a second after the drop
+		m.disable_trigger_group("combat")
+		m.start_processing(print_output=False)
+		self.assertTrue(wait_until(lambda: m.logged_in))
+		self.mud.drop(0)
+		self.assertTrue(wait_until(lambda: ("disconnect", False) in m.events))
+		self.assertFalse(m.connected)
+		m.send("say held while disconnected")
+		self.assertTrue(wait_until(lambda: "reconnect" in m.events))
+		self.assertEqual(self.reconnects(), 1)
+		self.assertTrue(m.logged_in)
+		self.assertEqual(m.events, ["login", ("disconnect", False), "login", "reconnect"])
+		self.assertFalse(m.triggers[0].enabled) # put back the way it was
+		self.assertTrue(self.mud.wait_for(b"say held while disconnected"))
+
+	def test_reconnect_on_a_host(self):
+		"""With a built-in scheduler the host thread runs the reconnect attempts and reads the connection, so an attempt mustn't wait for the login"""
+		self.host = Host(timer_backend="builtin", poll_interval=0.1)
+		m = self.bot(scheduler=self.host.scheduler, autoconnect=False)
+		m.connect()
+		self.host.add(m)
+		self.host.start()
+		self.assertTrue(wait_until(lambda: m.logged_in))
+		self.mud.drop(0)
+		self.assertTrue(wait_until(lambda: self.reconnects() == 1))
+		self.assertTrue(m.logged_in)
+		self.assertIn(m, self.host.sessions.values())
+
+	def test_failed_login_is_retried_on_a_host(self):
+		self.host = Host(timer_backend="builtin", poll_interval=0.1)
+		m = self.bot(scheduler=self.host.scheduler, autoconnect=False)
+		m.connect()
+		self.host.add(m)
+		self.host.start()
+		self.assertTrue(wait_until(lambda: m.logged_in))
+		self.mud.greeting = WRONG_PASSWORD_SCREEN
+		self.mud.drop(0)
+		self.assertTrue(wait_until(lambda: m.stats()['reconnect']['failed_attempts'] >= 1))
+		self.assertFalse(m.logged_in)
+		self.mud.greeting = LOGIN_SCREEN
+		self.assertTrue(wait_until(lambda: self.reconnects() == 1))
+		self.assertTrue(m.logged_in)
+		self.assertNotIn(("login failed", "Incorrect password."), m.events) # the reconnector handles it, and tries again
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,235 @@
+# Mbf, the mud bot framework - built-in timer scheduler tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import datetime
+import threading
+import time
+import unittest
+
+from support import Bot, wait_until
+
+from mbf.scheduler import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, HeapScheduler, JobLookupError
+
+
+class HeapSchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.s = HeapScheduler()
+		self.s.start()
+		self.ran = []
+
+	def tearDown(self):
+		self.s.shutdown()
+
+	def add(self, name, **kwargs):
+		"""Add a job that records name when it runs; returns it and when it was added"""
+		now = time.time()
+		job = self.s.add_job(self.ran.append, args=[name], **kwargs)
+		return job, now
+
+	def test_interval(self):
+		job, now = self.add("a", seconds=10)
+		self.assertAlmostEqual(job.next_run, now + 10, delta=0.5)
+		start = job.next_run
+		self.assertEqual(self.s.run_pending(start - 0.01), 0)
+		self.assertEqual(self.s.run_pending(start), 1)
+		self.assertEqual(self.s.run_pending(start + 5), 0)
+		self.assertEqual(self.s.run_pending(start + 10), 1)
+		self.assertEqual(self.ran, ["a", "a"])
+		self.assertEqual(job.next_run, start + 20)
+
+	def test_interval_units(self):
+		job, now = self.add("a", minutes=1, hours=1, days=1, weeks=1)
+		self.assertAlmostEqual(job.next_run - now, 60 + 3600 + 86400 + 604800, delta=0.5)
+		self.assertRaises(ValueError, self.s.add_job, self.ran.append)
+		self.assertRaises(ValueError, self.s.add_job, self.ran.append, 'cron')
+
+	def test_stays_on_schedule(self):
+		"""A run that's late doesn't push the ones after it back, and runs missed by falling more than an interval behind are skipped"""
+		job, now = self.add("a", seconds=10)
+		start = job.next_run
+		self.s.run_pending(start + 3)
+		self.assertEqual(job.next_run, start + 10)
+		self.assertEqual(self.s.run_pending(start + 45), 1)
+		self.assertEqual(job.next_run, start + 50)
+		self.assertEqual(self.ran, ["a", "a"])
+
+	def test_start_and_end_dates(self):
+		now = time.time()
+		later, _ = self.add("later", seconds=10, start_date=now + 100, end_date=now + 125)
+		past, _ = self.add("past", seconds=10, start_date=datetime.datetime.now() - datetime.timedelta(seconds=25))
+		self.assertEqual(later.next_run, now + 100)
+		self.assertAlmostEqual(past.next_run, now - 15, delta=0.5)
+		for t in (100, 110, 120, 130):
+			self.s.run_pending(now + t)
+		self.assertEqual(self.ran.count("later"), 3)
+		self.assertTrue(later.removed)
+		self.assertEqual(self.s.get_jobs(), [past])
+
+	def test_date(self):
+		now = time.time()
+		job, _ = self.add("a", trigger='date', run_date=datetime.datetime.utcfromtimestamp(now + 30).replace(tzinfo=UTC))
+		self.assertAlmostEqual(job.next_run, now + 30, delta=0.01)
+		self.assertEqual(self.s.run_pending(now + 29), 0)
+		self.assertEqual(self.s.run_pending(now + 31), 1)
+		self.assertEqual(self.s.run_pending(now + 100), 0)
+		self.assertEqual(self.ran, ["a"])
+		self.assertEqual(self.s.get_jobs(), [])
+		self.assertRaises(JobLookupError, job.remove)
+		soon, _ = self.add("soon", trigger='date') # right away
+		self.assertEqual(self.s.run_pending(), 1)
+
+	def test_time_until_next(self):
+		self.assertEqual(self.s.time_until_next(), None)
+		a, now = self.add("a", seconds=10)
+		b, _ = self.add("b", seconds=5)
+		self.assertAlmostEqual(self.s.time_until_next(now), 5, delta=0.5)
+		self.assertEqual(self.s.time_until_next(now + 100), 0)
+		b.remove()
+		self.assertAlmostEqual(self.s.time_until_next(now), 10, delta=0.5)
+		a.pause()
+		self.assertEqual(self.s.time_until_next(now), None)
+
+	def test_pause_resume_remove(self):
+		job, now = self.add("a", seconds=10)
+		start = job.next_run
+		job.pause()
+		self.assertEqual(self.s.run_pending(start + 1), 0)
+		job.resume()
+		self.assertEqual(job.next_run, start) # not due yet, so it's left where it was
+		self.assertEqual(self.s.run_pending(start + 1), 1)
+		self.s.remove_job(job.id)
+		self.assertEqual(self.s.run_pending(start + 100), 0)
+		self.assertEqual(self.ran, ["a"])
+		self.assertRaises(JobLookupError, job.pause)
+		self.assertRaises(JobLookupError, job.resume)
+		self.assertRaises(KeyError, job.remove)
+
+	def test_resume_after_missed_runs(self):
+		job, now = self.add("a", seconds=0.05)
+		start = job.next_run
+		job.pause()
+		time.sleep(0.12)
+		job.resume()
+		self.assertTrue(job.next_run > time.time())
+		self.assertAlmostEqual((job.next_run - start) / 0.05, round((job.next_run - start) / 0.05), delta=0.001) # still on it's original schedule
+
+	def test_not_running(self):
+		job, now = self.add("a", seconds=1)
+		self.s.shutdown()
+		self.assertEqual(self.s.run_pending(now + 10), 0)
+		self.s.start()
+		self.assertEqual(self.s.run_pending(now + 10), 1)
+
+	def test_listeners(self):
+		events = []
+		self.s.add_listener(events.append)
+		self.s.add_listener(lambda e: events.append("error"), EVENT_JOB_ERROR)
+		def fail():
+			raise RuntimeError("oops")
+		now = time.time()
+		self.s.add_job(fail, 'date', run_date=now, id="fail")
+		self.add("a", trigger='date', run_date=now, id="a")
+		self.assertEqual(self.s.run_pending(now), 2) # the failure didn't stop the other job
+		self.assertEqual([(e.code, e.job_id) for e in events if e != "error"], [(EVENT_JOB_ERROR, "fail"), (EVENT_JOB_EXECUTED, "a")])
+		self.assertTrue(isinstance(events[0].exception, RuntimeError))
+		self.assertEqual(events.count("error"), 1)
+
+	def test_thread(self):
+		threads = []
+		self.s.add_job(lambda: threads.append(threading.current_thread().name), seconds=0.02)
+		self.s.start(thread=True)
+		self.assertTrue(wait_until(lambda: len(threads) >= 2, 5))
+		self.assertEqual(set(threads), set(["mbf_scheduler"]))
+		thread = self.s.thread
+		self.s.start() # back to run_pending; the thread exits
+		thread.join(2)
+		self.assertFalse(thread.is_alive())
+		self.s.start(thread=True)
+		thread = self.s.thread
+		self.s.shutdown()
+		self.assertFalse(thread.is_alive())
+
+	def test_a_new_first_job_wakes_the_thread(self):
+		self.s.add_job(self.ran.append, args=["late"], seconds=100)
+		self.s.start(thread=True)
+		time.sleep(0.05) # waiting for the late job
+		self.add("soon", trigger='date')
+		self.assertTrue(wait_until(lambda: self.ran == ["soon"], 2))
+
+
+class UTCZone(datetime.tzinfo):
+	def utcoffset(self, dt):
+		return datetime.timedelta(0)
+
+	def dst(self, dt):
+		return datetime.timedelta(0)
+
+	def tzname(self, dt):
+		return "UTC"
+
+UTC = UTCZone()
+
+
+class BuiltinTimerTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, timer_backend="builtin")
+		self.ran = []
+
+	def tearDown(self):
+		self.m.stop_processing()
+
+	def test_timers(self):
+		m = self.m
+		@m.timer(seconds=0.02)
+		def every():
+			self.ran.append("every")
+		self.assertTrue(isinstance(m.scheduler, HeapScheduler))
+		m.start_processing(thread=False) # nothing reading, so the scheduler has a thread of it's own
+		self.assertTrue(wait_until(lambda: self.ran.count("every") >= 3, 5))
+
+	def test_run_limit(self):
+		m = self.m
+		@m.timer(seconds=0.02, run_limit=3)
+		def limited():
+			self.ran.append("limited")
+		@m.timer(seconds=0.02, one_shot=True)
+		def once():
+			self.ran.append("once")
+		@m.timer(seconds=0.02, name="marker")
+		def marker():
+			self.ran.append("marker")
+		m.start_processing(thread=False)
+		self.assertTrue(wait_until(lambda: self.ran.count("marker") >= 6, 5))
+		self.assertEqual((self.ran.count("limited"), self.ran.count("once")), (3, 1))
+		self.assertEqual(m.scheduler.get_jobs(), [t.job for t in m.timer_names["marker"]]) # the others are gone
+
+	def test_enable_and_disable(self):
+		m = self.m
+		@m.timer(seconds=0.02, enabled=False, group="g")
+		def off():
+			self.ran.append("off")
+		m.start_processing(thread=False)
+		time.sleep(0.1)
+		self.assertEqual(self.ran, [])
+		m.enable_timer("off")
+		self.assertTrue(wait_until(lambda: self.ran, 5))
+		m.disable_timer_group("g")
+		time.sleep(0.05)
+		count = len(self.ran)
+		time.sleep(0.1)
+		self.assertEqual(len(self.ran), count)
+
+	def test_date(self):
+		m = self.m
+		@m.timer('date', run_date=time.time() + 0.05)
+		def once():
+			self.ran.append("once")
+		self.assertAlmostEqual(m.poll_timeout(), 0.05, delta=0.05) # the reading loop wakes up for it
+		m.start_processing(thread=False)
+		self.assertTrue(wait_until(lambda: self.ran, 5))
+		time.sleep(0.1)
+		self.assertEqual(self.ran, ["once"])
+
+
+if __name__ == '__main__':
+	unittest.main()
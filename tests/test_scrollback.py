@@ -0,0 +1,112 @@
+# Mbf, the mud bot framework - scrollback and windowed trigger tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+from support import Bot
+
+from mbf.scrollback import Scrollback
+
+
+class ScrollbackTest(unittest.TestCase):
+	def test_wrap(self):
+		s = Scrollback(5)
+		s.extend([b"a", b"b"])
+		self.assertEqual(s.lines(0), [b"a", b"b"])
+		s.extend([b"c", b"d", b"e", b"f", b"g"])
+		self.assertEqual((s.total, s.first, len(s)), (7, 2, 5))
+		self.assertEqual(s.lines(2), [b"c", b"d", b"e", b"f", b"g"])
+		self.assertEqual(s.lines(3, 5), [b"d", b"e"])
+		self.assertEqual(s.lines(0), None) # forgotten
+		self.assertEqual(s.last(2), [b"f", b"g"])
+
+	def test_more_than_capacity_at_once(self):
+		s = Scrollback(5)
+		s.extend([b"x%d" % i for i in range(12)])
+		self.assertEqual(s.total, 12)
+		self.assertEqual(s.last(9), [b"x%d" % i for i in range(7, 12)])
+
+
+class WindowTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, scrollback=50)
+		self.got = []
+
+	def feed(self, *buffers):
+		for lines in buffers:
+			self.m.handle_lines(list(lines))
+
+	def test_window_across_reads(self):
+		@self.m.trigger(br"""^(?P<name>[^\n]+)\n\[Exits: (?P<exits>[^\]]+)\]""", window=2)
+		def room(t, match):
+			self.got.append((match.group("name"), match.group("exits")))
+		self.m.start_processing(print_output=False, thread=False)
+		self.feed([b"junk", b"The Town Square"], [b"[Exits: north south]", b"foo"], [b"more"])
+		self.assertEqual(self.got, [(b"The Town Square", b"north south")]) # once, though it's still in the window after
+
+	def test_plain_text_window(self):
+		@self.m.trigger(b"two\nthree", is_regexp=False, case_sensitive=False, window=3)
+		def plain(t, match):
+			self.got.append(t)
+		self.m.start_processing(print_output=False, thread=False)
+		self.feed([b"ONE", b"TWO"], [b"Three"], [b"Three"])
+		self.assertEqual(len(self.got), 1)
+
+	def score(self, **kwargs):
+		@self.m.trigger(br"""(?s)\A.*""", start=br"""^-+ Score -+$""", end=br"""^-+$""", **kwargs)
+		def score(t, match):
+			self.got.append(t.split(b"\n"))
+
+	def test_start_and_end(self):
+		self.score()
+		self.m.start_processing(print_output=False, thread=False)
+		self.feed([b"----- Score -----", b"Str: 18"], [b"Dex: 12"], [b"-----------", b"after"])
+		self.assertEqual(self.got, [[b"----- Score -----", b"Str: 18", b"Dex: 12", b"-----------"]])
+
+	def test_block_too_long_for_the_window(self):
+		self.score(window=3)
+		self.m.start_processing(print_output=False, thread=False)
+		self.feed([b"----- Score -----", b"Str: 18", b"Dex: 12", b"Con: 10", b"-----------"])
+		self.assertEqual(self.got, [])
+
+	def test_disabled_when_the_block_starts(self):
+		self.score()
+		self.m.start_processing(print_output=False, thread=False)
+		self.m.disable_trigger("score")
+		self.feed([b"----- Score -----", b"Str: 18"])
+		self.m.enable_trigger("score")
+		self.feed([b"-----------"])
+		self.assertEqual(self.got, [[b"----- Score -----", b"Str: 18", b"-----------"]])
+
+	def test_disabled_when_the_block_ends(self):
+		self.score()
+		self.m.start_processing(print_output=False, thread=False)
+		self.feed([b"----- Score -----"])
+		self.m.disable_trigger("score")
+		self.feed([b"-----------"])
+		self.m.enable_trigger("score")
+		self.feed([b"something else"])
+		self.assertEqual(self.got, [])
+
+	def test_end_in_a_buffer_where_processing_stopped(self):
+		@self.m.trigger(br"""^You flee""", sequence=1)
+		def flee(t, match):
+			return True
+		self.score()
+		self.m.start_processing(print_output=False, thread=False)
+		self.feed([b"----- Score -----", b"-----------", b"You flee in terror!"])
+		self.assertEqual(self.got, [])
+		self.feed([b"next"]) # matched the next time the trigger's reached
+		self.assertEqual(self.got, [[b"----- Score -----", b"-----------"]])
+
+	def test_memory_stays_the_same(self):
+		self.score()
+		self.m.start_processing(print_output=False, thread=False)
+		for i in range(2000):
+			self.feed([b"line %d" % i, b"----- Score -----", b"Str: %d" % i, b"-----"])
+		self.assertEqual(len(self.got), 2000)
+		self.assertEqual(len(self.m.scrollback), 50)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,151 @@
+# Mbf, the mud bot framework - send queue tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import socket
+import threading
+import time
+import unittest
+
+from support import wait_until
+
+from mbf.sendqueue import BULK, NORMAL, URGENT, SendQueue
+
+
+class Writes(object):
+	"""Stands in for a connection, recording each write and when it happened"""
+	def __init__(self, fail=False):
+		self.writes = []
+		self.times = []
+		self.fail = fail
+		self.hold = None # an event the next write waits on
+
+	def __call__(self, data):
+		if self.hold is not None:
+			hold, self.hold = self.hold, None
+			hold.wait(5)
+		if self.fail:
+			raise socket.error("connection reset")
+		self.writes.append(data)
+		self.times.append(time.time())
+
+	def commands(self):
+		return b"".join(self.writes).splitlines()
+
+
+class SendQueueTest(unittest.TestCase):
+	def setUp(self):
+		self.queues = []
+
+	def tearDown(self):
+		for q in self.queues:
+			q.stop(flush=False)
+
+	def queue(self, write, **kwargs):
+		q = SendQueue(write, **kwargs)
+		self.queues.append(q)
+		return q
+
+	def test_commands_queued_during_a_write_are_joined(self):
+		w = Writes()
+		hold = w.hold = threading.Event()
+		q = self.queue(w)
+		q.start()
+		q.put(b"first\n")
+		self.assertTrue(wait_until(lambda: q.busy))
+		for i in range(5):
+			q.put(b"cmd %d\n" % i)
+		hold.set()
+		self.assertTrue(q.flush(5))
+		self.assertEqual(w.writes, [b"first\n", b"cmd 0\ncmd 1\ncmd 2\ncmd 3\ncmd 4\n"])
+		self.assertEqual(q.get_stats()['commands'], 6)
+
+	def test_coalesce(self):
+		w = Writes()
+		q = self.queue(w, coalesce=0.2)
+		q.start()
+		for i in range(3):
+			q.put(b"cmd %d\n" % i)
+			time.sleep(0.02)
+		self.assertTrue(q.flush(5))
+		self.assertEqual(w.writes, [b"cmd 0\ncmd 1\ncmd 2\n"])
+
+	def test_max_write(self):
+		w = Writes()
+		q = self.queue(w, max_write=10)
+		for i in range(4):
+			q.put(b"command\n")
+		q.start()
+		self.assertTrue(q.flush(5))
+		self.assertEqual(w.writes, [b"command\ncommand\n", b"command\ncommand\n"])
+
+	def test_rate_limit(self):
+		w = Writes()
+		q = self.queue(w, rate=20, burst=2)
+		for i in range(6):
+			q.put(b"cmd %d\n" % i)
+		start = time.time()
+		q.start()
+		self.assertTrue(q.flush(5))
+		self.assertEqual(w.commands(), [b"cmd %d" % i for i in range(6)])
+		self.assertEqual(w.writes[0], b"cmd 0\ncmd 1\n") # the burst goes out at once
+		self.assertGreaterEqual(w.times[-1] - start, 0.15) # then one every twentieth of a second
+		self.assertGreater(q.get_stats()['throttled'], 0)
+
+	def test_lanes(self):
+		w = Writes()
+		q = self.queue(w, rate=1000, burst=1)
+		q.put(b"sell junk\n", BULK)
+		q.put(b"look\n")
+		q.put(b"flee\n", URGENT)
+		q.put(b"sell more junk\n", BULK)
+		q.put(b"quaff heal\n", URGENT)
+		q.start()
+		self.assertTrue(q.flush(5))
+		self.assertEqual(w.commands(), [b"flee", b"quaff heal", b"look", b"sell junk", b"sell more junk"])
+
+	def test_a_failed_batch_goes_back_in_its_original_lanes(self):
+		errors = []
+		w = Writes(fail=True)
+		q = self.queue(w, on_error=errors.append)
+		q.put(b"sell junk\n", BULK)
+		q.put(b"look\n", NORMAL)
+		q.put(b"flee\n", URGENT)
+		q.start()
+		self.assertTrue(wait_until(lambda: errors))
+		self.assertFalse(q.running)
+		q.put(b"quaff heal\n", URGENT) # while the connection is down
+		self.assertEqual(q.drain(), [(URGENT, b"flee\n"), (URGENT, b"quaff heal\n"), (NORMAL, b"look\n"), (BULK, b"sell junk\n")])
+
+	def test_written_with_pump(self):
+		w = Writes()
+		woken = []
+		q = self.queue(w, rate=10, burst=1)
+		q.start(thread=False, notify=lambda: woken.append(True))
+		self.assertIsNone(q.thread)
+		self.assertEqual(q.due(), None)
+		q.put(b"first\n")
+		q.put(b"second\n")
+		self.assertEqual(len(woken), 2)
+		self.assertEqual(q.due(), 0)
+		self.assertTrue(q.pump())
+		self.assertEqual(w.writes, [b"first\n"])
+		self.assertGreater(q.due(), 0) # out of tokens
+		self.assertTrue(q.flush(5)) # written on this thread
+		self.assertEqual(w.commands(), [b"first", b"second"])
+
+	def test_switching_from_a_thread_to_pump(self):
+		w = Writes()
+		q = self.queue(w)
+		q.start()
+		writer = q.thread
+		q.start(thread=False)
+		self.assertFalse(writer.is_alive())
+		q.put(b"look\n")
+		time.sleep(0.05)
+		self.assertEqual(w.writes, []) # nothing writes it but pump
+		q.pump()
+		self.assertEqual(w.writes, [b"look\n"])
+
+
+if __name__ == '__main__':
+	unittest.main()
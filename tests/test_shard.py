@@ -0,0 +1,65 @@
+# Mbf, the mud bot framework - trigger matching in worker processes tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import unittest
+
+import support # puts mbf on the path
+
+from mbf.shard import ShardPool
+from mbf.triggerset import TriggerSet
+from test_triggerset import ALL_BATCHES, ALL_SPECS, LINES, SPECS, make_triggers, record_batches
+
+
+class ShardPoolTest(unittest.TestCase):
+	def setUp(self):
+		self.pools = []
+
+	def pool(self, processes, cache_size=0):
+		def make(ts):
+			p = ShardPool(ts, processes, cache_size=cache_size)
+			self.pools.append(p)
+			return p
+		return make
+
+	def test_same_as_matching_here(self):
+		expected = record_batches(ALL_SPECS, ALL_BATCHES)
+		self.assertEqual(record_batches(ALL_SPECS, ALL_BATCHES, self.pool(2)), expected)
+		self.assertEqual(record_batches(ALL_SPECS, ALL_BATCHES, self.pool(3, cache_size=64)), expected)
+		for p in self.pools: # the workers really did the matching
+			self.assertEqual((p.batches, p.fallbacks), (7, 0))
+
+	def test_a_worker_dying(self):
+		pools = self.pools
+		pool = self.pool(2)
+		def kill(triggers):
+			p = pools[0].workers[0][0]
+			p.terminate()
+			p.join()
+		expected = record_batches(SPECS, [(LINES, None)] * 3)
+		self.assertEqual(record_batches(SPECS, [(LINES, None), kill, (LINES, None), (LINES, None)], pool), expected)
+		self.assertEqual(pools[0].fallbacks, 1) # the batch after it died was matched here
+		self.assertEqual(pools[0].batches, 3)
+
+	def test_workers_started_again(self):
+		ts = TriggerSet()
+		for t in make_triggers(SPECS, []):
+			ts.add(t)
+		p = ShardPool(ts, 2)
+		try:
+			p.process_lines(list(LINES))
+			self.assertEqual(len(p.workers), 2)
+			p.workers[1][0].terminate()
+			p.workers[1][0].join()
+			p.process_lines(list(LINES))
+			self.assertEqual((p.fallbacks, len(p.workers)), (1, 0))
+			p.process_lines(list(LINES))
+			self.assertEqual((p.fallbacks, len(p.workers)), (1, 2))
+			ts.add(make_triggers([(b"orc", {})], [])[0]) # a rebuilt set means new workers
+			p.process_lines(list(LINES))
+			self.assertEqual(p.restarts, 1)
+		finally:
+			p.stop()
+
+
+if __name__ == '__main__':
+	unittest.main()
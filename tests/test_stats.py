@@ -0,0 +1,126 @@
+# Mbf, the mud bot framework - statistics tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from support import Bot, wait_until
+
+from mbf.stats import TimerStats, TriggerStats, format_prometheus
+
+
+class StatsTest(unittest.TestCase):
+	def setUp(self):
+		self.m = Bot("127.0.0.1", {}, autoconnect=False, auto_login=False, reconnect=False, collect_stats=True, timer_backend="builtin")
+
+	def tearDown(self):
+		self.m.stop_processing()
+
+	def test_triggers(self):
+		m = self.m
+		@m.trigger(br"""(\w+) arrives""", name="arrives")
+		def arrives(text, match):
+			time.sleep(0.01)
+		@m.trigger(b"leaves", is_regexp=False, name="arrives") # counted with the one above
+		def leaves(text, match):
+			pass
+		@m.trigger(br"""^stop""", stop_processing=True, sequence=1)
+		def stop(text, match):
+			pass
+		@m.trigger(br"""\d+""", name="numbers")
+		def numbers(text, match):
+			pass
+		m.handle_lines([b"An orc arrives", b"A rat arrives 2", b"Bob leaves 3 4"])
+		m.handle_lines([b"stop here", b"A cat arrives"])
+		stats = m.stats()
+		a = stats['triggers']['arrives']
+		self.assertEqual(a['hits'], 3)
+		self.assertTrue(a['callback_time'] >= 0.02)
+		self.assertTrue(a['fire_time'] >= a['callback_time'])
+		self.assertEqual(a['stops'], 0)
+		self.assertEqual(stats['triggers']['stop']['stops'], 1)
+		self.assertEqual(stats['triggers']['stop']['hits'], 1)
+		n = stats['triggers']['numbers']
+		self.assertEqual((n['attempts'], n['hits']), (3, 3)) # it has no literal, so it's tried on every line of the first buffer; after the stop in the second it isn't tried at all
+		self.assertEqual(set(stats), set(['triggers', 'timers', 'send_queue']))
+
+	def test_timers(self):
+		m = self.m
+		@m.timer(seconds=0.02, name="tick")
+		def tick():
+			time.sleep(0.01)
+		@m.timer(seconds=0.03, name="tick") # counted with the one above
+		def tock():
+			time.sleep(0.02)
+		m.start_processing(thread=False)
+		self.assertTrue(wait_until(lambda: m.stats()['timers']['tick']['fires'] >= 4, 5))
+		t = m.stats()['timers']['tick']
+		self.assertTrue(t['callback_time'] >= 0.01 * t['fires'])
+		self.assertTrue(0.02 <= t['max_callback_time'] < t['callback_time']) # the longest, not the total
+		self.assertTrue(0 <= t['max_lag'] <= t['lag'])
+
+	def test_stats_text(self):
+		m = self.m
+		@m.trigger(br"""orc""", name='say "hi"')
+		def orc(text, match):
+			pass
+		m.handle_lines([b"orc"])
+		lines = m.stats_text().splitlines()
+		self.assertTrue('mbf_trigger_hits{trigger="say \\"hi\\""} 1' in lines)
+		self.assertTrue(any(l.startswith("mbf_send_queue_") for l in lines))
+
+	def test_dump_stats(self):
+		m = self.m
+		d = tempfile.mkdtemp()
+		try:
+			path = os.path.join(d, "mbf.prom")
+			m.dump_stats(0.02, path)
+			m.start_processing(thread=False)
+			self.assertTrue(wait_until(lambda: os.path.exists(path), 5))
+			with open(path) as f:
+				self.assertTrue(f.read().endswith("\n"))
+			self.assertEqual(os.listdir(d), ["mbf.prom"])
+		finally:
+			m.stop_processing()
+			shutil.rmtree(d)
+
+
+class FormatPrometheusTest(unittest.TestCase):
+	def test_format(self):
+		stats = {
+			'triggers': {'b': {'hits': 2, 'attempts': 5}, 'a\\b': {'hits': 1}},
+			'timers': {'tick': {'fires': 3}},
+			'send_queue': {'writes': 4, 'commands': 6},
+			'output': {'dropped': 0},
+			'unknown': {'ignored': 1},
+		}
+		self.assertEqual(format_prometheus(stats), "\n".join([
+			'mbf_trigger_hits{trigger="a\\\\b"} 1',
+			'mbf_trigger_attempts{trigger="b"} 5',
+			'mbf_trigger_hits{trigger="b"} 2',
+			'mbf_timer_fires{timer="tick"} 3',
+			'mbf_send_queue_commands{} 6',
+			'mbf_send_queue_writes{} 4',
+			'mbf_output_dropped{} 0',
+		]) + "\n")
+
+	def test_prefix(self):
+		self.assertEqual(format_prometheus({'send_queue': {'writes': 1}}, prefix="bot"), "bot_send_queue_writes{} 1\n")
+
+	def test_counters(self):
+		self.assertEqual(TriggerStats().as_dict(), {'attempts': 0, 'hits': 0, 'match_time': 0.0, 'fire_time': 0.0, 'callback_time': 0.0, 'stops': 0})
+		t = TimerStats()
+		t.record_run(0.5)
+		t.record_run(0.25)
+		t.record_lag(0.1)
+		t.record_lag(0.3)
+		self.assertEqual((t.fires, t.callback_time, t.max_callback_time), (2, 0.75, 0.5))
+		self.assertAlmostEqual(t.lag, 0.4)
+		self.assertEqual(t.max_lag, 0.3)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,122 @@
+# Mbf, the mud bot framework - persistent g tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import support # puts mbf on the path
+
+from mbf.store import RECORD, Store
+
+try:
+	import cPickle as pickle
+except ImportError: # python 3
+	import pickle
+
+
+class StoreTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "g.db")
+		self.stores = []
+
+	def tearDown(self):
+		for s in self.stores:
+			s.close()
+		shutil.rmtree(self.directory)
+
+	def open(self, **kwargs):
+		s = Store(self.path, **kwargs)
+		self.stores.append(s)
+		return s
+
+	def crash(self, s):
+		"""Stop a store the way the bot dying would: whatever was written to the log stays there, and nothing is compacted"""
+		s.stopped.set() # so close (at exit, or in tearDown) does nothing
+		s.thread.join()
+		s.log_file.close()
+		s.db.close()
+
+	def rows(self):
+		db = sqlite3.connect(self.path)
+		try:
+			return db.execute("SELECT count(*) FROM g").fetchone()[0]
+		finally:
+			db.close()
+
+	def test_survives_a_restart(self):
+		s = self.open()
+		s['hp'] = 100
+		s['map'] = {1: "Square"}
+		s['map'][2] = "Road"
+		s.touch('map')
+		s.close()
+		s = self.open()
+		self.assertEqual(s.get_stats()['loaded'], 0) # lazy
+		self.assertEqual(s['map'], {1: "Square", 2: "Road"})
+		self.assertEqual(sorted(s), ['hp', 'map'])
+		self.assertEqual(s.get_stats()['loads'], 1)
+
+	def test_crash_recovery_with_a_truncated_log(self):
+		s = self.open()
+		s['kept'] = "flushed"
+		s['gone'] = 1
+		s.flush()
+		del s['gone']
+		s.flush()
+		self.crash(s)
+		key, value = pickle.dumps('torn', 2), pickle.dumps("x" * 100, 2)
+		with open(self.path + ".log", "ab") as f: # a write the crash cut short
+			f.write((RECORD.pack(len(key), len(value)) + key + value)[:-20])
+		s = self.open()
+		self.assertEqual(s['kept'], "flushed")
+		self.assertNotIn('gone', s)
+		self.assertNotIn('torn', s)
+		self.assertEqual(os.path.getsize(self.path + ".log"), 0)
+
+	def test_crash_during_compaction(self):
+		s = self.open()
+		s['a'] = 1
+		s.flush()
+		self.crash(s)
+		os.rename(self.path + ".log", self.path + ".log.old") # moved aside, never applied
+		key, value = pickle.dumps('a', 2), pickle.dumps(2, 2)
+		with open(self.path + ".log", "wb") as f: # and written to again afterwards
+			f.write(RECORD.pack(len(key), len(value)) + key + value)
+		s = self.open()
+		self.assertEqual(s['a'], 2) # the old log is applied first
+		self.assertFalse(os.path.exists(self.path + ".log.old"))
+
+	def test_compaction(self):
+		s = self.open(compact_size=500)
+		for i in range(100):
+			s['key %d' % i] = "value %d" % i
+			s.flush()
+		self.assertGreater(s.get_stats()['snapshots'], 1)
+		s.close()
+		s = self.open()
+		self.assertEqual(len(s), 100)
+		self.assertEqual(s['key 99'], "value 99")
+
+	def test_equal_keys_are_one_row(self):
+		s = self.open()
+		s['hp'] = 1
+		s[1] = "one"
+		s['gone'] = 5
+		s.close()
+		s = self.open()
+		s[u'hp'] = 2 # equal to 'hp', and the same key in python 2, but pickled differently
+		s[True] = "true"
+		del s[u'gone']
+		s.close()
+		self.assertEqual(self.rows(), 2)
+		s = self.open()
+		self.assertEqual((len(s), s['hp'], s[1]), (2, 2, "true"))
+		self.assertNotIn('gone', s)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,102 @@
+# Mbf, the mud bot framework - telnet tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import re
+import threading
+import unittest
+
+from support import Bot, shut_down, wait_until
+
+from fakemud import FakeMud
+from mbf.telnet import EOR, EOR_CMD, GA, IAC, WILL
+
+
+class MccpTest(unittest.TestCase):
+	def setUp(self):
+		self.lines = []
+		self.m = None
+
+	def tearDown(self):
+		if self.m is not None:
+			shut_down(self.m)
+		self.mud.close()
+
+	def connect(self, **kwargs):
+		m = self.m = Bot("127.0.0.1", {}, port=self.mud.port, auto_login=False, reconnect=False, **kwargs)
+		@m.trigger(br"""^line \d+$""")
+		def line(t, match):
+			self.lines.append(t)
+		m.start_processing(print_output=False)
+		self.mud.wait_for_clients(1)
+		return m
+
+	def test_mccp2_round_trip(self):
+		self.mud = FakeMud(b"", mccp=True)
+		m = self.connect()
+		self.assertTrue(wait_until(lambda: self.mud.compressors and m.tn.decompressor is not None))
+		for i in range(200): # plenty of small compressed writes, so lines are split across reads
+			self.mud.send(0, b"line %d\r\n" % i)
+		self.assertTrue(wait_until(lambda: len(self.lines) == 200))
+		self.assertEqual(self.lines, [b"line %d" % i for i in range(200)])
+
+	def test_mccp3_round_trip(self):
+		self.mud = FakeMud(b"", mccp3=True)
+		m = self.connect(compress_output=True)
+		self.assertTrue(wait_until(lambda: m.tn.compressor is not None))
+		m.send("say compressed")
+		self.assertTrue(self.mud.wait_for(b"say compressed"))
+		self.assertTrue(self.mud.decompressors)
+
+	def test_mccp3_concurrent_writers(self):
+		"""Sends from several threads at once have to stay whole in MCCP3's single stream"""
+		self.mud = FakeMud(b"", mccp3=True)
+		m = self.connect(compress_output=True)
+		self.assertTrue(wait_until(lambda: m.tn.compressor is not None))
+		def writer(n):
+			for i in range(500):
+				m.tn.write(b"thread %d line %d\n" % (n, i))
+		threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertTrue(self.mud.wait_for(b"thread 3 line 499\n") and self.mud.wait_for(b"thread 0 line 499\n"))
+		self.assertTrue(wait_until(lambda: b"".join(self.mud.received).count(b"\n") >= 2000))
+		lines = re.findall(br"""thread \d line \d+\n""", b"".join(self.mud.received)) # the first one follows the negotiation
+		self.assertEqual(len(lines), 2000)
+		self.assertEqual(len(set(lines)), 2000)
+
+
+class TelnetMarksTest(unittest.TestCase):
+	"""GA and EOR from a mud reach triggers as prompts right away, without waiting for prompt_timeout"""
+	def setUp(self):
+		self.mud = FakeMud(b"")
+		self.m = Bot("127.0.0.1", {}, port=self.mud.port, auto_login=False, reconnect=False, prompt_timeout=30)
+		self.prompts = []
+		@self.m.trigger(br"""^<(\d+)hp> $""")
+		def prompt(t, match):
+			self.prompts.append(match.group(1))
+		self.m.start_processing(print_output=False)
+		self.mud.wait_for_clients(1)
+
+	def tearDown(self):
+		shut_down(self.m)
+		self.mud.close()
+
+	def test_ga(self):
+		self.mud.send(0, b"You are hit!\r\n<90hp> " + IAC + GA)
+		self.assertTrue(wait_until(lambda: self.prompts, 5))
+		self.assertEqual(self.prompts, [b"90"])
+
+	def test_eor(self):
+		self.mud.send(0, IAC + WILL + EOR)
+		self.assertTrue(wait_until(lambda: EOR in self.m.tn.remote))
+		self.mud.send(0, b"<80hp> " + IAC + EOR_CMD + b"<70h")
+		self.assertTrue(wait_until(lambda: self.prompts, 5))
+		self.mud.send(0, b"p> " + IAC + EOR_CMD)
+		self.assertTrue(wait_until(lambda: len(self.prompts) == 2, 5))
+		self.assertEqual(self.prompts, [b"80", b"70"])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+# Mbf, the mud bot framework - transcript tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support # puts mbf on the path
+
+from mbf.transcript import INBOUND, OUTBOUND, Recorder, Transcript
+
+BASE = 1000 * 60.0 # the start of a minute
+
+
+class TranscriptTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "session.gz")
+		self.recorders = []
+
+	def tearDown(self):
+		for r in self.recorders:
+			r.close()
+		shutil.rmtree(self.directory)
+
+	def recorder(self):
+		r = Recorder(self.path, segment_seconds=60, flush_interval=60)
+		self.recorders.append(r)
+		return r
+
+	def record(self, r, minutes):
+		"""Record a line in each of the given minutes, writing them as it goes"""
+		for minute in minutes:
+			r.pending.append((BASE + minute * 60, INBOUND, b"minute %d\n" % minute))
+			r.write_pending(now=BASE + minute * 60)
+
+	def crash(self, r, cut=0):
+		"""Stop a recorder the way the bot dying would: the segment being written is left unfinished and out of the index, cut bytes short"""
+		r.stopped.set() # so close does nothing
+		r.thread.join()
+		r.file.close()
+		r.index.close()
+		if cut:
+			with open(self.path, "r+b") as f:
+				f.truncate(os.path.getsize(self.path) - cut)
+
+	def lines(self, *args):
+		return [data for when, direction, data in Transcript(self.path).records(*args)]
+
+	def test_records_between_times(self):
+		r = self.recorder()
+		self.record(r, range(5))
+		r.pending.append((BASE + 4 * 60 + 1, OUTBOUND, b"look\n"))
+		r.close()
+		self.assertEqual(len(Transcript(self.path).segments), 5)
+		self.assertEqual(self.lines(BASE + 60, BASE + 180), [b"minute 1\n", b"minute 2\n"])
+		self.assertEqual([data for when, direction, data in Transcript(self.path).records(direction=OUTBOUND)], [b"look\n"])
+
+	def test_a_damaged_segment_costs_only_itself(self):
+		r = self.recorder()
+		self.record(r, [0, 1, 2])
+		self.crash(r, cut=3) # minute 2 is cut short
+		r = self.recorder() # the bot comes back and records after it
+		self.record(r, [3, 4, 5])
+		self.crash(r, cut=2) # and minute 5
+		r = self.recorder()
+		self.record(r, [6]) # still being written, after the damaged minute 5
+		self.assertEqual(self.lines(), [b"minute %d\n" % i for i in range(7)])
+		self.assertEqual(self.lines(BASE + 120, BASE + 240), [b"minute 2\n", b"minute 3\n"])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,263 @@
+# Mbf, the mud bot framework - compiled trigger set tests
+# Author: Blake Oliver <oliver22213@me.com>
+
+import re
+import unittest
+
+import support # puts mbf on the path
+
+from mbf.ansi import AnsiStripper
+from mbf.trigger import Trigger
+from mbf.triggerset import Automaton, TriggerSet, required_literal
+
+LINES = [
+	b"An orc hits you with a club.",
+	b"<100hp 50mp>",
+	b"Bob tells you, 'hi there'",
+	b"You are HUNGRY.",
+	b"An ORC arrives.",
+	b"orc misses Bob 12",
+	b"nothing here",
+	b"You feel very Tired",
+	b"An orc hits you with a rock.",
+]
+
+# (pattern, keyword arguments) for a mix of every kind of trigger the set treats differently
+SPECS = [
+	(br"""hits you with (a \w+)""", {}), # a literal
+	(br"""^<(\d+)hp (\d+)mp>$""", {'sequence': 10}),
+	(br"""(?P<name>\w+) tells you, '(?P<message>.+)'""", {}),
+	(b"you are hungry", {'is_regexp': False, 'case_sensitive': False}),
+	(b"An ORC", {'is_regexp': False}),
+	(b"an orc", {'is_regexp': False, 'case_sensitive': False, 'sequence': 5}),
+	(br"""an orc (arrives|leaves)""", {'case_sensitive': False}),
+	(br"""you feel (?:very )?tired""", {'case_sensitive': False, 'sequence': 100}),
+	(br"""^(\w+) (?:hits|misses) (\w+) \d+$""", {}), # no literal
+	(br"""\d+""", {'sequence': 150}), # no literal, and a match on most lines
+	(br"""hp (\d+)mp>\n(\w+) tells""", {'multiline': True}),
+	(b"hungry.\nan orc", {'is_regexp': False, 'case_sensitive': False, 'multiline': True}),
+	(b"not in any line", {'is_regexp': False, 'sequence': 1}),
+]
+
+# Lines with colour, and triggers that match on it
+COLOURED_LINES, COLOURS = AnsiStripper().strip_lines([
+	b"\x1b[31mAn orc\x1b[0m hits you with a club.",
+	b"An orc hits you with a rock.",
+	b"\x1b[1;32mBob\x1b[0m tells you, 'hi there'",
+	b"\x1b[31mAn ORC arrives.",
+	b"orc misses Bob 12\x1b[0m",
+])
+COLOURED_SPECS = [
+	(br"""an orc""", {'case_sensitive': False, 'fg': 'red'}),
+	(b"bob", {'is_regexp': False, 'case_sensitive': False, 'fg': 'green'}),
+]
+
+
+def make_triggers(specs, record):
+	"""Triggers for specs whose functions append (name, text, match span) to record, returning true (stopping processing) as the Mbf wrapper would"""
+	triggers = []
+	for n, (pattern, kwargs) in enumerate(specs):
+		t = Trigger(pattern, name="t{}".format(n), **kwargs)
+		def fn(text, match, t=t):
+			record.append((t.name, text, match.span() if match is not None else None))
+			return t.stop_processing
+		t.add_function(fn)
+		triggers.append(t)
+	return triggers
+
+
+def scan_each(triggers, lines):
+	"""What mbf did before the compiled set: try every enabled trigger on it's own, in order of sequence, until one stops processing"""
+	block = b"\n".join(lines)
+	for t in sorted(triggers, key=lambda t: t.sequence):
+		if not t.enabled:
+			continue
+		found = t.find(block) if t.multiline else t.find_lines(lines)
+		if t.call(found):
+			return t
+	return None
+
+
+def record_batches(specs, batches, matcher=None, **kwargs):
+	"""Build a TriggerSet (with kwargs) of triggers for specs, and process each batch of (lines, colours) with it, or with what matcher returns for it; a function in batches is called with the triggers instead, to enable or disable some between batches.
+	Returns every trigger function call, as make_triggers records them.
+	"""
+	record = []
+	triggers = make_triggers(specs, record)
+	ts = TriggerSet(**kwargs)
+	for t in triggers:
+		ts.add(t)
+	m = matcher(ts) if matcher is not None else ts
+	try:
+		for batch in batches:
+			if callable(batch):
+				batch(triggers)
+			else:
+				lines, colours = batch
+				m.process_lines(list(lines), colours=colours)
+	finally:
+		if m is not ts:
+			m.stop()
+	return record
+
+
+def disable(*numbers):
+	def f(triggers):
+		for n in numbers:
+			triggers[n].enabled = False
+	return f
+
+
+def enable(*numbers):
+	def f(triggers):
+		for n in numbers:
+			triggers[n].enabled = True
+	return f
+
+# Every kind of trigger, stopping processing part way through the lines, with triggers disabled and enabled again between batches; seen twice, so a line cache has the lines the second time
+ALL_SPECS = SPECS + COLOURED_SPECS + [(b"Bob 12", {'is_regexp': False, 'stop_processing': True, 'sequence': 120})]
+ALL_BATCHES = [
+	(LINES, None),
+	(COLOURED_LINES, COLOURS),
+	disable(0, 13),
+	(LINES, None),
+	(COLOURED_LINES, COLOURS),
+	enable(0, 13),
+	disable(2, 8),
+	(LINES, None),
+	(COLOURED_LINES, COLOURS),
+	(LINES[:3], None),
+]
+
+
+class TriggerSetTest(unittest.TestCase):
+	def compare(self, specs, lines=LINES, setup=None):
+		"""Match lines with a compiled set and with scan_each, and check the same trigger functions were called with the same text and match spans, in the same order"""
+		expected, got = [], []
+		each = make_triggers(specs, expected)
+		compiled = make_triggers(specs, got)
+		if setup is not None:
+			setup(each)
+			setup(compiled)
+		s = TriggerSet()
+		for t in compiled:
+			s.add(t)
+		stopped = s.process_lines(list(lines))
+		stopped_each = scan_each(each, list(lines))
+		self.assertEqual(got, expected)
+		self.assertEqual(stopped is None, stopped_each is None)
+		if stopped is not None:
+			self.assertEqual(stopped.name, stopped_each.name)
+		return got
+
+	def test_same_as_scanning_each_trigger(self):
+		got = self.compare(SPECS)
+		self.assertEqual(set(name for name, text, span in got), set("t{}".format(n) for n in range(len(SPECS) - 1)))
+		self.assertEqual(got[0][0], "t5") # lowest sequence first
+
+	def test_case_insensitive_plain_text(self):
+		got = self.compare([(b"you are hungry", {'is_regexp': False, 'case_sensitive': False}), (b"HUNGRY", {'is_regexp': False}), (b"hungry", {'is_regexp': False})])
+		self.assertEqual([name for name, text, span in got], ["t0", "t1"])
+
+	def test_stop_processing(self):
+		specs = SPECS + [(b"nothing here", {'is_regexp': False, 'stop_processing': True, 'sequence': 50})]
+		got = self.compare(specs)
+		self.assertEqual(got[-1][0], "t{}".format(len(specs) - 1))
+		self.assertNotIn("t9", [name for name, text, span in got]) # sequence 150, after the stop
+
+	def test_disabled(self):
+		def setup(triggers):
+			triggers[0].enabled = False
+			triggers[8].enabled = False
+		got = self.compare(SPECS, setup=setup)
+		self.assertFalse(set(["t0", "t8"]) & set(name for name, text, span in got))
+
+	def test_disabled_by_an_earlier_trigger(self):
+		"""Whether a trigger is enabled is checked when it's reached, so a trigger function can disable the ones after it"""
+		def setup(triggers):
+			first = triggers[5].fn
+			def disable(text, match):
+				triggers[0].enabled = False
+				return first(text, match)
+			triggers[5].fn = disable
+		got = self.compare(SPECS, setup=setup)
+		self.assertNotIn("t0", [name for name, text, span in got])
+
+	def test_many_keywords(self):
+		"""More keywords than Automaton.regexp_limit, so the lines are scanned by stepping through the automaton"""
+		specs = [(b"mob %d arrives" % i, {'is_regexp': False, 'case_sensitive': i % 2 == 0}) for i in range(60)]
+		specs += [(br"""mob %d leaves""" % i, {'case_sensitive': i % 3 == 0}) for i in range(60)]
+		lines = [b"A mob 7 arrives.", b"A MOB 8 ARRIVES.", b"mob 12 leaves, then mob 13 leaves", b"MOB 30 LEAVES", b"mob 59 arrives"]
+		got = self.compare(specs, lines)
+		self.assertEqual([name for name, text, span in got], ["t7", "t59", "t72", "t73"])
+
+	def test_remove(self):
+		record = []
+		a, b = make_triggers([(b"a", {}), (b"b", {})], record) # the same sequence, so they compare equal
+		s = TriggerSet()
+		s.add(a)
+		s.add(b)
+		s.remove(b)
+		self.assertEqual(len(s.triggers), 1)
+		self.assertIs(s.triggers[0], a)
+		s.process_lines([b"a b"])
+		self.assertEqual([name for name, text, span in record], ["t0"])
+
+
+class LineCacheTest(unittest.TestCase):
+	def test_same_as_without_the_cache(self):
+		expected = record_batches(ALL_SPECS, ALL_BATCHES)
+		self.assertEqual(record_batches(ALL_SPECS, ALL_BATCHES, cache_size=64), expected)
+		self.assertEqual(record_batches(ALL_SPECS, ALL_BATCHES * 3, cache_size=4), record_batches(ALL_SPECS, ALL_BATCHES * 3)) # lines forgotten and seen again
+		names = set(name for name, text, span in expected)
+		self.assertTrue(set(["t10", "t11", "t13", "t14", "t15"]) <= names) # multiline, coloured, and the stop
+
+	def test_hits(self):
+		s = TriggerSet(cache_size=64)
+		for t in make_triggers(SPECS, []):
+			s.add(t)
+		s.process_lines(list(LINES))
+		s.process_lines(list(LINES))
+		stats = s.cache.get_stats()
+		self.assertEqual((stats['hits'], stats['misses']), (len(LINES), len(LINES)))
+		s.add(make_triggers([(b"orc", {})], [])[0])
+		s.process_lines(list(LINES[:2])) # rebuilt, so the cache starts again
+		self.assertEqual(s.cache.get_stats()['entries'], 2)
+
+
+class RequiredLiteralTest(unittest.TestCase):
+	def literal(self, pattern, flags=0):
+		return required_literal(re.compile(pattern, flags))
+
+	def test_literals(self):
+		self.assertEqual(self.literal(br"""(\w+) tells you, '(.+)'"""), b" tells you, '")
+		self.assertEqual(self.literal(br"""^You (are|feel) HUNGRY""", re.IGNORECASE), b" hungry")
+		self.assertEqual(self.literal(br"""abc(?:def)?"""), b"abc")
+		self.assertEqual(self.literal(br"""first\nsecond line"""), b"second line")
+
+	def test_no_literal(self):
+		self.assertEqual(self.literal(br"""^(\w+) (\d+)$"""), None)
+		self.assertEqual(self.literal(br"""a|bc"""), None)
+		self.assertEqual(self.literal(br"""x\d"""), None) # too short to be worth it
+
+
+class AutomatonTest(unittest.TestCase):
+	def search(self, keywords, text):
+		a = Automaton()
+		for n, k in enumerate(keywords):
+			a.add(k, n)
+		a.build()
+		found = set()
+		a.search(text, found)
+		return found
+
+	def test_overlapping_keywords(self):
+		keywords = [b"he", b"she", b"his", b"hers", b"ushers"]
+		self.assertEqual(self.search(keywords, b"ushers"), set([0, 1, 3, 4]))
+		many = keywords + [b"filler %d" % i for i in range(Automaton.regexp_limit)] # stepping through the automaton instead of a regexp
+		self.assertEqual(self.search(many, b"ushers"), set([0, 1, 3, 4]))
+		self.assertEqual(self.search(many, b"filler 3 and his"), set([2, 8]))
+
+
+if __name__ == '__main__':
+	unittest.main()